@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+'''
+Timing of the k-point batched KRCCSD amplitude equations against the
+reference implementation with explicit loops over k-points (diamond, GTH-SZV
+basis).
+'''
+
+import time
+from pyscf.pbc import gto, scf
+from pyscf.pbc.cc import kccsd_rhf
+
+cell = gto.Cell()
+cell.atom='''
+C 0.000000000000   0.000000000000   0.000000000000
+C 1.685068664391   1.685068664391   1.685068664391
+'''
+cell.basis = 'gth-szv'
+cell.pseudo = 'gth-pade'
+cell.a = '''
+0.000000000, 3.370137329, 3.370137329
+3.370137329, 0.000000000, 3.370137329
+3.370137329, 3.370137329, 0.000000000'''
+cell.unit = 'B'
+cell.gs = [10,10,10]
+cell.verbose = 4
+cell.build()
+
+for nk in ((1,1,2), (2,2,2), (3,3,3), (4,4,4)):
+    kmf = scf.KRHF(cell, cell.make_kpts(nk), exxdiv=None).run()
+    mycc = kccsd_rhf.RCCSD(kmf)
+    eris = mycc.ao2mo()
+    t1, t2 = mycc.init_amps(eris)[1:]
+    t1, t2 = mycc.update_amps(t1, t2, eris)
+
+    t0 = time.time()
+    t1ref, t2ref = kccsd_rhf.update_amps_loop(mycc, t1, t2, eris)
+    eref = kccsd_rhf.energy_loop(mycc, t1ref, t2ref, eris)
+    t_loop = time.time() - t0
+
+    t0 = time.time()
+    t1new, t2new = kccsd_rhf.update_amps(mycc, t1, t2, eris)
+    e = kccsd_rhf.energy(mycc, t1new, t2new, eris)
+    t_batch = time.time() - t0
+
+    print('kmesh %s  loop %8.2f s  batched %8.2f s  |dt2| = %.3g  dE = %.3g' %
+          (nk, t_loop, t_batch, abs(t2new-t2ref).max(), e-eref))
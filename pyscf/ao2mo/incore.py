@@ -6,10 +6,13 @@
 import sys
 import numpy
 import ctypes
+from pyscf import lib
 from pyscf.lib import logger
 from pyscf.ao2mo import _ao2mo
 
 BLOCK = 56
+# The number of AO functions in the shell chunks of screened_rows
+CHUNK = 8
 
 def full(eri_ao, mo_coeff, verbose=0, compact=True, **kwargs):
     r'''MO integral transformation for the given orbital.
@@ -51,7 +54,8 @@ def full(eri_ao, mo_coeff, verbose=0, compact=True, **kwargs):
     return general(eri_ao, (mo_coeff,)*4, verbose, compact)
 
 # It consumes two times of the memory needed by MO integrals
-def general(eri_ao, mo_coeffs, verbose=0, compact=True, **kwargs):
+def general(eri_ao, mo_coeffs, verbose=0, compact=True, screen_tol=None,
+            ao_loc=None, **kwargs):
     r'''For the given four sets of orbitals, transfer the 8-fold or 4-fold 2e
     AO integrals to MO integrals.
 
@@ -70,6 +74,16 @@ def general(eri_ao, mo_coeffs, verbose=0, compact=True, **kwargs):
             returned MO integrals has (up to 4-fold) permutation symmetry.
             If it's False, the function will abandon any permutation symmetry,
             and return the "plain" MO integrals
+        screen_tol : float
+            If screen_tol is given, the orbitals are transformed in blocks of
+            nearby orbitals.  For each block only the AO functions on which
+            the coefficients are larger than screen_tol are included, and the
+            blocks of (ij|kl) below screen_tol (by Schwarz inequality) are
+            skipped.  It reduces the cost for localized orbitals (see
+            :mod:`pyscf.lo`).
+        ao_loc : 1D int array
+            The offsets of AO shells.  If given, the MO coefficients are
+            screened shell by shell.
 
     Returns:
         2D array of transformed MO integrals.  The MO integrals may or may not
@@ -115,6 +129,10 @@ def general(eri_ao, mo_coeffs, verbose=0, compact=True, **kwargs):
     nao_pair = nao*(nao+1)//2
     assert(eri_ao.size in (nao_pair**2, nao_pair*(nao_pair+1)//2))
 
+    if screen_tol is not None:
+        return _general_screened(eri_ao, mo_coeffs, compact, screen_tol,
+                                 ao_loc, log)
+
 # transform e1
     eri1 = half_e1(eri_ao, mo_coeffs, compact)
     klmosym, nkl_pair, mokl, klshape = _conc_mos(mo_coeffs[2], mo_coeffs[3], compact)
@@ -130,6 +148,55 @@ def general(eri_ao, mo_coeffs, verbose=0, compact=True, **kwargs):
     eri1 = _ao2mo.nr_e2(eri1, mokl, klshape, aosym='s4', mosym=klmosym)
     return eri1
 
+def _general_screened(eri_ao, mo_coeffs, compact, tol, ao_loc=None,
+                      verbose=logger.WARN):
+    '''MO integrals of incore.general for the screened orbital blocks'''
+    log = logger.new_logger(None, verbose)
+    nao = mo_coeffs[0].shape[0]
+    nao_pair = nao*(nao+1)//2
+    if eri_ao.size != nao_pair**2:
+        from pyscf.ao2mo.addons import restore
+        eri_ao = restore(4, eri_ao, nao)
+    eri_ao = eri_ao.reshape(nao_pair,nao_pair)
+    if ao_loc is None:
+        ao_loc = numpy.arange(nao+1)
+    ao_loc = numpy.asarray(ao_loc)
+
+    diag = numpy.sqrt(abs(eri_ao.diagonal()))
+    q_cond = lib.unpack_tril(diag)
+    q_cond = numpy.maximum.reduceat(q_cond, ao_loc[:-1], axis=0)
+    q_cond = numpy.maximum.reduceat(q_cond, ao_loc[:-1], axis=1)
+
+    def ao_pairs(i0, i1, j0, j1):
+        i = numpy.arange(ao_loc[i0], ao_loc[i1])
+        j = numpy.arange(ao_loc[j0], ao_loc[j1])
+        ij = numpy.maximum(i[:,None], j)
+        return (ij*(ij+1)//2 + numpy.minimum(i[:,None], j)).ravel(), i.size, j.size
+    def fint(shls_slice):
+        ij, ni, nj = ao_pairs(*shls_slice[:4])
+        kl, nk, nl = ao_pairs(*shls_slice[4:])
+        return lib.take_2d(eri_ao, ij, kl).reshape(ni,nj,nk,nl)
+
+    ijsym = compact and iden_coeffs(mo_coeffs[0], mo_coeffs[1])
+    klsym = compact and iden_coeffs(mo_coeffs[2], mo_coeffs[3])
+    nmoi, nmoj, nmok, nmol = [c.shape[1] for c in mo_coeffs]
+    if ijsym:
+        nij_pair = nmoi * (nmoi+1) // 2
+    else:
+        nij_pair = nmoi * nmoj
+    if klsym:
+        nkl_pair = nmok * (nmok+1) // 2
+    else:
+        nkl_pair = nmok * nmol
+    eri_mo = numpy.zeros((nij_pair,nkl_pair))
+    nrow = 0
+    for rows, buf in screened_rows(fint, mo_coeffs, q_cond, tol, ijsym, klsym,
+                                   ao_loc):
+        eri_mo[rows] = buf
+        nrow += rows.size
+    log.debug('%d of %d (ij| rows computed after screening', nrow, nij_pair)
+    return eri_mo
+
 def half_e1(eri_ao, mo_coeffs, compact=True):
     r'''Given two set of orbitals, half transform the (ij| pair of 8-fold or
     4-fold AO integrals (ij|kl)
@@ -215,6 +282,259 @@ def half_e1(eri_ao, mo_coeffs, compact=True):
         eri1[:,blk0:blk1] = buf.T
     return eri1
 
+def screen_ao(mo_coeffs, tol, ao_loc=None):
+    '''Indices of the AO functions which have coefficients larger than tol
+    in any of the given orbitals.  If ao_loc is given, the AO functions of a
+    shell are kept or removed together.
+    '''
+    nao = mo_coeffs[0].shape[0]
+    cmax = numpy.zeros(nao)
+    for c in mo_coeffs:
+        if c.shape[1] > 0:
+            cmax = numpy.maximum(cmax, abs(c).max(axis=1))
+    if ao_loc is None:
+        return numpy.where(cmax > tol)[0]
+    else:
+        ao_loc = numpy.asarray(ao_loc)
+        mask = numpy.maximum.reduceat(cmax, ao_loc[:-1]) > tol
+        return numpy.where(numpy.repeat(mask, ao_loc[1:]-ao_loc[:-1]))[0]
+
+def sub_mo_coeffs(mo_coeffs, aoidx):
+    '''The rows aoidx of the orbital coefficients.  Return None if the
+    permutation symmetry between the orbitals cannot be kept in the screened
+    orbitals.
+    '''
+    sub_mos = []
+    for i, c in enumerate(mo_coeffs):
+        for j in range(i):
+            if iden_coeffs(c, mo_coeffs[j]):
+                sub_mos.append(sub_mos[j])
+                break
+        else:
+            sub_mos.append(numpy.asarray(c[aoidx], order='F'))
+            for j in range(i):
+                if iden_coeffs(sub_mos[i], sub_mos[j]):
+                    return None
+    return sub_mos
+
+def mo_blocks(mo_coeff, tol, ao_loc=None, blksize=None):
+    '''Partition the orbitals into blocks of orbitals centered on nearby AO
+    shells.  For each block, returns the orbital indices, the shells on which
+    the coefficients of the block are larger than tol, and the weights
+    sum_{p in shell} max_{i in block} |C[p,i]| of these shells.
+    '''
+    nao, nmo = mo_coeff.shape
+    if ao_loc is None:
+        ao_loc = numpy.arange(nao+1)
+    if blksize is None:
+        blksize = BLOCK
+    ao_loc = numpy.asarray(ao_loc)
+    cabs = abs(mo_coeff)
+    blocks = []
+    if nmo == 0:
+        return blocks
+    # The orbitals are sorted by the shell of the largest weight.  The shells
+    # of the same atom are adjacent, so are the orbitals of one block.
+    wsh = numpy.add.reduceat(cabs, ao_loc[:-1], axis=0)
+    order = numpy.argsort(wsh.argmax(axis=0), kind='mergesort')
+    for p0, p1 in lib.prange(0, nmo, blksize):
+        idx = order[p0:p1]
+        cmax = cabs[:,idx].max(axis=1)
+        shls = numpy.where(numpy.maximum.reduceat(cmax, ao_loc[:-1]) > tol)[0]
+        weights = numpy.add.reduceat(cmax, ao_loc[:-1])[shls]
+        blocks.append((idx, shls, weights))
+    return blocks
+
+def _shell_ao_idx(shls, ao_loc):
+    return numpy.hstack([numpy.arange(ao_loc[i], ao_loc[i+1]) for i in shls])
+
+def _shell_segments(shls, nao_sh, max_ao):
+    '''Split the (sorted) shells into segments of contiguous shells, each of
+    at most max_ao AO functions (at least one shell in each segment)'''
+    segs = []
+    k0 = 0
+    nao = 0
+    for k, ish in enumerate(shls):
+        n = nao_sh[ish]
+        if k > k0 and (nao + n > max_ao or ish != shls[k-1]+1):
+            segs.append((k0, k))
+            k0 = k
+            nao = 0
+        nao += n
+    segs.append((k0, len(shls)))
+    return segs
+
+def _pair_blocks(blocks1, blocks2, q_cond, sym, nmo2):
+    '''The pairs of orbital blocks and their Schwarz bound
+    sum_{pq} w1[p] sqrt((pq|pq)) w2[q].  For the symmetric pairs (sym=True),
+    the pair indices are i*(i+1)/2+j (i >= j) and the mask selects the unique
+    pairs of the diagonal blocks.
+    '''
+    pairs = []
+    for I, (oi, si, wi) in enumerate(blocks1):
+        if sym:
+            blocks2_ = blocks2[:I+1]
+        else:
+            blocks2_ = blocks2
+        for J, (oj, sj, wj) in enumerate(blocks2_):
+            if si.size == 0 or sj.size == 0:
+                continue
+            bound = numpy.dot(wi, numpy.dot(q_cond[si[:,None],sj], wj))
+            if sym:
+                i = numpy.maximum(oi[:,None], oj)
+                j = numpy.minimum(oi[:,None], oj)
+                idx = (i*(i+1)//2 + j).ravel()
+                if I == J:
+                    mask = (oi[:,None] >= oj).ravel()
+                else:
+                    mask = None
+            else:
+                idx = (oi[:,None] * nmo2 + oj).ravel()
+                mask = None
+            pairs.append((bound, I, J, idx, mask))
+    return pairs
+
+def _half_trans(eri, ci, cj):
+    '''(ij|rs) of the AO integrals block eri[p,q,r,s]'''
+    np, nq, nr, ns = eri.shape
+    ni, nj = ci.shape[1], cj.shape[1]
+    t = lib.dot(ci.T, eri.reshape(np,-1)).reshape(ni,nq,-1)
+    t = lib.dot(cj.T, t.transpose(1,0,2).reshape(nq,-1))
+    return t.reshape(nj,ni,nr,ns).transpose(1,0,2,3)
+
+def screened_rows(fint, mo_coeffs, q_cond, tol, ijsym, klsym,
+                  ao_loc=None, blksize=None):
+    '''Generate the rows of MO integrals (ij|kl) for the pairs of orbital
+    blocks (I,J).  The orbitals are grouped in blocks (see :func:`mo_blocks`).
+    For each block pair, only the AO shells on which the coefficients of the
+    blocks are larger than tol are included, and the block quadruples
+    (I,J,K,L) are skipped if the Schwarz bound is smaller than tol.  The AO
+    integrals of a block pair (I,J) are evaluated once for all the (K,L)
+    block pairs.  Within a block pair, the AO integrals are evaluated for the
+    chunks of shells and the chunk quadruples are screened in the same way.
+
+    Args:
+        fint : function
+            fint(shls_slice) returns the AO integrals (pq|rs) of the shell
+            ranges shls_slice = (ish0, ish1, jsh0, jsh1, ksh0, ksh1, lsh0,
+            lsh1) as a 4D array.
+        q_cond : 2D array
+            Schwarz bound max sqrt((pq|pq)) of the shell pairs.
+        ijsym, klsym : bool
+            Whether the (ij| and |kl) pairs are stored in the compact
+            (lower triangular) form.
+
+    Yields:
+        The row indices (sorted) and the 2D array of the MO integrals.
+        The rows which are not generated are zero.
+    '''
+    if ao_loc is None:
+        ao_loc = numpy.arange(mo_coeffs[0].shape[0]+1)
+    blocks = []
+    for i, c in enumerate(mo_coeffs):
+        for j in range(i):
+            if iden_coeffs(c, mo_coeffs[j]):
+                blocks.append(blocks[j])
+                break
+        else:
+            blocks.append(mo_blocks(c, tol, ao_loc, blksize))
+    nmol = mo_coeffs[3].shape[1]
+    if klsym:
+        nkl_pair = nmol * (nmol+1) // 2
+    else:
+        nkl_pair = mo_coeffs[2].shape[1] * nmol
+    ij_pairs = _pair_blocks(blocks[0], blocks[1], q_cond, ijsym,
+                            mo_coeffs[1].shape[1])
+    kl_pairs = _pair_blocks(blocks[2], blocks[3], q_cond, klsym, nmol)
+    if not ij_pairs or not kl_pairs:
+        return
+    kl_max = max([x[0] for x in kl_pairs])
+
+    def sub_coeff(k, blk):
+        idx, shls = blocks[k][blk][:2]
+        return mo_coeffs[k][_shell_ao_idx(shls, ao_loc)][:,idx]
+    nao_sh = ao_loc[1:] - ao_loc[:-1]
+    nbas = nao_sh.size
+
+    def chunk_bounds(shls1, w1, shls2, w2):
+        # Schwarz bound of the pairs of shell chunks
+        seg1 = _shell_segments(shls1, nao_sh, CHUNK)
+        seg2 = _shell_segments(shls2, nao_sh, CHUNK)
+        q = w1[:,None] * q_cond[shls1[:,None],shls2] * w2
+        q = numpy.add.reduceat(q, [x[0] for x in seg1], axis=0)
+        q = numpy.add.reduceat(q, [x[0] for x in seg2], axis=1)
+        return seg1, seg2, q
+
+    for bound_ij, I, J, rows, ijmask in ij_pairs:
+        if bound_ij * kl_max < tol:
+            continue
+        kl_todo = [x for x in kl_pairs if bound_ij * x[0] >= tol]
+        # The shells and the largest weights of all the (K,L) block pairs
+        wk = numpy.zeros(nbas)
+        wl = numpy.zeros(nbas)
+        for x in kl_todo:
+            shls, w = blocks[2][x[1]][1:]
+            wk[shls] = numpy.maximum(wk[shls], w)
+            shls, w = blocks[3][x[2]][1:]
+            wl[shls] = numpy.maximum(wl[shls], w)
+        shls_k = numpy.where(wk > 0)[0]
+        shls_l = numpy.where(wl > 0)[0]
+        oi, shls_i, wi = blocks[0][I]
+        oj, shls_j, wj = blocks[1][J]
+        ci = sub_coeff(0, I)
+        cj = sub_coeff(1, J)
+        ni, nj = ci.shape[1], cj.shape[1]
+        aoi = numpy.append(0, numpy.cumsum(nao_sh[shls_i]))
+        aoj = numpy.append(0, numpy.cumsum(nao_sh[shls_j]))
+        aok = numpy.append(0, numpy.cumsum(nao_sh[shls_k]))
+        aol = numpy.append(0, numpy.cumsum(nao_sh[shls_l]))
+
+        # The AO integrals are evaluated for the chunks of shells.  The chunk
+        # quadruples below tol (by Schwarz inequality) are skipped.
+        seg_i, seg_j, q_ij = chunk_bounds(shls_i, wi, shls_j, wj)
+        seg_k, seg_l, q_kl = chunk_bounds(shls_k, wk[shls_k], shls_l, wl[shls_l])
+        kl_idx = numpy.argwhere(q_kl * bound_ij >= tol)
+        half = numpy.zeros((ni,nj,aok[-1],aol[-1]))
+        for a, b in numpy.argwhere(q_ij * q_kl.max() >= tol):
+            i0, i1 = seg_i[a]
+            j0, j1 = seg_j[b]
+            c_i = ci[aoi[i0]:aoi[i1]]
+            c_j = cj[aoj[j0]:aoj[j1]]
+            for c, d in kl_idx[q_ij[a,b] * q_kl[kl_idx[:,0],kl_idx[:,1]] >= tol]:
+                k0, k1 = seg_k[c]
+                l0, l1 = seg_l[d]
+                buf = fint((shls_i[i0], shls_i[i1-1]+1, shls_j[j0], shls_j[j1-1]+1,
+                            shls_k[k0], shls_k[k1-1]+1, shls_l[l0], shls_l[l1-1]+1))
+                half[:,:,aok[k0]:aok[k1],aol[l0]:aol[l1]] += _half_trans(buf, c_i, c_j)
+        half = half.reshape(ni*nj,aok[-1],aol[-1])
+        # AO index of the shells_k and shells_l in the (ij|rs) intermediate
+        kidx = numpy.zeros(ao_loc[-1], dtype=int)
+        kidx[_shell_ao_idx(shls_k, ao_loc)] = numpy.arange(aok[-1])
+        lidx = numpy.zeros(ao_loc[-1], dtype=int)
+        lidx[_shell_ao_idx(shls_l, ao_loc)] = numpy.arange(aol[-1])
+
+        if ijmask is not None:
+            rows = rows[ijmask]
+            half = half[ijmask]
+        nij = rows.size
+        out = numpy.zeros((nij,nkl_pair))
+        for bound_kl, K, L, cols, klmask in kl_todo:
+            ak = kidx[_shell_ao_idx(blocks[2][K][1], ao_loc)]
+            al = lidx[_shell_ao_idx(blocks[3][L][1], ao_loc)]
+            ck = sub_coeff(2, K)
+            cl = sub_coeff(3, L)
+            nk, nl = ck.shape[1], cl.shape[1]
+            t = lib.dot(half[:,ak[:,None],al].reshape(-1,al.size), cl)
+            t = t.reshape(nij,ak.size,nl).transpose(1,0,2).reshape(ak.size,-1)
+            eri = lib.dot(ck.T, t).reshape(nk,nij,nl).transpose(1,0,2)
+            eri = eri.reshape(nij,nk*nl)
+            if klmask is not None:
+                eri = eri[:,klmask]
+                cols = cols[klmask]
+            out[:,cols] = eri
+        order = numpy.argsort(rows)
+        yield rows[order], out[order]
+
 def iden_coeffs(mo1, mo2):
     return (id(mo1) == id(mo2) or
             (mo1.shape==mo2.shape and numpy.linalg.norm(mo1-mo2) < 1e-13))
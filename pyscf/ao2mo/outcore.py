@@ -2,24 +2,34 @@
 # $Id$
 # -*- coding: utf-8
 
+import os
 import time
+import atexit
+import ctypes
+import copy
 import tempfile
+import multiprocessing
 import numpy
 import h5py
 from pyscf import lib
 from pyscf.lib import logger
 from pyscf.ao2mo import _ao2mo
 from pyscf.ao2mo import incore
+from pyscf.gto.moleintor import getints4c
 
 # default ioblk_size is 256 MB
 
 IOBUF_WORDS_PREFER = 1e8 # 800 MB
 IOBLK_SIZE = 256  # MB
 IOBUF_ROW_MIN = 160
+# Max number of pending I/O requests in the asynchronous reader/writer.  Each
+# pending request holds one I/O buffer.
+IO_QUEUE_DEPTH = 2
 
 def full(mol, mo_coeff, erifile, dataname='eri_mo', tmpdir=None,
          intor='int2e_sph', aosym='s4', comp=1,
-         max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True):
+         max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True,
+         **kwargs):
     r'''Transfer arbitrary spherical AO integrals to MO integrals for given orbitals
 
     Args:
@@ -100,12 +110,15 @@ def full(mol, mo_coeff, erifile, dataname='eri_mo', tmpdir=None,
     dataset ['eri_mo', 'new'], shape (3, 100, 55)
     '''
     general(mol, (mo_coeff,)*4, erifile, dataname, tmpdir,
-            intor, aosym, comp, max_memory, ioblk_size, verbose, compact)
+            intor, aosym, comp, max_memory, ioblk_size, verbose, compact,
+            **kwargs)
     return erifile
 
 def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
             intor='int2e_sph', aosym='s4', comp=1,
-            max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True):
+            max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True,
+            io_depth=IO_QUEUE_DEPTH, screen_tol=None, nproc=1,
+            compression=None, trunc_tol=None):
     r'''For the given four sets of orbitals, transfer arbitrary spherical AO
     integrals to MO integrals on the fly.
 
@@ -159,6 +172,39 @@ def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
             returned MO integrals has (up to 4-fold) permutation symmetry.
             If it's False, the function will abandon any permutation symmetry,
             and return the "plain" MO integrals
+        io_depth : int
+            Number of I/O requests (reading the half-transformed integrals
+            and writing the MO integrals) which can be queued in the
+            background thread while the integrals are transformed.  Each
+            request holds one I/O buffer.  The depth is reduced if the
+            buffers do not fit in max_memory.
+        screen_tol : float
+            If screen_tol is given, the orbitals are transformed in blocks of
+            nearby orbitals.  For each block only the AO shells on which the
+            coefficients are larger than screen_tol are included, and the
+            blocks of (ij|kl) and the AO shell chunks below screen_tol (by
+            Schwarz inequality) are skipped.  The cost grows roughly
+            quadratically with the size of the system for localized orbitals
+            (see :mod:`pyscf.lo`).  For nproc > 1 or the integrals other than
+            int2e, the AO shells whose MO coefficients are smaller than
+            screen_tol in all four sets of orbitals are excluded instead.
+        nproc : int
+            Number of local worker processes.  If nproc > 1, the AO blocks
+            of the first half transformation and the MO ij rows of the
+            second half transformation are distributed over the workers.
+            Each worker writes the rows of eri_mo to its own shard file
+            (erifile.dataname.shardN).  The shards are presented as one
+            virtual dataset erifile[dataname].  The shard files are removed
+            when the dataset is replaced by another call of this function,
+            or at exit if erifile has been deleted.  The max_memory is shared
+            by all workers.  Each worker runs with one OpenMP thread.
+        compression : bool or str
+            Lossless compression of eri_mo ('lz4', 'zstd', 'gzip', 'lzf' or
+            True, see :func:`lib.h5filter_options`).  The dataset is chunked
+            in blocks of rows to match the row-wise access of the consumers.
+        trunc_tol : float
+            If trunc_tol is given, the MO integrals smaller than trunc_tol
+            are stored as 0.  It improves the compression ratio.
 
     Returns:
         None
@@ -212,6 +258,15 @@ def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
     nao = mo_coeffs[0].shape[0]
     assert(nao == mol.nao_nr())
 
+    screen_blocks = (screen_tol is not None and comp == 1 and nproc <= 1 and
+                     _ao2mo.ascint3(intor) in ('int2e_sph', 'int2e_cart'))
+    if screen_tol is not None and not screen_blocks:
+        mol, mo_coeffs = screen_shells(mol, mo_coeffs, screen_tol,
+                                       'cart' in intor)
+        log.debug('AO functions %d -> %d after screening MO coefficients',
+                  nao, mo_coeffs[0].shape[0])
+        nao = mo_coeffs[0].shape[0]
+
     aosym = _stand_sym_code(aosym)
     if aosym in ('s4', 's2kl'):
         nao_pair = nao * (nao+1) // 2
@@ -235,20 +290,35 @@ def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
         if h5py.is_hdf5(erifile):
             feri = h5py.File(erifile)
             if dataname in feri:
+                _remove_shards(feri[dataname])
                 del(feri[dataname])
         else:
             feri = h5py.File(erifile, 'w')
     else:
         assert(isinstance(erifile, h5py.Group))
         feri = erifile
+
+    if nproc > 1 and nij_pair > 0 and nkl_pair > 0:
+        _general_sharded(mol, mo_coeffs, feri, dataname, tmpdir, intor, aosym,
+                         comp, max_memory, ioblk_size, log, compact, io_depth,
+                         nproc, compression, trunc_tol)
+        if isinstance(erifile, str):
+            feri.close()
+        log.timer('AO->MO transformation for %s '%intor, *time_0pass)
+        return erifile
+
     if comp == 1:
+        shape = (nij_pair,nkl_pair)
         chunks = (nmoj,nmol)
-        h5d_eri = feri.create_dataset(dataname, (nij_pair,nkl_pair),
-                                      'f8', chunks=chunks)
     else:
+        shape = (comp,nij_pair,nkl_pair)
         chunks = (1,nmoj,nmol)
-        h5d_eri = feri.create_dataset(dataname, (comp,nij_pair,nkl_pair),
-                                      'f8', chunks=chunks)
+    if compression and nij_pair > 0 and nkl_pair > 0:
+        h5d_eri = feri.create_dataset(dataname, shape, 'f8',
+                                      chunks=lib.h5chunks(shape),
+                                      **lib.h5filter_options(compression))
+    else:
+        h5d_eri = feri.create_dataset(dataname, shape, 'f8', chunks=chunks)
 
     if nij_pair == 0 or nkl_pair == 0:
         if isinstance(erifile, str):
@@ -258,85 +328,270 @@ def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
     log.debug('num. MO ints = %.8g, required disk %.8g MB',
               float(nij_pair)*nkl_pair*comp, nij_pair*nkl_pair*comp*8/1e6)
 
+    if screen_blocks:
+        _general_screened(mol, mo_coeffs, h5d_eri, intor, aosym, compact,
+                          screen_tol, max_memory, log, trunc_tol)
+        if isinstance(erifile, str):
+            feri.close()
+        log.timer('AO->MO transformation for %s '%intor, *time_0pass)
+        return erifile
+
 # transform e1
     if tmpdir is None:
         tmpdir = lib.param.TMPDIR
     swapfile = tempfile.NamedTemporaryFile(dir=tmpdir)
     fswap = h5py.File(swapfile.name, 'w')
     half_e1(mol, mo_coeffs, fswap, intor, aosym, comp, max_memory, ioblk_size,
-            log, compact)
+            log, compact, io_depth=io_depth)
 
     time_1pass = log.timer('AO->MO transformation for %s 1 pass'%intor,
                            *time_0pass)
 
+    ao_loc = mol.ao_loc_nr('cart' in intor)
+    _transform_e2(fswap, h5d_eri, 0, nij_pair, mokl, klshape, aosym, klmosym,
+                  ao_loc, comp, max_memory, ioblk_size, io_depth, log,
+                  trunc_tol)
+    fswap.close()
+    if isinstance(erifile, str):
+        feri.close()
+
+    log.timer('AO->MO transformation for %s 2 pass'%intor, *time_1pass)
+    log.timer('AO->MO transformation for %s '%intor, *time_0pass)
+    return erifile
+
+
+def _transform_e2(fswap, h5d_eri, row_start, row_stop, mokl, klshape, aosym,
+                  klmosym, ao_loc, comp, max_memory, ioblk_size, io_depth, log,
+                  trunc_tol=None):
+    '''Transform the second pair of indices for the rows [row_start:row_stop]
+    of the half-transformed integrals in fswap.  The results are saved in
+    h5d_eri[row-row_start].  The integrals smaller than trunc_tol are saved
+    as 0.
+    '''
+    nao = ao_loc[-1]
+    if aosym in ('s4', 's2kl'):
+        nao_pair = nao * (nao+1) // 2
+    else:
+        nao_pair = nao * nao
+    if klmosym == 's2':
+        nkl_pair = (klshape[1]-klshape[0]) * (klshape[1]-klshape[0]+1) // 2
+    else:
+        nkl_pair = (klshape[1]-klshape[0]) * (klshape[3]-klshape[2])
+
     def load(icomp, row0, row1, buf):
-        if icomp+1 < comp:
-            icomp += 1
-        else:  # move to next row-block
-            row0, row1 = row1, min(nij_pair, row1+iobuflen)
-            icomp = 0
-        if row0 < row1:
-            _load_from_h5g(fswap['%d'%icomp], row0, row1, buf)
+        _load_from_h5g(fswap['%d'%icomp], row0, row1, buf)
 
     def save(icomp, row0, row1, buf):
+        lib.zero_small(buf[:row1-row0], trunc_tol)
         if comp == 1:
-            h5d_eri[row0:row1] = buf[:row1-row0]
+            h5d_eri[row0-row_start:row1-row_start] = buf[:row1-row0]
         else:
-            h5d_eri[icomp,row0:row1] = buf[:row1-row0]
+            h5d_eri[icomp,row0-row_start:row1-row_start] = buf[:row1-row0]
 
     ioblk_size = max(max_memory*.1, ioblk_size)
-    iobuflen = guess_e2bufsize(ioblk_size, nij_pair, max(nao_pair,nkl_pair))[0]
-    buf = numpy.empty((iobuflen,nao_pair))
-    buf_prefetch = numpy.empty_like(buf)
-    outbuf = numpy.empty((iobuflen,nkl_pair))
-    buf_write = numpy.empty_like(outbuf)
+    iobuflen = guess_e2bufsize(ioblk_size, row_stop-row_start,
+                               max(nao_pair,nkl_pair))[0]
+    mem_avail = (max_memory - lib.current_memory()[0]
+                 - iobuflen*(nao_pair+nkl_pair)*8*2/1e6)
+    io_depth = guess_io_depth(mem_avail, iobuflen*(nao_pair+nkl_pair)*8/1e6,
+                              io_depth)
+# The reading and the writing requests are pending in the same queue.  The
+# loaded blocks and the transformed blocks are held in two rings of
+# io_depth+1 buffers.
+    nbuf = io_depth + 1
+    bufs = [numpy.empty((iobuflen,nao_pair)) for i in range(nbuf)]
+    outbufs = [numpy.empty((iobuflen,nkl_pair)) for i in range(nbuf)]
 
     log.debug('step2: kl-pair (ao %d, mo %d), mem %.8g MB, ioblock %.8g MB',
               nao_pair, nkl_pair, iobuflen*nao_pair*8/1e6,
               iobuflen*nkl_pair*8/1e6)
-
-    klaoblks = len(fswap['0'])
-    ijmoblks = int(numpy.ceil(float(nij_pair)/iobuflen)) * comp
+    log.debug('step2: io_depth %d', io_depth)
+
+    tasks = [(icomp, row0, row1)
+             for row0, row1 in prange(row_start, row_stop, iobuflen)
+             for icomp in range(comp)]
+    ijmoblks = len(tasks)
+    ti0 = (time.clock(), time.time())
+    with lib.call_in_background(load, save, depth=io_depth) as (prefetch, async_write):
+        loading = [prefetch(*(tasks[k]+(bufs[k],)))
+                   for k in range(min(io_depth, ijmoblks))]
+
+        for istep, (icomp, row0, row1) in enumerate(tasks):
+            nrow = row1 - row0
+            log.debug1('step 2 [%d/%d], [%d,%d:%d], row = %d',
+                       istep+1, ijmoblks, icomp, row0, row1, nrow)
+
+            k = istep + io_depth
+            if k < ijmoblks:
+                loading.append(prefetch(*(tasks[k]+(bufs[k%nbuf],))))
+            loading[istep].join()
+            loading[istep] = None
+
+            outbuf = outbufs[istep%nbuf]
+            _ao2mo.nr_e2(bufs[istep%nbuf][:nrow], mokl, klshape, aosym, klmosym,
+                         ao_loc=ao_loc, out=outbuf)
+            async_write(icomp, row0, row1, outbuf)
+
+            ti1 = (time.clock(), time.time())
+            log.debug1('step 2 [%d/%d] CPU time: %9.2f, Wall time: %9.2f',
+                       istep+1, ijmoblks, ti1[0]-ti0[0], ti1[1]-ti0[1])
+            ti0 = ti1
+
+
+def _general_sharded(mol, mo_coeffs, feri, dataname, tmpdir, intor, aosym,
+                     comp, max_memory, ioblk_size, log, compact, io_depth,
+                     nproc, compression=None, trunc_tol=None):
+    '''Multi-process version of :func:`general`.  The AO blocks of half_e1
+    and the MO ij rows of the second half transformation are distributed over
+    nproc worker processes.  Worker N saves the rows of eri_mo in the shard
+    file erifile.dataname.shardN.  The shards are mapped to the virtual
+    dataset feri[dataname].
+    '''
+    time0 = (time.clock(), time.time())
+    nmoi = mo_coeffs[0].shape[1]
+    nmoj = mo_coeffs[1].shape[1]
+    if (compact and iden_coeffs(mo_coeffs[0], mo_coeffs[1]) and
+        aosym in ('s4', 's2ij')):
+        nij_pair = nmoi*(nmoi+1) // 2
+    else:
+        nij_pair = nmoi*nmoj
+    klmosym, nkl_pair, mokl, klshape = \
+            incore._conc_mos(mo_coeffs[2], mo_coeffs[3],
+                             compact and aosym in ('s4', 's2kl'))
     ao_loc = mol.ao_loc_nr('cart' in intor)
-    ti0 = time_1pass
-    istep = 0
-    with lib.call_in_background(load) as prefetch:
-        with lib.call_in_background(save) as async_write:
-            _load_from_h5g(fswap['0'], 0, min(nij_pair, iobuflen), buf_prefetch)
-
-            for row0, row1 in prange(0, nij_pair, iobuflen):
-                nrow = row1 - row0
-
-                for icomp in range(comp):
-                    istep += 1
-                    log.debug1('step 2 [%d/%d], [%d,%d:%d], row = %d',
-                               istep, ijmoblks, icomp, row0, row1, nrow)
-
-                    buf, buf_prefetch = buf_prefetch, buf
-                    prefetch(icomp, row0, row1, buf_prefetch)
-                    _ao2mo.nr_e2(buf[:nrow], mokl, klshape, aosym, klmosym,
-                                 ao_loc=ao_loc, out=outbuf)
-                    async_write(icomp, row0, row1, outbuf)
-                    outbuf, buf_write = buf_write, outbuf  # avoid flushing writing buffer
-
-                    ti1 = (time.clock(), time.time())
-                    log.debug1('step 2 [%d/%d] CPU time: %9.2f, Wall time: %9.2f',
-                               istep, ijmoblks, ti1[0]-ti0[0], ti1[1]-ti0[1])
-                    ti0 = ti1
-    fswap.close()
-    if isinstance(erifile, str):
-        feri.close()
+    max_memory = max_memory / nproc
+# The OpenMP runtime (libgomp) cannot start a new thread team in the forked
+# child processes if the parent has used OpenMP.  Worker processes run with
+# one thread.
+    nthreads = 1
+    log.debug('%d worker processes, %.8g MB for each worker', nproc, max_memory)
 
-    log.timer('AO->MO transformation for %s 2 pass'%intor, *time_1pass)
-    log.timer('AO->MO transformation for %s '%intor, *time_0pass)
-    return erifile
+    if tmpdir is None:
+        tmpdir = lib.param.TMPDIR
+    swapfile = tempfile.NamedTemporaryFile(dir=tmpdir)
+    swapfiles = [tempfile.NamedTemporaryFile(dir=tmpdir) for i in range(nproc)]
+    def e1_worker(ishard):
+        with lib.with_omp_threads(nthreads):
+            half_e1(mol, mo_coeffs, swapfiles[ishard].name, intor, aosym, comp,
+                    max_memory, ioblk_size, log, compact, io_depth=io_depth,
+                    shard=(ishard, nproc))
+    _run_processes(e1_worker, nproc)
+
+# Link the AO blocks of all workers to one swap file
+    with h5py.File(swapfile.name, 'w') as fswap:
+        for ishard in range(nproc):
+            with h5py.File(swapfiles[ishard].name, 'r') as f1:
+                for icomp in f1:
+                    for istep in f1[icomp]:
+                        key = '%s/%s' % (icomp, istep)
+                        fswap[key] = h5py.ExternalLink(swapfiles[ishard].name, key)
+    time1 = log.timer('AO->MO transformation for %s 1 pass'%intor, *time0)
+
+    row_ranges = list(lib.prange(0, nij_pair, -(-nij_pair//nproc)))
+    shardfiles = [_shard_filename(feri, dataname, ishard)
+                  for ishard in range(len(row_ranges))]
+    def e2_worker(ishard):
+        row0, row1 = row_ranges[ishard]
+        if comp == 1:
+            shape = (row1-row0, nkl_pair)
+        else:
+            shape = (comp, row1-row0, nkl_pair)
+        with lib.with_omp_threads(nthreads):
+            with h5py.File(swapfile.name, 'r') as fswap:
+                with h5py.File(shardfiles[ishard], 'w') as fshard:
+                    if compression:
+                        h5d_eri = fshard.create_dataset(
+                            dataname, shape, 'f8', chunks=lib.h5chunks(shape),
+                            **lib.h5filter_options(compression))
+                    else:
+                        h5d_eri = fshard.create_dataset(dataname, shape, 'f8')
+                    _transform_e2(fswap, h5d_eri, row0, row1, mokl, klshape,
+                                  aosym, klmosym, ao_loc, comp, max_memory,
+                                  ioblk_size, io_depth, log, trunc_tol)
+    _run_processes(e2_worker, len(row_ranges))
 
+    if comp == 1:
+        shape = (nij_pair, nkl_pair)
+    else:
+        shape = (comp, nij_pair, nkl_pair)
+    if hasattr(h5py, 'VirtualLayout'):
+        layout = h5py.VirtualLayout(shape, 'f8')
+        for ishard, (row0, row1) in enumerate(row_ranges):
+            vsource = h5py.VirtualSource(shardfiles[ishard], dataname,
+                                         shape=shape[:-2]+(row1-row0,nkl_pair))
+            if comp == 1:
+                layout[row0:row1] = vsource
+            else:
+                layout[:,row0:row1] = vsource
+        feri.create_virtual_dataset(dataname, layout, fillvalue=0)
+        _register_shards(feri, shardfiles)
+    else:
+        log.warn('h5py %s does not support virtual dataset. The shards of '
+                 '%s are copied to one dataset.', h5py.version.version, dataname)
+        if compression:
+            h5d_eri = feri.create_dataset(dataname, shape, 'f8',
+                                          chunks=lib.h5chunks(shape),
+                                          **lib.h5filter_options(compression))
+        else:
+            h5d_eri = feri.create_dataset(dataname, shape, 'f8')
+        for ishard, (row0, row1) in enumerate(row_ranges):
+            with h5py.File(shardfiles[ishard], 'r') as fshard:
+                if comp == 1:
+                    h5d_eri[row0:row1] = fshard[dataname]
+                else:
+                    h5d_eri[:,row0:row1] = fshard[dataname]
+            os.remove(shardfiles[ishard])
+    log.timer('AO->MO transformation for %s 2 pass'%intor, *time1)
+
+def _shard_filename(feri, dataname, ishard):
+    return '%s.%s.shard%d' % (os.path.abspath(feri.file.filename),
+                              dataname.strip('/').replace('/', '.'), ishard)
+
+# The shard files of the virtual datasets created in this process
+_SHARD_FILES = {}
+def _register_shards(feri, shardfiles):
+    if not _SHARD_FILES:
+        atexit.register(_cleanup_shards)
+    erifile = os.path.abspath(feri.file.filename)
+    _SHARD_FILES.setdefault(erifile, set()).update(shardfiles)
+
+def _remove_shards(h5d):
+    '''Remove the shard files of the virtual dataset h5d'''
+    if isinstance(h5d, h5py.Dataset) and getattr(h5d, 'is_virtual', False):
+        erifile = os.path.abspath(h5d.file.filename)
+        for vs in h5d.virtual_sources():
+            shardfile = os.path.join(os.path.dirname(erifile), vs.file_name)
+            if os.path.isfile(shardfile):
+                os.remove(shardfile)
+            _SHARD_FILES.get(erifile, set()).discard(shardfile)
+
+def _cleanup_shards():
+    '''At exit, remove the shard files whose erifile no longer exists (e.g.
+    the erifile of a NamedTemporaryFile).'''
+    for erifile, shardfiles in _SHARD_FILES.items():
+        if not os.path.isfile(erifile):
+            for shardfile in shardfiles:
+                if os.path.isfile(shardfile):
+                    os.remove(shardfile)
+
+def _run_processes(fn, nproc):
+    '''Call fn(0), fn(1), ..., fn(nproc-1) in nproc forked processes'''
+    procs = [multiprocessing.Process(target=fn, args=(i,))
+             for i in range(nproc)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    for i, p in enumerate(procs):
+        if p.exitcode != 0:
+            raise RuntimeError('ao2mo worker process %d failed (exitcode %s)'
+                               % (i, p.exitcode))
 
 # swapfile will be overwritten if exists.
 def half_e1(mol, mo_coeffs, swapfile,
             intor='int2e_sph', aosym='s4', comp=1,
             max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True,
-            ao2mopt=None):
+            ao2mopt=None, io_depth=IO_QUEUE_DEPTH, shard=None):
     r'''Half transform arbitrary spherical AO integrals to MO integrals
     for the given two sets of orbitals
 
@@ -383,6 +638,14 @@ def half_e1(mol, mo_coeffs, swapfile,
             and return the "plain" MO integrals
         ao2mopt : :class:`AO2MOpt` object
             Precomputed data to improve perfomance
+        io_depth : int
+            Number of the half-transformed blocks which can be queued in the
+            background writer thread.  It is reduced if the buffers do not
+            fit in max_memory.
+        shard : (int, int)
+            (ishard, nshard).  Only the AO blocks istep with
+            istep % nshard == ishard are computed and saved in swapfile.
+            It is used by the multi-process mode of :func:`general`.
 
     Returns:
         None
@@ -438,19 +701,30 @@ def half_e1(mol, mo_coeffs, swapfile,
             _transpose_to_h5g(fswap, '%d/%d'%(icomp,istep), iobuf[icomp],
                               e2buflen, None)
 
+# Two iobufs (the one being filled and the one being written) are counted in
+# guess_e1bufsize.  A deeper writing queue needs one more iobuf per level.
+    iobuf_size = comp*e1buflen*nij_pair*8/1e6
+    mem_avail = (max_memory - lib.current_memory()[0]
+                 - comp*e1buflen*nao_pair*8/1e6 - iobuf_size*2)
+    io_depth = guess_io_depth(mem_avail, iobuf_size, io_depth)
+    log.debug1('step1: io_depth %d', io_depth)
+
     # transform e1
     ti0 = log.timer('Initializing ao2mo.outcore.half_e1', *time0)
-    with lib.call_in_background(save) as async_write:
+    with lib.call_in_background(save, depth=io_depth) as async_write:
         buf1 = numpy.empty((comp*e1buflen,nao_pair))
-        buf2 = numpy.empty((comp*e1buflen,nij_pair))
-        buf_write = numpy.empty_like(buf2)
+        iobufs = [numpy.empty((comp*e1buflen,nij_pair))
+                  for i in range(io_depth+1)]
         fill = _ao2mo.nr_e1fill
         f_e1 = _ao2mo.nr_e1
         for istep,sh_range in enumerate(shranges):
+            if shard is not None and istep % shard[1] != shard[0]:
+                continue
             log.debug1('step 1 [%d/%d], AO [%d:%d], len(buf) = %d', \
                        istep+1, nstep, *(sh_range[:3]))
             buflen = sh_range[2]
-            iobuf = numpy.ndarray((comp,buflen,nij_pair), buffer=buf2)
+            iobuf = numpy.ndarray((comp,buflen,nij_pair),
+                                  buffer=iobufs[istep%(io_depth+1)])
             nmic = len(sh_range[3])
             p1 = 0
             for imic, aoshs in enumerate(sh_range[3]):
@@ -464,7 +738,6 @@ def half_e1(mol, mo_coeffs, swapfile,
             ti0 = log.timer_debug1('gen AO/transform MO [%d/%d]'%(istep+1,nstep), *ti0)
 
             async_write(istep, iobuf)
-            buf2, buf_write = buf_write, buf2
 
     if isinstance(swapfile, str):
         fswap.close()
@@ -582,7 +855,8 @@ def full_iofree(mol, mo_coeff, intor='int2e_sph', aosym='s4', comp=1,
         return eri
 
 def general_iofree(mol, mo_coeffs, intor='int2e_sph', aosym='s4', comp=1,
-                   max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True):
+                   max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True,
+                   screen_tol=None):
     r'''For the given four sets of orbitals, transfer arbitrary spherical AO
     integrals to MO integrals on the fly.  This function is a wrap for
     :func:`ao2mo.outcore.general`.  It's not really IO free.  The returned MO
@@ -621,6 +895,9 @@ def general_iofree(mol, mo_coeffs, intor='int2e_sph', aosym='s4', comp=1,
             returned MO integrals has (up to 4-fold) permutation symmetry.
             If it's False, the function will abandon any permutation symmetry,
             and return the "plain" MO integrals
+        screen_tol : float
+            Threshold to screen the MO coefficients by AO shells.  See
+            :func:`general`
 
     Returns:
         2D/3D MO-integral array.  They may or may not have the permutation
@@ -663,7 +940,7 @@ def general_iofree(mol, mo_coeffs, intor='int2e_sph', aosym='s4', comp=1,
         general(mol, mo_coeffs, feri, dataname='eri_mo',
                 intor=intor, aosym=aosym, comp=comp,
                 max_memory=max_memory, ioblk_size=ioblk_size,
-                verbose=verbose, compact=compact)
+                verbose=verbose, compact=compact, screen_tol=screen_tol)
         eri = numpy.asarray(feri['eri_mo'])
         for key in feri.keys():
             del(feri[key])
@@ -690,6 +967,81 @@ def guess_e1bufsize(max_memory, ioblk_size, nij_pair, nao_pair, comp):
     e1buflen = max(e1buflen, IOBUF_ROW_MIN)
     return e1buflen, mem_words, iobuf_words, ioblk_words
 
+def screen_shells(mol, mo_coeffs, tol, cart=False):
+    '''Remove the AO shells whose coefficients are smaller than tol in all
+    the given orbitals.  Return the Mole object of the remaining shells and the
+    corresponding rows of the orbital coefficients.
+    '''
+    ao_loc = mol.ao_loc_nr(cart)
+    aoidx = incore.screen_ao(mo_coeffs, tol, ao_loc)
+    sub_mos = incore.sub_mo_coeffs(mo_coeffs, aoidx)
+    if aoidx.size == ao_loc[-1] or aoidx.size == 0 or sub_mos is None:
+        return mol, mo_coeffs
+
+    nao_sh = ao_loc[1:] - ao_loc[:-1]
+    shls = numpy.unique(numpy.repeat(numpy.arange(mol.nbas), nao_sh)[aoidx])
+    pmol = copy.copy(mol)
+    pmol._bas = numpy.asarray(mol._bas)[shls]
+    return pmol, sub_mos
+
+def _general_screened(mol, mo_coeffs, h5d_eri, intor, aosym, compact, tol,
+                      max_memory, log, trunc_tol=None):
+    '''Transform the 2e integrals for blocks of nearby orbitals.  The AO
+    integrals of each pair of orbital blocks are evaluated on the shells
+    which the orbitals of the blocks have coefficients larger than tol.  The
+    block quadruples and the shell chunks below tol (by Schwarz inequality)
+    are skipped.  See :func:`incore.screened_rows`.
+    '''
+    time0 = (time.clock(), time.time())
+    intor = _ao2mo.ascint3(intor)
+    cart = 'cart' in intor
+    ao_loc = mol.ao_loc_nr(cart)
+    nbas = mol.nbas
+    ao2mopt = _ao2mo.AO2MOpt(mol, intor, 'CVHFnr_schwarz_cond',
+                             'CVHFsetnr_direct_scf')
+    q_cond = numpy.ctypeslib.as_array((ctypes.c_double*(nbas*nbas)).from_address(
+            ao2mopt._this.contents.q_cond))
+    q_cond = q_cond.reshape(nbas,nbas).copy()
+    cintopt = ao2mopt._cintopt
+
+    def fint(shls_slice):
+        i0, i1, j0, j1, k0, k1, l0, l1 = shls_slice
+        eri = getints4c(intor, mol._atm, mol._bas, mol._env,
+                        shls_slice, cintopt=cintopt)
+        return eri.reshape(ao_loc[i1]-ao_loc[i0], ao_loc[j1]-ao_loc[j0],
+                           ao_loc[k1]-ao_loc[k0], ao_loc[l1]-ao_loc[l0])
+
+    ijsym = (compact and incore.iden_coeffs(mo_coeffs[0], mo_coeffs[1]) and
+             aosym in ('s4', 's2ij'))
+    klsym = (compact and incore.iden_coeffs(mo_coeffs[2], mo_coeffs[3]) and
+             aosym in ('s4', 's2kl'))
+    nkl_pair = h5d_eri.shape[1]
+    # Each block pair holds blksize**2*(nkl_pair+nao**2) words for the output
+    # and the half-transformed intermediates
+    nao = ao_loc[-1]
+    blksize = int(numpy.sqrt(max(0, max_memory-lib.current_memory()[0])*.5e6/8
+                             / (nkl_pair+nao**2)))
+    blksize = max(1, min(incore.BLOCK, blksize))
+    nrow = 0
+    for rows, buf in incore.screened_rows(fint, mo_coeffs, q_cond, tol, ijsym,
+                                          klsym, ao_loc, blksize):
+        lib.zero_small(buf, trunc_tol)
+        h5d_eri[rows] = buf
+        nrow += rows.size
+    log.debug('%d of %d (ij| rows computed after screening',
+              nrow, h5d_eri.shape[0])
+    log.timer('AO->MO transformation for screened orbital blocks', *time0)
+
+def guess_io_depth(mem_avail, iobuf_size, depth=IO_QUEUE_DEPTH):
+    '''The number of I/O requests allowed to be pending in the background
+    thread.  Each level of the queue beyond the first one holds one more I/O
+    buffer (iobuf_size MB) which should fit in mem_avail (MB).
+    '''
+    if depth is None or depth < 1:
+        return 1
+    nextra = int(max(0, mem_avail) // max(iobuf_size, 1e-6))
+    return max(1, min(depth, nextra+1))
+
 def guess_e2bufsize(ioblk_size, nrows, ncols):
     e2buflen = int(min(ioblk_size*1e6/8/ncols, nrows))
     e2buflen = max(e2buflen//IOBUF_ROW_MIN, 1) * IOBUF_ROW_MIN
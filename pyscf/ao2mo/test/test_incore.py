@@ -44,6 +44,52 @@ class KnowValues(unittest.TestCase):
         eri1 = eri1.reshape(2,2,3,3)
         self.assertTrue(numpy.allclose(eri1, eriref[:2,1:3,:3,2:5]))
 
+    def test_screen_tol(self):
+        numpy.random.seed(2)
+        ao_loc = mol.ao_loc_nr()
+        mo1 = numpy.random.random((nao,4))
+        mo2 = numpy.random.random((nao,3))
+        # orbitals localized on O and the first H
+        mo1[ao_loc[mol.nbas-3]:] = 0
+        mo2[ao_loc[mol.nbas-3]:] = 1e-12
+        eri = mol.intor('int2e_sph', aosym='s8')
+        for eri_ao in (eri, ao2mo.restore(4, eri, nao)):
+            for mos in ((mo1,mo1,mo1,mo1), (mo1,mo2,mo2,mo1)):
+                eriref = ao2mo.incore.general(eri_ao, mos)
+                eri1 = ao2mo.incore.general(eri_ao, mos, screen_tol=1e-10)
+                self.assertEqual(eri1.shape, eriref.shape)
+                self.assertTrue(numpy.allclose(eri1, eriref))
+                eri1 = ao2mo.incore.general(eri_ao, mos, screen_tol=1e-10,
+                                            ao_loc=ao_loc)
+                self.assertTrue(numpy.allclose(eri1, eriref))
+        aoidx = ao2mo.incore.screen_ao((mo1,mo2), 1e-10, ao_loc)
+        self.assertEqual(aoidx.size, ao_loc[mol.nbas-3])
+
+    def test_screen_local_orbitals(self):
+        from pyscf import lo
+        hchain = gto.M(atom=[['H', (0, 0, i//2*2.5+i%2*.74)] for i in range(12)],
+                       basis='6-31g', unit='A', verbose=0)
+        c = lo.orth_ao(hchain, 'meta_lowdin')[:,::2]
+        c[abs(c) < 1e-3] = 0
+        ao_loc = hchain.ao_loc_nr()
+        blocks = ao2mo.incore.mo_blocks(c, 1e-9, ao_loc, 2)
+        self.assertTrue(all([b[1].size < hchain.nbas for b in blocks]))
+        eri = hchain.intor('int2e_sph', aosym='s8')
+        c1 = c[:,::-1]
+        for mos in ((c,c,c,c), (c,c1,c1,c)):
+            eriref = ao2mo.incore.general(eri, mos)
+            block = ao2mo.incore.BLOCK
+            try:
+                ao2mo.incore.BLOCK = 2
+                self.assertEqual(len(ao2mo.incore.mo_blocks(c, 1e-9, ao_loc)),
+                                 (c.shape[1]+1)//2)
+                eri1 = ao2mo.incore.general(eri, mos, screen_tol=1e-9,
+                                            ao_loc=ao_loc)
+            finally:
+                ao2mo.incore.BLOCK = block
+            self.assertEqual(eri1.shape, eriref.shape)
+            self.assertAlmostEqual(abs(eri1-eriref).max(), 0, 8)
+
 
 if __name__ == '__main__':
     print('Full Tests for incore')
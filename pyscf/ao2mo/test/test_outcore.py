@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import os
+import glob
 import ctypes
 import unittest
 from functools import reduce
@@ -116,6 +118,98 @@ class KnowValues(unittest.TestCase):
         eri1 = eri1.reshape(nao,nao,nao,nao)
         self.assertTrue(numpy.allclose(eri1, eriref))
 
+    def test_io_depth(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        eriref = ao2mo.incore.full(mol.intor('int2e_sph', aosym='s8'), mo)
+        for io_depth in (1, 3):
+            ao2mo.outcore.general(mol, (mo,)*4, ftmp.name, max_memory=4000,
+                                  ioblk_size=.5, io_depth=io_depth)
+            with h5py.File(ftmp.name, 'r') as feri:
+                self.assertTrue(numpy.allclose(feri['eri_mo'], eriref))
+
+        self.assertEqual(ao2mo.outcore.guess_io_depth(1000, 100, 4), 4)
+        self.assertEqual(ao2mo.outcore.guess_io_depth(150, 100, 4), 2)
+        self.assertEqual(ao2mo.outcore.guess_io_depth(-10, 100, 4), 1)
+
+    def test_screen_tol(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        ao_loc = mol.ao_loc_nr()
+        mo1 = mo[:,:5].copy()
+        mo1[ao_loc[mol.nbas-3]:] = 0
+        mo2 = mo[:,5:9].copy()
+        mo2[ao_loc[mol.nbas-3]:] = 0
+        eri = mol.intor('int2e_sph', aosym='s8')
+        for mos in ((mo1,mo1,mo1,mo1), (mo1,mo2,mo1,mo2)):
+            eriref = ao2mo.incore.general(eri, mos)
+            ao2mo.outcore.general(mol, mos, ftmp.name, max_memory=10,
+                                  ioblk_size=.5, screen_tol=1e-12)
+            with h5py.File(ftmp.name, 'r') as feri:
+                self.assertTrue(numpy.allclose(feri['eri_mo'], eriref))
+            eri1 = ao2mo.general(mol, mos, screen_tol=1e-12)
+            self.assertTrue(numpy.allclose(eri1, eriref))
+
+        pmol, mos = ao2mo.outcore.screen_shells(mol, (mo1,mo2), 1e-12)
+        self.assertEqual(pmol.nbas, mol.nbas-3)
+        self.assertEqual(mos[0].shape, (pmol.nao_nr(), 5))
+
+    def test_screen_local_orbitals(self):
+        from pyscf import lo
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        hchain = gto.M(atom=[['H', (0, 0, i//2*2.5+i%2*.74)] for i in range(12)],
+                       basis='6-31g', unit='A', verbose=0)
+        c = lo.orth_ao(hchain, 'meta_lowdin')[:,::2]
+        c[abs(c) < 1e-3] = 0
+        eri = hchain.intor('int2e_sph', aosym='s8')
+        c1 = c[:,::-1]
+        for mos in ((c,c,c,c), (c,c1,c1,c)):
+            eriref = ao2mo.incore.general(eri, mos)
+            block = ao2mo.incore.BLOCK
+            try:
+                ao2mo.incore.BLOCK = 2
+                ao2mo.outcore.general(hchain, mos, ftmp.name, screen_tol=1e-9)
+            finally:
+                ao2mo.incore.BLOCK = block
+            with h5py.File(ftmp.name, 'r') as feri:
+                self.assertAlmostEqual(abs(feri['eri_mo'][:]-eriref).max(), 0, 8)
+
+    def test_nproc(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        eri = mol.intor('int2e_sph', aosym='s8')
+        mos = (mo[:,:5], mo[:,:7], mo[:,:5], mo[:,:7])
+        eriref = ao2mo.incore.general(eri, mos)
+        ao2mo.outcore.general(mol, mos, ftmp.name, max_memory=10,
+                              ioblk_size=.5, nproc=2)
+        with h5py.File(ftmp.name, 'r') as feri:
+            self.assertTrue(numpy.allclose(feri['eri_mo'], eriref))
+        self.assertEqual(len(glob.glob(ftmp.name+'.eri_mo.shard*')), 2)
+        eriref = ao2mo.incore.full(eri, mo)
+        ao2mo.outcore.full(mol, mo, ftmp.name, max_memory=10,
+                           ioblk_size=.5, nproc=3)
+        with h5py.File(ftmp.name, 'r') as feri:
+            self.assertTrue(numpy.allclose(feri['eri_mo'], eriref))
+        self.assertEqual(len(glob.glob(ftmp.name+'.eri_mo.shard*')), 3)
+        # The shards of the replaced dataset are removed
+        ao2mo.outcore.full(mol, mo, ftmp.name, max_memory=10,
+                           ioblk_size=.5, nproc=2)
+        self.assertEqual(len(glob.glob(ftmp.name+'.eri_mo.shard*')), 2)
+        # The shards of the deleted erifile are removed at exit
+        filename = ftmp.name
+        ftmp.close()
+        ao2mo.outcore._cleanup_shards()
+        self.assertEqual(glob.glob(filename+'.eri_mo.shard*'), [])
+
+    def test_compression(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        eri = mol.intor('int2e_sph', aosym='s8')
+        eriref = ao2mo.incore.full(eri, mo)
+        ao2mo.outcore.full(mol, mo, ftmp.name, max_memory=10, ioblk_size=.5,
+                           compression='gzip', trunc_tol=1e-10)
+        with h5py.File(ftmp.name, 'r') as feri:
+            self.assertEqual(feri['eri_mo'].compression, 'gzip')
+            self.assertTrue(abs(feri['eri_mo'][:] - eriref).max() < 1e-10)
+        self.assertEqual(lib.h5chunks((20,100,5050)), (1,12,5050))
+        self.assertEqual(lib.h5chunks((10,10)), (10,10))
+
     def test_group_segs(self):
         numpy.random.seed(1)
         segs = numpy.asarray(numpy.random.random(40)*50, dtype=int)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import copy
+from functools import reduce
 import numpy
 from pyscf import lib
 
@@ -100,3 +102,70 @@ def spin2spatial(tx, orbspin):
         t2bb = t2bb.reshape(nocc_b,nocc_b,nvir_b,nvir_b)
         t2ab = t2ab.reshape(nocc_a,nocc_b,nvir_a,nvir_b)
         return t2aa,t2ab,t2bb
+
+
+def fno(method, thresh=1e-6, pct_occ=None, nvir_act=None, density_fit=False):
+    '''Frozen natural orbital (FNO) approximation for RCCSD and RCISD.  The
+    virtual space is truncated with the MP2 natural orbitals (see
+    :func:`mp.mp2.make_fno` for thresh, pct_occ and nvir_act).  The MP2
+    energy of the discarded virtual space (delta_emp2) is added to e_corr
+    after kernel.  CCSD(T) is computed in the truncated space.
+
+    Kwargs:
+        density_fit : bool
+            Whether to use DF-MP2 to generate the natural orbitals and the
+            MP2 correction.  DF-MP2 is always used if the underlying SCF
+            object is density fitted.
+
+    Returns:
+        A copy of method in the FNO space
+
+    Examples:
+
+    >>> mycc = cc.CCSD(mf).fno(thresh=1e-5).run()
+    >>> mycc.ccsd_t()
+    '''
+    from pyscf import scf
+    from pyscf.mp import mp2, dfmp2
+    mf = method._scf
+    if isinstance(mf, scf.uhf.UHF):
+        raise NotImplementedError('FNO for UHF based methods')
+    if density_fit or (hasattr(mf, 'with_df') and mf.with_df):
+        MP2 = dfmp2.MP2
+        mp_kwargs = {}
+    else:
+        MP2 = mp2.MP2
+        mp_kwargs = {'with_t2': False}
+
+    pt = MP2(mf, method.frozen, method.mo_coeff, method.mo_occ)
+    pt.verbose = method.verbose
+    pt.max_memory = method.max_memory
+    emp2 = pt.kernel(**mp_kwargs)[0]
+    frozen, no_coeff = pt.make_fno(thresh, pct_occ, nvir_act)
+
+# MP2 energy in the truncated space with the semi-canonical orbital energies
+    x = reduce(numpy.dot, (method.mo_coeff.T, mf.get_ovlp(), no_coeff))
+    pt_fno = MP2(mf, frozen, no_coeff, method.mo_occ)
+    pt_fno.verbose = 0
+    pt_fno.max_memory = method.max_memory
+    if MP2 is dfmp2.MP2:
+        pt_fno.with_df = pt.with_df
+    pt_fno.mo_energy = numpy.einsum('ki,k,ki->i', x, pt.mo_energy, x)
+    emp2_fno = pt_fno.kernel(**mp_kwargs)[0]
+
+    class FNO(method.__class__):
+        def kernel(self, *args, **kwargs):
+            res = method.__class__.kernel(self, *args, **kwargs)
+            self.e_corr = self.e_corr + self.delta_emp2
+            lib.logger.note(self, 'FNO MP2 correction = %.15g  E_corr = %.16g',
+                            self.delta_emp2, numpy.asarray(self.e_corr))
+            return (self.e_corr,) + tuple(res[1:])
+
+    obj = copy.copy(method)
+    obj.__class__ = FNO
+    obj.frozen = frozen
+    obj.mo_coeff = no_coeff
+    obj.delta_emp2 = emp2 - emp2_fno
+    obj._keys = obj._keys.union(['delta_emp2'])
+    lib.logger.info(method, 'FNO MP2 correction = %.15g', obj.delta_emp2)
+    return obj
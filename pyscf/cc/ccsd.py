@@ -44,20 +44,28 @@ def kernel(mycc, eris, t1=None, t2=None, max_cycle=50, tol=1e-8, tolnormt=1e-6,
         adiis = lambda t1,t2,*args: (t1,t2)
 
     conv = False
-    for istep in range(max_cycle):
-        t1new, t2new = mycc.update_amps(t1, t2, eris)
-        normt = numpy.linalg.norm(t1new-t1) + numpy.linalg.norm(t2new-t2)
-        t1, t2 = t1new, t2new
-        t1new = t2new = None
-        if mycc.diis:
-            t1, t2 = mycc.diis(t1, t2, istep, normt, eccsd-eold, adiis)
-        eold, eccsd = eccsd, mycc.energy(t1, t2, eris)
-        log.info('cycle = %d  E(CCSD) = %.15g  dE = %.9g  norm(t1,t2) = %.6g',
-                 istep+1, eccsd, eccsd - eold, normt)
-        cput1 = log.timer('CCSD iter', *cput1)
-        if abs(eccsd-eold) < tol and normt < tolnormt:
-            conv = True
-            break
+    mycc._single_prec = mycc.mixed_precision
+    try:
+        for istep in range(max_cycle):
+            t1new, t2new = mycc.update_amps(t1, t2, eris)
+            normt = numpy.linalg.norm(t1new-t1) + numpy.linalg.norm(t2new-t2)
+            t1, t2 = t1new, t2new
+            t1new = t2new = None
+            if mycc.diis:
+                t1, t2 = mycc.diis(t1, t2, istep, normt, eccsd-eold, adiis)
+            eold, eccsd = eccsd, mycc.energy(t1, t2, eris)
+            log.info('cycle = %d  E(CCSD) = %.15g  dE = %.9g  norm(t1,t2) = %.6g',
+                     istep+1, eccsd, eccsd - eold, normt)
+            cput1 = log.timer('CCSD iter', *cput1)
+            if mycc._single_prec:
+                if normt < mycc.mixed_precision_tol:
+                    log.info('Switch to double precision')
+                    mycc._single_prec = False
+            elif abs(eccsd-eold) < tol and normt < tolnormt:
+                conv = True
+                break
+    finally:
+        mycc._single_prec = False
     log.timer('CCSD', *cput0)
     return conv, eccsd, t1, t2
 
@@ -388,6 +396,16 @@ def add_wvvVV_(mycc, t1, t2, eris, t2new_tril, with_ovvv=True):
 
     def contract_tril_(t2new_tril, tau, eri, a0, a):
         nvir = tau.shape[-1]
+        if tau.dtype == numpy.float32:
+            tau = tau.reshape(-1,nvir*nvir)
+            eri = eri.reshape(-1,nvir)[:(a+1-a0)*nvir]
+            eri = numpy.asarray(eri, dtype=numpy.float32)
+            out = t2new_tril.reshape(-1,nvir*nvir)
+            out[:,a*nvir:(a+1)*nvir] += numpy.dot(tau[:,a0*nvir:(a+1)*nvir], eri)
+            if a > a0:
+                out[:,a0*nvir:a*nvir] += numpy.dot(tau[:,a*nvir:(a+1)*nvir],
+                                                   eri[:(a-a0)*nvir].T)
+            return
         #: t2new[i,:i+1, a] += numpy.einsum('xcd,cdb->xb', tau[:,a0:a+1], eri)
         _dgemm('N', 'N', nocc*(nocc+1)//2, nvir, (a+1-a0)*nvir,
                tau.reshape(-1,nvir*nvir), eri.reshape(-1,nvir),
@@ -433,8 +451,16 @@ def add_wvvVV_(mycc, t1, t2, eris, t2new_tril, with_ovvv=True):
         loadbuf = numpy.empty((dmax,dmax,nao,nao))
         fint = gto.moleintor.getints4c
 
+        skip = _ladder_screen(mol, ao2mopt, tau, sh_ranges,
+                              mycc.direct_screen_tol)
+        logger.debug(mycc, 'AO-vvvv: %d of %d shell blocks skipped by screening',
+                     numpy.count_nonzero(numpy.tril(skip)),
+                     len(sh_ranges)*(len(sh_ranges)+1)//2)
+
         for ip, (ish0, ish1, ni) in enumerate(sh_ranges):
-            for jsh0, jsh1, nj in sh_ranges[:ip]:
+            for jp, (jsh0, jsh1, nj) in enumerate(sh_ranges[:ip]):
+                if skip[ip,jp]:
+                    continue
                 eri = fint(intor, mol._atm, mol._bas, mol._env,
                            shls_slice=(ish0,ish1,jsh0,jsh1), aosym='s2kl',
                            ao_loc=ao_loc, cintopt=ao2mopt._cintopt, out=eribuf)
@@ -448,6 +474,8 @@ def add_wvvVV_(mycc, t1, t2, eris, t2new_tril, with_ovvv=True):
                 contract_rec_(outbuf, tau, tmp, i0, i1, j0, j1)
                 time0 = logger.timer_debug1(mycc, 'AO-vvvv [%d:%d,%d:%d]' %
                                             (ish0,ish1,jsh0,jsh1), *time0)
+            if skip[ip,ip]:
+                continue
             eri = fint(intor, mol._atm, mol._bas, mol._env,
                        shls_slice=(ish0,ish1,ish0,ish1), aosym='s4',
                        ao_loc=ao_loc, cintopt=ao2mopt._cintopt, out=eribuf)
@@ -485,6 +513,8 @@ def add_wvvVV_(mycc, t1, t2, eris, t2new_tril, with_ovvv=True):
             p0, p1 = p1, p1 + i+1
             tau[p0:p1] = numpy.einsum('a,jb->jab', t1[i], t1[:i+1])
             tau[p0:p1] += t2[i,:i+1]
+        if mycc._single_prec:
+            tau = tau.astype(numpy.float32)
         time0 = logger.timer_debug1(mycc, 'vvvv-tau', *time0)
         max_memory = max(2000, mycc.max_memory - lib.current_memory()[0])
         blksize = int(min(nvir, max(4, max_memory*.95e6/8/(nvir**3*2))))
@@ -621,6 +651,33 @@ class CCSD(lib.StreamObject):
             The step to start DIIS.  Default is 0.
         direct : bool
             AO-direct CCSD. Default is False.
+        direct_screen_tol : float
+            In AO-direct CCSD, the AO shell blocks of the particle-particle
+            ladder are skipped if their Schwarz bound weighted by the
+            back-transformed tau amplitudes is smaller than
+            direct_screen_tol.  Default is 1e-13.
+        eris_compression : bool or str
+            Lossless compression ('lz4', 'zstd', 'gzip', 'lzf' or True, see
+            :func:`lib.h5filter_options`) of the ovvv and vvvv integrals
+            when they are stored on disk.  Default is None (no compression).
+        eris_trunc_tol : float
+            If given, the ovvv and vvvv integrals smaller than eris_trunc_tol
+            are stored on disk as 0.  Default is None.
+        mixed_precision : bool
+            Whether to evaluate the particle-particle ladder term of the MO
+            vvvv integrals in single precision in the early iterations.  The
+            iterations switch to double precision when norm(t1,t2) is
+            smaller than mixed_precision_tol.  The AO-direct ladder
+            (direct=True) is always evaluated in double precision.  Default
+            is False.
+        mixed_precision_tol : float
+            Default is 1e-4.
+        keep_eris : bool
+            Whether to keep the MO integrals in self.eris after kernel.  They
+            are reused by solve_lambda, ccsd_t and the nuclear gradients (see
+            get_eris) and are released when the molecule, the SCF object or
+            the orbitals change.  The kept integrals include the vvvv block.
+            Default is False.
         frozen : int or list
             If integer is given, the inner-most orbitals are frozen from CC
             amplitudes.  Given the orbital indices (0-based) in a list, both
@@ -645,6 +702,8 @@ class CCSD(lib.StreamObject):
             T amplitudes t1[i,a], t2[i,j,a,b]  (i,j in occ, a,b in virt)
         l1, l2 : 
             Lambda amplitudes l1[i,a], l2[i,j,a,b]  (i,j in occ, a,b in virt)
+        eris :
+            MO integrals of the last calculation if keep_eris is set.
     '''
     def __init__(self, mf, frozen=0, mo_coeff=None, mo_occ=None):
         from pyscf import gto
@@ -671,6 +730,12 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
 # FIXME: Should we avoid DIIS starting early?
         self.diis_start_energy_diff = 1e9
         self.direct = False
+        self.direct_screen_tol = 1e-13
+        self.eris_compression = None
+        self.eris_trunc_tol = None
+        self.mixed_precision = False
+        self.mixed_precision_tol = 1e-4
+        self.keep_eris = False
 
         self.frozen = frozen
 
@@ -686,8 +751,10 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         self.t2 = None
         self.l1 = None
         self.l2 = None
+        self.eris = None
         self._nocc = None
         self._nmo = None
+        self._single_prec = False
         self.chkfile = None
 
         self._keys = set(self.__dict__.keys())
@@ -724,6 +791,9 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
             log.info('frozen orbitals %s', str(self.frozen))
         log.info('max_cycle = %d', self.max_cycle)
         log.info('direct = %d', self.direct)
+        if self.mixed_precision:
+            log.info('mixed_precision = %s, mixed_precision_tol = %g',
+                     self.mixed_precision, self.mixed_precision_tol)
         log.info('conv_tol = %g', self.conv_tol)
         log.info('conv_tol_normt = %s', self.conv_tol_normt)
         log.info('diis_space = %d', self.diis_space)
@@ -769,7 +839,7 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         self.dump_flags()
 
         if eris is None:
-            eris = self.ao2mo(self.mo_coeff)
+            eris = self.get_eris()
         self.converged, self.e_corr, self.t1, self.t2 = \
                 kernel(self, eris, t1, t2, max_cycle=self.max_cycle,
                        tol=self.conv_tol, tolnormt=self.conv_tol_normt,
@@ -787,13 +857,17 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
 
     as_scanner = as_scanner
 
+    def fno(self, thresh=1e-6, pct_occ=None, nvir_act=None, density_fit=False):
+        from pyscf.cc import addons
+        return addons.fno(self, thresh, pct_occ, nvir_act, density_fit)
+
 
     def solve_lambda(self, t1=None, t2=None, l1=None, l2=None,
                      eris=None):
         from pyscf.cc import ccsd_lambda
         if t1 is None: t1 = self.t1
         if t2 is None: t2 = self.t2
-        if eris is None: eris = self.ao2mo(self.mo_coeff)
+        if eris is None: eris = self.get_eris()
         self.converged_lambda, self.l1, self.l2 = \
                 ccsd_lambda.kernel(self, eris, t1, t2, l1, l2,
                                    max_cycle=self.max_cycle,
@@ -801,12 +875,12 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
                                    verbose=self.verbose)
         return self.l1, self.l2
 
-    def ccsd_t(self, t1=None, t2=None, eris=None):
+    def ccsd_t(self, t1=None, t2=None, eris=None, nproc=1, progress_file=None):
         from pyscf.cc import ccsd_t
         if t1 is None: t1 = self.t1
         if t2 is None: t2 = self.t2
-        if eris is None: eris = self.ao2mo(self.mo_coeff)
-        return ccsd_t.kernel(self, eris, t1, t2, self.verbose)
+        if eris is None: eris = self.get_eris()
+        return ccsd_t.kernel(self, eris, t1, t2, self.verbose, nproc, progress_file)
 
     def make_rdm1(self, t1=None, t2=None, l1=None, l2=None):
         '''Un-relaxed 1-particle density matrix in MO space'''
@@ -855,6 +929,26 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         # return eris
         return _ERIS(self, mo_coeff)
 
+    def get_eris(self, mo_coeff=None):
+        '''MO integrals for the CCSD, lambda, (T) and gradient stages.  If
+        keep_eris is set, the integrals held in self.eris (including the HDF5
+        datasets of the outcore transformation) are returned when they were
+        generated for the same mol, SCF object and orbitals.  Otherwise the
+        integrals are transformed by self.ao2mo (and saved in self.eris if
+        keep_eris is set).
+        '''
+        if mo_coeff is None:
+            mo_coeff = self.mo_coeff
+        if not self.keep_eris:
+            return self.ao2mo(mo_coeff)
+        if not _eris_match(self, self.eris, mo_coeff):
+            self.eris = None  # release the old integrals first
+            eris = self.ao2mo(mo_coeff)
+            eris._mol = self.mol
+            eris._scf = self._scf
+            self.eris = eris
+        return self.eris
+
     add_wvvVV_ = add_wvvVV_
 
     def add_wvvVV(self, t1, t2, eris, with_ovvv=True):
@@ -1005,8 +1099,10 @@ class _ERIS:
             self.feri1['ovoo'] = ovoo.reshape(nocc,nvir,nocc,nocc)
             self.feri1['oovv'] = oovv.reshape(nocc,nocc,nvir,nvir)
             self.feri1['ovov'] = ovov.reshape(nocc,nvir,nocc,nvir)
-            self.feri1['ovvv'] = ovvv.reshape(nocc,nvir,nvir_pair)
-            self.feri1['vvvv'] = vvvv.reshape(nvir_pair,nvir_pair)
+            _h5_vvv_dataset(cc, self.feri1, 'ovvv', (nocc,nvir,nvir_pair))[:] = \
+                    lib.zero_small(ovvv, cc.eris_trunc_tol).reshape(nocc,nvir,nvir_pair)
+            _h5_vvv_dataset(cc, self.feri1, 'vvvv', (nvir_pair,nvir_pair))[:] = \
+                    lib.zero_small(vvvv, cc.eris_trunc_tol)
             self.oooo = self.feri1['oooo']
             self.ooov = self.feri1['ooov']
             self.ovoo = self.feri1['ovoo']
@@ -1027,7 +1123,7 @@ class _ERIS:
             self.ovoo = self.feri1.create_dataset('ovoo', (nocc,nvir,nocc,nocc), 'f8')
             self.oovv = self.feri1.create_dataset('oovv', (nocc,nocc,nvir,nvir), 'f8')
             self.ovov = self.feri1.create_dataset('ovov', (nocc,nvir,nocc,nvir), 'f8')
-            self.ovvv = self.feri1.create_dataset('ovvv', (nocc,nvir,nvpair), 'f8')
+            self.ovvv = _h5_vvv_dataset(cc, self.feri1, 'ovvv', (nocc,nvir,nvpair))
             fsort = _ccsd.libcc.CCsd_sort_inplace
             nocc_pair = nocc*(nocc+1)//2
             nvir_pair = nvir*(nvir+1)//2
@@ -1049,12 +1145,14 @@ class _ERIS:
                 oo, ov, vv = sort_inplace(eri)
                 self.ovoo[i,p0:p1] = lib.unpack_tril(oo, out=buf)
                 self.ovov[i,p0:p1] = ov
-                self.ovvv[i,p0:p1] = vv
+                self.ovvv[i,p0:p1] = lib.zero_small(vv, cc.eris_trunc_tol)
 
             if not cc.direct:
                 max_memory = max(2000,cc.max_memory-lib.current_memory()[0])
                 self.feri2 = lib.H5TmpFile()
-                ao2mo.full(cc.mol, orbv, self.feri2, max_memory=max_memory, verbose=log)
+                ao2mo.full(cc.mol, orbv, self.feri2, max_memory=max_memory, verbose=log,
+                           compression=cc.eris_compression,
+                           trunc_tol=cc.eris_trunc_tol)
                 self.vvvv = self.feri2['eri_mo']
                 cput1 = log.timer_debug1('transforming vvvv', *cput1)
 
@@ -1167,9 +1265,70 @@ def make_tau(t2, t1a, t1b, fac=1, out=None):
 def make_theta(t2, out=None):
     return _ccsd.make_0132(t2, t2, -1, 2, out)
 
+def _eris_match(mycc, eris, mo_coeff):
+    '''Whether eris were generated by mycc for the orbitals mo_coeff'''
+    if eris is None or getattr(eris, 'mo_coeff', None) is None:
+        return False
+    if (getattr(eris, '_mol', None) is not mycc.mol or
+        getattr(eris, '_scf', None) is not mycc._scf):
+        return False
+    mo = _mo_without_core(mycc, mo_coeff)
+    return (eris.mo_coeff.shape == mo.shape and
+            numpy.array_equal(eris.mo_coeff, mo))
+
 def _cp(a):
     return numpy.array(a, copy=False, order='C')
 
+def _ladder_screen(mol, ao2mopt, tau, sh_ranges, tol):
+    '''Density-weighted Schwarz screening for the AO-driven ladder term
+
+        t2new[x,a,b] += tau[x,c,d] (ca|db)
+
+    The contribution of the shell blocks I (for c) and J (for a) is bounded
+    by Q_IJ * max(Q) * max_x sum_{c in I, d} |tau[x,c,d]|, where Q is the
+    Schwarz bound sqrt(|(ij|ij)|) of the shell pairs.  Returns a boolean
+    mask of the (I,J) blocks which can be skipped.
+    '''
+    nblk = len(sh_ranges)
+    skip = numpy.zeros((nblk,nblk), dtype=bool)
+    if not tol or nblk == 0:
+        return skip
+
+    if not ao2mopt._this.contents.q_cond:
+        return skip
+
+    nbas = mol.nbas
+    q_cond = numpy.ctypeslib.as_array((ctypes.c_double*(nbas*nbas)).from_address(
+            ao2mopt._this.contents.q_cond)).reshape(nbas,nbas)
+    ao_loc = mol.ao_loc_nr()
+    sh_loc = [x[0] for x in sh_ranges]
+    ao_blk_loc = [ao_loc[x[0]] for x in sh_ranges]
+
+    nocc2, nao = tau.shape[:2]
+    tau_blk = numpy.zeros(nblk)
+    blksize = max(1, int(4e6/8/nao**2))
+    for p0, p1 in lib.prange(0, nocc2, blksize):
+        tau_c = abs(tau[p0:p1]).sum(axis=2)
+        tau_c = numpy.add.reduceat(tau_c, ao_blk_loc, axis=1)
+        tau_blk = numpy.maximum(tau_blk, tau_c.max(axis=0))
+
+    q_blk = numpy.maximum.reduceat(numpy.maximum.reduceat(q_cond, sh_loc, axis=0),
+                                   sh_loc, axis=1)
+    q_max = q_blk.max()
+    tau_blk = numpy.maximum(tau_blk[:,None], tau_blk)
+    skip = q_blk * q_max * tau_blk < tol
+    return skip
+
+def _h5_vvv_dataset(mycc, feri, key, shape):
+    '''Create the dataset for ovvv or vvvv.  They are read in slices of the
+    leading indices (load_ovvv in update_amps, the vvvv rows in add_wvvVV_).
+    The chunks are made of the contiguous trailing dimensions.'''
+    if mycc.eris_compression and all(shape):
+        return feri.create_dataset(key, shape, 'f8', chunks=lib.h5chunks(shape),
+                                   **lib.h5filter_options(mycc.eris_compression))
+    else:
+        return feri.create_dataset(key, shape, 'f8')
+
 
 if __name__ == '__main__':
     from pyscf import gto
@@ -25,7 +25,7 @@ BLKSIZE = 192
 def IX_intermediates(mycc, t1, t2, l1, l2, eris=None, d1=None, d2=None):
     if eris is None:
 # Note eris are in Chemist's notation
-        eris = ccsd._ERIS(mycc)
+        eris = _get_eris(mycc)
     if d1 is None:
         d1 = ccsd_rdm.gamma1_intermediates(mycc, t1, t2, l1, l2)
     doo, dov, dvo, dvv = d1
@@ -238,7 +238,7 @@ def IX_intermediates(mycc, t1, t2, l1, l2, eris=None, d1=None, d2=None):
 def response_dm1(mycc, t1, t2, l1, l2, eris=None, IX=None):
     if eris is None:
 # Note eris are in Chemist's notation
-        eris = ccsd._ERIS(mycc)
+        eris = _get_eris(mycc)
     if IX is None:
         Ioo, Ivv, Ivo, Xvo = IX_intermediates(mycc, t1, t2, l1, l2, eris)
     else:
@@ -284,7 +284,7 @@ def kernel(mycc, t1=None, t2=None, l1=None, l2=None, eris=None, atmlst=None,
     if t2 is None: t2 = mycc.t2
     if l1 is None: l1 = mycc.l1
     if l2 is None: l2 = mycc.l2
-    if eris is None: eris = ccsd._ERIS(mycc)
+    if eris is None: eris = _get_eris(mycc)
     if mf_grad is None:
         mf_grad = rhf_grad.Gradients(mycc._scf)
 
@@ -434,7 +434,7 @@ def as_scanner(cc):
         cc.mol = mol
         cc.mo_coeff = mf_scanner.mo_coeff
         cc.mo_occ = mf_scanner.mo_occ
-        eris = cc.ao2mo(cc.mo_coeff)
+        eris = cc.get_eris()
         mf_grad = cc._scf.nuc_grad_method()
         cc.kernel(cc.t1, cc.t2, eris=eris)
         cc.solve_lambda(cc.t1, cc.t2, cc.l1, cc.l2, eris=eris)
@@ -443,6 +443,16 @@ def as_scanner(cc):
     return solver
 
 
+def _get_eris(mycc):
+    '''Reuse the integrals kept by the CCSD object (keep_eris) if available.
+    The AO-direct CCSD integrals do not have the vvvv block required by
+    gradients.'''
+    if mycc.keep_eris:
+        eris = mycc.get_eris()
+        if hasattr(eris, 'vvvv'):
+            return eris
+    return ccsd._ERIS(mycc)
+
 def shell_prange(mol, start, stop, blksize):
     nao = 0
     ib0 = start
@@ -3,6 +3,7 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
+import os
 import gc
 import time
 import ctypes
@@ -21,7 +22,21 @@ CCSD(T)
 # t3 as ijkabc
 
 # JCP, 94, 442.  Error in Eq (1), should be [ia] >= [jb] >= [kc]
-def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
+def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE,
+           nproc=1, progress_file=None):
+    '''CCSD(T) correction
+
+    Kwargs:
+        nproc : int
+            Number of local worker processes.  If nproc > 1, the blocks of
+            virtual orbitals (a0:a1, b0:b1) are distributed over the worker
+            processes.  The sorted integrals vvop are shared read-only
+            through a memory map.
+        progress_file : str
+            The energies of the finished blocks are recorded in this file.
+            If the file exists and it was written for the same amplitudes,
+            the recorded blocks are not computed again.
+    '''
     cpu1 = cpu0 = (time.clock(), time.time())
     log = logger.new_logger(mycc, verbose)
     if t1 is None: t1 = mycc.t1
@@ -29,10 +44,17 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
 
     nocc, nvir = t1.shape
     nmo = nocc + nvir
+    blockwise = nproc > 1 or progress_file is not None
+    if blockwise:
+        progress = _Progress(progress_file, 'CCSD(T) %d %d %s' %
+                             (nocc, nvir, _fingerprint(t1, t2)), log)
 
     _tmpfile = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
     ftmp = h5py.File(_tmpfile.name)
-    eris_vvop = ftmp.create_dataset('vvop', (nvir,nvir,nocc,nmo), 'f8')
+    if nproc > 1:
+        eris_vvop = _memmap_tmp((nvir,nvir,nocc,nmo))
+    else:
+        eris_vvop = ftmp.create_dataset('vvop', (nvir,nvir,nocc,nmo), 'f8')
     orbsym = _sort_eri(mycc, eris, nocc, nvir, eris_vvop, log)
 
     ftmp['t2'] = t2  # read back late.  Cache t2T in t2 to reduce memory footprint
@@ -82,20 +104,28 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     max_memory = max(2000, mycc.max_memory - mem_now)
     bufsize = max(1, (max_memory*1e6/8-nocc**3*100)*.7/(nocc*nmo))
     log.debug('max_memory %d MB (%d MB in use)', max_memory, mem_now)
-    for a0, a1 in reversed(list(lib.prange_tril(0, nvir, bufsize))):
-        with lib.call_in_background(contract) as async_contract:
-            cache_row_a = numpy.asarray(eris_vvop[a0:a1,:a1], order='C')
-            cache_col_a = numpy.asarray(eris_vvop[:a0,a0:a1], order='C')
-            async_contract(a0, a1, a0, a1, (cache_row_a,cache_col_a,
-                                            cache_row_a,cache_col_a))
-
-            for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
-                cache_row_b = numpy.asarray(eris_vvop[b0:b1,:b1], order='C')
-                cache_col_b = numpy.asarray(eris_vvop[:b0,b0:b1], order='C')
-                async_contract(a0, a1, b0, b1, (cache_row_a,cache_col_a,
-                                                cache_row_b,cache_col_b))
-                cache_row_b = cache_col_b = None
-            cache_row_a = cache_col_a = None
+    if blockwise:
+        tasks = _tril_tasks(nvir, max(1, bufsize / nproc))
+        def fcontract(a0, a1, b0, b1):
+            cache = _load_tril_cache(eris_vvop, eris_vvop, a0, a1, b0, b1)
+            return contract(a0, a1, b0, b1, cache)
+        et_sum[0] = _contract_blocks('rccsd', tasks, fcontract, nproc, progress, log)
+        progress.close()
+    else:
+        for a0, a1 in reversed(list(lib.prange_tril(0, nvir, bufsize))):
+            with lib.call_in_background(contract) as async_contract:
+                cache_row_a = numpy.asarray(eris_vvop[a0:a1,:a1], order='C')
+                cache_col_a = numpy.asarray(eris_vvop[:a0,a0:a1], order='C')
+                async_contract(a0, a1, a0, a1, (cache_row_a,cache_col_a,
+                                                cache_row_a,cache_col_a))
+
+                for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
+                    cache_row_b = numpy.asarray(eris_vvop[b0:b1,:b1], order='C')
+                    cache_col_b = numpy.asarray(eris_vvop[:b0,b0:b1], order='C')
+                    async_contract(a0, a1, b0, b1, (cache_row_a,cache_col_a,
+                                                    cache_row_b,cache_col_b))
+                    cache_row_b = cache_col_b = None
+                cache_row_a = cache_col_a = None
 
     t2[:] = ftmp['t2']
     ftmp.close()
@@ -105,6 +135,151 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     log.note('CCSD(T) correction = %.15g', et)
     return et
 
+class _Progress(object):
+    '''The energies of the finished (T) blocks.  Each block is appended to the
+    text file as one line "label a0 a1 b0 b1 energy" and flushed to disk
+    immediately, so that the records survive if the calculation is killed.
+    The first line of the file identifies the calculation.  The partition of
+    the blocks of each label is saved in one line "tasks label a0 a1 b0 b1
+    ..." before the energies of these blocks.  The partition depends on the
+    available memory and the number of processes.  It is read back when the
+    calculation is restarted (see :meth:`partition`).
+    '''
+    def __init__(self, filename, header, log):
+        self.filename = filename
+        self.done = {}
+        self.tasks = {}
+        self._f = None
+        if filename is None:
+            return
+
+        if os.path.isfile(filename):
+            with open(filename, 'r') as f:
+                # The last line is dropped if it is not terminated by newline
+                # (the program was killed while writing it).
+                lines = f.read().split('\n')[:-1]
+            if lines and lines[0] == header:
+                for line in lines[1:]:
+                    try:
+                        fields = line.split()
+                        if fields[0] == 'tasks' and len(fields) % 4 == 2:
+                            blocks = [int(x) for x in fields[2:]]
+                            self.tasks[fields[1]] = list(zip(*[iter(blocks)]*4))
+                            continue
+                        label, a0, a1, b0, b1, et = fields
+                        key = (label, int(a0), int(a1), int(b0), int(b1))
+                        self.done[key] = float(et)
+                    except (ValueError, IndexError):
+                        pass
+                log.info('Restart (T) from %s, %d blocks were finished',
+                         filename, len(self.done))
+            elif lines:
+                log.warn('Progress file %s was created for a different '
+                         'calculation. It is overwritten.', filename)
+
+        self._f = open(filename, 'w')
+        self._f.write(header + '\n')
+        for label, tasks in self.tasks.items():
+            self._write_tasks(label, tasks)
+        for key, et in self.done.items():
+            self._f.write('%s %d %d %d %d %.17g\n' % (key + (et,)))
+        self._flush()
+
+    def partition(self, label, tasks):
+        '''The blocks of label recorded in the progress file.  If the
+        partition of label was not recorded, tasks is saved and returned.
+        '''
+        if label in self.tasks:
+            return self.tasks[label]
+        tasks = [tuple(task) for task in tasks]
+        self.tasks[label] = tasks
+        if self._f is not None:
+            self._write_tasks(label, tasks)
+            self._flush()
+        return tasks
+
+    def _write_tasks(self, label, tasks):
+        self._f.write('tasks %s %s\n' %
+                      (label, ' '.join(['%d %d %d %d' % t for t in tasks])))
+
+    def save(self, key, et):
+        self.done[key] = et
+        if self._f is not None:
+            self._f.write('%s %d %d %d %d %.17g\n' % (key + (et,)))
+            self._flush()
+
+    def _flush(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+def _fingerprint(t1, t2):
+    if isinstance(t1, numpy.ndarray):
+        t1, t2 = (t1,), (t2,)
+    return ' '.join(['%.12e %.12e' % (lib.finger(x), numpy.linalg.norm(y))
+                     for x, y in zip(t1, t2)])
+
+def _memmap_tmp(shape, dtype=numpy.double):
+    '''A numpy array of the given shape in a temporary file.  The memory map
+    is shared with the forked worker processes.  The file is removed from the
+    file system immediately, the data are released when the array is garbage
+    collected.
+    '''
+    with tempfile.TemporaryFile(dir=lib.param.TMPDIR) as f:
+        return numpy.memmap(f, dtype=dtype, mode='w+', shape=shape)
+
+def _tril_tasks(nvir, bufsize):
+    '''The blocks (a0, a1, b0, b1) of the triangular loops a >= b'''
+    tasks = []
+    for a0, a1 in reversed(list(lib.prange_tril(0, nvir, bufsize))):
+        tasks.append((a0, a1, a0, a1))
+        for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
+            if b1 > b0:
+                tasks.append((a0, a1, b0, b1))
+    return tasks
+
+def _load_tril_cache(vvop_a, vvop_b, a0, a1, b0, b1):
+    cache_row_a = numpy.asarray(vvop_a[a0:a1,:a1], order='C')
+    cache_col_a = numpy.asarray(vvop_a[:a0,a0:a1], order='C')
+    if a0 == b0 and a1 == b1 and vvop_a is vvop_b:
+        return cache_row_a, cache_col_a, cache_row_a, cache_col_a
+    cache_row_b = numpy.asarray(vvop_b[b0:b1,:b1], order='C')
+    cache_col_b = numpy.asarray(vvop_b[:b0,b0:b1], order='C')
+    return cache_row_a, cache_col_a, cache_row_b, cache_col_b
+
+def _contract_blocks(label, tasks, fcontract, nproc, progress, log):
+    '''Sum the (T) energies fcontract(a0, a1, b0, b1) of the blocks in tasks.
+    If progress has a partition of label, the recorded partition is used
+    instead of tasks.  The blocks recorded in progress are skipped.  If
+    nproc > 1, the blocks are evaluated by nproc forked worker processes.
+    '''
+    tasks = progress.partition(label, tasks)
+    et_sum = 0
+    todo = []
+    for task in tasks:
+        key = (label,) + tuple(task)
+        if key in progress.done:
+            et_sum += progress.done[key]
+        else:
+            todo.append(task)
+    log.debug('(T) %s: %d blocks, %d to compute', label, len(tasks), len(todo))
+
+    if nproc <= 1 or len(todo) <= 1:
+        for task in todo:
+            et = fcontract(*task)
+            progress.save((label,) + tuple(task), et)
+            et_sum += et
+        return et_sum
+
+    for i, et in lib.fork_imap(fcontract, todo, nproc, '(T) block'):
+        progress.save((label,) + tuple(todo[i]), et)
+        et_sum += et
+    return et_sum
+
 def _sort_eri(mycc, eris, nocc, nvir, vvop, log):
     cpu1 = (time.clock(), time.time())
     mol = mycc.mol
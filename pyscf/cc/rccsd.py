@@ -47,20 +47,28 @@ def kernel(cc, eris, t1=None, t2=None, max_cycle=50, tol=1e-8, tolnormt=1e-6,
         adiis = lambda t1,t2,*args: (t1,t2)
 
     conv = False
-    for istep in range(max_cycle):
-        t1new, t2new = cc.update_amps(t1, t2, eris)
-        normt = numpy.linalg.norm(t1new-t1) + numpy.linalg.norm(t2new-t2)
-        t1, t2 = t1new, t2new
-        t1new = t2new = None
-        if cc.diis:
-            t1, t2 = cc.diis(t1, t2, istep, normt, eccsd-eold, adiis)
-        eold, eccsd = eccsd, energy(cc, t1, t2, eris)
-        log.info('istep = %d  E(CCSD) = %.15g  dE = %.9g  norm(t1,t2) = %.6g',
-                 istep, eccsd, eccsd - eold, normt)
-        cput1 = log.timer('CCSD iter', *cput1)
-        if abs(eccsd-eold) < tol and normt < tolnormt:
-            conv = True
-            break
+    cc._single_prec = cc.mixed_precision
+    try:
+        for istep in range(max_cycle):
+            t1new, t2new = cc.update_amps(t1, t2, eris)
+            normt = numpy.linalg.norm(t1new-t1) + numpy.linalg.norm(t2new-t2)
+            t1, t2 = t1new, t2new
+            t1new = t2new = None
+            if cc.diis:
+                t1, t2 = cc.diis(t1, t2, istep, normt, eccsd-eold, adiis)
+            eold, eccsd = eccsd, energy(cc, t1, t2, eris)
+            log.info('istep = %d  E(CCSD) = %.15g  dE = %.9g  norm(t1,t2) = %.6g',
+                     istep, eccsd, eccsd - eold, normt)
+            cput1 = log.timer('CCSD iter', *cput1)
+            if cc._single_prec:
+                if normt < cc.mixed_precision_tol:
+                    log.info('Switch to double precision')
+                    cc._single_prec = False
+            elif abs(eccsd-eold) < tol and normt < tolnormt:
+                conv = True
+                break
+    finally:
+        cc._single_prec = False
     log.timer('CCSD', *cput0)
     return conv, eccsd, t1, t2
 
@@ -201,7 +209,7 @@ class RCCSD(ccsd.CCSD):
             mbpt2 : bool
                 Use one-shot MBPT2 approximation to CCSD.
         '''
-        if eris is None: eris = self.ao2mo(self.mo_coeff)
+        if eris is None: eris = self.get_eris()
         self.eris = eris
         self.dump_flags()
         if mbpt2:
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import unittest
+import tempfile
 import numpy
 from pyscf import gto, scf, lib, symm
 from pyscf import cc
@@ -50,6 +51,48 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(e3a, -0.003060022611584471, 9)
         mcc.mol.symmetry = True
 
+    def test_ccsd_t_nproc(self):
+        eris = mcc.ao2mo()
+        e3a = ccsd_t.kernel(mcc, eris, nproc=2)
+        self.assertAlmostEqual(e3a, -0.003060022611584471, 9)
+
+        ftmp = tempfile.NamedTemporaryFile()
+        e3a = ccsd_t.kernel(mcc, eris, progress_file=ftmp.name)
+        self.assertAlmostEqual(e3a, -0.003060022611584471, 9)
+        with open(ftmp.name, 'r') as f:
+            lines = f.read().split('\n')
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[1].split()[:2], ['tasks', 'rccsd'])
+        # Modify the recorded block energy to check that the restarted
+        # calculation takes the energy from the progress file
+        label, a0, a1, b0, b1, et = lines[2].split()
+        with open(ftmp.name, 'w') as f:
+            f.write('%s\n%s\n%s %s %s %s %s %.17g\n' %
+                    (lines[0], lines[1], label, a0, a1, b0, b1, float(et)+.5))
+        e3a = ccsd_t.kernel(mcc, eris, nproc=2, progress_file=ftmp.name)
+        self.assertAlmostEqual(e3a, -0.003060022611584471+1, 9)
+
+        # The restarted calculation uses the recorded partition of the blocks
+        # rather than the one of the current memory and nproc.
+        nvir = mcc.t1.shape[1]
+        tasks = ccsd_t._tril_tasks(nvir, 6)
+        self.assertTrue(len(tasks) > 2)
+        with open(ftmp.name, 'w') as f:
+            f.write('%s\ntasks rccsd %s\n' %
+                    (lines[0], ' '.join(['%d %d %d %d' % t for t in tasks])))
+        e3a = ccsd_t.kernel(mcc, eris, progress_file=ftmp.name)
+        self.assertAlmostEqual(e3a, -0.003060022611584471, 9)
+        with open(ftmp.name, 'r') as f:
+            lines = f.read().split('\n')
+        self.assertEqual(len(lines), len(tasks)+3)
+        label, a0, a1, b0, b1, et = lines[3].split()
+        self.assertEqual(tuple(map(int, (a0, a1, b0, b1))), tasks[1])
+        with open(ftmp.name, 'w') as f:
+            f.write('%s\n%s\n%s %s %s %s %s %.17g\n' %
+                    (lines[0], lines[1], label, a0, a1, b0, b1, float(et)+.5))
+        e3a = ccsd_t.kernel(mcc, eris, nproc=2, progress_file=ftmp.name)
+        self.assertAlmostEqual(e3a, -0.003060022611584471+1, 9)
+
     def test_sort_eri(self):
         eris = mcc.ao2mo()
         nocc, nvir = mcc.t1.shape
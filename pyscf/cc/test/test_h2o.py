@@ -58,6 +58,60 @@ class KnowValues(unittest.TestCase):
         t2b = mcc.add_wvvVV(t1, t2, eris)
         self.assertTrue(numpy.allclose(t2a,t2b))
 
+    def test_eris_compression(self):
+        mcc = cc.ccsd.CC(mf)
+        eris0 = mcc.ao2mo()
+        emp2, t1, t2 = mcc.init_amps(eris0)
+        mcc.eris_compression = 'gzip'
+        mcc.eris_trunc_tol = 1e-12
+        eris1 = cc.ccsd._ERIS(mcc, method='outcore')
+        self.assertTrue(eris1.ovvv.compression is not None)
+        self.assertTrue(eris1.vvvv.compression is not None)
+        self.assertTrue(abs(eris1.ovvv[:]-eris0.ovvv).max() < 1e-12)
+        self.assertTrue(abs(eris1.vvvv[:]-eris0.vvvv).max() < 1e-12)
+        t1a, t2a = cc.ccsd.update_amps(mcc, t1, t2, eris0)
+        t1b, t2b = cc.ccsd.update_amps(mcc, t1, t2, eris1)
+        self.assertTrue(abs(t1a-t1b).max() < 1e-9)
+        self.assertTrue(abs(t2a-t2b).max() < 1e-9)
+
+    def test_direct_screen(self):
+        mcc = cc.ccsd.CC(mf)
+        mcc.direct = True
+        eris = mcc.ao2mo()
+        emp2, t1, t2 = mcc.init_amps(eris)
+        mcc.direct_screen_tol = None
+        t2a = mcc.add_wvvVV(t1, t2, eris)
+        mcc.direct_screen_tol = 1e-9
+        t2b = mcc.add_wvvVV(t1, t2, eris)
+        self.assertTrue(abs(t2a-t2b).max() < 1e-8)
+
+        from pyscf.ao2mo import _ao2mo
+        nao = mol.nao_nr()
+        ao2mopt = _ao2mo.AO2MOpt(mol, 'int2e_sph', 'CVHFnr_schwarz_cond',
+                                 'CVHFsetnr_direct_scf')
+        sh_ranges = [(0, 3, 0), (3, 6, 0), (6, mol.nbas, 0)]
+        tau = numpy.zeros((3,nao,nao))
+        tau[:,15:] = 1.
+        skip = cc.ccsd._ladder_screen(mol, ao2mopt, tau, sh_ranges, 1e-9)
+        self.assertEqual(skip.tolist(), [[True, True, False],
+                                         [True, True, False],
+                                         [False, False, False]])
+
+    def test_mixed_precision(self):
+        mcc = cc.ccsd.CC(mf)
+        mcc.conv_tol = 1e-10
+        mcc.mixed_precision = True
+        mcc.kernel()
+        self.assertAlmostEqual(mcc.e_corr, -0.2133432312951, 8)
+        self.assertFalse(mcc._single_prec)
+
+        # single precision ladder in the early iterations
+        e1 = cc.ccsd.CC(mf).set(max_cycle=2).kernel()[0]
+        e2 = cc.ccsd.CC(mf).set(max_cycle=2, mixed_precision=True).kernel()[0]
+        self.assertAlmostEqual(e1, e2, 6)
+        mcc = cc.ccsd.CC(mf).set(direct=True, max_cycle=2, mixed_precision=True)
+        self.assertAlmostEqual(mcc.kernel()[0], e1, 6)
+
     def test_ccsd_frozen(self):
         mcc = cc.ccsd.CC(mf, frozen=range(1))
         mcc.conv_tol = 1e-10
@@ -65,6 +119,29 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(mcc.ecc, -0.21124878189922872, 8)
         self.assertAlmostEqual(abs(mcc.t2).sum(), 5.4996425901189347, 6)
 
+    def test_fno(self):
+        mcc = cc.ccsd.CC(mf, frozen=1)
+        mcc.conv_tol = 1e-10
+        ecc = mcc.kernel()[0]
+        et = mcc.ccsd_t()
+        # keeping all natural orbitals reproduces CCSD
+        mfno = mcc.fno(nvir_act=19)
+        mfno.kernel()
+        self.assertAlmostEqual(mfno.delta_emp2, 0, 12)
+        self.assertAlmostEqual(mfno.e_corr, ecc, 8)
+        self.assertAlmostEqual(mfno.ccsd_t(), et, 8)
+
+        mfno = mcc.fno(thresh=1e-4)
+        self.assertEqual(mfno.nmo, 21)
+        self.assertEqual(mfno.frozen[0], 0)
+        mfno.kernel()
+        self.assertAlmostEqual(mfno.e_corr, ecc, 4)
+        self.assertAlmostEqual(mfno.ccsd_t(), et, 3)
+
+        mfno = mcc.fno(pct_occ=.99, density_fit=True)
+        mfno.kernel()
+        self.assertAlmostEqual(mfno.e_corr, ecc, 3)
+
     def test_ccsd_cart(self):
         pmol = mol.copy()
         pmol.cart = True
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import unittest
+import tempfile
 import numpy
 import copy
 from pyscf import gto, scf, lib, symm
@@ -53,6 +54,50 @@ class KnowValues(unittest.TestCase):
         e3a = mcc.ccsd_t()
         self.assertAlmostEqual(e3a, -0.0009857042572475674, 11)
 
+    def test_uccsd_t_small_blocks(self):
+        # The bbb blocks b < a of the serial loop are only visited when the
+        # virtual orbitals are split into several blocks
+        eris = mcc.ao2mo()
+        prange_tril = lib.prange_tril
+        try:
+            lib.prange_tril = lambda start, stop, blocksize: \
+                    prange_tril(start, stop, 8)
+            e3a = uccsd_t.kernel(mcc, eris)
+        finally:
+            lib.prange_tril = prange_tril
+        self.assertAlmostEqual(e3a, -0.0009857042572475674, 11)
+
+    def test_uccsd_t_nproc(self):
+        eris = mcc.ao2mo()
+        ftmp = tempfile.NamedTemporaryFile()
+        e3a = uccsd_t.kernel(mcc, eris, nproc=2, progress_file=ftmp.name)
+        self.assertAlmostEqual(e3a, -0.0009857042572475674, 11)
+        with open(ftmp.name, 'r') as f:
+            lines = [line.split() for line in f.read().split('\n')[1:-1]]
+        labels = [x[0] for x in lines if x[0] != 'tasks']
+        self.assertEqual(sorted(set(labels)), ['aaa', 'abb', 'baa', 'bbb'])
+        labels = [x[1] for x in lines if x[0] == 'tasks']
+        self.assertEqual(sorted(labels), ['aaa', 'abb', 'baa', 'bbb'])
+        e3a = mcc.ccsd_t(eris=eris, progress_file=ftmp.name)
+        self.assertAlmostEqual(e3a, -0.0009857042572475674, 11)
+
+    def test_uccsd_outcore(self):
+        mycc = cc.UCCSD(mf)
+        mycc.conv_tol = 1e-14
+        mycc.max_memory = 1
+        eris = mycc.ao2mo()
+        self.assertTrue(hasattr(eris, 'feri'))
+        t1, t2 = mcc.t1, mcc.t2
+        t1ref, t2ref = mcc.update_amps(t1, t2, mcc.eris)
+        t1new, t2new = mycc.update_amps(t1, t2, eris)
+        for x, y in zip(t1new+t2new, t1ref+t2ref):
+            self.assertAlmostEqual(abs(x-y).max(), 0, 12)
+
+        mycc.kernel(eris=eris)
+        self.assertAlmostEqual(mycc.e_corr, mcc.e_corr, 9)
+        e3a = mycc.ccsd_t(eris=eris)
+        self.assertAlmostEqual(e3a, -0.0009857042572475674, 9)
+
     #def test_uccsd_t_symm(self):
     #    mf = scf.UHF(mol).run(conv_tol=1e-14)
     #    mcc = cc.UCCSD(mf)
@@ -101,11 +101,12 @@ def update_amps(cc, t1, t2, eris):
     wOvVo = np.zeros((noccb,nvira,nvirb,nocca))
     wOvvO = np.zeros((noccb,nvira,nvira,noccb))
 
-    mem_now = lib.current_memory()[0]
-    max_memory = lib.param.MAX_MEMORY - mem_now
-    blksize = max(int(max_memory*1e6/8/(nvira**3*3)), 2)
-    for p0,p1 in lib.prange(0, nocca, blksize):
-        ovvv = np.asarray(eris.ovvv[p0:p1]).reshape((p1-p0)*nvira,-1)
+# The ovvv-type integrals are loaded in blocks.  If they are stored on disk,
+# the next block is read in background.
+    max_memory = max(0, cc.max_memory - lib.current_memory()[0])
+    blksize = max(int(max_memory*1e6/8/(nvira**3*4)), 2)
+    for p0,p1,ovvv in _prefetch_rows(eris.ovvv, lib.prange(0, nocca, blksize)):
+        ovvv = np.asarray(ovvv).reshape((p1-p0)*nvira,-1)
         ovvv = lib.unpack_tril(ovvv).reshape(-1,nvira,nvira,nvira)
         ovvv = ovvv - ovvv.transpose(0,3,2,1)
         Fvva += np.einsum('mf,mfae->ae', t1a[p0:p1], ovvv)
@@ -116,9 +117,9 @@ def update_amps(cc, t1, t2, eris):
         u2aa -= lib.einsum('ijmb,ma->ijab', tmp1aa, t1a[p0:p1]*.5)
         ovvv = tmp1aa = None
 
-    blksize = max(int(max_memory*1e6/8/(nvirb**3*3)), 2)
-    for p0,p1 in lib.prange(0, noccb, blksize):
-        OVVV = np.asarray(eris.OVVV[p0:p1]).reshape((p1-p0)*nvirb,-1)
+    blksize = max(int(max_memory*1e6/8/(nvirb**3*4)), 2)
+    for p0,p1,OVVV in _prefetch_rows(eris.OVVV, lib.prange(0, noccb, blksize)):
+        OVVV = np.asarray(OVVV).reshape((p1-p0)*nvirb,-1)
         OVVV = lib.unpack_tril(OVVV).reshape(-1,nvirb,nvirb,nvirb)
         OVVV = OVVV - OVVV.transpose(0,3,2,1)
         Fvvb += np.einsum('mf,mfae->ae', t1b[p0:p1], OVVV)
@@ -129,9 +130,9 @@ def update_amps(cc, t1, t2, eris):
         u2bb -= lib.einsum('ijmb,ma->ijab', tmp1bb, t1b[p0:p1]*.5)
         OVVV = tmp1bb = None
 
-    blksize = max(int(max_memory*1e6/8/(nvira*nvirb**2*3)), 2)
-    for p0,p1 in lib.prange(0, nocca, blksize):
-        ovVV = np.asarray(eris.ovVV[p0:p1]).reshape((p1-p0)*nvira,-1)
+    blksize = max(int(max_memory*1e6/8/(nvira*nvirb**2*4)), 2)
+    for p0,p1,ovVV in _prefetch_rows(eris.ovVV, lib.prange(0, nocca, blksize)):
+        ovVV = np.asarray(ovVV).reshape((p1-p0)*nvira,-1)
         ovVV = lib.unpack_tril(ovVV).reshape(-1,nvira,nvirb,nvirb)
         Fvvb += np.einsum('mf,mfAE->AE', t1a[p0:p1], ovVV)
         woVvO[p0:p1] = einsum('JF,meBF->mBeJ', t1b, ovVV)
@@ -142,9 +143,9 @@ def update_amps(cc, t1, t2, eris):
         u2ab -= lib.einsum('iJmB,ma->iJaB', tmp1ab, t1a[p0:p1])
         ovVV = tmp1ab = None
 
-    blksize = max(int(max_memory*1e6/8/(nvirb*nocca**2*3)), 2)
-    for p0,p1 in lib.prange(0, noccb, blksize):
-        OVvv = np.asarray(eris.OVvv[p0:p1]).reshape((p1-p0)*nvirb,-1)
+    blksize = max(int(max_memory*1e6/8/(nvirb*nvira**2*4)), 2)
+    for p0,p1,OVvv in _prefetch_rows(eris.OVvv, lib.prange(0, noccb, blksize)):
+        OVvv = np.asarray(OVvv).reshape((p1-p0)*nvirb,-1)
         OVvv = lib.unpack_tril(OVvv).reshape(-1,nvirb,nvira,nvira)
         Fvva += np.einsum('MF,MFae->ae', t1b[p0:p1], OVvv)
         wOvVo[p0:p1] = einsum('jf,MEbf->MbEj', t1a, OVvv)
@@ -543,12 +544,12 @@ class UCCSD(rccsd.RCCSD):
                                     verbose=self.verbose)
         return self.l1, self.l2
 
-    def ccsd_t(self, t1=None, t2=None, eris=None):
+    def ccsd_t(self, t1=None, t2=None, eris=None, nproc=1, progress_file=None):
         from pyscf.cc import uccsd_t
         if t1 is None: t1 = self.t1
         if t2 is None: t2 = self.t2
         if eris is None: eris = self.ao2mo(self.mo_coeff)
-        return uccsd_t.kernel(self, eris, t1, t2, self.verbose)
+        return uccsd_t.kernel(self, eris, t1, t2, self.verbose, nproc, progress_file)
     uccsd_t = ccsd_t
 
     def make_rdm1(self, t1=None, t2=None, l1=None, l2=None):
@@ -2234,13 +2235,17 @@ class _ERIS:
             self.OVvv = self.feri.create_dataset('OVvv', (noccb,nvirb,nvira*(nvira+1)//2), ds_type)
 
             cput1 = time.clock(), time.time()
+            max_memory = max(2000, cc.max_memory-lib.current_memory()[0])
             # <ij||pq> = <ij|pq> - <ij|qp> = (ip|jq) - (iq|jp)
             tmpfile2 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
-            ao2mo.general(cc.mol, (orboa,moa,moa,moa), tmpfile2.name, 'aa')
+            ao2mo.general(cc.mol, (orboa,moa,moa,moa), tmpfile2.name, 'aa',
+                          max_memory=max_memory, verbose=log)
             with h5py.File(tmpfile2.name) as f:
                 buf = numpy.empty((nmoa,nmoa,nmoa))
-                for i in range(nocca):
-                    lib.unpack_tril(f['aa'][i*nmoa:(i+1)*nmoa], out=buf)
+                tasks = [(i*nmoa, (i+1)*nmoa) for i in range(nocca)]
+                for p0, p1, dat in _prefetch_rows(f['aa'], tasks):
+                    i = p0 // nmoa
+                    lib.unpack_tril(dat, out=buf)
                     self.oooo[i] = buf[:nocca,:nocca,:nocca]
                     self.ooov[i] = buf[:nocca,:nocca,nocca:]
                     self.ovoo[i] = buf[nocca:,:nocca,:nocca]
@@ -2252,11 +2257,14 @@ class _ERIS:
                 del(f['aa'])
                 buf = None
 
-            ao2mo.general(cc.mol, (orbob,mob,mob,mob), tmpfile2.name, 'bb')
+            ao2mo.general(cc.mol, (orbob,mob,mob,mob), tmpfile2.name, 'bb',
+                          max_memory=max_memory, verbose=log)
             with h5py.File(tmpfile2.name) as f:
                 buf = numpy.empty((nmob,nmob,nmob))
-                for i in range(noccb):
-                    lib.unpack_tril(f['bb'][i*nmob:(i+1)*nmob], out=buf)
+                tasks = [(i*nmob, (i+1)*nmob) for i in range(noccb)]
+                for p0, p1, dat in _prefetch_rows(f['bb'], tasks):
+                    i = p0 // nmob
+                    lib.unpack_tril(dat, out=buf)
                     self.OOOO[i] = buf[:noccb,:noccb,:noccb]
                     self.OOOV[i] = buf[:noccb,:noccb,noccb:]
                     self.OVOO[i] = buf[noccb:,:noccb,:noccb]
@@ -2268,11 +2276,14 @@ class _ERIS:
                 del(f['bb'])
                 buf = None
 
-            ao2mo.general(cc.mol, (orboa,moa,mob,mob), tmpfile2.name, 'ab')
+            ao2mo.general(cc.mol, (orboa,moa,mob,mob), tmpfile2.name, 'ab',
+                          max_memory=max_memory, verbose=log)
             with h5py.File(tmpfile2.name) as f:
                 buf = numpy.empty((nmoa,nmob,nmob))
-                for i in range(nocca):
-                    lib.unpack_tril(f['ab'][i*nmoa:(i+1)*nmoa], out=buf)
+                tasks = [(i*nmoa, (i+1)*nmoa) for i in range(nocca)]
+                for p0, p1, dat in _prefetch_rows(f['ab'], tasks):
+                    i = p0 // nmoa
+                    lib.unpack_tril(dat, out=buf)
                     self.ooOO[i] = buf[:nocca,:noccb,:noccb]
                     self.ooOV[i] = buf[:nocca,:noccb,noccb:]
                     self.ovOO[i] = buf[nocca:,:noccb,:noccb]
@@ -2284,11 +2295,14 @@ class _ERIS:
                 del(f['ab'])
                 buf = None
 
-            ao2mo.general(cc.mol, (orbob,mob,moa,moa), tmpfile2.name, 'ba')
+            ao2mo.general(cc.mol, (orbob,mob,moa,moa), tmpfile2.name, 'ba',
+                          max_memory=max_memory, verbose=log)
             with h5py.File(tmpfile2.name) as f:
                 buf = numpy.empty((nmob,nmoa,nmoa))
-                for i in range(noccb):
-                    lib.unpack_tril(f['ba'][i*nmob:(i+1)*nmob], out=buf)
+                tasks = [(i*nmob, (i+1)*nmob) for i in range(noccb)]
+                for p0, p1, dat in _prefetch_rows(f['ba'], tasks):
+                    i = p0 // nmob
+                    lib.unpack_tril(dat, out=buf)
                     self.OOov[i] = buf[:noccb,:nocca,nocca:]
                     self.OVoo[i] = buf[noccb:,:nocca,:nocca]
                     self.OOvo[i] = buf[:noccb,nocca:,:nocca]
@@ -2300,9 +2314,12 @@ class _ERIS:
 
             cput1 = log.timer_debug1('transforming oopq, ovpq', *cput1)
 
-            ao2mo.full(cc.mol, orbva, self.feri, dataname='vvvv')
-            ao2mo.full(cc.mol, orbvb, self.feri, dataname='VVVV')
-            ao2mo.general(cc.mol, (orbva,orbva,orbvb,orbvb), self.feri, dataname='vvVV')
+            ao2mo.full(cc.mol, orbva, self.feri, dataname='vvvv',
+                       max_memory=max_memory, verbose=log)
+            ao2mo.full(cc.mol, orbvb, self.feri, dataname='VVVV',
+                       max_memory=max_memory, verbose=log)
+            ao2mo.general(cc.mol, (orbva,orbva,orbvb,orbvb), self.feri,
+                          dataname='vvVV', max_memory=max_memory, verbose=log)
             self.vvvv = self.feri['vvvv']
             self.VVVV = self.feri['VVVV']
             self.vvVV = self.feri['vvVV']
@@ -3138,6 +3155,31 @@ def make_tau_ab(t2ab, t1, r1, fac=1, out=None):
     tau1ab += t2ab
     return tau1ab
 
+def _prefetch_rows(dat, tasks):
+    '''Iterate over the row blocks dat[p0:p1] for (p0,p1) in tasks.  If dat
+    is a HDF5 dataset, the next block is read in background while the caller
+    works on the current block.  The yielded block is overwritten in the next
+    iteration.
+    '''
+    tasks = list(tasks)
+    if isinstance(dat, numpy.ndarray) or len(tasks) == 0:
+        for p0, p1 in tasks:
+            yield p0, p1, dat[p0:p1]
+        return
+
+    def load(p0, p1, buf):
+        buf[:p1-p0] = dat[p0:p1]
+    blksize = max(p1-p0 for p0, p1 in tasks)
+    bufs = [numpy.empty((blksize,)+dat.shape[1:], dtype=dat.dtype)
+            for i in range(2)]
+    with lib.call_in_background(load, depth=1) as prefetch:
+        handler = prefetch(tasks[0][0], tasks[0][1], bufs[0])
+        for k, (p0, p1) in enumerate(tasks):
+            handler.join()
+            if k+1 < len(tasks):
+                handler = prefetch(tasks[k+1][0], tasks[k+1][1], bufs[(k+1)%2])
+            yield p0, p1, bufs[k%2][:p1-p0]
+
 def _add_vvvv_(cc, t2, eris, Ht2):
     t2aa, t2ab, t2bb = t2
     u2aa, u2ab, u2bb = Ht2
@@ -3145,10 +3187,29 @@ def _add_vvvv_(cc, t2, eris, Ht2):
     fakeri = lambda:None
     fakeri.vvvv = eris.VVVV
     rccsd._add_vvvv_(cc, t2bb, fakeri, u2bb)
-    fakeri.vvvv = eris.vvVV
-    rccsd._add_vvvv1_(cc, t2ab, fakeri, u2ab)
+    _add_vvVV_(cc, t2ab, eris, u2ab)
     return (u2aa,u2ab,u2bb)
 
+def _add_vvVV_(cc, t2ab, eris, Ht2):
+    '''Ht2 += einsum('iJeF,aeBF->iJaB', t2ab, vvVV).  The lower-triangular
+    rows ae of vvVV are loaded in blocks of a.
+    '''
+    time0 = time.clock(), time.time()
+    nvira, nvirb = t2ab.shape[2:]
+    max_memory = max(0, cc.max_memory - lib.current_memory()[0])
+    blksize = max(1, int(max_memory*1e6/8/(nvira*nvirb**2*2)))
+    ablocks = list(lib.prange(0, nvira, blksize))
+    tasks = [(a0*(a0+1)//2, a1*(a1+1)//2) for a0, a1 in ablocks]
+    for (a0, a1), (p0, p1, vvVV) in zip(ablocks, _prefetch_rows(eris.vvVV, tasks)):
+        for a in range(a0, a1):
+            i0 = a*(a+1)//2 - p0
+            vvv = lib.unpack_tril(np.asarray(vvVV[i0:i0+a+1]))
+            Ht2[:,:, a] += lib.einsum('ijef,ebf->ijb', t2ab[:,:,:a+1], vvv)
+            Ht2[:,:,:a] += lib.einsum('ijf,abf->ijab', t2ab[:,:,a], vvv[:a])
+            vvv = None
+        time0 = logger.timer_debug1(cc, 'vvVV [%d:%d]'%(a0,a1), *time0)
+    return Ht2
+
 
 if __name__ == '__main__':
     from pyscf import scf
@@ -9,12 +9,24 @@ import numpy
 from pyscf import lib
 from pyscf.lib import logger
 from pyscf.cc import _ccsd
+from pyscf.cc import ccsd_t
 
 '''
 UCCSD(T)
 '''
 
-def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
+def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE,
+           nproc=1, progress_file=None):
+    '''UCCSD(T) correction
+
+    Kwargs:
+        nproc : int
+            Number of local worker processes for the blocks of virtual
+            orbitals.  See :func:`ccsd_t.kernel`.
+        progress_file : str
+            File to record the energies of the finished blocks.  A restarted
+            calculation skips the recorded blocks.  See :func:`ccsd_t.kernel`.
+    '''
     cpu1 = cpu0 = (time.clock(), time.time())
     log = logger.new_logger(mycc, verbose)
     if t1 is None: t1 = mycc.t1
@@ -29,6 +41,11 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     nvirb = nmob - noccb
     mo_ea = eris.focka.diagonal().copy()
     mo_eb = eris.fockb.diagonal().copy()
+    blockwise = nproc > 1 or progress_file is not None
+    if blockwise:
+        progress = ccsd_t._Progress(progress_file, 'UCCSD(T) %d %d %d %d %s' %
+                                    (nocca, noccb, nvira, nvirb,
+                                     ccsd_t._fingerprint(t1, t2)), log)
 
     ftmp = lib.H5TmpFile()
     ftmp['t2ab'] = t2ab
@@ -42,14 +59,17 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     eris_vOoO = numpy.asarray(eris.ovOO).transpose(1,2,0,3).copy()
     eris_VoOo = numpy.asarray(eris.OVoo).transpose(1,2,0,3).copy()
 
-    _sort_eri(mycc, eris, ftmp, log)
-    eris_vvop = ftmp['vvop']
-    eris_VVOP = ftmp['VVOP']
-    eris_vVoP = ftmp['vVoP']
-    eris_VvOp = ftmp['VvOp']
+    eris_vvop, eris_VVOP, eris_vVoP, eris_VvOp = \
+            _sort_eri(mycc, eris, ftmp, log, nproc)
     cpu1 = log.timer_debug1('UCCSD(T) sort_eri', *cpu1)
 
     et_sum = [0]
+    def contract_blocks(label, tasks, contract, load_cache):
+        def fcontract(a0, a1, b0, b1):
+            return contract([0], a0, a1, b0, b1, load_cache(a0, a1, b0, b1))
+        et_sum[0] += ccsd_t._contract_blocks(label, tasks, fcontract, nproc,
+                                             progress, log)
+
     mem_now = lib.current_memory()[0]
     max_memory = max(2000, mycc.max_memory - mem_now)
     # aaa
@@ -57,20 +77,24 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     log.debug('max_memory %d MB (%d MB in use)', max_memory, mem_now)
     orbsym = numpy.zeros(mo_ea.size, dtype=int)
     contract = _gen_contract_aaa(t1aT, t2aaT, eris_vooo, mo_ea, orbsym, log)
-    for a0, a1 in reversed(list(lib.prange_tril(0, nvira, bufsize))):
-        with lib.call_in_background(contract) as ctr:
-            cache_row_a = numpy.asarray(eris_vvop[a0:a1,:a1], order='C')
-            cache_col_a = numpy.asarray(eris_vvop[:a0,a0:a1], order='C')
-            ctr(et_sum, a0, a1, a0, a1, (cache_row_a,cache_col_a,
-                                         cache_row_a,cache_col_a))
-
-            for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
-                cache_row_b = numpy.asarray(eris_vvop[b0:b1,:b1], order='C')
-                cache_col_b = numpy.asarray(eris_vvop[:b0,b0:b1], order='C')
-                ctr(et_sum, a0, a1, b0, b1, (cache_row_a,cache_col_a,
-                                             cache_row_b,cache_col_b))
-                cache_row_b = cache_col_b = None
-            cache_row_a = cache_col_a = None
+    if blockwise:
+        contract_blocks('aaa', ccsd_t._tril_tasks(nvira, bufsize/nproc), contract,
+                        lambda *x: ccsd_t._load_tril_cache(eris_vvop, eris_vvop, *x))
+    else:
+        for a0, a1 in reversed(list(lib.prange_tril(0, nvira, bufsize))):
+            with lib.call_in_background(contract) as ctr:
+                cache_row_a = numpy.asarray(eris_vvop[a0:a1,:a1], order='C')
+                cache_col_a = numpy.asarray(eris_vvop[:a0,a0:a1], order='C')
+                ctr(et_sum, a0, a1, a0, a1, (cache_row_a,cache_col_a,
+                                             cache_row_a,cache_col_a))
+
+                for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
+                    cache_row_b = numpy.asarray(eris_vvop[b0:b1,:b1], order='C')
+                    cache_col_b = numpy.asarray(eris_vvop[:b0,b0:b1], order='C')
+                    ctr(et_sum, a0, a1, b0, b1, (cache_row_a,cache_col_a,
+                                                 cache_row_b,cache_col_b))
+                    cache_row_b = cache_col_b = None
+                cache_row_a = cache_col_a = None
     cpu1 = log.timer_debug1('contract_aaa', *cpu1)
 
     # bbb
@@ -78,20 +102,24 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     log.debug('max_memory %d MB (%d MB in use)', max_memory, mem_now)
     orbsym = numpy.zeros(mo_eb.size, dtype=int)
     contract = _gen_contract_aaa(t1bT, t2bbT, eris_VOOO, mo_eb, orbsym, log)
-    for a0, a1 in reversed(list(lib.prange_tril(0, nvirb, bufsize))):
-        with lib.call_in_background(contract) as ctr:
-            cache_row_a = numpy.asarray(eris_VVOP[a0:a1,:a1], order='C')
-            cache_col_a = numpy.asarray(eris_VVOP[:a0,a0:a1], order='C')
-            ctr(et_sum, a0, a1, a0, a1, (cache_row_a,cache_col_a,
-                                         cache_row_a,cache_col_a))
-
-            for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
-                cache_row_b = numpy.asarray(eris_vvop[b0:b1,:b1], order='C')
-                cache_col_b = numpy.asarray(eris_vvop[:b0,b0:b1], order='C')
-                ctr(et_sum, a0, a1, b0, b1, (cache_row_a,cache_col_a,
-                                             cache_row_b,cache_col_b))
-                cache_row_b = cache_col_b = None
-            cache_row_a = cache_col_a = None
+    if blockwise:
+        contract_blocks('bbb', ccsd_t._tril_tasks(nvirb, bufsize/nproc), contract,
+                        lambda *x: ccsd_t._load_tril_cache(eris_VVOP, eris_VVOP, *x))
+    else:
+        for a0, a1 in reversed(list(lib.prange_tril(0, nvirb, bufsize))):
+            with lib.call_in_background(contract) as ctr:
+                cache_row_a = numpy.asarray(eris_VVOP[a0:a1,:a1], order='C')
+                cache_col_a = numpy.asarray(eris_VVOP[:a0,a0:a1], order='C')
+                ctr(et_sum, a0, a1, a0, a1, (cache_row_a,cache_col_a,
+                                             cache_row_a,cache_col_a))
+
+                for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
+                    cache_row_b = numpy.asarray(eris_VVOP[b0:b1,:b1], order='C')
+                    cache_col_b = numpy.asarray(eris_VVOP[:b0,b0:b1], order='C')
+                    ctr(et_sum, a0, a1, b0, b1, (cache_row_a,cache_col_a,
+                                                 cache_row_b,cache_col_b))
+                    cache_row_b = cache_col_b = None
+                cache_row_a = cache_col_a = None
     cpu1 = log.timer_debug1('contract_bbb', *cpu1)
 
     # Cache t2abT in t2ab to reduce memory footprint
@@ -102,17 +130,21 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     ts = t1aT, t1bT, t2aaT, t2abT
     vooo = (eris_vooo, eris_vOoO, eris_VoOo)
     contract = _gen_contract_baa(ts, vooo, (mo_ea,mo_eb), orbsym, log)
-    for a0, a1 in lib.prange(0, nvirb, int(bufsize/nvira+1)):
-        with lib.call_in_background(contract) as ctr:
-            cache_row_a = numpy.asarray(eris_VvOp[a0:a1,:], order='C')
-            cache_col_a = numpy.asarray(eris_vVoP[:,a0:a1], order='C')
-            for b0, b1 in lib.prange_tril(0, nvira, bufsize):
-                cache_row_b = numpy.asarray(eris_vvop[b0:b1,:b1], order='C')
-                cache_col_b = numpy.asarray(eris_vvop[:b0,b0:b1], order='C')
-                ctr(et_sum, a0, a1, b0, b1, (cache_row_a,cache_col_a,
-                                             cache_row_b,cache_col_b))
-                cache_row_b = cache_col_b = None
-            cache_row_a = cache_col_a = None
+    if blockwise:
+        contract_blocks('baa', _rect_tasks(nvirb, nvira, bufsize/nproc), contract,
+                        lambda *x: _load_rect_cache(eris_VvOp, eris_vVoP, eris_vvop, *x))
+    else:
+        for a0, a1 in lib.prange(0, nvirb, int(bufsize/nvira+1)):
+            with lib.call_in_background(contract) as ctr:
+                cache_row_a = numpy.asarray(eris_VvOp[a0:a1,:], order='C')
+                cache_col_a = numpy.asarray(eris_vVoP[:,a0:a1], order='C')
+                for b0, b1 in lib.prange_tril(0, nvira, bufsize):
+                    cache_row_b = numpy.asarray(eris_vvop[b0:b1,:b1], order='C')
+                    cache_col_b = numpy.asarray(eris_vvop[:b0,b0:b1], order='C')
+                    ctr(et_sum, a0, a1, b0, b1, (cache_row_a,cache_col_a,
+                                                 cache_row_b,cache_col_b))
+                    cache_row_b = cache_col_b = None
+                cache_row_a = cache_col_a = None
     cpu1 = log.timer_debug1('contract_baa', *cpu1)
 
     t2baT = numpy.ndarray((nvirb,nvira,noccb,nocca), buffer=t2abT)
@@ -121,17 +153,22 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     ts = t1bT, t1aT, t2bbT, t2baT
     vooo = (eris_VOOO, eris_VoOo, eris_vOoO)
     contract = _gen_contract_baa(ts, vooo, (mo_eb,mo_ea), orbsym, log)
-    for a0, a1 in lib.prange(0, nvira, int(bufsize/nvirb+1)):
-        with lib.call_in_background(contract) as ctr:
-            cache_row_a = numpy.asarray(eris_vVoP[a0:a1,:], order='C')
-            cache_col_a = numpy.asarray(eris_VvOp[:,a0:a1], order='C')
-            for b0, b1 in lib.prange_tril(0, nvirb, bufsize):
-                cache_row_b = numpy.asarray(eris_VVOP[b0:b1,:b1], order='C')
-                cache_col_b = numpy.asarray(eris_VVOP[:b0,b0:b1], order='C')
-                ctr(et_sum, a0, a1, b0, b1, (cache_row_a,cache_col_a,
-                                             cache_row_b,cache_col_b))
-                cache_row_b = cache_col_b = None
-            cache_row_a = cache_col_a = None
+    if blockwise:
+        contract_blocks('abb', _rect_tasks(nvira, nvirb, bufsize/nproc), contract,
+                        lambda *x: _load_rect_cache(eris_vVoP, eris_VvOp, eris_VVOP, *x))
+        progress.close()
+    else:
+        for a0, a1 in lib.prange(0, nvira, int(bufsize/nvirb+1)):
+            with lib.call_in_background(contract) as ctr:
+                cache_row_a = numpy.asarray(eris_vVoP[a0:a1,:], order='C')
+                cache_col_a = numpy.asarray(eris_VvOp[:,a0:a1], order='C')
+                for b0, b1 in lib.prange_tril(0, nvirb, bufsize):
+                    cache_row_b = numpy.asarray(eris_VVOP[b0:b1,:b1], order='C')
+                    cache_col_b = numpy.asarray(eris_VVOP[:b0,b0:b1], order='C')
+                    ctr(et_sum, a0, a1, b0, b1, (cache_row_a,cache_col_a,
+                                                 cache_row_b,cache_col_b))
+                    cache_row_b = cache_col_b = None
+                cache_row_a = cache_col_a = None
     cpu1 = log.timer_debug1('contract_abb', *cpu1)
 
     t2ab[:] = ftmp['t2ab']
@@ -215,7 +252,21 @@ def _gen_contract_baa(ts, vooo, mo_energy, orbsym, log):
         return et
     return contract
 
-def _sort_eri(mycc, eris, h5tmp, log):
+def _rect_tasks(nvira, nvirb, bufsize):
+    '''Blocks of the baa (or abb) contraction.  nvira is the number of virtual
+    orbitals of the single spin, nvirb of the pair spin.'''
+    return [(a0, a1, b0, b1)
+            for a0, a1 in lib.prange(0, nvira, int(bufsize/nvirb+1))
+            for b0, b1 in lib.prange_tril(0, nvirb, bufsize) if b1 > b0]
+
+def _load_rect_cache(VvOp, vVoP, vvop, a0, a1, b0, b1):
+    cache_row_a = numpy.asarray(VvOp[a0:a1,:], order='C')
+    cache_col_a = numpy.asarray(vVoP[:,a0:a1], order='C')
+    cache_row_b = numpy.asarray(vvop[b0:b1,:b1], order='C')
+    cache_col_b = numpy.asarray(vvop[:b0,b0:b1], order='C')
+    return cache_row_a, cache_col_a, cache_row_b, cache_col_b
+
+def _sort_eri(mycc, eris, h5tmp, log, nproc=1):
     cpu1 = (time.clock(), time.time())
     nocca = eris.nocca
     noccb = eris.noccb
@@ -224,10 +275,16 @@ def _sort_eri(mycc, eris, h5tmp, log):
     nvira = nmoa - nocca
     nvirb = nmob - noccb
 
-    eris_vvop = h5tmp.create_dataset('vvop', (nvira,nvira,nocca,nmoa), 'f8')
-    eris_VVOP = h5tmp.create_dataset('VVOP', (nvirb,nvirb,noccb,nmob), 'f8')
-    eris_vVoP = h5tmp.create_dataset('vVoP', (nvira,nvirb,nocca,nmob), 'f8')
-    eris_VvOp = h5tmp.create_dataset('VvOp', (nvirb,nvira,noccb,nmoa), 'f8')
+    if nproc > 1:  # shared with the worker processes
+        eris_vvop = ccsd_t._memmap_tmp((nvira,nvira,nocca,nmoa))
+        eris_VVOP = ccsd_t._memmap_tmp((nvirb,nvirb,noccb,nmob))
+        eris_vVoP = ccsd_t._memmap_tmp((nvira,nvirb,nocca,nmob))
+        eris_VvOp = ccsd_t._memmap_tmp((nvirb,nvira,noccb,nmoa))
+    else:
+        eris_vvop = h5tmp.create_dataset('vvop', (nvira,nvira,nocca,nmoa), 'f8')
+        eris_VVOP = h5tmp.create_dataset('VVOP', (nvirb,nvirb,noccb,nmob), 'f8')
+        eris_vVoP = h5tmp.create_dataset('vVoP', (nvira,nvirb,nocca,nmob), 'f8')
+        eris_VvOp = h5tmp.create_dataset('VvOp', (nvirb,nvira,noccb,nmoa), 'f8')
 
     max_memory = max(2000, mycc.max_memory - lib.current_memory()[0])
     max_memory = min(8000, max_memory*.9)
@@ -303,6 +360,7 @@ def _sort_eri(mycc, eris, h5tmp, log):
                 bufopv, buf1 = buf1, bufopv
             ovvo = ovvv = None
             cpu1 = log.timer_debug1('transpose %d:%d'%(j0,j1), *cpu1)
+    return eris_vvop, eris_VVOP, eris_vVoP, eris_VvOp
 
 
 if __name__ == '__main__':
@@ -407,6 +407,7 @@ class CISD(lib.StreamObject):
 
         self.frozen = frozen
         self.direct = False
+        self.direct_screen_tol = 1e-13
         self.chkfile = None
 
 ##################################################
@@ -459,6 +460,11 @@ class CISD(lib.StreamObject):
 
     def kernel(self, ci0=None, eris=None):
         return self.cisd(ci0, eris)
+
+    def fno(self, thresh=1e-6, pct_occ=None, nvir_act=None, density_fit=False):
+        from pyscf.cc import addons
+        return addons.fno(self, thresh, pct_occ, nvir_act, density_fit)
+
     def cisd(self, ci0=None, eris=None):
         if eris is None:
             eris = self.ao2mo(self.mo_coeff)
@@ -11,6 +11,10 @@ from pyscf import lib
 
 libfci = lib.load_library('libfci')
 
+# The link_index tables larger than this (in MB) are not generated by the FCI
+# solvers.  The string links are generated on the fly in libfci instead.
+MAX_LINKSTR_MEMORY = 200
+
 def gen_strings4orblist(orb_list, nelec):
     '''Generate string from the given orbital list.
 
@@ -97,6 +101,11 @@ def num_strings(n, m):
     else:
         return math.factorial(n) // (math.factorial(n-m)*math.factorial(m))
 
+def linkstr_index_memory(norb, nocc):
+    '''Memory (in MB) required by the link_index table of gen_linkstr_index'''
+    nlink = nocc * (norb - nocc + 1)
+    return num_strings(norb, nocc) * nlink * 16 / 1e6
+
 def gen_linkstr_index_o0(orb_list, nelec, strs=None):
     if strs is None:
         strs = gen_strings4orblist(orb_list, nelec)
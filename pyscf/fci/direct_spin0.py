@@ -51,6 +51,43 @@ def contract_1e(f1e, fcivec, norb, nelec, link_index=None):
 # no *.5 because FCIcontract_2e_spin0 only compute half of the contraction
     return lib.transpose_sum(ci1, inplace=True).reshape(fcivec.shape)
 
+def contract_2e_multi(eri, fcivecs, norb, nelec, link_index=None):
+    '''Contract the 2-electron Hamiltonian with a list of symmetrized FCI
+    vectors.  See also :func:`direct_spin1.contract_2e_multi`
+    '''
+    fcivecs = [numpy.asarray(x, order='C') for x in fcivecs]
+    nvec = len(fcivecs)
+    if nvec == 0:
+        return []
+    eri = ao2mo.restore(4, eri, norb)
+    lib.transpose_sum(eri, inplace=True)
+    eri *= .5
+    otf = direct_spin1._otf_linkstr(norb, nelec, link_index)
+    if otf:
+        neleca = direct_spin1._unpack_nelec(nelec)[0]
+        na = cistring.num_strings(norb, neleca)
+    else:
+        link_index = _unpack(norb, nelec, link_index)
+        na, nlink = link_index.shape[:2]
+    assert(all(x.size == na**2 for x in fcivecs))
+    ci1s = [numpy.empty((na,na)) for x in fcivecs]
+
+    Tvecs = ctypes.c_void_p * nvec
+    ci0_ptrs = Tvecs(*[x.ctypes.data_as(ctypes.c_void_p) for x in fcivecs])
+    ci1_ptrs = Tvecs(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci1s])
+    if otf:
+        libfci.FCIcontract_2e_spin0_otf(eri.ctypes.data_as(ctypes.c_void_p),
+                                        ci0_ptrs, ci1_ptrs, ctypes.c_int(nvec),
+                                        ctypes.c_int(norb), ctypes.c_int(neleca))
+    else:
+        libfci.FCIcontract_2e_spin0_nvec(eri.ctypes.data_as(ctypes.c_void_p),
+                                         ci0_ptrs, ci1_ptrs, ctypes.c_int(nvec),
+                                         ctypes.c_int(norb), ctypes.c_int(na),
+                                         ctypes.c_int(nlink),
+                                         link_index.ctypes.data_as(ctypes.c_void_p))
+    return [lib.transpose_sum(ci1, inplace=True).reshape(x.shape)
+            for ci1, x in zip(ci1s, fcivecs)]
+
 # Note eri is NOT the 2e hamiltonian matrix, the 2e hamiltonian is
 # h2e = eri_{pq,rs} p^+ q r^+ s
 #     = (pq|rs) p^+ r^+ s q - (pq|rs) \delta_{qr} p^+ s
@@ -63,6 +100,8 @@ def contract_1e(f1e, fcivec, norb, nelec, link_index=None):
 @lib.with_doc(direct_spin1.contract_2e.__doc__)
 def contract_2e(eri, fcivec, norb, nelec, link_index=None):
     fcivec = numpy.asarray(fcivec, order='C')
+    if direct_spin1._otf_linkstr(norb, nelec, link_index):
+        return contract_2e_multi(eri, [fcivec], norb, nelec)[0]
     eri = ao2mo.restore(4, eri, norb)
     lib.transpose_sum(eri, inplace=True)
     eri *= .5
@@ -139,7 +178,7 @@ def trans_rdm1s(cibra, ciket, norb, nelec, link_index=None):
         else:
             neleca, nelecb = nelec
             assert(neleca == nelecb)
-        link_index = cistring.gen_linkstr_index(range(norb), neleca)
+        link_index = rdm._unpack_linkstr(norb, (neleca,neleca), None)[0]
     rdm1a = rdm.make_rdm1('FCItrans_rdm1a', cibra, ciket,
                           norb, nelec, link_index)
     rdm1b = rdm.make_rdm1('FCItrans_rdm1b', cibra, ciket,
@@ -213,48 +252,61 @@ def kernel_ms0(fci, h1e, eri, norb, nelec, ci0=None, link_index=None,
 
     assert(fci.spin is None or fci.spin == 0)
 
-    link_index = _unpack(norb, nelec, link_index)
+    if direct_spin1._otf_linkstr(norb, nelec, link_index):
+# link_index=None is passed to contract_2e.  The string links are generated on
+# the fly for large tables
+        na = cistring.num_strings(norb, direct_spin1._unpack_nelec(nelec)[0])
+    else:
+        if link_index is None:
+            link_index = direct_spin1._cached_link_index(fci, norb, nelec, _unpack)
+        na = link_index.shape[0]
     h1e = numpy.ascontiguousarray(h1e)
     eri = numpy.ascontiguousarray(eri)
-    na = link_index.shape[0]
-    hdiag = fci.make_hdiag(h1e, eri, norb, nelec)
-
-    try:
-        addr, h0 = fci.pspace(h1e, eri, norb, nelec, hdiag, max(pspace_size,nroots))
-        if pspace_size > 0:
-            pw, pv = fci.eig(h0)
-        else:
-            pw = pv = None
 
-        if pspace_size >= na*na and ci0 is None and not davidson_only:
+    precond_data = direct_spin1._load_precond(fci, h1e, eri, norb, nelec, ci0,
+                                              pspace_size)
+    if precond_data is not None:
+        hdiag, addr, pw, pv = precond_data
+    else:
+        hdiag = fci.make_hdiag(h1e, eri, norb, nelec)
+        try:
+            addr, h0 = fci.pspace(h1e, eri, norb, nelec, hdiag, max(pspace_size,nroots))
+            if pspace_size > 0:
+                pw, pv = fci.eig(h0)
+            else:
+                pw = pv = None
+            direct_spin1._save_precond(fci, h1e, eri, norb, nelec, pspace_size,
+                                       hdiag, addr, pw, pv)
+
+            if pspace_size >= na*na and ci0 is None and not davidson_only:
 # The degenerated wfn can break symmetry.  The davidson iteration with proper
 # initial guess doesn't have this issue
-            if na*na == 1:
-                return pw[0]+ecore, pv[:,0].reshape(1,1)
-            elif nroots > 1:
-                civec = numpy.empty((nroots,na*na))
-                civec[:,addr] = pv[:,:nroots].T
-                civec = civec.reshape(nroots,na,na)
-                try:
-                    return pw[:nroots]+ecore, [_check_(ci) for ci in civec]
-                except ValueError:
-                    pass
-            elif abs(pw[0]-pw[1]) > 1e-12:
-                civec = numpy.empty((na*na))
-                civec[addr] = pv[:,0]
-                civec = civec.reshape(na,na)
-                civec = lib.transpose_sum(civec) * .5
-                # direct diagonalization may lead to triplet ground state
+                if na*na == 1:
+                    return pw[0]+ecore, pv[:,0].reshape(1,1)
+                elif nroots > 1:
+                    civec = numpy.empty((nroots,na*na))
+                    civec[:,addr] = pv[:,:nroots].T
+                    civec = civec.reshape(nroots,na,na)
+                    try:
+                        return pw[:nroots]+ecore, [_check_(ci) for ci in civec]
+                    except ValueError:
+                        pass
+                elif abs(pw[0]-pw[1]) > 1e-12:
+                    civec = numpy.empty((na*na))
+                    civec[addr] = pv[:,0]
+                    civec = civec.reshape(na,na)
+                    civec = lib.transpose_sum(civec) * .5
+                    # direct diagonalization may lead to triplet ground state
 ##TODO: optimize initial guess.  Using pspace vector as initial guess may have
 ## spin problems.  The 'ground state' of psapce vector may have different spin
 ## state to the true ground state.
-                try:
-                    return pw[0]+ecore, _check_(civec.reshape(na,na))
-                except ValueError:
-                    pass
-    except NotImplementedError:
-        addr = [0]
-        pw = pv = None
+                    try:
+                        return pw[0]+ecore, _check_(civec.reshape(na,na))
+                    except ValueError:
+                        pass
+        except NotImplementedError:
+            addr = [0]
+            pw = pv = None
 
     precond = fci.make_precond(hdiag, pw, pv, addr)
 
@@ -262,6 +314,12 @@ def kernel_ms0(fci, h1e, eri, norb, nelec, ci0=None, link_index=None,
     def hop(c):
         hc = fci.contract_2e(h2e, c.reshape(na,na), norb, nelec, link_index)
         return hc.ravel()
+    if direct_spin1._has_contract_2e_multi(fci):
+        def hop_multi(cs):
+            hcs = fci.contract_2e_multi(h2e, [c.reshape(na,na) for c in cs],
+                                        norb, nelec, link_index)
+            return [hc.ravel() for hc in hcs]
+        hop.multi = hop_multi
 
 #TODO: check spin of initial guess
     if ci0 is None:
@@ -322,6 +380,10 @@ class FCISolver(direct_spin1.FCISolver):
     def contract_2e(self, eri, fcivec, norb, nelec, link_index=None, **kwargs):
         return contract_2e(eri, fcivec, norb, nelec, link_index, **kwargs)
 
+    def contract_2e_multi(self, eri, fcivecs, norb, nelec, link_index=None,
+                          **kwargs):
+        return contract_2e_multi(eri, fcivecs, norb, nelec, link_index, **kwargs)
+
     def get_init_guess(self, norb, nelec, nroots, hdiag):
         return get_init_guess(norb, nelec, nroots, hdiag)
 
@@ -51,6 +51,16 @@ def contract_1e(f1e, fcivec, norb, nelec, link_index=None, orbsym=None):
 def contract_2e(eri, fcivec, norb, nelec, link_index=None, orbsym=None, wfnsym=0):
     if orbsym is None:
         return direct_spin0.contract_2e(eri, fcivec, norb, nelec, link_index)
+    return contract_2e_multi(eri, [fcivec], norb, nelec, link_index,
+                             orbsym, wfnsym)[0]
+
+def contract_2e_multi(eri, fcivecs, norb, nelec, link_index=None, orbsym=None,
+                      wfnsym=0):
+    '''Contract the 2-electron Hamiltonian with a list of symmetrized FCI
+    vectors.  See also :func:`direct_spin1_symm.contract_2e_multi`
+    '''
+    if orbsym is None:
+        return direct_spin0.contract_2e_multi(eri, fcivecs, norb, nelec, link_index)
 
     eri = ao2mo.restore(4, eri, norb)
     neleca, nelecb = direct_spin1._unpack_nelec(nelec)
@@ -67,30 +77,34 @@ def contract_2e(eri, fcivec, norb, nelec, link_index=None, orbsym=None, wfnsym=0
     linka_ptr = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in link_indexa])
     eri_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in eri_irs])
     dimirrep = (ctypes.c_int*TOTIRREPS)(*[x.shape[0] for x in eri_irs])
-    fcivec_shape = fcivec.shape
-    fcivec = fcivec.reshape((na,na), order='C')
-    ci1new = numpy.zeros_like(fcivec)
     nas = (ctypes.c_int*TOTIRREPS)(*[x.size for x in aidx])
 
-    ci0 = []
-    ci1 = []
-    for ir in range(TOTIRREPS):
-        ma, mb = aidx[ir].size, aidx[wfnsym^ir].size
-        ci0.append(numpy.zeros((ma,mb)))
-        ci1.append(numpy.zeros((ma,mb)))
-        if ma > 0 and mb > 0:
-            lib.take_2d(fcivec, aidx[ir], aidx[wfnsym^ir], out=ci0[ir])
-    ci0_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci0])
-    ci1_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci1])
-    libfci.FCIcontract_2e_symm1(eri_ptrs, ci0_ptrs, ci1_ptrs,
-                                ctypes.c_int(norb), nas, nas,
-                                ctypes.c_int(nlinka), ctypes.c_int(nlinka),
-                                linka_ptr, linka_ptr, dimirrep,
-                                ctypes.c_int(wfnsym))
-    for ir in range(TOTIRREPS):
-        if ci0[ir].size > 0:
-            lib.takebak_2d(ci1new, ci1[ir], aidx[ir], aidx[wfnsym^ir])
-    return lib.transpose_sum(ci1new, inplace=True).reshape(fcivec_shape)
+    ci1s = []
+    for fcivec in fcivecs:
+        fcivec_shape = fcivec.shape
+        fcivec = numpy.asarray(fcivec, order='C').reshape(na,na)
+        ci1new = numpy.zeros_like(fcivec)
+
+        ci0 = []
+        ci1 = []
+        for ir in range(TOTIRREPS):
+            ma, mb = aidx[ir].size, aidx[wfnsym^ir].size
+            ci0.append(numpy.zeros((ma,mb)))
+            ci1.append(numpy.zeros((ma,mb)))
+            if ma > 0 and mb > 0:
+                lib.take_2d(fcivec, aidx[ir], aidx[wfnsym^ir], out=ci0[ir])
+        ci0_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci0])
+        ci1_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci1])
+        libfci.FCIcontract_2e_symm1(eri_ptrs, ci0_ptrs, ci1_ptrs,
+                                    ctypes.c_int(norb), nas, nas,
+                                    ctypes.c_int(nlinka), ctypes.c_int(nlinka),
+                                    linka_ptr, linka_ptr, dimirrep,
+                                    ctypes.c_int(wfnsym))
+        for ir in range(TOTIRREPS):
+            if ci0[ir].size > 0:
+                lib.takebak_2d(ci1new, ci1[ir], aidx[ir], aidx[wfnsym^ir])
+        ci1s.append(lib.transpose_sum(ci1new, inplace=True).reshape(fcivec_shape))
+    return ci1s
 
 
 def kernel(h1e, eri, norb, nelec, ci0=None, level_shift=1e-3, tol=1e-10,
@@ -229,6 +243,14 @@ class FCISolver(direct_spin0.FCISolver):
         wfnsym = direct_spin1_symm._id_wfnsym(self, norb, nelec, wfnsym)
         return contract_2e(eri, fcivec, norb, nelec, link_index, orbsym, wfnsym, **kwargs)
 
+    def contract_2e_multi(self, eri, fcivecs, norb, nelec, link_index=None,
+                          orbsym=None, wfnsym=None, **kwargs):
+        if orbsym is None: orbsym = self.orbsym
+        if wfnsym is None: wfnsym = self.wfnsym
+        wfnsym = direct_spin1_symm._id_wfnsym(self, norb, nelec, wfnsym)
+        return contract_2e_multi(eri, fcivecs, norb, nelec, link_index, orbsym,
+                                 wfnsym, **kwargs)
+
     def get_init_guess(self, norb, nelec, nroots, hdiag):
         wfnsym = direct_spin1_symm._id_wfnsym(self, norb, nelec, self.wfnsym)
         return get_init_guess(norb, nelec, nroots, hdiag, self.orbsym, wfnsym)
@@ -27,6 +27,7 @@ direct_nosym        No            No             No**               Yes
 
 import sys
 import ctypes
+import tempfile
 import numpy
 import scipy.linalg
 from pyscf import lib
@@ -94,6 +95,8 @@ def contract_2e(eri, fcivec, norb, nelec, link_index=None):
     See also :func:`direct_spin1.absorb_h1e`
     '''
     fcivec = numpy.asarray(fcivec, order='C')
+    if _otf_linkstr(norb, nelec, link_index):
+        return contract_2e_multi(eri, [fcivec], norb, nelec)[0]
     eri = ao2mo.restore(4, eri, norb)
     link_indexa, link_indexb = _unpack(norb, nelec, link_index)
     na, nlinka = link_indexa.shape[:2]
@@ -111,6 +114,96 @@ def contract_2e(eri, fcivec, norb, nelec, link_index=None):
                                 link_indexb.ctypes.data_as(ctypes.c_void_p))
     return ci1
 
+def contract_2e_multi(eri, fcivecs, norb, nelec, link_index=None):
+    '''Contract the 2-electron Hamiltonian with a list of FCI vectors.
+
+    The string links are traversed only once for all vectors and the
+    intermediates of all vectors are contracted with eri in one matrix
+    multiplication.  The returned list has the same length as fcivecs, each
+    element being identical to the output of :func:`contract_2e` for the
+    corresponding FCI vector.
+
+    If link_index is not given and the link_index tables are larger than
+    cistring.MAX_LINKSTR_MEMORY, the string links are generated on the fly.
+    '''
+    fcivecs = [numpy.asarray(x, order='C') for x in fcivecs]
+    nvec = len(fcivecs)
+    if nvec == 0:
+        return []
+    eri = ao2mo.restore(4, eri, norb)
+    otf = _otf_linkstr(norb, nelec, link_index)
+    if otf:
+        neleca, nelecb = _unpack_nelec(nelec)
+        na = cistring.num_strings(norb, neleca)
+        nb = cistring.num_strings(norb, nelecb)
+    else:
+        link_indexa, link_indexb = _unpack(norb, nelec, link_index)
+        na, nlinka = link_indexa.shape[:2]
+        nb, nlinkb = link_indexb.shape[:2]
+    assert(all(x.size == na*nb for x in fcivecs))
+    ci1s = [numpy.empty_like(x) for x in fcivecs]
+
+    Tvecs = ctypes.c_void_p * nvec
+    ci0_ptrs = Tvecs(*[x.ctypes.data_as(ctypes.c_void_p) for x in fcivecs])
+    ci1_ptrs = Tvecs(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci1s])
+    if otf:
+        libfci.FCIcontract_2e_spin1_otf(eri.ctypes.data_as(ctypes.c_void_p),
+                                        ci0_ptrs, ci1_ptrs, ctypes.c_int(nvec),
+                                        ctypes.c_int(norb), ctypes.c_int(neleca),
+                                        ctypes.c_int(nelecb))
+    else:
+        libfci.FCIcontract_2e_spin1_nvec(eri.ctypes.data_as(ctypes.c_void_p),
+                                         ci0_ptrs, ci1_ptrs, ctypes.c_int(nvec),
+                                         ctypes.c_int(norb),
+                                         ctypes.c_int(na), ctypes.c_int(nb),
+                                         ctypes.c_int(nlinka), ctypes.c_int(nlinkb),
+                                         link_indexa.ctypes.data_as(ctypes.c_void_p),
+                                         link_indexb.ctypes.data_as(ctypes.c_void_p))
+    return ci1s
+
+def contract_2e_blocked(eri, fcivec, norb, nelec, out=None,
+                        max_memory=lib.param.MAX_MEMORY, verbose=logger.NOTE):
+    '''Contract the 2-electron Hamiltonian with a FCI vector which may be
+    larger than the memory, eg a numpy.memmap.
+
+    The (intermediate) alpha strings are processed block by block.  A block
+    covers as many rows of fcivec as fit in max_memory (in MB).  The string
+    links of each block are generated on the fly, no link_index table is
+    needed.  For each block, only the rows of fcivec and out of the alpha
+    strings linked to the block are read and updated.  Besides the per-thread
+    buffers of the length of one column of fcivec, no array of the size of the
+    CI vector is allocated.  The result is accumulated in out, which can be a
+    numpy.memmap of the same shape as fcivec.  It is identical to the output
+    of :func:`contract_2e`.
+    '''
+    neleca, nelecb = _unpack_nelec(nelec)
+    na = cistring.num_strings(norb, neleca)
+    nb = cistring.num_strings(norb, nelecb)
+    fcivec = numpy.asarray(fcivec, order='C')
+    assert(fcivec.size == na*nb)
+    if out is None:
+        out = numpy.zeros_like(fcivec)
+    else:
+        assert(out.size == na*nb and out.flags.c_contiguous)
+        out[:] = 0
+    eri = ao2mo.restore(4, eri, norb)
+    log = logger.new_logger(None, verbose)
+
+# Per-thread buffers of libfci, the beta strings are blocked by STRB_BLKSIZE=112
+    mem_now = (na * 112 * 8 + eri.nbytes) * lib.num_threads() / 1e6
+    blksize = int((max_memory - mem_now) * 1e6 / (nb * 8))
+    blksize = min(na, max(1, blksize))
+    ci0_ptr = (ctypes.c_void_p * 1)(fcivec.ctypes.data_as(ctypes.c_void_p))
+    ci1_ptr = (ctypes.c_void_p * 1)(out.ctypes.data_as(ctypes.c_void_p))
+    for a0, a1 in lib.prange(0, na, blksize):
+        libfci.FCIcontract_2e_spin1_blk(eri.ctypes.data_as(ctypes.c_void_p),
+                                        ci0_ptr, ci1_ptr, ctypes.c_int(1),
+                                        ctypes.c_int(norb), ctypes.c_int(neleca),
+                                        ctypes.c_int(nelecb),
+                                        ctypes.c_int(a0), ctypes.c_int(a1))
+        log.debug1('contract_2e_blocked alpha strings [%d:%d] of %d', a0, a1, na)
+    return out
+
 def make_hdiag(h1e, eri, norb, nelec):
     '''Diagonal Hamiltonian for Davidson preconditioner
     '''
@@ -232,11 +325,7 @@ def energy(h1e, eri, fcivec, norb, nelec, link_index=None):
 def make_rdm1s(fcivec, norb, nelec, link_index=None):
     '''Spin searated 1-particle density matrices, (alpha,beta)
     '''
-    if link_index is None:
-        neleca, nelecb = _unpack_nelec(nelec)
-        link_indexa = cistring.gen_linkstr_index(range(norb), neleca)
-        link_indexb = cistring.gen_linkstr_index(range(norb), nelecb)
-        link_index = (link_indexa, link_indexb)
+    link_index = rdm._unpack_linkstr(norb, nelec, link_index)
     rdm1a = rdm.make_rdm1_spin1('FCImake_rdm1a', fcivec, fcivec,
                                 norb, nelec, link_index)
     rdm1b = rdm.make_rdm1_spin1('FCImake_rdm1b', fcivec, fcivec,
@@ -370,41 +459,69 @@ def kernel_ms1(fci, h1e, eri, norb, nelec, ci0=None, link_index=None,
     if pspace_size is None: pspace_size = fci.pspace_size
 
     nelec = _unpack_nelec(nelec, fci.spin)
-    link_indexa, link_indexb = _unpack(norb, nelec, link_index)
-    na = link_indexa.shape[0]
-    nb = link_indexb.shape[0]
-    hdiag = fci.make_hdiag(h1e, eri, norb, nelec)
-
-    try:
-        addr, h0 = fci.pspace(h1e, eri, norb, nelec, hdiag, max(pspace_size,nroots))
-        if pspace_size > 0:
-            pw, pv = fci.eig(h0)
-        else:
-            pw = pv = None
-
-        if pspace_size >= na*nb and ci0 is None and not davidson_only:
+    if _otf_linkstr(norb, nelec, link_index):
+# link_index=None is passed to contract_2e.  The string links are generated on
+# the fly for large tables
+        na = cistring.num_strings(norb, nelec[0])
+        nb = cistring.num_strings(norb, nelec[1])
+    else:
+        if link_index is None:
+            link_index = _cached_link_index(fci, norb, nelec)
+        na = link_index[0].shape[0]
+        nb = link_index[1].shape[0]
+
+    precond_data = _load_precond(fci, h1e, eri, norb, nelec, ci0, pspace_size)
+    if precond_data is not None:
+        hdiag, addr, pw, pv = precond_data
+    else:
+        hdiag = fci.make_hdiag(h1e, eri, norb, nelec)
+        try:
+            addr, h0 = fci.pspace(h1e, eri, norb, nelec, hdiag, max(pspace_size,nroots))
+            if pspace_size > 0:
+                pw, pv = fci.eig(h0)
+            else:
+                pw = pv = None
+            _save_precond(fci, h1e, eri, norb, nelec, pspace_size,
+                          hdiag, addr, pw, pv)
+
+            if pspace_size >= na*nb and ci0 is None and not davidson_only:
 # The degenerated wfn can break symmetry.  The davidson iteration with proper
 # initial guess doesn't have this issue
-            if na*nb == 1:
-                return pw[0]+ecore, pv[:,0].reshape(1,1)
-            elif nroots > 1:
-                civec = numpy.empty((nroots,na*nb))
-                civec[:,addr] = pv[:,:nroots].T
-                return pw[:nroots]+ecore, [c.reshape(na,nb) for c in civec]
-            elif abs(pw[0]-pw[1]) > 1e-12:
-                civec = numpy.empty((na*nb))
-                civec[addr] = pv[:,0]
-                return pw[0]+ecore, civec.reshape(na,nb)
-    except NotImplementedError:
-        addr = [0]
-        pw = pv = None
+                if na*nb == 1:
+                    return pw[0]+ecore, pv[:,0].reshape(1,1)
+                elif nroots > 1:
+                    civec = numpy.empty((nroots,na*nb))
+                    civec[:,addr] = pv[:,:nroots].T
+                    return pw[:nroots]+ecore, [c.reshape(na,nb) for c in civec]
+                elif abs(pw[0]-pw[1]) > 1e-12:
+                    civec = numpy.empty((na*nb))
+                    civec[addr] = pv[:,0]
+                    return pw[0]+ecore, civec.reshape(na,nb)
+        except NotImplementedError:
+            addr = [0]
+            pw = pv = None
 
     precond = fci.make_precond(hdiag, pw, pv, addr)
 
+    if max_memory is None: max_memory = fci.max_memory
     h2e = fci.absorb_h1e(h1e, eri, norb, nelec, .5)
-    def hop(c):
-        hc = fci.contract_2e(h2e, c, norb, nelec, (link_indexa,link_indexb))
-        return hc.ravel()
+    if na*nb*8e-6 > max_memory and _contract_2e_is_default(fci):
+# The CI vector does not fit in memory.  H*c is computed by the blocked driver
+# and stored in a memory-mapped scratch file
+        def hop(c):
+            hc = numpy.memmap(tempfile.TemporaryFile(dir=lib.param.TMPDIR),
+                              dtype=numpy.double, mode='w+', shape=(na*nb,))
+            return contract_2e_blocked(h2e, c, norb, nelec, hc, max_memory,
+                                       fci.verbose)
+    else:
+        def hop(c):
+            hc = fci.contract_2e(h2e, c, norb, nelec, link_index)
+            return hc.ravel()
+        if _has_contract_2e_multi(fci):
+            def hop_multi(cs):
+                hcs = fci.contract_2e_multi(h2e, cs, norb, nelec, link_index)
+                return [hc.ravel() for hc in hcs]
+            hop.multi = hop_multi
 
     if ci0 is None:
         if hasattr(fci, 'get_init_guess'):
@@ -425,7 +542,6 @@ def kernel_ms1(fci, h1e, eri, norb, nelec, ci0=None, link_index=None,
     if lindep is None: lindep = fci.lindep
     if max_cycle is None: max_cycle = fci.max_cycle
     if max_space is None: max_space = fci.max_space
-    if max_memory is None: max_memory = fci.max_memory
     if verbose is None: verbose = logger.Logger(fci.stdout, fci.verbose)
 
     with lib.with_omp_threads(fci.threads):
@@ -496,6 +612,12 @@ class FCISolver(lib.StreamObject):
             The dimension of Hamiltonian matrix over which Davidson iteration
             algorithm will be used for the eigenvalue problem.  Default is 400.
             This is roughly corresponding to a (6e,6o) system.
+        precond_reuse_tol : float
+            If the kernel is called with an initial guess (eg in the CASSCF
+            iterations) and the integrals differ from those of the previous
+            call by less than precond_reuse_tol, the preconditioner (hdiag
+            and pspace eigenpairs) of the previous call is reused.  The
+            converged solution is not affected.  Default is 0 (disabled).
         nroots : int
             Number of states to be solved.  Default is 1, the ground state.
         spin : int or None
@@ -546,6 +668,8 @@ class FCISolver(lib.StreamObject):
         self.davidson_only = False
         self.nroots = 1
         self.pspace_size = 400
+        # reuse the preconditioner of the previous call for a warm start
+        self.precond_reuse_tol = 0
         self.spin = None
 # Initialize symmetry attributes for the compatibility with direct_spin1_symm
 # solver.  They are not used by direct_spin1 solver.
@@ -592,6 +716,11 @@ class FCISolver(lib.StreamObject):
     def contract_2e(self, eri, fcivec, norb, nelec, link_index=None, **kwargs):
         return contract_2e(eri, fcivec, norb, nelec, link_index, **kwargs)
 
+    def contract_2e_multi(self, eri, fcivecs, norb, nelec, link_index=None,
+                          **kwargs):
+        '''Contract the 2-electron Hamiltonian with a list of FCI vectors'''
+        return contract_2e_multi(eri, fcivecs, norb, nelec, link_index, **kwargs)
+
     def eig(self, op, x0=None, precond=None, **kwargs):
         if isinstance(op, numpy.ndarray):
             self.converged = True
@@ -601,9 +730,19 @@ class FCISolver(lib.StreamObject):
             lessio = True
         else:
             lessio = False
-        self.converged, e, ci = \
-                lib.davidson1(lambda xs: [op(x) for x in xs],
-                              x0, precond, lessio=lessio, **kwargs)
+        # op.multi, if present, computes the sigma vectors of all new trial
+        # vectors in one call.  The block Davidson solver is used then, unless
+        # the CI vectors are so large that the subspace is kept on disk.
+        aop = getattr(op, 'multi', None)
+        if (aop is not None and not lessio and
+            'dot' not in kwargs and 'callback' not in kwargs):
+            self.converged, e, ci = \
+                    lib.davidson_block(aop, x0, precond, **kwargs)
+        else:
+            if aop is None:
+                aop = lambda xs: [op(x) for x in xs]
+            self.converged, e, ci = \
+                    lib.davidson1(aop, x0, precond, lessio=lessio, **kwargs)
         if kwargs['nroots'] == 1:
             self.converged = self.converged[0]
             e = e[0]
@@ -717,6 +856,13 @@ class FCISolver(lib.StreamObject):
 FCI = FCISolver
 
 
+def _contract_2e_is_default(fci):
+    '''Whether fci.contract_2e is the spin1 contract_2e function of this
+    module.'''
+    fn = getattr(fci.contract_2e, '__func__', None)
+    return (fn is FCISolver.__dict__['contract_2e'] and
+            _has_contract_2e_multi(fci))
+
 def _unpack_nelec(nelec, spin=None):
     if spin is None:
         spin = 0
@@ -728,6 +874,38 @@ def _unpack_nelec(nelec, spin=None):
         nelec = neleca, nelecb
     return nelec
 
+def _has_contract_2e_multi(fci):
+    '''Whether fci.contract_2e_multi is consistent with fci.contract_2e.  It is
+    not if contract_2e was overwritten (eg by addons.fix_spin_ or in a
+    subclass) without a matched contract_2e_multi.'''
+    if 'contract_2e' in fci.__dict__:
+        return False
+    defined = False
+    for cls in type(fci).__mro__:
+        if 'contract_2e' in cls.__dict__ or 'contract_2e_multi' in cls.__dict__:
+            if not defined and ('contract_2e' not in cls.__dict__ or
+                                'contract_2e_multi' not in cls.__dict__):
+                return False
+            defined = True
+# The module level contract_2e function may be overwritten too, eg
+# addons.fix_spin_(direct_spin1)
+            mod = sys.modules[cls.__module__]
+            fn = getattr(mod, 'contract_2e', None)
+            if fn is not None and getattr(fn, '__module__', None) != mod.__name__:
+                return False
+    return defined
+
+def _otf_linkstr(norb, nelec, link_index):
+    '''Whether to generate the string links on the fly rather than the
+    link_index tables'''
+    if link_index is not None:
+        return False
+    neleca, nelecb = _unpack_nelec(nelec)
+    mem = cistring.linkstr_index_memory(norb, neleca)
+    if neleca != nelecb:
+        mem += cistring.linkstr_index_memory(norb, nelecb)
+    return mem > cistring.MAX_LINKSTR_MEMORY
+
 def _unpack(norb, nelec, link_index, spin=None):
     if link_index is None:
         neleca, nelecb = _unpack_nelec(nelec, spin)
@@ -738,6 +916,42 @@ def _unpack(norb, nelec, link_index, spin=None):
     else:
         return link_index
 
+def _cached_link_index(fci, norb, nelec, unpack=_unpack):
+    '''The link_index tables generated by unpack(norb, nelec, None).  They are
+    cached in the solver for each (norb, nelec), so that repeated calls to
+    the solver (eg in the CASSCF macro- and micro-iterations) do not
+    regenerate them.'''
+    cache = fci.__dict__.setdefault('_link_index_cache', {})
+    key = (unpack.__module__, norb, tuple(_unpack_nelec(nelec)))
+    if key not in cache:
+        cache[key] = unpack(norb, nelec, None)
+    return cache[key]
+
+def _load_precond(fci, h1e, eri, norb, nelec, ci0, pspace_size):
+    '''hdiag and the pspace eigenpairs of the previous call to the solver, if
+    they can be reused as the preconditioner.  This requires an initial guess
+    ci0, the same (norb, nelec, pspace_size), and integrals which differ from
+    the previous ones by no more than fci.precond_reuse_tol.  The converged
+    solution does not depend on the preconditioner.'''
+    tol = getattr(fci, 'precond_reuse_tol', 0)
+    cache = getattr(fci, '_precond_cache', None)
+    if not tol or ci0 is None or cache is None:
+        return None
+    key, h1e_last, eri_last, precond_data = cache
+    h1e = numpy.asarray(h1e)
+    eri = numpy.asarray(eri)
+    if (key == (norb, tuple(_unpack_nelec(nelec)), pspace_size) and
+        h1e.shape == h1e_last.shape and eri.shape == eri_last.shape and
+        abs(h1e - h1e_last).max() < tol and abs(eri - eri_last).max() < tol):
+        return precond_data
+    return None
+
+def _save_precond(fci, h1e, eri, norb, nelec, pspace_size, hdiag, addr, pw, pv):
+    if getattr(fci, 'precond_reuse_tol', 0):
+        key = (norb, tuple(_unpack_nelec(nelec)), pspace_size)
+        fci._precond_cache = (key, numpy.array(h1e, copy=True),
+                              numpy.array(eri, copy=True), (hdiag, addr, pw, pv))
+
 
 if __name__ == '__main__':
     from functools import reduce
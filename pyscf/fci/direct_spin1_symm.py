@@ -48,6 +48,17 @@ def contract_1e(f1e, fcivec, norb, nelec, link_index=None, orbsym=None):
 def contract_2e(eri, fcivec, norb, nelec, link_index=None, orbsym=None, wfnsym=0):
     if orbsym is None:
         return direct_spin1.contract_2e(eri, fcivec, norb, nelec, link_index)
+    return contract_2e_multi(eri, [fcivec], norb, nelec, link_index,
+                             orbsym, wfnsym)[0]
+
+def contract_2e_multi(eri, fcivecs, norb, nelec, link_index=None, orbsym=None,
+                      wfnsym=0):
+    '''Contract the 2-electron Hamiltonian with a list of FCI vectors.  The
+    symmetry adapted integrals and string links are generated once for all
+    vectors.
+    '''
+    if orbsym is None:
+        return direct_spin1.contract_2e_multi(eri, fcivecs, norb, nelec, link_index)
 
     eri = ao2mo.restore(4, eri, norb)
     neleca, nelecb = direct_spin1._unpack_nelec(nelec)
@@ -69,52 +80,56 @@ def contract_2e(eri, fcivec, norb, nelec, link_index=None, orbsym=None, wfnsym=0
     linkb_ptr = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in link_indexb])
     eri_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in eri_irs])
     dimirrep = (ctypes.c_int*TOTIRREPS)(*[x.shape[0] for x in eri_irs])
-    fcivec_shape = fcivec.shape
-    fcivec = fcivec.reshape((na,nb), order='C')
-    ci1new = numpy.zeros_like(fcivec)
     nas = (ctypes.c_int*TOTIRREPS)(*[x.size for x in aidx])
     nbs = (ctypes.c_int*TOTIRREPS)(*[x.size for x in bidx])
 
+    ci1s = []
+    for fcivec in fcivecs:
+        fcivec_shape = fcivec.shape
+        fcivec = numpy.asarray(fcivec, order='C').reshape(na,nb)
+        ci1new = numpy.zeros_like(fcivec)
+
 # aa, ab
-    ci0 = []
-    ci1 = []
-    for ir in range(TOTIRREPS):
-        ma, mb = aidx[ir].size, bidx[wfnsym^ir].size
-        ci0.append(numpy.zeros((ma,mb)))
-        ci1.append(numpy.zeros((ma,mb)))
-        if ma > 0 and mb > 0:
-            lib.take_2d(fcivec, aidx[ir], bidx[wfnsym^ir], out=ci0[ir])
-    ci0_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci0])
-    ci1_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci1])
-    libfci.FCIcontract_2e_symm1(eri_ptrs, ci0_ptrs, ci1_ptrs,
-                                ctypes.c_int(norb), nas, nbs,
-                                ctypes.c_int(nlinka), ctypes.c_int(nlinkb),
-                                linka_ptr, linkb_ptr, dimirrep,
-                                ctypes.c_int(wfnsym))
-    for ir in range(TOTIRREPS):
-        if ci0[ir].size > 0:
-            lib.takebak_2d(ci1new, ci1[ir], aidx[ir], bidx[wfnsym^ir])
+        ci0 = []
+        ci1 = []
+        for ir in range(TOTIRREPS):
+            ma, mb = aidx[ir].size, bidx[wfnsym^ir].size
+            ci0.append(numpy.zeros((ma,mb)))
+            ci1.append(numpy.zeros((ma,mb)))
+            if ma > 0 and mb > 0:
+                lib.take_2d(fcivec, aidx[ir], bidx[wfnsym^ir], out=ci0[ir])
+        ci0_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci0])
+        ci1_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci1])
+        libfci.FCIcontract_2e_symm1(eri_ptrs, ci0_ptrs, ci1_ptrs,
+                                    ctypes.c_int(norb), nas, nbs,
+                                    ctypes.c_int(nlinka), ctypes.c_int(nlinkb),
+                                    linka_ptr, linkb_ptr, dimirrep,
+                                    ctypes.c_int(wfnsym))
+        for ir in range(TOTIRREPS):
+            if ci0[ir].size > 0:
+                lib.takebak_2d(ci1new, ci1[ir], aidx[ir], bidx[wfnsym^ir])
 
 # bb, ba
-    ci0T = []
-    for ir in range(TOTIRREPS):
-        mb, ma = bidx[ir].size, aidx[wfnsym^ir].size
-        ci0T.append(numpy.zeros((mb,ma)))
-        if ma > 0 and mb > 0:
-            lib.transpose(ci0[wfnsym^ir], out=ci0T[ir])
-    ci0, ci0T = ci0T, None
-    ci1 = [numpy.zeros_like(x) for x in ci0]
-    ci0_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci0])
-    ci1_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci1])
-    libfci.FCIcontract_2e_symm1(eri_ptrs, ci0_ptrs, ci1_ptrs,
-                                ctypes.c_int(norb), nbs, nas,
-                                ctypes.c_int(nlinkb), ctypes.c_int(nlinka),
-                                linkb_ptr, linka_ptr, dimirrep,
-                                ctypes.c_int(wfnsym))
-    for ir in range(TOTIRREPS):
-        if ci0[ir].size > 0:
-            lib.takebak_2d(ci1new, lib.transpose(ci1[ir]), aidx[wfnsym^ir], bidx[ir])
-    return ci1new.reshape(fcivec_shape)
+        ci0T = []
+        for ir in range(TOTIRREPS):
+            mb, ma = bidx[ir].size, aidx[wfnsym^ir].size
+            ci0T.append(numpy.zeros((mb,ma)))
+            if ma > 0 and mb > 0:
+                lib.transpose(ci0[wfnsym^ir], out=ci0T[ir])
+        ci0, ci0T = ci0T, None
+        ci1 = [numpy.zeros_like(x) for x in ci0]
+        ci0_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci0])
+        ci1_ptrs = Tirrep(*[x.ctypes.data_as(ctypes.c_void_p) for x in ci1])
+        libfci.FCIcontract_2e_symm1(eri_ptrs, ci0_ptrs, ci1_ptrs,
+                                    ctypes.c_int(norb), nbs, nas,
+                                    ctypes.c_int(nlinkb), ctypes.c_int(nlinka),
+                                    linkb_ptr, linka_ptr, dimirrep,
+                                    ctypes.c_int(wfnsym))
+        for ir in range(TOTIRREPS):
+            if ci0[ir].size > 0:
+                lib.takebak_2d(ci1new, lib.transpose(ci1[ir]), aidx[wfnsym^ir], bidx[ir])
+        ci1s.append(ci1new.reshape(fcivec_shape))
+    return ci1s
 
 
 def kernel(h1e, eri, norb, nelec, ci0=None, level_shift=1e-3, tol=1e-10,
@@ -315,6 +330,14 @@ class FCISolver(direct_spin1.FCISolver):
         wfnsym = _id_wfnsym(self, norb, nelec, wfnsym)
         return contract_2e(eri, fcivec, norb, nelec, link_index, orbsym, wfnsym, **kwargs)
 
+    def contract_2e_multi(self, eri, fcivecs, norb, nelec, link_index=None,
+                          orbsym=None, wfnsym=None, **kwargs):
+        if orbsym is None: orbsym = self.orbsym
+        if wfnsym is None: wfnsym = self.wfnsym
+        wfnsym = _id_wfnsym(self, norb, nelec, wfnsym)
+        return contract_2e_multi(eri, fcivecs, norb, nelec, link_index, orbsym,
+                                 wfnsym, **kwargs)
+
     def get_init_guess(self, norb, nelec, nroots, hdiag):
         wfnsym = _id_wfnsym(self, norb, nelec, self.wfnsym)
         return get_init_guess(norb, nelec, nroots, hdiag, self.orbsym, wfnsym)
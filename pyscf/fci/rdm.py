@@ -29,11 +29,11 @@ def reorder_rdm(rdm1, rdm2, inplace=False):
 def make_rdm1_ms0(fname, cibra, ciket, norb, nelec, link_index=None):
     cibra = numpy.asarray(cibra, order='C')
     ciket = numpy.asarray(ciket, order='C')
+    neleca, nelecb = _unpack_nelec(nelec)
     if link_index is None:
-        neleca, nelecb = _unpack_nelec(nelec)
         assert(neleca == nelecb)
-        link_index = cistring.gen_linkstr_index(range(norb), neleca)
-    na, nlink = link_index.shape[:2]
+        link_index = _unpack_linkstr(norb, nelec, None)[0]
+    na, nlink, link_ptr = _linkstr_args(link_index, norb, neleca)
     assert(cibra.size == na**2)
     assert(ciket.size == na**2)
     rdm1 = numpy.empty((norb,norb))
@@ -44,8 +44,7 @@ def make_rdm1_ms0(fname, cibra, ciket, norb, nelec, link_index=None):
        ctypes.c_int(norb),
        ctypes.c_int(na), ctypes.c_int(na),
        ctypes.c_int(nlink), ctypes.c_int(nlink),
-       link_index.ctypes.data_as(ctypes.c_void_p),
-       link_index.ctypes.data_as(ctypes.c_void_p))
+       link_ptr, link_ptr)
     return rdm1
 
 # NOTE the rdm2 is calculated as <p^+ q r^+ s>, call reorder_rdm to transform
@@ -56,7 +55,7 @@ def make_rdm12_ms0(fname, cibra, ciket, norb, nelec, link_index=None, symm=0):
     if link_index is None:
         neleca, nelecb = _unpack_nelec(nelec)
         assert(neleca == nelecb)
-        link_index = cistring.gen_linkstr_index(range(norb), neleca)
+        link_index = _unpack_linkstr(norb, nelec, None)[0]
     link_index = (link_index, link_index)
     return make_rdm12_spin1(fname, cibra, ciket, norb, nelec, link_index, symm)
 
@@ -73,15 +72,10 @@ def make_rdm12(fname, cibra, ciket, norb, nelec, link_index=None, symm=0):
 def make_rdm1_spin1(fname, cibra, ciket, norb, nelec, link_index=None):
     cibra = numpy.asarray(cibra, order='C')
     ciket = numpy.asarray(ciket, order='C')
-    if link_index is None:
-        neleca, nelecb = _unpack_nelec(nelec)
-        link_indexa = link_indexb = cistring.gen_linkstr_index(range(norb), neleca)
-        if neleca != nelecb:
-            link_indexb = cistring.gen_linkstr_index(range(norb), nelecb)
-    else:
-        link_indexa, link_indexb = link_index
-    na,nlinka = link_indexa.shape[:2]
-    nb,nlinkb = link_indexb.shape[:2]
+    neleca, nelecb = _unpack_nelec(nelec)
+    link_indexa, link_indexb = _unpack_linkstr(norb, nelec, link_index)
+    na, nlinka, link_ptra = _linkstr_args(link_indexa, norb, neleca)
+    nb, nlinkb, link_ptrb = _linkstr_args(link_indexb, norb, nelecb)
     assert(cibra.size == na*nb)
     assert(ciket.size == na*nb)
     rdm1 = numpy.empty((norb,norb))
@@ -92,8 +86,7 @@ def make_rdm1_spin1(fname, cibra, ciket, norb, nelec, link_index=None):
        ctypes.c_int(norb),
        ctypes.c_int(na), ctypes.c_int(nb),
        ctypes.c_int(nlinka), ctypes.c_int(nlinkb),
-       link_indexa.ctypes.data_as(ctypes.c_void_p),
-       link_indexb.ctypes.data_as(ctypes.c_void_p))
+       link_ptra, link_ptrb)
     return rdm1
 
 # NOTE the rdm2 is calculated as <p^+ q r^+ s>, call reorder_rdm to transform
@@ -103,15 +96,10 @@ def make_rdm1_spin1(fname, cibra, ciket, norb, nelec, link_index=None):
 def make_rdm12_spin1(fname, cibra, ciket, norb, nelec, link_index=None, symm=0):
     cibra = numpy.asarray(cibra, order='C')
     ciket = numpy.asarray(ciket, order='C')
-    if link_index is None:
-        neleca, nelecb = _unpack_nelec(nelec)
-        link_indexa = link_indexb = cistring.gen_linkstr_index(range(norb), neleca)
-        if neleca != nelecb:
-            link_indexb = cistring.gen_linkstr_index(range(norb), nelecb)
-    else:
-        link_indexa, link_indexb = link_index
-    na,nlinka = link_indexa.shape[:2]
-    nb,nlinkb = link_indexb.shape[:2]
+    neleca, nelecb = _unpack_nelec(nelec)
+    link_indexa, link_indexb = _unpack_linkstr(norb, nelec, link_index)
+    na, nlinka, link_ptra = _linkstr_args(link_indexa, norb, neleca)
+    nb, nlinkb, link_ptrb = _linkstr_args(link_indexb, norb, nelecb)
     assert(cibra.size == na*nb)
     assert(ciket.size == na*nb)
     rdm1 = numpy.empty((norb,norb))
@@ -124,11 +112,36 @@ def make_rdm12_spin1(fname, cibra, ciket, norb, nelec, link_index=None, symm=0):
                         ctypes.c_int(norb),
                         ctypes.c_int(na), ctypes.c_int(nb),
                         ctypes.c_int(nlinka), ctypes.c_int(nlinkb),
-                        link_indexa.ctypes.data_as(ctypes.c_void_p),
-                        link_indexb.ctypes.data_as(ctypes.c_void_p),
-                        ctypes.c_int(symm))
+                        link_ptra, link_ptrb, ctypes.c_int(symm))
     return rdm1, rdm2
 
+def _unpack_linkstr(norb, nelec, link_index):
+    '''The (alpha, beta) link_index tables.  If the tables are larger than
+    cistring.MAX_LINKSTR_MEMORY, (None, None) is returned and the string links
+    are generated in libfci.
+    '''
+    if link_index is not None:
+        return link_index
+    neleca, nelecb = _unpack_nelec(nelec)
+    mem = cistring.linkstr_index_memory(norb, neleca)
+    if neleca != nelecb:
+        mem += cistring.linkstr_index_memory(norb, nelecb)
+    if mem > cistring.MAX_LINKSTR_MEMORY:
+        return None, None
+    link_indexa = link_indexb = cistring.gen_linkstr_index(range(norb), neleca)
+    if neleca != nelecb:
+        link_indexb = cistring.gen_linkstr_index(range(norb), nelecb)
+    return link_indexa, link_indexb
+
+def _linkstr_args(link_index, norb, nocc):
+    '''(nstr, nlink, pointer) of the link_index table to pass to libfci'''
+    if link_index is None:
+        return (cistring.num_strings(norb, nocc), nocc*(norb-nocc+1),
+                ctypes.c_void_p())
+    else:
+        na, nlink = link_index.shape[:2]
+        return na, nlink, link_index.ctypes.data_as(ctypes.c_void_p)
+
 
 ##############################
 #
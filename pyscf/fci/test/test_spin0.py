@@ -53,12 +53,48 @@ class KnowValues(unittest.TestCase):
         self.assertTrue(numpy.allclose(ci1ref, ci1))
         self.assertAlmostEqual(numpy.linalg.norm(ci1), 15.076640155228787, 7)
 
+    def test_contract_2e_multi(self):
+        ci1s = fci.direct_spin0.contract_2e_multi(g2e, [ci0, ci1.ravel()],
+                                                  norb, nelec)
+        for c, hc in zip([ci0, ci1.ravel()], ci1s):
+            ref = fci.direct_spin0.contract_2e(g2e, c, norb, nelec)
+            self.assertEqual(hc.shape, c.shape)
+            self.assertAlmostEqual(abs(hc-ref).max(), 0, 11)
+
+    def test_contract_2e_otf(self):
+        ref = fci.direct_spin0.contract_2e(g2e, ci0, norb, nelec)
+        dmref = fci.direct_spin0.make_rdm12(ci0, norb, nelec)
+        max_memory_bak = fci.cistring.MAX_LINKSTR_MEMORY
+        fci.cistring.MAX_LINKSTR_MEMORY = 0
+        try:
+            hc = fci.direct_spin0.contract_2e(g2e, ci0, norb, nelec)
+            self.assertAlmostEqual(abs(hc-ref).max(), 0, 11)
+            dm1, dm2 = fci.direct_spin0.make_rdm12(ci0, norb, nelec)
+            self.assertAlmostEqual(abs(dm1-dmref[0]).max(), 0, 12)
+            self.assertAlmostEqual(abs(dm2-dmref[1]).max(), 0, 12)
+            e = fci.direct_spin0.kernel(h1e, g2e, norb, nelec)[0]
+            self.assertAlmostEqual(e, -9.1491239851241737, 8)
+        finally:
+            fci.cistring.MAX_LINKSTR_MEMORY = max_memory_bak
+
     def test_kernel(self):
         e, c = fci.direct_spin0.kernel(h1e, g2e, norb, nelec)
         self.assertAlmostEqual(e, -9.1491239851241737, 8)
         e = fci.direct_spin0.energy(h1e, g2e, c, norb, nelec)
         self.assertAlmostEqual(e, -9.1491239851241737, 8)
 
+    def test_precond_reuse(self):
+        cis = fci.direct_spin0.FCISolver()
+        cis.precond_reuse_tol = 1e-2
+        e0, c0 = cis.kernel(h1e, g2e, norb, nelec)
+        numpy.random.seed(1)
+        dh = numpy.random.random((norb,norb)) * 1e-3
+        dh = dh + dh.T
+        e1, c1 = cis.kernel(h1e+dh, g2e, norb, nelec, ci0=c0)
+        self.assertAlmostEqual(abs(cis._precond_cache[1] - h1e).max(), 0, 14)
+        eref = fci.direct_spin0.kernel(h1e+dh, g2e, norb, nelec)[0]
+        self.assertAlmostEqual(e1, eref, 9)
+
     def test_rdm1(self):
         dm1ref = fci.direct_spin1.make_rdm1(ci0, norb, nelec)
         dm1 = fci.direct_spin0.make_rdm1(ci0, norb, nelec)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import unittest
+import tempfile
 from functools import reduce
 import numpy
 from pyscf import gto
@@ -57,6 +58,64 @@ class KnowValues(unittest.TestCase):
         ci3 = fci.direct_spin1.contract_2e(g2e, ci2, norb, neleci)
         self.assertAlmostEqual(numpy.linalg.norm(ci3), 127.49780293866368, 6)
 
+    def test_contract_2e_multi(self):
+        ci1s = fci.direct_spin1.contract_2e_multi(g2e, [ci0, ci1], norb, nelec)
+        self.assertEqual(len(ci1s), 2)
+        for c, hc in zip([ci0, ci1], ci1s):
+            ref = fci.direct_spin1.contract_2e(g2e, c, norb, nelec)
+            self.assertAlmostEqual(abs(hc-ref).max(), 0, 11)
+        ci1s = fci.direct_spin1.contract_2e_multi(g2e, [ci2, ci3, ci2.ravel()],
+                                                  norb, neleci)
+        for c, hc in zip([ci2, ci3, ci2.ravel()], ci1s):
+            ref = fci.direct_spin1.contract_2e(g2e, c, norb, neleci)
+            self.assertEqual(hc.shape, c.shape)
+            self.assertAlmostEqual(abs(hc-ref).max(), 0, 11)
+
+        cis = fci.direct_spin1.FCI()
+        e, c = cis.kernel(h1e, g2e, norb, neleci, nroots=3, davidson_only=True)
+        # contract_2e is patched by fix_spin_, Davidson falls back to the
+        # single vector hop
+        fci.addons.fix_spin_(cis, shift=0)
+        self.assertFalse(fci.direct_spin1._has_contract_2e_multi(cis))
+        eref = cis.kernel(h1e, g2e, norb, neleci, nroots=3, davidson_only=True)[0]
+        self.assertAlmostEqual(abs(e-eref).max(), 0, 8)
+
+    def test_contract_2e_otf(self):
+        ref = fci.direct_spin1.contract_2e(g2e, ci2, norb, neleci)
+        dm1ref = fci.direct_spin1.make_rdm1s(ci2, norb, neleci)
+        dm2ref = fci.direct_spin1.make_rdm12s(ci2, norb, neleci)[1]
+        eref = fci.direct_spin1.kernel(h1e, g2e, norb, neleci)[0]
+        max_memory_bak = fci.cistring.MAX_LINKSTR_MEMORY
+        fci.cistring.MAX_LINKSTR_MEMORY = 0
+        try:
+            self.assertTrue(fci.direct_spin1._otf_linkstr(norb, neleci, None))
+            hc = fci.direct_spin1.contract_2e(g2e, ci2, norb, neleci)
+            self.assertAlmostEqual(abs(hc-ref).max(), 0, 11)
+            hcs = fci.direct_spin1.contract_2e_multi(g2e, [ci3, ci2], norb, neleci)
+            self.assertAlmostEqual(abs(hcs[1]-ref).max(), 0, 11)
+            dm1 = fci.direct_spin1.make_rdm1s(ci2, norb, neleci)
+            self.assertAlmostEqual(abs(numpy.array(dm1)-dm1ref).max(), 0, 12)
+            dm2 = fci.direct_spin1.make_rdm12s(ci2, norb, neleci)[1]
+            for d, dref in zip(dm2, dm2ref):
+                self.assertAlmostEqual(abs(d-dref).max(), 0, 12)
+            e = fci.direct_spin1.kernel(h1e, g2e, norb, neleci)[0]
+            self.assertAlmostEqual(e, eref, 9)
+        finally:
+            fci.cistring.MAX_LINKSTR_MEMORY = max_memory_bak
+
+    def test_contract_2e_blocked(self):
+        ref = fci.direct_spin1.contract_2e(g2e, ci2, norb, neleci)
+        hc = fci.direct_spin1.contract_2e_blocked(g2e, ci2, norb, neleci)
+        self.assertAlmostEqual(abs(hc-ref).max(), 0, 11)
+        with tempfile.NamedTemporaryFile() as ftmp:
+            ci = numpy.memmap(ftmp.name, dtype=numpy.double, mode='w+',
+                              shape=(2,)+ci2.shape)
+            ci[0] = ci2
+            hc = fci.direct_spin1.contract_2e_blocked(g2e, ci[0], norb, neleci,
+                                                      out=ci[1], max_memory=.001)
+            self.assertAlmostEqual(abs(ci[1]-ref).max(), 0, 11)
+            del ci, hc
+
     def test_kernel(self):
         eref, cref = fci.direct_spin0.kernel(h1e, g2e, norb, mol.nelectron)
         e, c = fci.direct_spin1.kernel(h1e, g2e, norb, nelec)
@@ -67,6 +126,48 @@ class KnowValues(unittest.TestCase):
         e, c = fci.direct_spin1.kernel(h1e, g2e, norb, neleci)
         self.assertAlmostEqual(e, -8.7498253981782, 8)
 
+    def test_kernel_outcore(self):
+        cis = fci.direct_spin1.FCISolver()
+        cis.davidson_only = True
+        e0, c0 = cis.kernel(h1e, g2e, norb, neleci, nroots=2)
+        cis.max_memory = 1e-4
+        e1, c1 = cis.kernel(h1e, g2e, norb, neleci, nroots=2)
+        self.assertTrue(isinstance(c1[0], numpy.memmap))
+        self.assertAlmostEqual(abs(e1 - e0).max(), 0, 9)
+        self.assertAlmostEqual(e1[0], -8.7498253981782, 8)
+        self.assertAlmostEqual(abs(numpy.dot(c1[1].ravel(), c0[1].ravel())), 1, 6)
+
+    def test_kernel_davidson_block(self):
+        cis = fci.direct_spin1.FCISolver()
+        cis.davidson_only = True
+        cis.conv_tol = 1e-12
+        e0, c0 = cis.kernel(h1e, g2e, norb, nelec, nroots=3)
+        self.assertTrue(all(cis.converged))
+        # lib.davidson1 is used when a callback is given
+        e1, c1 = cis.kernel(h1e, g2e, norb, nelec, nroots=3,
+                            callback=lambda envs: None)
+        self.assertAlmostEqual(abs(e1 - e0).max(), 0, 9)
+        for k in range(3):
+            self.assertAlmostEqual(abs(numpy.dot(c1[k].ravel(), c0[k].ravel())), 1, 6)
+
+        hdiag = fci.direct_spin1.make_hdiag(h1e, g2e, norb, nelec)
+        addr, h0 = fci.direct_spin1.pspace(h1e, g2e, norb, nelec, hdiag, hdiag.size)
+        self.assertAlmostEqual(abs(e0 - numpy.linalg.eigh(h0)[0][:3]).max(), 0, 9)
+
+    def test_precond_reuse(self):
+        cis = fci.direct_spin1.FCISolver()
+        cis.precond_reuse_tol = 1e-2
+        e0, c0 = cis.kernel(h1e, g2e, norb, nelec)
+        numpy.random.seed(1)
+        dh = numpy.random.random((norb,norb)) * 1e-3
+        dh = dh + dh.T
+        e1, c1 = cis.kernel(h1e+dh, g2e, norb, nelec, ci0=c0)
+        # preconditioner of the first call is reused
+        self.assertAlmostEqual(abs(cis._precond_cache[1] - h1e).max(), 0, 14)
+        self.assertEqual(len(cis._link_index_cache), 1)
+        eref = fci.direct_spin1.kernel(h1e+dh, g2e, norb, nelec)[0]
+        self.assertAlmostEqual(e1, eref, 9)
+
     def test_hdiag(self):
         hdiagref = fci.direct_spin0.make_hdiag(h1e, g2e, norb, mol.nelectron)
         hdiag = fci.direct_spin1.make_hdiag(h1e, g2e, norb, nelec)
@@ -49,6 +49,24 @@ class KnowValues(unittest.TestCase):
         ci1 = cis.contract_2e(g2e, ci1, norb, nelec, wfnsym=3)
         self.assertAlmostEqual(numpy.linalg.norm(ci1), 81.343382883053323, 9)
 
+    def test_contract_2e_multi(self):
+        cs = [fci.addons.symmetrize_wfn(ci0, norb, nelec, orbsym, wfnsym=1),
+              fci.addons.symmetrize_wfn(ci0.T, norb, nelec, orbsym, wfnsym=1)]
+        ci1s = cis.contract_2e_multi(g2e, cs, norb, nelec, wfnsym=1)
+        for c, hc in zip(cs, ci1s):
+            ref = cis.contract_2e(g2e, c, norb, nelec, wfnsym=1)
+            self.assertAlmostEqual(abs(hc-ref).max(), 0, 11)
+        self.assertAlmostEqual(numpy.linalg.norm(ci1s[0]), 82.295069645213317, 9)
+
+        cis0 = fci.direct_spin0_symm.FCISolver(mol)
+        cis0.orbsym = orbsym
+        cs = [fci.addons.symmetrize_wfn(ci0+ci0.T, norb, nelec, orbsym, wfnsym=0),
+              fci.addons.symmetrize_wfn(ci0*ci0.T, norb, nelec, orbsym, wfnsym=0)]
+        ci1s = cis0.contract_2e_multi(g2e, cs, norb, nelec, wfnsym=0)
+        for c, hc in zip(cs, ci1s):
+            ref = fci.direct_spin1.contract_2e(g2e, c, norb, nelec)
+            self.assertAlmostEqual(abs(hc-ref).max(), 0, 10)
+
     def test_kernel(self):
         e, c = fci.direct_spin1_symm.kernel(h1e, g2e, norb, nelec, orbsym=orbsym)
         self.assertAlmostEqual(e, -84.200905534209554, 8)
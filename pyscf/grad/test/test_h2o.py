@@ -56,6 +56,38 @@ class KnowValues(unittest.TestCase):
         g1 = grad.ccsd.kernel(mycc)
         self.assertAlmostEqual(finger(g1), 0.065802850540912422, 8)
 
+    def test_ccsd_shared_eris(self):
+        from pyscf import cc
+        rhf = scf.RHF(h2o).run()
+        mycc = cc.CCSD(rhf)
+        ncall = []
+        ao2mo = mycc.ao2mo
+        def count_ao2mo(mo_coeff=None):
+            ncall.append(1)
+            return ao2mo(mo_coeff)
+        mycc.ao2mo = count_ao2mo
+        mycc.max_memory = 0  # outcore HDF5 integrals
+        mycc.kernel()
+        self.assertTrue(mycc.eris is None)
+        mycc.solve_lambda()
+        self.assertEqual(len(ncall), 2)
+
+        mycc.keep_eris = True
+        mycc.kernel()
+        mycc.solve_lambda()
+        mycc.ccsd_t()
+        g1 = grad.ccsd.kernel(mycc)
+        self.assertEqual(len(ncall), 3)
+        self.assertAlmostEqual(finger(g1), 0.065802850540912422, 7)
+
+        mycc.mo_coeff = rhf.mo_coeff * -1
+        mycc.get_eris()
+        self.assertEqual(len(ncall), 4)
+        mycc._scf = scf.RHF(h2o)
+        mycc.get_eris()
+        self.assertEqual(len(ncall), 5)
+        mycc.eris = None
+
     def test_rks_lda(self):
         mf = dft.RKS(h2o)
         mf.grids.prune = None
@@ -347,6 +347,281 @@ def select_strs_ctypes(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, ne
     str_add = numpy.asarray(str_add)
     return str_add
 
+def hash_strs(strs):
+    '''Open-addressing hash index of the determinant strings'''
+    strs = numpy.asarray(strs, dtype=numpy.uint64, order='C')
+    nstrs, nset = strs.shape
+    tabsize = 1 << (2*nstrs).bit_length()
+    table = numpy.empty(tabsize, dtype=numpy.int64)
+    libhci.hash_strs(table.ctypes.data_as(ctypes.c_void_p),
+                     ctypes.c_ulonglong(tabsize),
+                     strs.ctypes.data_as(ctypes.c_void_p),
+                     ctypes.c_ulonglong(nstrs),
+                     ctypes.c_int(nset))
+    return table
+
+def lookup_strs(table, strs, query):
+    '''Addresses of the query strings in the strings indexed by hash_strs.
+    -1 for the strings which are not found.
+    '''
+    strs = numpy.asarray(strs, dtype=numpy.uint64, order='C')
+    query = numpy.asarray(query, dtype=numpy.uint64, order='C')
+    nquery, nset = query.shape
+    addr = numpy.empty(nquery, dtype=numpy.int64)
+    libhci.lookup_strs(addr.ctypes.data_as(ctypes.c_void_p),
+                       query.ctypes.data_as(ctypes.c_void_p),
+                       ctypes.c_ulonglong(nquery),
+                       table.ctypes.data_as(ctypes.c_void_p),
+                       ctypes.c_ulonglong(table.size),
+                       strs.ctypes.data_as(ctypes.c_void_p),
+                       ctypes.c_int(nset))
+    return addr
+
+def argunique_hash(strs):
+    '''Indices of the unique strings, in the order of their first occurrence'''
+    strs = numpy.asarray(strs, dtype=numpy.uint64, order='C')
+    nstrs, nset = strs.shape
+    uniq_idx = numpy.empty(nstrs, dtype=numpy.uint64)
+    nstrs_ = numpy.array([nstrs], dtype=numpy.uint64)
+    libhci.hash_argunique(strs.ctypes.data_as(ctypes.c_void_p),
+                          uniq_idx.ctypes.data_as(ctypes.c_void_p),
+                          nstrs_.ctypes.data_as(ctypes.c_void_p),
+                          ctypes.c_int(nset))
+    return numpy.asarray(uniq_idx[:nstrs_[0]], dtype=numpy.int64)
+
+def update_hamiltonian(h1, eri, strs, norb, nelec, hmat=None, max_memory=1000):
+    '''Off-diagonal Hamiltonian matrix elements in the selected CI space.
+
+    The matrix is stored as hmat = (strs, rows, cols, vals), each pair of
+    connected determinants (rows[k], cols[k]) being stored once.  If the
+    matrix hmat of a previous space is given, the elements between the
+    determinants which remain in the space are taken from hmat and only the
+    couplings of the new determinants are computed.  None is returned if the
+    matrix elements do not fit in max_memory (MB).
+    '''
+    neleca, nelecb = nelec
+    h1 = numpy.asarray(h1, order='C')
+    eri = numpy.asarray(eri, order='C')
+    strs = numpy.asarray(strs, dtype=numpy.uint64, order='C')
+    ndet = strs.shape[0]
+    table = hash_strs(strs)
+
+    isnew = numpy.ones(ndet, dtype=numpy.int8)
+    if hmat is None:
+        rows = [numpy.empty(0, dtype=numpy.int64)]
+        cols = [numpy.empty(0, dtype=numpy.int64)]
+        vals = [numpy.empty(0)]
+    else:
+        strs_old, rows_old, cols_old, vals_old = hmat
+        addr = lookup_strs(table, strs, strs_old)
+        isnew[addr[addr >= 0]] = 0
+        mask = (addr[rows_old] >= 0) & (addr[cols_old] >= 0)
+        rows = [addr[rows_old[mask]]]
+        cols = [addr[cols_old[mask]]]
+        vals = [vals_old[mask]]
+    npair = rows[0].size
+
+    nvira = norb - neleca
+    nvirb = norb - nelecb
+    max_conn = (neleca * nvira + nelecb * nvirb +
+                neleca*(neleca-1)//2 * nvira*(nvira-1)//2 +
+                nelecb*(nelecb-1)//2 * nvirb*(nvirb-1)//2 +
+                neleca * nvira * nelecb * nvirb)
+    ndet_batch = max(1, int(max_memory*.2e6) // (16 * max_conn))
+    for p0, p1 in lib.prange(0, ndet, ndet_batch):
+        if not isnew[p0:p1].any():
+            continue
+        cols_batch = numpy.empty((p1-p0,max_conn), dtype=numpy.int64)
+        vals_batch = numpy.empty((p1-p0,max_conn))
+        nconn = numpy.empty(p1-p0, dtype=numpy.int32)
+        libhci.compute_h_connections(h1.ctypes.data_as(ctypes.c_void_p),
+                                     eri.ctypes.data_as(ctypes.c_void_p),
+                                     ctypes.c_int(norb),
+                                     ctypes.c_int(neleca),
+                                     ctypes.c_int(nelecb),
+                                     strs.ctypes.data_as(ctypes.c_void_p),
+                                     ctypes.c_ulonglong(ndet),
+                                     isnew.ctypes.data_as(ctypes.c_void_p),
+                                     table.ctypes.data_as(ctypes.c_void_p),
+                                     ctypes.c_ulonglong(table.size),
+                                     ctypes.c_ulonglong(p0),
+                                     ctypes.c_ulonglong(p1),
+                                     ctypes.c_int(max_conn),
+                                     cols_batch.ctypes.data_as(ctypes.c_void_p),
+                                     vals_batch.ctypes.data_as(ctypes.c_void_p),
+                                     nconn.ctypes.data_as(ctypes.c_void_p))
+        mask = numpy.arange(max_conn) < nconn[:,None]
+        rows.append(numpy.repeat(numpy.arange(p0, p1), nconn))
+        cols.append(cols_batch[mask])
+        vals.append(vals_batch[mask])
+        npair += rows[-1].size
+        if npair * 24e-6 > max_memory:
+            return None
+
+    return (strs, numpy.hstack(rows), numpy.hstack(cols), numpy.hstack(vals))
+
+def contract_2e_sparse(hmat, civec, hdiag):
+    '''H * C with the Hamiltonian given by update_hamiltonian and hdiag'''
+    strs, rows, cols, vals = hmat
+    ndet = strs.shape[0]
+    civec = numpy.asarray(civec, order='C')
+    hdiag = numpy.asarray(hdiag, order='C')
+    ci1 = numpy.empty(ndet)
+    libhci.contract_h_c_sparse(hdiag.ctypes.data_as(ctypes.c_void_p),
+                               rows.ctypes.data_as(ctypes.c_void_p),
+                               cols.ctypes.data_as(ctypes.c_void_p),
+                               vals.ctypes.data_as(ctypes.c_void_p),
+                               ctypes.c_ulonglong(rows.size),
+                               civec.ctypes.data_as(ctypes.c_void_p),
+                               ctypes.c_ulonglong(ndet),
+                               ci1.ctypes.data_as(ctypes.c_void_p))
+    return as_SCIvector(ci1, strs)
+
+def make_hdiag_ctypes(h1, eri, strs, norb, nelec):
+    '''Diagonal Hamiltonian elements of the determinants strs'''
+    neleca, nelecb = nelec
+    h1 = numpy.asarray(h1, order='C')
+    eri = numpy.asarray(ao2mo.restore(1, eri, norb), order='C')
+    strs = numpy.asarray(strs, order='C')
+    ndet = strs.shape[0]
+    hdiag = numpy.empty(ndet)
+    libhci.compute_hdiag(h1.ctypes.data_as(ctypes.c_void_p),
+                         eri.ctypes.data_as(ctypes.c_void_p),
+                         ctypes.c_int(norb),
+                         ctypes.c_int(neleca),
+                         ctypes.c_int(nelecb),
+                         strs.ctypes.data_as(ctypes.c_void_p),
+                         ctypes.c_ulonglong(ndet),
+                         hdiag.ctypes.data_as(ctypes.c_void_p))
+    return hdiag
+
+def select_strs_pt2(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, nelec,
+                    e0=None, nproc=None):
+    r'''Heat-bath selection of new strings from the determinants of civec.
+    If the energy e0 of civec is given, the Epstein-Nesbet PT2 correction
+
+        E2 = \sum_A |\sum_I <A|H|I> c_I|^2 / (e0 - <A|H|A>)
+
+    is computed in the same pass.  The sum runs over the determinants A
+    outside the space of civec which are connected to a determinant I by
+    |<A|H|I> c_I| > myci.pt2_cutoff.
+
+    The determinants of civec are split into batches.  If nproc > 1, the
+    batches are processed by nproc forked worker processes.  The strings
+    generated by each batch are made unique in the worker, then the batches
+    are merged.
+
+    Returns:
+        The selected strings (which are not in civec if e0 is given) and the
+        PT2 correction (None if e0 is not given)
+    '''
+    if nproc is None:
+        nproc = myci.nproc
+    strs = numpy.asarray(civec._strs, order='C')
+    ndet, nset = strs.shape
+    neleca, nelecb = nelec
+    nvira = norb - neleca
+    nvirb = norb - nelecb
+    do_pt2 = e0 is not None
+
+    h1 = numpy.asarray(h1, order='C')
+    eri = numpy.asarray(eri, order='C')
+    jk = numpy.asarray(jk, order='C')
+    civec = numpy.asarray(civec, order='C')
+    eri_sorted = numpy.asarray(eri_sorted, order='C')
+    jk_sorted = numpy.asarray(jk_sorted, order='C')
+    if do_pt2:
+        pt2_cutoff = myci.pt2_cutoff
+        if pt2_cutoff is None:
+            pt2_cutoff = myci.select_cutoff
+        table = hash_strs(strs)
+    else:
+        pt2_cutoff = myci.select_cutoff
+
+    # Upper bound of the number of determinants generated by one reference
+    # determinant
+    max_add = (neleca*nvira + nelecb*nvirb + neleca*nvira*nelecb*nvirb +
+               neleca*(neleca-1)//2 * nvira*(nvira-1)//2 +
+               nelecb*(nelecb-1)//2 * nvirb*(nvirb-1)//2)
+    max_add = max(1, max_add)
+    max_memory = myci.max_memory / max(1, nproc)
+    ndet_batch = max(1, int(max_memory*1e6) // (max_add * (nset*8+9)))
+
+    def select_batch(p0, p1):
+        nmax = max_add * (p1 - p0)
+        str_add = numpy.empty((nmax,nset), dtype=numpy.uint64)
+        n_str_add = numpy.array([nmax], dtype=numpy.uint64)
+        if do_pt2:
+            hac = numpy.empty(nmax)
+            sel = numpy.empty(nmax, dtype=numpy.int8)
+            hac_ptr = hac.ctypes.data_as(ctypes.c_void_p)
+            sel_ptr = sel.ctypes.data_as(ctypes.c_void_p)
+        else:
+            hac_ptr = sel_ptr = None
+        libhci.select_strs_pt2(h1.ctypes.data_as(ctypes.c_void_p),
+                               eri.ctypes.data_as(ctypes.c_void_p),
+                               jk.ctypes.data_as(ctypes.c_void_p),
+                               eri_sorted.ctypes.data_as(ctypes.c_void_p),
+                               jk_sorted.ctypes.data_as(ctypes.c_void_p),
+                               ctypes.c_int(norb),
+                               ctypes.c_int(neleca),
+                               ctypes.c_int(nelecb),
+                               strs.ctypes.data_as(ctypes.c_void_p),
+                               civec.ctypes.data_as(ctypes.c_void_p),
+                               ctypes.c_ulonglong(p0),
+                               ctypes.c_ulonglong(p1),
+                               ctypes.c_double(myci.select_cutoff),
+                               ctypes.c_double(pt2_cutoff),
+                               str_add.ctypes.data_as(ctypes.c_void_p),
+                               hac_ptr, sel_ptr,
+                               n_str_add.ctypes.data_as(ctypes.c_void_p))
+        n_str_add = int(n_str_add[0])
+        str_add = str_add[:n_str_add]
+        if not do_pt2:
+            return str_add[argunique_hash(str_add)]
+
+        external = lookup_strs(table, strs, str_add) < 0
+        return _merge_candidates(str_add[external], hac[:n_str_add][external],
+                                 sel[:n_str_add][external])
+
+    tasks = list(lib.prange(0, ndet, ndet_batch))
+    results = _run_batches(select_batch, tasks, nproc)
+
+    if not do_pt2:
+        str_add = numpy.vstack(results)
+        return str_add[argunique_hash(str_add)], None
+
+    str_add, hac, sel = _merge_candidates(*[numpy.concatenate(x)
+                                            for x in zip(*results)])
+    hdiag = make_hdiag_ctypes(h1, eri, str_add, norb, nelec)
+    e_pt2 = numpy.dot(hac**2, 1./(e0 - hdiag))
+    return str_add[sel], e_pt2
+
+def _merge_candidates(strs, hac, sel):
+    '''Remove the duplicated strings, summing up their PT2 numerators'''
+    if strs.shape[0] == 0:
+        return strs, hac, sel.astype(bool)
+    uniq_idx = argunique_hash(strs)
+    uniq_strs = strs[uniq_idx]
+    addr = lookup_strs(hash_strs(uniq_strs), uniq_strs, strs)
+    nuniq = uniq_idx.size
+    hac = numpy.bincount(addr, weights=hac, minlength=nuniq)
+    sel = numpy.bincount(addr, weights=sel, minlength=nuniq) > 0
+    return uniq_strs, hac, sel
+
+def _run_batches(fn, tasks, nproc):
+    '''Evaluate fn(p0, p1) for the batches (p0, p1) in tasks.  If nproc > 1,
+    the batches are evaluated by nproc forked worker processes.  The results
+    are returned in the order of tasks.
+    '''
+    if nproc <= 1 or len(tasks) <= 1:
+        return [fn(p0, p1) for p0, p1 in tasks]
+
+    results = [None] * len(tasks)
+    for i, res in lib.fork_imap(fn, tasks, nproc, 'Selection of determinants'):
+        results[i] = res
+    return results
+
 def enlarge_space(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, nelec):
     if not isinstance(civec, (tuple, list)):
         civec = [civec]
@@ -363,23 +638,23 @@ def enlarge_space(myci, civec, h1, eri, jk, eri_sorted, jk_sorted, norb, nelec):
 
     ci_coeff = [as_SCIvector(c[cidx], strs) for c in civec]
  
-    strs_new = strs.copy()
+    strs_new = [strs]
 
     for p in range(nroots):
-        str_add = select_strs_ctypes(myci, ci_coeff[p], h1, eri, jk, eri_sorted, jk_sorted, norb, nelec)
-        strs_new = numpy.vstack((strs, str_add))
+        str_add = select_strs_pt2(myci, ci_coeff[p], h1, eri, jk, eri_sorted, jk_sorted, norb, nelec)[0]
+        strs_new.append(str_add)
 
-    # Add strings together and remove duplicate strings
-    tmp = numpy.ascontiguousarray(strs_new).view(numpy.dtype((numpy.void, strs_new.dtype.itemsize * strs_new.shape[1])))
-    _, tmpidx = numpy.unique(tmp, return_index=True)
+    # Add strings together and remove duplicate strings.  The strings of the
+    # current space are kept in front in the same order, so that the
+    # Hamiltonian matrix elements between them can be reused
+    strs_new = numpy.vstack(strs_new)
+    strs_new = strs_new[argunique_hash(strs_new)]
 
     new_ci = []
     for p in range(nroots):
         c = numpy.zeros(strs_new.shape[0])
         c[:ci_coeff[p].shape[0]] = ci_coeff[p]
-        new_ci.append(c[tmpidx])
-
-    strs_new = strs_new[tmpidx]
+        new_ci.append(c)
 
     return [as_SCIvector(ci, strs_new) for ci in new_ci]
 
@@ -460,11 +735,29 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
 
     ci0 = myci.enlarge_space(ci0, h1e, eri, jk, eri_sorted, jk_sorted, norb, nelec)
 
+    # The off-diagonal Hamiltonian elements are stored and updated for the new
+    # determinants in each cycle, unless contract_2e is customized
+    # (eg by fix_spin)
+    hmat = None
+    sparse_h = _contract_2e_is_default(myci)
     def hop(c):
-        hc = myci.contract_2e((h1e, eri), as_SCIvector(c, ci_strs), norb, nelec, hdiag)
+        if hmat is None:
+            hc = myci.contract_2e((h1e, eri), as_SCIvector(c, ci_strs), norb, nelec, hdiag)
+        else:
+            hc = contract_2e_sparse(hmat, c, hdiag)
         return hc.ravel()
     precond = lambda x, e, *args: x/(hdiag-e+myci.level_shift)
 
+    def update_hmat(hmat):
+        t_start = time.time()
+        hmat = update_hamiltonian(h1e, eri, ci_strs, norb, nelec, hmat, max_memory)
+        t_current = time.time() - t_start
+        if hmat is None:
+            log.debug('Not enough memory for the Hamiltonian matrix elements')
+        else:
+            log.debug('Timing for the Hamiltonian matrix elements: %10.3f', t_current)
+        return hmat
+
     e_last = 0
     float_tol = 3e-4
     conv = False
@@ -474,6 +767,9 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
         log.info('\nMacroiteration %d', icycle)
         log.info('Number of CI configurations: %d', ci_strs.shape[0])
         hdiag = myci.make_hdiag(h1e, eri, ci_strs, norb, nelec)
+        if sparse_h:
+            hmat = update_hmat(hmat)
+            sparse_h = hmat is not None
         t_start = time.time()
         e, ci0 = myci.eig(hop, ci0, precond, tol=float_tol, lindep=lindep,
                           max_cycle=max_cycle, max_space=max_space, nroots=nroots,
@@ -504,6 +800,8 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
     log.info('\nExtra CI in the final selected space')
     log.info('Number of CI configurations: %d', ci_strs.shape[0])
     hdiag = myci.make_hdiag(h1e, eri, ci_strs, norb, nelec)
+    if sparse_h:
+        hmat = update_hmat(hmat)
     e, c = myci.eig(hop, ci0, precond, tol=tol, lindep=lindep,
                     max_cycle=max_cycle, max_space=max_space, nroots=nroots,
                     max_memory=max_memory, verbose=log, **kwargs)
@@ -512,11 +810,28 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
         e = [e]
     log.info('\nSelected CI  E = %s', numpy.array(e)+ecore)
 
+    if myci.pt2_cutoff is not None:
+        t_start = time.time()
+        e_pt2 = [select_strs_pt2(myci, as_SCIvector(c[i], ci_strs), h1e, eri, jk,
+                                 eri_sorted, jk_sorted, norb, nelec, e0=e[i])[1]
+                 for i in range(len(c))]
+        myci.e_pt2 = numpy.array(e_pt2)
+        t_current = time.time() - t_start
+        log.debug('Timing for the PT2 correction: %10.3f', t_current)
+        log.info('Selected CI  E(PT2) = %s', myci.e_pt2)
+        log.info('Selected CI  E+E(PT2) = %s', numpy.array(e)+ecore+myci.e_pt2)
+
     if (return_integrals):
         return (numpy.array(e)+ecore), [as_SCIvector(ci, ci_strs) for ci in c], eri_sorted, jk, jk_sorted
     else:
         return (numpy.array(e)+ecore), [as_SCIvector(ci, ci_strs) for ci in c]
 
+def _contract_2e_is_default(myci):
+    '''Whether contract_2e of myci is the one of the SelectedCI class'''
+    return ('contract_2e' not in myci.__dict__ and
+            getattr(myci.contract_2e, '__func__', None) is
+            SelectedCI.__dict__['contract_2e'])
+
 def fix_spin(myci, shift=.2, ss=None, **kwargs):
     r'''If Selected CI solver cannot stick on spin eigenfunction, modify the solver by
     adding a shift on spin square operator
@@ -691,20 +1006,32 @@ class SelectedCI(direct_spin1.FCISolver):
         self.conv_ndet_tol = 0.001
         self.nroots = 1
         self.max_iter = 10
-        # Maximum memory in MB for storing lists of selected strings
+        # Maximum memory in MB for storing lists of selected strings and the
+        # Hamiltonian matrix elements
         self.max_memory = 1000
+        # Epstein-Nesbet PT2 correction for the final selected space.  The
+        # determinants connected by |<A|H|I> c_I| > pt2_cutoff are included
+        # (None: no PT2 correction)
+        self.pt2_cutoff = None
+        # Number of worker processes for the selection of determinants
+        self.nproc = 1
 
 ##################################################
 # don't modify the following attributes, they are not input options
         #self.converged = False
         #self.ci = None
         self._strs = None
+        self.e_pt2 = None
         self._keys = set(self.__dict__.keys())
 
     def dump_flags(self, verbose=None):
         direct_spin1.FCISolver.dump_flags(self, verbose)
         logger.info(self, 'ci_coeff_cutoff %g', self.ci_coeff_cutoff)
         logger.info(self, 'select_cutoff   %g', self.select_cutoff)
+        if self.pt2_cutoff is not None:
+            logger.info(self, 'pt2_cutoff      %g', self.pt2_cutoff)
+        if self.nproc > 1:
+            logger.info(self, 'nproc = %d', self.nproc)
 
     # define absorb_h1e for compatibility to other FCI solver
     def absorb_h1e(h1, eri, *args, **kwargs):
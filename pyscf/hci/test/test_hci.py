@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+import unittest
+from functools import reduce
+import numpy
+from pyscf import lib
+from pyscf import gto
+from pyscf import scf
+from pyscf import ao2mo
+from pyscf import symm
+from pyscf import fci
+from pyscf.hci import hci
+
+mol = gto.Mole()
+mol.verbose = 0
+mol.output = None
+mol.atom = [['H', (0, 0, i*1.4)] for i in range(8)]
+mol.unit = 'Bohr'
+mol.basis = 'sto-3g'
+mol.symmetry = True
+mol.build()
+
+m = scf.RHF(mol)
+m.conv_tol = 1e-12
+m.scf()
+
+norb = m.mo_coeff.shape[1]
+nelec = (4, 4)
+h1 = reduce(numpy.dot, (m.mo_coeff.T, m.get_hcore(), m.mo_coeff))
+eri = ao2mo.restore(1, ao2mo.kernel(mol, m.mo_coeff), norb).ravel()
+eri_sorted = abs(eri).argsort()[::-1]
+jk = eri.reshape([norb]*4)
+jk = jk - jk.transpose(2,1,0,3)
+jk = jk.ravel()
+jk_sorted = abs(jk).argsort()[::-1]
+
+hf_str = numpy.hstack([hci.orblst2str(range(nelec[0]), norb),
+                       hci.orblst2str(range(nelec[1]), norb)]).reshape(1,-1)
+
+def enlarge_space(myci, civec):
+    return hci.enlarge_space(myci, civec, h1, eri, jk, eri_sorted, jk_sorted,
+                             norb, nelec)
+
+def hmat_to_dense(hmat):
+    strs, rows, cols, vals = hmat
+    ndet = len(strs)
+    h = numpy.zeros((ndet,ndet))
+    numpy.add.at(h, (rows, cols), vals)
+    return h + h.T
+
+class KnowValues(unittest.TestCase):
+    def test_contract_2e_sparse(self):
+        myci = hci.SCI()
+        myci.select_cutoff = 1e-3
+        myci.ci_coeff_cutoff = 1e-3
+        ci1 = enlarge_space(myci, [hci.as_SCIvector(numpy.ones(1), hf_str)])
+        numpy.random.seed(1)
+        c = numpy.random.random(len(ci1[0])) - .5
+        ci2 = enlarge_space(myci, [hci.as_SCIvector(c, ci1[0]._strs)])
+        h2e = fci.direct_spin1.absorb_h1e(h1, eri, norb, nelec, .5)
+# The couplings are found by a pair scan for the small space and by the
+# lookup of the excitations for the large space
+        for strs in (ci1[0]._strs, ci2[0]._strs):
+            c = hci.as_SCIvector(numpy.random.random(len(strs)) - .5, strs)
+            hdiag = hci.make_hdiag(h1, eri, strs, norb, nelec)
+            hmat = hci.update_hamiltonian(h1, eri, strs, norb, nelec)
+            hc = numpy.asarray(hci.contract_2e_sparse(hmat, c, hdiag))
+            ref = hci.contract_2e_ctypes((h1, eri), c, norb, nelec, hdiag)
+            self.assertAlmostEqual(abs(hc - ref).max(), 0, 10)
+
+            ref = hci.to_fci([c], norb, nelec)
+            ref = fci.direct_spin1.contract_2e(h2e, ref, norb, nelec)
+            ref = numpy.asarray(hci.from_fci(ref, strs, norb, nelec))
+            self.assertAlmostEqual(abs(hc - ref).max(), 0, 10)
+        self.assertTrue(len(ci1[0]) < 360 < len(ci2[0]))
+
+    def test_update_hamiltonian(self):
+        myci = hci.SCI()
+        myci.select_cutoff = 2e-3
+        myci.ci_coeff_cutoff = 2e-3
+        ci1 = enlarge_space(myci, [hci.as_SCIvector(numpy.ones(1), hf_str)])
+        strs1 = ci1[0]._strs
+        hmat1 = hci.update_hamiltonian(h1, eri, strs1, norb, nelec)
+
+        numpy.random.seed(2)
+        c = numpy.random.random(len(strs1)) - .5
+        c[numpy.random.random(len(strs1)) < .2] = 0
+        c *= 1./numpy.linalg.norm(c)
+        myci.select_cutoff = 5e-4
+        ci2 = enlarge_space(myci, [hci.as_SCIvector(c, strs1)])
+        strs2 = ci2[0]._strs
+        self.assertTrue(len(strs2) > len(strs1))
+
+        hmat2 = hci.update_hamiltonian(h1, eri, strs2, norb, nelec, hmat1)
+        ref = hci.update_hamiltonian(h1, eri, strs2, norb, nelec)
+        self.assertEqual(hmat2[1].size, ref[1].size)
+        self.assertAlmostEqual(abs(hmat_to_dense(hmat2) -
+                                   hmat_to_dense(ref)).max(), 0, 12)
+
+    def test_argunique_hash(self):
+        numpy.random.seed(3)
+        strs = numpy.random.randint(0, 12, (300,2)).astype(numpy.uint64)
+        idx = hci.argunique_hash(strs)
+        key = strs[:,0] * 12 + strs[:,1]
+        uniq, ref = numpy.unique(key, return_index=True)
+        self.assertEqual(len(idx), len(uniq))
+        # indices of the first occurrences, in the order of the input
+        self.assertTrue(numpy.all(idx == numpy.sort(ref)))
+
+    def test_kernel_nroots(self):
+        myci = hci.SCI()
+        myci.select_cutoff = 1e-4
+        myci.ci_coeff_cutoff = 1e-4
+        myci.nroots = 2
+        e, c = myci.kernel(h1, eri, norb, nelec)
+        self.assertEqual(len(c), 2)
+
+# The singlet states of the irrep of the HF determinant
+        orbsym = symm.label_orb_symm(mol, mol.irrep_id, mol.symm_orb,
+                                     m.mo_coeff)
+        cis = fci.direct_spin1_symm.FCI(mol)
+        efci, cfci = cis.kernel(h1, eri, norb, nelec, orbsym=orbsym, wfnsym=0,
+                                nroots=4)
+        ss = [fci.spin_op.spin_square0(x, norb, nelec)[0] for x in cfci]
+        efci = efci[numpy.array(ss) < .1]
+        self.assertAlmostEqual(e[0], efci[0], 5)
+        self.assertAlmostEqual(e[1], efci[1], 5)
+        self.assertAlmostEqual(e[0], -13.965749549, 7)
+        self.assertAlmostEqual(e[1], -13.422212478, 7)
+
+    def test_pt2(self):
+        efci = fci.direct_spin1.kernel(h1, eri, norb, nelec)[0]
+        myci = hci.SCI()
+        myci.select_cutoff = 2e-3
+        myci.ci_coeff_cutoff = 2e-3
+        myci.pt2_cutoff = 1e-8
+        e, c = myci.kernel(h1, eri, norb, nelec)
+        self.assertAlmostEqual(myci.e_pt2[0], -0.00082650, 7)
+        self.assertTrue(abs(e[0] - efci) > 8e-4)
+        self.assertTrue(abs(e[0] + myci.e_pt2[0] - efci) < 6e-5)
+
+    def test_select_strs_pt2_nproc(self):
+        myci = hci.SCI()
+        myci.select_cutoff = 5e-3
+        myci.ci_coeff_cutoff = 5e-3
+        e, c = myci.kernel(h1, eri, norb, nelec)
+        myci.select_cutoff = 1e-3
+        myci.pt2_cutoff = 1e-6
+# Small batches, so that the determinants are split over several tasks
+        myci.max_memory = .5
+# The parent process has an OpenMP thread team when the workers are forked
+        with lib.with_omp_threads(2):
+            s1, e1 = hci.select_strs_pt2(myci, c[0], h1, eri, jk, eri_sorted,
+                                         jk_sorted, norb, nelec, e0=e[0], nproc=1)
+            s2, e2 = hci.select_strs_pt2(myci, c[0], h1, eri, jk, eri_sorted,
+                                         jk_sorted, norb, nelec, e0=e[0], nproc=2)
+            self.assertTrue(len(s1) > 0)
+            self.assertTrue(numpy.all(s1 == s2))
+            self.assertAlmostEqual(e1, e2, 12)
+
+            s1 = hci.select_strs_pt2(myci, c[0], h1, eri, jk, eri_sorted,
+                                     jk_sorted, norb, nelec, nproc=1)[0]
+            s2 = hci.select_strs_pt2(myci, c[0], h1, eri, jk, eri_sorted,
+                                     jk_sorted, norb, nelec, nproc=2)[0]
+            self.assertTrue(numpy.all(s1 == s2))
+
+            myci.max_memory = 1000
+            myci.select_cutoff = 2e-3
+            myci.ci_coeff_cutoff = 2e-3
+            myci.pt2_cutoff = 1e-8
+            e1 = myci.kernel(h1, eri, norb, nelec)[0]
+            pt2_1 = myci.e_pt2
+            myci.nproc = 2
+            e2 = myci.kernel(h1, eri, norb, nelec)[0]
+            pt2_2 = myci.e_pt2
+        self.assertAlmostEqual(e1[0], e2[0], 10)
+        self.assertAlmostEqual(pt2_1[0], pt2_2[0], 12)
+
+
+if __name__ == "__main__":
+    print("Full Tests for hci")
+    unittest.main()
@@ -21,7 +21,7 @@ void contract_h_c(double *h1, double *eri, int norb, int neleca, int nelecb, uin
     #pragma omp parallel default(none) shared(h1, eri, norb, neleca, nelecb, strs, civec, hdiag, ndet, ci1, ts)
     {
 
-    size_t ip, jp, p;
+    size_t ip, jp;
     int nset = (norb + 63) / 64;
  
     // Calculate excitation level for prescreening
@@ -40,124 +40,13 @@ void contract_h_c(double *h1, double *eri, int norb, int neleca, int nelecb, uin
     for (ip = 0; ip < ndet; ++ip) {
         for (jp = 0; jp < ndet; ++jp) {
             if (abs(ts[ip] - ts[jp]) < 3) {
-                uint64_t *stria = strs + ip * 2 * nset;
-                uint64_t *strib = strs + ip * 2 * nset + nset;
-                uint64_t *strja = strs + jp * 2 * nset;
-                uint64_t *strjb = strs + jp * 2 * nset + nset;
-                int n_excit_a = n_excitations(stria, strja, nset);
-                int n_excit_b = n_excitations(strib, strjb, nset);
                 // Diagonal term
                 if (ip == jp) {
                     ci1[ip] += hdiag[ip] * civec[ip];
                 }
-                // Single excitation
-                else if ((n_excit_a + n_excit_b) == 1) {
-                    int *ia;
-                    // alpha->alpha
-                    if (n_excit_b == 0) {
-                        ia = get_single_excitation(stria, strja, nset);
-                        int i = ia[0];
-                        int a = ia[1];
-                        double sign = compute_cre_des_sign(a, i, stria, nset);
-                        int *occsa = compute_occ_list(stria, nset, norb, neleca);
-                        int *occsb = compute_occ_list(strib, nset, norb, nelecb);
-                        double fai = h1[a * norb + i];
-                        for (p = 0; p < neleca; ++p) {
-                            int k = occsa[p];
-                            int kkai = k * norb * norb * norb + k * norb * norb + a * norb + i;
-                            int kiak = k * norb * norb * norb + i * norb * norb + a * norb + k;
-                            fai += eri[kkai] - eri[kiak];
-                        }
-                        for (p = 0; p < nelecb; ++p) {
-                            int k = occsb[p];
-                            int kkai = k * norb * norb * norb + k * norb * norb + a * norb + i;
-                            fai += eri[kkai];
-                        }
-                        if (fabs(fai) > 1.0E-14) ci1[ip] += sign * fai * civec[jp];
-                        free(occsa);
-                        free(occsb);
-                    }
-                    // beta->beta
-                    else if (n_excit_a == 0) {
-                        ia = get_single_excitation(strib, strjb, nset);
-                        int i = ia[0];
-                        int a = ia[1];
-                        double sign = compute_cre_des_sign(a, i, strib, nset);
-                        int *occsa = compute_occ_list(stria, nset, norb, neleca);
-                        int *occsb = compute_occ_list(strib, nset, norb, nelecb);
-                        double fai = h1[a * norb + i];
-                        for (p = 0; p < nelecb; ++p) {
-                            int k = occsb[p];
-                            int kkai = k * norb * norb * norb + k * norb * norb + a * norb + i;
-                            int kiak = k * norb * norb * norb + i * norb * norb + a * norb + k;
-                            fai += eri[kkai] - eri[kiak];
-                        }
-                        for (p = 0; p < neleca; ++p) {
-                            int k = occsa[p];
-                            int kkai = k * norb * norb * norb + k * norb * norb + a * norb + i;
-                            fai += eri[kkai];
-                        }
-                        if (fabs(fai) > 1.0E-14) ci1[ip] += sign * fai * civec[jp];
-                        free(occsa);
-                        free(occsb);
-                    }
-                   free(ia);
-                }
-                // Double excitation
-                else if ((n_excit_a + n_excit_b) == 2) {
-                    int i, j, a, b;
-                    // alpha,alpha->alpha,alpha
-                    if (n_excit_b == 0) {
-	                int *ijab = get_double_excitation(stria, strja, nset);
-                        i = ijab[0]; j = ijab[1]; a = ijab[2]; b = ijab[3];
-                        double v, sign;
-                        int ajbi = a * norb * norb * norb + j * norb * norb + b * norb + i;
-                        int aibj = a * norb * norb * norb + i * norb * norb + b * norb + j;
-                        if (a > j || i > b) {
-                            v = eri[ajbi] - eri[aibj];
-                            sign = compute_cre_des_sign(b, i, stria, nset);
-                            sign *= compute_cre_des_sign(a, j, stria, nset);
-                        } 
-                        else {
-                            v = eri[aibj] - eri[ajbi];
-                            sign = compute_cre_des_sign(b, j, stria, nset);
-                            sign *= compute_cre_des_sign(a, i, stria, nset);
-                        }
-                        if (fabs(v) > 1.0E-14) ci1[ip] += sign * v * civec[jp];
-                        free(ijab);
-                    }
-                    // beta,beta->beta,beta
-                    else if (n_excit_a == 0) {
-	                int *ijab = get_double_excitation(strib, strjb, nset);
-                        i = ijab[0]; j = ijab[1]; a = ijab[2]; b = ijab[3];
-                        double v, sign;
-                        int ajbi = a * norb * norb * norb + j * norb * norb + b * norb + i;
-                        int aibj = a * norb * norb * norb + i * norb * norb + b * norb + j;
-                        if (a > j || i > b) {
-                            v = eri[ajbi] - eri[aibj];
-                            sign = compute_cre_des_sign(b, i, strib, nset);
-                            sign *= compute_cre_des_sign(a, j, strib, nset);
-                        } 
-                        else {
-                            v = eri[aibj] - eri[ajbi];
-                            sign = compute_cre_des_sign(b, j, strib, nset);
-                            sign *= compute_cre_des_sign(a, i, strib, nset);
-                        }
-                        if (fabs(v) > 1.0E-14) ci1[ip] += sign * v * civec[jp];
-                        free(ijab);
-                    }
-                    // alpha,beta->alpha,beta
-                    else {
-                        int *ia = get_single_excitation(stria, strja, nset);
-                        int *jb = get_single_excitation(strib, strjb, nset);
-                        i = ia[0]; a = ia[1]; j = jb[0]; b = jb[1];
-                        double v = eri[a * norb * norb * norb + i * norb * norb + b * norb + j];
-                        double sign = compute_cre_des_sign(a, i, stria, nset);
-                        sign *= compute_cre_des_sign(b, j, strib, nset);
-                        if (fabs(v) > 1.0E-14) ci1[ip] += sign * v * civec[jp];
-                        free(ia);
-                        free(jb);
-                   }
+                else {
+                    double hij = compute_hij(h1, eri, norb, neleca, nelecb, strs + ip * 2 * nset, strs + jp * 2 * nset, nset);
+                    if (fabs(hij) > 1.0E-14) ci1[ip] += hij * civec[jp];
                 }
             } // end if over ts
         } // end loop over jp
@@ -169,6 +58,133 @@ void contract_h_c(double *h1, double *eri, int norb, int neleca, int nelecb, uin
 
 }
 
+// Computes the off-diagonal Hamiltonian matrix element <I|H|J> (I != J);
+// zero if the two determinants differ by more than a double excitation
+double compute_hij(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *stri, uint64_t *strj, int nset) {
+
+    size_t p;
+    uint64_t *stria = stri;
+    uint64_t *strib = stri + nset;
+    uint64_t *strja = strj;
+    uint64_t *strjb = strj + nset;
+    int n_excit_a = n_excitations(stria, strja, nset);
+    int n_excit_b = n_excitations(strib, strjb, nset);
+    double hij = 0.0;
+
+    // Single excitation
+    if ((n_excit_a + n_excit_b) == 1) {
+        int *ia;
+        // alpha->alpha
+        if (n_excit_b == 0) {
+            ia = get_single_excitation(stria, strja, nset);
+            int i = ia[0];
+            int a = ia[1];
+            double sign = compute_cre_des_sign(a, i, stria, nset);
+            int *occsa = compute_occ_list(stria, nset, norb, neleca);
+            int *occsb = compute_occ_list(strib, nset, norb, nelecb);
+            double fai = h1[a * norb + i];
+            for (p = 0; p < neleca; ++p) {
+                int k = occsa[p];
+                int kkai = k * norb * norb * norb + k * norb * norb + a * norb + i;
+                int kiak = k * norb * norb * norb + i * norb * norb + a * norb + k;
+                fai += eri[kkai] - eri[kiak];
+            }
+            for (p = 0; p < nelecb; ++p) {
+                int k = occsb[p];
+                int kkai = k * norb * norb * norb + k * norb * norb + a * norb + i;
+                fai += eri[kkai];
+            }
+            hij = sign * fai;
+            free(occsa);
+            free(occsb);
+        }
+        // beta->beta
+        else {
+            ia = get_single_excitation(strib, strjb, nset);
+            int i = ia[0];
+            int a = ia[1];
+            double sign = compute_cre_des_sign(a, i, strib, nset);
+            int *occsa = compute_occ_list(stria, nset, norb, neleca);
+            int *occsb = compute_occ_list(strib, nset, norb, nelecb);
+            double fai = h1[a * norb + i];
+            for (p = 0; p < nelecb; ++p) {
+                int k = occsb[p];
+                int kkai = k * norb * norb * norb + k * norb * norb + a * norb + i;
+                int kiak = k * norb * norb * norb + i * norb * norb + a * norb + k;
+                fai += eri[kkai] - eri[kiak];
+            }
+            for (p = 0; p < neleca; ++p) {
+                int k = occsa[p];
+                int kkai = k * norb * norb * norb + k * norb * norb + a * norb + i;
+                fai += eri[kkai];
+            }
+            hij = sign * fai;
+            free(occsa);
+            free(occsb);
+        }
+        free(ia);
+    }
+    // Double excitation
+    else if ((n_excit_a + n_excit_b) == 2) {
+        int i, j, a, b;
+        // alpha,alpha->alpha,alpha
+        if (n_excit_b == 0) {
+            int *ijab = get_double_excitation(stria, strja, nset);
+            i = ijab[0]; j = ijab[1]; a = ijab[2]; b = ijab[3];
+            double v, sign;
+            int ajbi = a * norb * norb * norb + j * norb * norb + b * norb + i;
+            int aibj = a * norb * norb * norb + i * norb * norb + b * norb + j;
+            if (a > j || i > b) {
+                v = eri[ajbi] - eri[aibj];
+                sign = compute_cre_des_sign(b, i, stria, nset);
+                sign *= compute_cre_des_sign(a, j, stria, nset);
+            } 
+            else {
+                v = eri[aibj] - eri[ajbi];
+                sign = compute_cre_des_sign(b, j, stria, nset);
+                sign *= compute_cre_des_sign(a, i, stria, nset);
+            }
+            hij = sign * v;
+            free(ijab);
+        }
+        // beta,beta->beta,beta
+        else if (n_excit_a == 0) {
+            int *ijab = get_double_excitation(strib, strjb, nset);
+            i = ijab[0]; j = ijab[1]; a = ijab[2]; b = ijab[3];
+            double v, sign;
+            int ajbi = a * norb * norb * norb + j * norb * norb + b * norb + i;
+            int aibj = a * norb * norb * norb + i * norb * norb + b * norb + j;
+            if (a > j || i > b) {
+                v = eri[ajbi] - eri[aibj];
+                sign = compute_cre_des_sign(b, i, strib, nset);
+                sign *= compute_cre_des_sign(a, j, strib, nset);
+            } 
+            else {
+                v = eri[aibj] - eri[ajbi];
+                sign = compute_cre_des_sign(b, j, strib, nset);
+                sign *= compute_cre_des_sign(a, i, strib, nset);
+            }
+            hij = sign * v;
+            free(ijab);
+        }
+        // alpha,beta->alpha,beta
+        else {
+            int *ia = get_single_excitation(stria, strja, nset);
+            int *jb = get_single_excitation(strib, strjb, nset);
+            i = ia[0]; a = ia[1]; j = jb[0]; b = jb[1];
+            double v = eri[a * norb * norb * norb + i * norb * norb + b * norb + j];
+            double sign = compute_cre_des_sign(a, i, stria, nset);
+            sign *= compute_cre_des_sign(b, j, strib, nset);
+            hij = sign * v;
+            free(ia);
+            free(jb);
+        }
+    }
+
+    return hij;
+
+}
+
 // Compare two strings and compute excitation level
 int n_excitations(uint64_t *str1, uint64_t *str2, int nset) {
 
@@ -790,6 +806,573 @@ void argunique(uint64_t *strs, uint64_t *sort_idx, uint64_t *nstrs_, int nset) {
 
 }
 
+// Hash function of a string of nset 64-bit words
+static uint64_t hash_str(uint64_t *str, int nset) {
+
+    size_t i;
+    uint64_t h = 0;
+
+    for (i = 0; i < nset; ++i) {
+        h ^= str[i] + 0x9e3779b97f4a7c15ULL + (h << 6) + (h >> 2);
+    }
+    // splitmix64 finalizer
+    h ^= h >> 30;
+    h *= 0xbf58476d1ce4e5b9ULL;
+    h ^= h >> 27;
+    h *= 0x94d049bb133111ebULL;
+    h ^= h >> 31;
+
+    return h;
+
+}
+
+// Builds an open-addressing (linear probing) hash index of the strings.
+// tabsize must be a power of 2 larger than nstrs. Each slot of table holds
+// the address of a string in strs, or -1 for an empty slot
+void hash_strs(int64_t *table, uint64_t tabsize, uint64_t *strs, uint64_t nstrs, int nset) {
+
+    size_t i, p;
+    uint64_t mask = tabsize - 1;
+
+    for (p = 0; p < tabsize; ++p) table[p] = -1;
+
+    for (i = 0; i < nstrs; ++i) {
+        p = hash_str(strs + i * nset, nset) & mask;
+        while (table[p] >= 0) {
+            p = (p + 1) & mask;
+        }
+        table[p] = i;
+    }
+
+}
+
+// Returns the address of str in the hash indexed strings, or -1 if not found
+int64_t hash_lookup(int64_t *table, uint64_t tabsize, uint64_t *strs, int nset, uint64_t *str) {
+
+    uint64_t mask = tabsize - 1;
+    size_t p = hash_str(str, nset) & mask;
+
+    while (table[p] >= 0) {
+        if (order(strs + table[p] * nset, str, nset) == 0) return table[p];
+        p = (p + 1) & mask;
+    }
+
+    return -1;
+
+}
+
+// Addresses of the query strings in the hash indexed strings (-1 if not found)
+void lookup_strs(int64_t *addr, uint64_t *query, uint64_t nquery, int64_t *table, uint64_t tabsize, uint64_t *strs, int nset) {
+
+    #pragma omp parallel default(none) shared(addr, query, nquery, table, tabsize, strs, nset)
+    {
+    size_t i;
+    #pragma omp for schedule(static)
+    for (i = 0; i < nquery; ++i) {
+        addr[i] = hash_lookup(table, tabsize, strs, nset, query + i * nset);
+    }
+    }
+
+}
+
+// Indices of the unique strings in the order of their first occurrence
+// (nset is a total number of strings)
+void hash_argunique(uint64_t *strs, uint64_t *uniq_idx, uint64_t *nstrs_, int nset) {
+
+    size_t i, p;
+    uint64_t nstrs = nstrs_[0];
+    uint64_t tabsize = 1;
+    while (tabsize < 2 * nstrs) tabsize <<= 1;
+    uint64_t mask = tabsize - 1;
+    int64_t *table = malloc(sizeof(int64_t) * tabsize);
+    uint64_t nuniq = 0;
+
+    for (p = 0; p < tabsize; ++p) table[p] = -1;
+
+    for (i = 0; i < nstrs; ++i) {
+        uint64_t *str = strs + i * nset;
+        p = hash_str(str, nset) & mask;
+        while (table[p] >= 0 && order(strs + table[p] * nset, str, nset) != 0) {
+            p = (p + 1) & mask;
+        }
+        if (table[p] < 0) {
+            table[p] = i;
+            uniq_idx[nuniq] = i;
+            nuniq++;
+        }
+    }
+    nstrs_[0] = nuniq;
+
+    free(table);
+
+}
+
+// Toggles the bit of orbital p in place
+static void flip_bit(uint64_t *str, int nset, int p) {
+
+    str[nset - p / 64 - 1] ^= 1ULL << (p % 64);
+
+}
+
+// Stores the connection to the determinant str if it is in the space
+static void add_connection(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *strs, int8_t *isnew, int64_t *table, uint64_t tabsize, uint64_t idet, uint64_t *str, int nset, int max_conn, int64_t *cols, double *vals, int *nconn) {
+
+    int64_t jdet = hash_lookup(table, tabsize, strs, 2 * nset, str);
+    if (jdet >= 0 && (!isnew[jdet] || jdet < idet) && *nconn < max_conn) {
+        double hij = compute_hij(h1, eri, norb, neleca, nelecb, strs + idet * 2 * nset, str, nset);
+        if (fabs(hij) > 1.0E-14) {
+            cols[*nconn] = jdet;
+            vals[*nconn] = hij;
+            (*nconn)++;
+        }
+    }
+
+}
+
+// Computes the off-diagonal Hamiltonian elements which couple the
+// determinants strs[ndet_start:ndet_finish] to the rest of the space. Only the
+// elements which are not available from the previous space are computed: for
+// a new determinant I (isnew[I] = 1), the couplings to the old determinants
+// and the new determinants J < I. The connected determinants are either found
+// by comparing all pairs (small spaces) or by generating the single and double
+// excitations of I and looking them up in the hash index (table). For the
+// determinant ndet_start + k, the addresses of the connected determinants and
+// the matrix elements are stored in cols[k*max_conn:] and vals[k*max_conn:],
+// and their number in nconn[k]
+void compute_h_connections(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *strs, uint64_t ndet, int8_t *isnew, int64_t *table, uint64_t tabsize, uint64_t ndet_start, uint64_t ndet_finish, int max_conn, int64_t *cols, double *vals, int *nconn) {
+
+    int nset = (norb + 63) / 64;
+    int nvira = norb - neleca;
+    int nvirb = norb - nelecb;
+    uint64_t nexcit = neleca * nvira + nelecb * nvirb +
+                      neleca * (neleca - 1) / 2 * nvira * (nvira - 1) / 2 +
+                      nelecb * (nelecb - 1) / 2 * nvirb * (nvirb - 1) / 2 +
+                      neleca * nvira * nelecb * nvirb;
+
+    #pragma omp parallel default(none) shared(h1, eri, norb, neleca, nelecb, strs, ndet, isnew, table, tabsize, ndet_start, ndet_finish, max_conn, cols, vals, nconn, nset, nvira, nvirb, nexcit)
+    {
+
+    size_t idet, jdet;
+    int i, j, a, b, ia, jb;
+    uint64_t *str = malloc(sizeof(uint64_t) * 2 * nset);
+
+    #pragma omp for schedule(dynamic, 4)
+    for (idet = ndet_start; idet < ndet_finish; ++idet) {
+        if (!isnew[idet]) {
+            nconn[idet-ndet_start] = 0;
+            continue;
+        }
+        uint64_t *stri = strs + idet * 2 * nset;
+        int64_t *pcols = cols + (idet - ndet_start) * max_conn;
+        double *pvals = vals + (idet - ndet_start) * max_conn;
+        int n = 0;
+
+        if (ndet < nexcit) {
+            // Compare all pairs of determinants
+            for (jdet = 0; jdet < ndet; ++jdet) {
+                if (jdet == idet || (isnew[jdet] && jdet > idet)) continue;
+                uint64_t *strj = strs + jdet * 2 * nset;
+                int n_excit = n_excitations(stri, strj, nset) + n_excitations(stri + nset, strj + nset, nset);
+                if (n_excit <= 2 && n < max_conn) {
+                    double hij = compute_hij(h1, eri, norb, neleca, nelecb, stri, strj, nset);
+                    if (fabs(hij) > 1.0E-14) {
+                        pcols[n] = jdet;
+                        pvals[n] = hij;
+                        n++;
+                    }
+                }
+            }
+        }
+        else {
+            // Generate the single and double excitations
+            int *occsa = compute_occ_list(stri, nset, norb, neleca);
+            int *occsb = compute_occ_list(stri + nset, nset, norb, nelecb);
+            int *virsa = compute_vir_list(stri, nset, norb, neleca);
+            int *virsb = compute_vir_list(stri + nset, nset, norb, nelecb);
+            uint64_t *stra = str;
+            uint64_t *strb = str + nset;
+            memcpy(str, stri, sizeof(uint64_t) * 2 * nset);
+
+            // alpha->alpha and alpha,beta->alpha,beta
+            for (i = 0; i < neleca; ++i) {
+            for (a = 0; a < nvira; ++a) {
+                flip_bit(stra, nset, occsa[i]);
+                flip_bit(stra, nset, virsa[a]);
+                add_connection(h1, eri, norb, neleca, nelecb, strs, isnew, table, tabsize, idet, str, nset, max_conn, pcols, pvals, &n);
+                for (j = 0; j < nelecb; ++j) {
+                for (b = 0; b < nvirb; ++b) {
+                    flip_bit(strb, nset, occsb[j]);
+                    flip_bit(strb, nset, virsb[b]);
+                    add_connection(h1, eri, norb, neleca, nelecb, strs, isnew, table, tabsize, idet, str, nset, max_conn, pcols, pvals, &n);
+                    flip_bit(strb, nset, occsb[j]);
+                    flip_bit(strb, nset, virsb[b]);
+                } }
+                flip_bit(stra, nset, occsa[i]);
+                flip_bit(stra, nset, virsa[a]);
+            } }
+            // beta->beta
+            for (j = 0; j < nelecb; ++j) {
+            for (b = 0; b < nvirb; ++b) {
+                flip_bit(strb, nset, occsb[j]);
+                flip_bit(strb, nset, virsb[b]);
+                add_connection(h1, eri, norb, neleca, nelecb, strs, isnew, table, tabsize, idet, str, nset, max_conn, pcols, pvals, &n);
+                flip_bit(strb, nset, occsb[j]);
+                flip_bit(strb, nset, virsb[b]);
+            } }
+            // alpha,alpha->alpha,alpha
+            for (i = 0; i < neleca; ++i) {
+            for (j = 0; j < i; ++j) {
+            for (ia = 0; ia < nvira; ++ia) {
+            for (jb = 0; jb < ia; ++jb) {
+                flip_bit(stra, nset, occsa[i]);
+                flip_bit(stra, nset, occsa[j]);
+                flip_bit(stra, nset, virsa[ia]);
+                flip_bit(stra, nset, virsa[jb]);
+                add_connection(h1, eri, norb, neleca, nelecb, strs, isnew, table, tabsize, idet, str, nset, max_conn, pcols, pvals, &n);
+                flip_bit(stra, nset, occsa[i]);
+                flip_bit(stra, nset, occsa[j]);
+                flip_bit(stra, nset, virsa[ia]);
+                flip_bit(stra, nset, virsa[jb]);
+            } } } }
+            // beta,beta->beta,beta
+            for (i = 0; i < nelecb; ++i) {
+            for (j = 0; j < i; ++j) {
+            for (ia = 0; ia < nvirb; ++ia) {
+            for (jb = 0; jb < ia; ++jb) {
+                flip_bit(strb, nset, occsb[i]);
+                flip_bit(strb, nset, occsb[j]);
+                flip_bit(strb, nset, virsb[ia]);
+                flip_bit(strb, nset, virsb[jb]);
+                add_connection(h1, eri, norb, neleca, nelecb, strs, isnew, table, tabsize, idet, str, nset, max_conn, pcols, pvals, &n);
+                flip_bit(strb, nset, occsb[i]);
+                flip_bit(strb, nset, occsb[j]);
+                flip_bit(strb, nset, virsb[ia]);
+                flip_bit(strb, nset, virsb[jb]);
+            } } } }
+            free(occsa);
+            free(occsb);
+            free(virsa);
+            free(virsb);
+        }
+        nconn[idet-ndet_start] = n;
+    }
+
+    free(str);
+
+    } // end omp
+
+}
+
+// Computes C' = H * C with the Hamiltonian stored as the diagonal hdiag and
+// the off-diagonal elements (rows[k], cols[k], vals[k]), each pair of
+// connected determinants being stored once
+void contract_h_c_sparse(double *hdiag, int64_t *rows, int64_t *cols, double *vals, uint64_t npair, double *civec, uint64_t ndet, double *ci1) {
+
+    size_t i;
+
+    for (i = 0; i < ndet; ++i) {
+        ci1[i] = hdiag[i] * civec[i];
+    }
+
+    #pragma omp parallel default(none) shared(rows, cols, vals, npair, civec, ndet, ci1)
+    {
+
+    size_t k, i;
+    double *buf = calloc(ndet, sizeof(double));
+
+    #pragma omp for schedule(static)
+    for (k = 0; k < npair; ++k) {
+        buf[rows[k]] += vals[k] * civec[cols[k]];
+        buf[cols[k]] += vals[k] * civec[rows[k]];
+    }
+
+    #pragma omp critical
+    for (i = 0; i < ndet; ++i) {
+        ci1[i] += buf[i];
+    }
+
+    free(buf);
+
+    } // end omp
+
+}
+
+// Computes the diagonal Hamiltonian elements <I|H|I>
+void compute_hdiag(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *strs, uint64_t ndet, double *hdiag) {
+
+    #pragma omp parallel default(none) shared(h1, eri, norb, neleca, nelecb, strs, ndet, hdiag)
+    {
+
+    size_t p, q, i, j, idet;
+    int nset = (norb + 63) / 64;
+    size_t n2 = norb * norb;
+    size_t n3 = n2 * norb;
+
+    #pragma omp for schedule(static)
+    for (idet = 0; idet < ndet; ++idet) {
+        int *occsa = compute_occ_list(strs + idet * 2 * nset, nset, norb, neleca);
+        int *occsb = compute_occ_list(strs + idet * 2 * nset + nset, nset, norb, nelecb);
+        double e = 0.0;
+        for (p = 0; p < neleca; ++p) {
+            i = occsa[p];
+            e += h1[i * norb + i];
+            for (q = 0; q < neleca; ++q) {
+                j = occsa[q];
+                e += .5 * (eri[i * n3 + i * n2 + j * norb + j] - eri[i * n3 + j * n2 + j * norb + i]);
+            }
+            for (q = 0; q < nelecb; ++q) {
+                j = occsb[q];
+                e += eri[i * n3 + i * n2 + j * norb + j];
+            }
+        }
+        for (p = 0; p < nelecb; ++p) {
+            i = occsb[p];
+            e += h1[i * norb + i];
+            for (q = 0; q < nelecb; ++q) {
+                j = occsb[q];
+                e += .5 * (eri[i * n3 + i * n2 + j * norb + j] - eri[i * n3 + j * n2 + j * norb + i]);
+            }
+        }
+        hdiag[idet] = e;
+        free(occsa);
+        free(occsb);
+    }
+
+    } // end omp
+
+}
+
+static int bit_occupied(uint64_t *str, int nset, int p) {
+
+    return (str[nset - p / 64 - 1] >> (p % 64)) & 1;
+
+}
+
+// Stores the determinant str, the PT2 numerator <A|H|I> c_I and the selection flag
+static void add_candidate(uint64_t *str, int nset, double hac_k, int8_t select_k, uint64_t *strs_add, double *hac, int8_t *select, uint64_t *strs_added, uint64_t max_strs_add) {
+
+    if (*strs_added >= max_strs_add) {
+        printf("\nError: Number of selected strings is greater than the size of the buffer array (%ld vs %ld).\n", *strs_added + 1, max_strs_add);
+        exit(EXIT_FAILURE);
+    }
+    memcpy(strs_add + *strs_added * 2 * nset, str, sizeof(uint64_t) * 2 * nset);
+    if (hac != NULL) {
+        hac[*strs_added] = hac_k;
+        select[*strs_added] = select_k;
+    }
+    (*strs_added)++;
+
+}
+
+// Heat-bath selection from the reference determinants [ndet_start, ndet_finish)
+// with the Epstein-Nesbet PT2 numerators computed in the same pass. The
+// screening follows select_strs (Fock estimate for single excitations,
+// two-electron integrals in the order of jk_sorted and eri_sorted for double
+// excitations), but each determinant A connected to a reference I is
+// generated only once. If hac is NULL, only the determinants which pass
+// select_cutoff are stored. Otherwise, the determinants with
+// |<A|H|I> c_I| > pt2_cutoff are stored as well, with hac = <A|H|I> c_I and
+// select = 1 for the ones which pass select_cutoff
+void select_strs_pt2(double *h1, double *eri, double *jk, uint64_t *eri_sorted, uint64_t *jk_sorted, int norb, int neleca, int nelecb, uint64_t *strs, double *civec, uint64_t ndet_start, uint64_t ndet_finish, double select_cutoff, double pt2_cutoff, uint64_t *strs_add, double *hac, int8_t *select, uint64_t *strs_add_size) {
+
+    size_t p, q, r, i, k, a, ip, jp, kp, lp, ij, ih, idet;
+
+    uint64_t max_strs_add = strs_add_size[0];
+    int nset = (norb + 63) / 64;
+    int do_pt2 = (hac != NULL);
+    size_t n2 = norb * norb;
+    size_t n3 = n2 * norb;
+
+    // Compute Fock intermediates
+    double *focka = malloc(sizeof(double) * norb * norb);
+    double *fockb = malloc(sizeof(double) * norb * norb);
+    for (p = 0; p < norb; ++p) {
+        for (q = 0; q < norb; ++q) {
+            double vja = 0.0;
+            double vka = 0.0;
+            for (i = 0; i < neleca; ++i) {
+                vja += eri[i * n3 + i * n2 + p * norb + q];
+                vka += eri[p * n3 + i * n2 + i * norb + q];
+            }
+            double vjb = 0.0;
+            double vkb = 0.0;
+            for (i = 0; i < nelecb; ++i) {
+                vjb += eri[i * n3 + i * n2 + p * norb + q];
+                vkb += eri[p * n3 + i * n2 + i * norb + q];
+            }
+            focka[p * norb + q] = h1[p * norb + q] + vja + vjb - vka;
+            fockb[p * norb + q] = h1[p * norb + q] + vja + vjb - vkb;
+        }
+    }
+
+    int *holes_a = malloc(sizeof(int) * norb);
+    int *holes_b = malloc(sizeof(int) * norb);
+    int *particles_a = malloc(sizeof(int) * norb);
+    int *particles_b = malloc(sizeof(int) * norb);
+    uint64_t *str = malloc(sizeof(uint64_t) * 2 * nset);
+    uint64_t strs_added = 0;
+
+    // Loop over determinants
+    for (idet = ndet_start; idet < ndet_finish; ++idet) {
+        if (civec[idet] == 0) continue;
+        uint64_t *stri = strs + idet * 2 * nset;
+        uint64_t *stra = stri;
+        uint64_t *strb = stri + nset;
+        int *occsa = compute_occ_list(stra, nset, norb, neleca);
+        int *occsb = compute_occ_list(strb, nset, norb, nelecb);
+        int *virsa = compute_vir_list(stra, nset, norb, neleca);
+        int *virsb = compute_vir_list(strb, nset, norb, nelecb);
+        double tol_select = select_cutoff / fabs(civec[idet]);
+        double tol_pt2 = do_pt2 ? pt2_cutoff / fabs(civec[idet]) : tol_select;
+        double tol = (tol_pt2 < tol_select) ? tol_pt2 : tol_select;
+
+        // Holes and particles relative to the reference determinant
+        int n_holes_a = 0;
+        int n_holes_b = 0;
+        int n_particles_a = 0;
+        int n_particles_b = 0;
+        for (p = 0; p < (norb - neleca); ++p) {
+            if (virsa[p] < neleca) holes_a[n_holes_a++] = virsa[p];
+        }
+        for (p = 0; p < neleca; ++p) {
+            if (occsa[p] >= neleca) particles_a[n_particles_a++] = occsa[p];
+        }
+        for (p = 0; p < (norb - nelecb); ++p) {
+            if (virsb[p] < nelecb) holes_b[n_holes_b++] = virsb[p];
+        }
+        for (p = 0; p < nelecb; ++p) {
+            if (occsb[p] >= nelecb) particles_b[n_particles_b++] = occsb[p];
+        }
+
+        // Single excitations, alpha->alpha and beta->beta
+        int spin;
+        for (spin = 0; spin < 2; ++spin) {
+            int nocc = (spin == 0) ? neleca : nelecb;
+            int *occs = (spin == 0) ? occsa : occsb;
+            int *virs = (spin == 0) ? virsa : virsb;
+            double *fock = (spin == 0) ? focka : fockb;
+            int *particles_s = (spin == 0) ? particles_a : particles_b;
+            int *holes_s = (spin == 0) ? holes_a : holes_b;
+            int *particles_o = (spin == 0) ? particles_b : particles_a;
+            int *holes_o = (spin == 0) ? holes_b : holes_a;
+            int n_particles_s = (spin == 0) ? n_particles_a : n_particles_b;
+            int n_holes_s = (spin == 0) ? n_holes_a : n_holes_b;
+            int n_particles_o = (spin == 0) ? n_particles_b : n_particles_a;
+            int n_holes_o = (spin == 0) ? n_holes_b : n_holes_a;
+            for (p = 0; p < nocc; ++p) {
+                i = occs[p];
+                for (q = 0; q < (norb - nocc); ++q) {
+                    a = virs[q];
+                    double fai = fock[a * norb + i];
+                    for (r = 0; r < n_particles_s; ++r) {
+                        k = particles_s[r];
+                        fai += jk[k * n3 + k * n2 + a * norb + i];
+                    }
+                    for (r = 0; r < n_holes_s; ++r) {
+                        k = holes_s[r];
+                        fai -= jk[k * n3 + k * n2 + a * norb + i];
+                    }
+                    for (r = 0; r < n_particles_o; ++r) {
+                        k = particles_o[r];
+                        fai += eri[k * n3 + k * n2 + a * norb + i];
+                    }
+                    for (r = 0; r < n_holes_o; ++r) {
+                        k = holes_o[r];
+                        fai -= eri[k * n3 + k * n2 + a * norb + i];
+                    }
+                    int8_t sel = (fabs(fai) > tol_select);
+                    if (!sel && !do_pt2) continue;
+                    memcpy(str, stri, sizeof(uint64_t) * 2 * nset);
+                    flip_bit(str + spin * nset, nset, a);
+                    flip_bit(str + spin * nset, nset, i);
+                    double hai = 0.0;
+                    if (do_pt2) {
+                        hai = compute_hij(h1, eri, norb, neleca, nelecb, str, stri, nset);
+                        if (!sel && !(fabs(hai) > tol_pt2)) continue;
+                    }
+                    add_candidate(str, nset, hai * civec[idet], sel, strs_add, hac, select, &strs_added, max_strs_add);
+                }
+            }
+        }
+
+        // Double excitations
+        for (p = 0; p < n3 * norb; ++p) {
+            ih = jk_sorted[p];
+            int aaaa_bbbb_done = (fabs(jk[ih]) < tol);
+            if (!aaaa_bbbb_done) {
+                lp = ih % norb;
+                ij = ih / norb;
+                kp = ij % norb;
+                ij = ij / norb;
+                jp = ij % norb;
+                ip = ij / norb;
+                // The four permutations (ip,kp)x(jp,lp) lead to the same
+                // determinant
+                if (ip < kp && jp < lp) {
+                    int8_t sel = !(fabs(jk[ih]) < tol_select);
+                    // alpha,alpha->alpha,alpha and beta,beta->beta,beta
+                    for (spin = 0; spin < 2; ++spin) {
+                        uint64_t *strs_s = stri + spin * nset;
+                        if (bit_occupied(strs_s, nset, jp) && bit_occupied(strs_s, nset, lp) &&
+                            !bit_occupied(strs_s, nset, ip) && !bit_occupied(strs_s, nset, kp)) {
+                            memcpy(str, stri, sizeof(uint64_t) * 2 * nset);
+                            flip_bit(str + spin * nset, nset, jp);
+                            flip_bit(str + spin * nset, nset, ip);
+                            flip_bit(str + spin * nset, nset, lp);
+                            flip_bit(str + spin * nset, nset, kp);
+                            double hai = 0.0;
+                            if (do_pt2) hai = compute_hij(h1, eri, norb, neleca, nelecb, str, stri, nset);
+                            add_candidate(str, nset, hai * civec[idet], sel, strs_add, hac, select, &strs_added, max_strs_add);
+                        }
+                    }
+                }
+            }
+            // alpha,beta->alpha,beta
+            ih = eri_sorted[p];
+            int aabb_done = (fabs(eri[ih]) < tol);
+            if (!aabb_done) {
+                lp = ih % norb;
+                ij = ih / norb;
+                kp = ij % norb;
+                ij = ij / norb;
+                jp = ij % norb;
+                ip = ij / norb;
+                if (bit_occupied(stra, nset, jp) && !bit_occupied(stra, nset, ip) &&
+                    bit_occupied(strb, nset, lp) && !bit_occupied(strb, nset, kp)) {
+                    int8_t sel = !(fabs(eri[ih]) < tol_select);
+                    memcpy(str, stri, sizeof(uint64_t) * 2 * nset);
+                    flip_bit(str, nset, jp);
+                    flip_bit(str, nset, ip);
+                    flip_bit(str + nset, nset, lp);
+                    flip_bit(str + nset, nset, kp);
+                    double hai = 0.0;
+                    if (do_pt2) hai = compute_hij(h1, eri, norb, neleca, nelecb, str, stri, nset);
+                    add_candidate(str, nset, hai * civec[idet], sel, strs_add, hac, select, &strs_added, max_strs_add);
+                }
+            }
+            // Break statement
+            if (aaaa_bbbb_done && aabb_done) {
+                break;
+            }
+        }
+        free(occsa);
+        free(occsb);
+        free(virsa);
+        free(virsb);
+    } // end loop over determinants
+
+    free(focka);
+    free(fockb);
+    free(holes_a);
+    free(holes_b);
+    free(particles_a);
+    free(particles_b);
+    free(str);
+
+    strs_add_size[0] = strs_added;
+
+}
+
 // Computes C' = S2 * C in the selected CI basis
 void contract_ss_c(int norb, int neleca, int nelecb, uint64_t *strs, double *civec, uint64_t ndet, double *ci1) {
 
@@ -949,7 +1532,7 @@ void contract_h_c_ss_c(double *h1, double *eri, int norb, int neleca, int nelecb
                         free(occsb);
                     }
                     // beta->beta
-                    else if (n_excit_a == 0) {
+                    else {
                         ia = get_single_excitation(strib, strjb, nset);
                         int i = ia[0];
                         int a = ia[1];
@@ -1050,7 +1633,7 @@ void compute_rdm12s(int norb, int neleca, int nelecb, uint64_t *strs, double *ci
     #pragma omp parallel default(none) shared(norb, neleca, nelecb, strs, civec, ndet, rdm1a, rdm1b, rdm2aa, rdm2ab, rdm2bb)
     {
 
-    size_t ip, jp, p, q, r, s;
+    size_t ip, jp, p, q;
     int nset = (norb + 63) / 64;
     double ci_sq = 0.0;
     double *rdm1a_private = malloc(sizeof(double) * norb * norb);
@@ -1163,7 +1746,7 @@ void compute_rdm12s(int norb, int neleca, int nelecb, uint64_t *strs, double *ci
                     free(occsb);
                 }
                 // beta->beta
-                else if (n_excit_a == 0) {
+                else {
                     ia = get_single_excitation(strib, strjb, nset);
                     int i = ia[0];
                     int a = ia[1];
@@ -1232,7 +1815,7 @@ void compute_rdm12s(int norb, int neleca, int nelecb, uint64_t *strs, double *ci
                 else if (n_excit_a == 0) {
 	            int *ijab = get_double_excitation(strib, strjb, nset);
                     i = ijab[0]; j = ijab[1]; a = ijab[2]; b = ijab[3];
-                    double v, sign;
+                    double sign;
                     int baij = b * norb * norb * norb + a * norb * norb + i * norb + j;
                     int baji = b * norb * norb * norb + a * norb * norb + j * norb + i;
                     int abij = a * norb * norb * norb + b * norb * norb + i * norb + j;
@@ -5,6 +5,7 @@
 #define MAX_THREADS     256
 
 void contract_h_c(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *strs, double *civec, double *hdiag, uint64_t ndet, double *ci1);
+double compute_hij(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *stri, uint64_t *strj, int nset);
 int n_excitations(uint64_t *str1, uint64_t *str2, int nset);
 int popcount(uint64_t bb);
 int *get_single_excitation(uint64_t *str1, uint64_t *str2, int nset);
@@ -19,6 +20,14 @@ uint64_t *toggle_bit(uint64_t *str, int nset, int p);
 int order(uint64_t *strs_i, uint64_t *strs_j, int nset);
 void qsort_idx(uint64_t *strs, uint64_t *idx, uint64_t *nstrs, int nset, uint64_t *new_idx);
 void argunique(uint64_t *strs, uint64_t *sort_idx, uint64_t *nstrs, int nset);
+void hash_strs(int64_t *table, uint64_t tabsize, uint64_t *strs, uint64_t nstrs, int nset);
+int64_t hash_lookup(int64_t *table, uint64_t tabsize, uint64_t *strs, int nset, uint64_t *str);
+void lookup_strs(int64_t *addr, uint64_t *query, uint64_t nquery, int64_t *table, uint64_t tabsize, uint64_t *strs, int nset);
+void hash_argunique(uint64_t *strs, uint64_t *uniq_idx, uint64_t *nstrs_, int nset);
+void compute_h_connections(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *strs, uint64_t ndet, int8_t *isnew, int64_t *table, uint64_t tabsize, uint64_t ndet_start, uint64_t ndet_finish, int max_conn, int64_t *cols, double *vals, int *nconn);
+void contract_h_c_sparse(double *hdiag, int64_t *rows, int64_t *cols, double *vals, uint64_t npair, double *civec, uint64_t ndet, double *ci1);
+void compute_hdiag(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *strs, uint64_t ndet, double *hdiag);
+void select_strs_pt2(double *h1, double *eri, double *jk, uint64_t *eri_sorted, uint64_t *jk_sorted, int norb, int neleca, int nelecb, uint64_t *strs, double *civec, uint64_t ndet_start, uint64_t ndet_finish, double select_cutoff, double pt2_cutoff, uint64_t *strs_add, double *hac, int8_t *select, uint64_t *strs_add_size);
 void contract_ss_c(int norb, int neleca, int nelecb, uint64_t *strs, double *civec, uint64_t ndet, double *ci1);
 void contract_h_c_ss_c(double *h1, double *eri, int norb, int neleca, int nelecb, uint64_t *strs, double *civec, double *hdiag, uint64_t ndet, double *ci1, double *ci2);
 void compute_rdm12s(int norb, int neleca, int nelecb, uint64_t *strs, double *civec, uint64_t ndet, double *rdm1a, double *rdm1b, double *rdm2aa, double *rdm2ab, double *rdm2bb);
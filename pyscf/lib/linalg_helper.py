@@ -326,6 +326,13 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
     conv = [False] * nroots
     emin = None
 
+    if _incore:
+        keep = lambda x: x
+    else:
+# The trial vectors, the residuals and the current eigenvectors are stored in
+# memory-mapped scratch files, as the subspace vectors in _Xlist
+        keep = _outcore_copy
+
     for icyc in range(max_cycle):
         if fresh_start:
             if _incore:
@@ -338,12 +345,12 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
 # Orthogonalize xt space because the basis of subspace xs must be orthogonal
 # but the eigenvectors x0 might not be strictly orthogonal
             xt = None
-            xt, x0 = _qr(x0, dot), None
+            xt, x0 = _qr(x0, dot, keep), None
             max_dx_last = 1e9
             if SORT_EIG_BY_SIMILARITY:
                 conv = numpy.array([False] * nroots)
         elif len(xt) > 1:
-            xt = _qr(xt, dot)
+            xt = _qr(xt, dot, keep)
             xt = xt[:40]  # 40 trial vectors at most
 
         axt = aop(xt)
@@ -393,7 +400,7 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
             xt = [None] * nroots
             for k, ek in enumerate(e):
                 if not conv[k]:
-                    xt[k] = ax0[k] - ek * x0[k]
+                    xt[k] = keep(ax0[k] - ek * x0[k])
                     dx_norm[k] = numpy.sqrt(dot(xt[k].conj(), xt[k]).real)
                     if abs(de[k]) < tol and dx_norm[k] < toloose:
                         log.debug('root %d converged  |r|= %4.3g  e= %s  max|de|= %4.3g',
@@ -406,7 +413,7 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
             xt = []
             conv = [False] * nroots
             for k, ek in enumerate(e):
-                xt.append(ax0[k] - ek * x0[k])
+                xt.append(keep(ax0[k] - ek * x0[k]))
                 dx_norm.append(numpy.sqrt(dot(xt[k].conj(), xt[k]).real))
                 conv[k] = abs(de[k]) < tol and dx_norm[k] < toloose
                 if conv[k] and not conv_last[k]:
@@ -434,35 +441,199 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
 
         # remove subspace linear dependency
         if any(((not conv[k]) and n**2>lindep) for k, n in enumerate(dx_norm)):
-            for k, ek in enumerate(e):
-                if (not conv[k]) and dx_norm[k]**2 > lindep:
-                    xt[k] = precond(xt[k], e[0], x0[k])
-                    xt[k] *= 1/numpy.sqrt(dot(xt[k].conj(), xt[k]).real)
-                else:
-                    xt[k] = None
+            new_trial = [(not conv[k]) and n**2 > lindep
+                         for k, n in enumerate(dx_norm)]
         else:
-            for k, ek in enumerate(e):
-                if dx_norm[k]**2 > lindep:
-                    xt[k] = precond(xt[k], e[0], x0[k])
-                    xt[k] *= 1/numpy.sqrt(dot(xt[k].conj(), xt[k]).real)
-                else:
-                    xt[k] = None
-        xt = [xi for xi in xt if xi is not None]
-
-        for i in range(space):
-            xsi = xs[i]
-            for xi in xt:
-                xi -= xsi * dot(xsi.conj(), xi)
+            new_trial = [n**2 > lindep for n in dx_norm]
+# The trial vectors are generated one at a time.  Only one of them is held in
+# memory when the vectors are stored out of core.
         norm_min = 1
-        for i,xi in enumerate(xt):
+        for k, ek in enumerate(e):
+            if not new_trial[k]:
+                xt[k] = None
+                continue
+            xi = precond(xt[k], e[0], x0[k])
+            xi *= 1/numpy.sqrt(dot(xi.conj(), xi).real)
+            for i in range(space):
+                xsi = xs[i]
+                xi -= xsi * dot(xsi.conj(), xi)
             norm = numpy.sqrt(dot(xi.conj(), xi).real)
             if norm**2 > lindep:
-                xt[i] *= 1/norm
+                xi *= 1/norm
                 norm_min = min(norm_min, norm)
+                xt[k] = keep(xi)
             else:
-                xt[i] = None
+                xt[k] = None
         xt = [xi for xi in xt if xi is not None]
-        xi = None
+        xi = xsi = None
+        log.debug('davidson %d %d  |r|= %4.3g  e= %s  max|de|= %4.3g  lindep= %4.3g',
+                  icyc, space, max_dx_norm, e, de[ide], norm_min)
+        if len(xt) == 0:
+            log.debug('Linear dependency in trial subspace. |r| for each state %s',
+                     dx_norm)
+            conv = [conv[k] or (norm < toloose) for k,norm in enumerate(dx_norm)]
+            break
+
+        max_dx_last = max_dx_norm
+        fresh_start = space+nroots > max_space
+
+        if callable(callback):
+            callback(locals())
+
+    return conv, e, x0
+
+def davidson_block(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
+                   lindep=1e-14, max_memory=2000, dot=numpy.dot, callback=None,
+                   nroots=1, lessio=False, verbose=logger.WARN,
+                   follow_state=False):
+    '''Block Davidson diagonalization method to solve  a c = e c.  It is the
+    same algorithm as :func:`davidson1`, except that the trial vectors are
+    handled as one 2D array.  The operator is applied to all new trial vectors
+    in one call, the subspace Hamiltonian and the Ritz vectors are computed by
+    matrix-matrix products, and the trial vectors are orthogonalized by
+    blocked Gram-Schmidt.  Converged roots are soft-locked: they are kept in
+    the subspace but do not generate correction vectors.
+
+    Args:
+        aop : function(xs) => array_like_xs
+            Matrix vector multiplication :math:`y_{ki} = \sum_{j}a_{ij}*x_{kj}`.
+            The argument is a 2D array of shape (nvec,n).  The returned value
+            should be an array (or a list of 1D arrays) of the same shape.
+        x0 : 1D array, 2D array or a list of 1D array
+            Initial guess.
+        precond : function(dx, e, x0) => array_like_dx
+            Preconditioner to generate new trial vector.
+            The argument dx is a residual vector ``a*x0-e*x0``; e is the current
+            eigenvalue; x0 is the current eigenvector.
+
+    Kwargs:
+        dot : function(x, y) => array
+            Matrix product of two blocks of vectors.  Default is numpy.dot.
+
+        See :func:`davidson1` for the other keyword arguments.
+
+    Returns:
+        conv : list of bools
+            Converged or not
+        e : list of floats
+            The lowest :attr:`nroots` eigenvalues.
+        c : 2D array
+            The lowest :attr:`nroots` eigenvectors, one in each row.
+
+    Examples:
+
+    >>> from pyscf import lib
+    >>> a = numpy.random.random((10,10))
+    >>> a = a + a.T
+    >>> aop = lambda xs: numpy.dot(xs, a)
+    >>> precond = lambda dx, e, x0: dx/(a.diagonal()-e)
+    >>> x0 = a[:2]
+    >>> conv, e, c = lib.davidson_block(aop, x0, precond, nroots=2)
+    >>> c.shape
+    (2, 10)
+    '''
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(sys.stdout, verbose)
+
+    toloose = numpy.sqrt(tol)
+    log.debug1('tol %g  toloose %g', tol, toloose)
+
+    x0 = numpy.asarray(x0)
+    if x0.ndim == 1:
+        x0 = x0.reshape(1,-1)
+    nvec, n = x0.shape
+    max_space = max_space + nroots * 3
+    # Enough rows for the initial guess and for nroots trial vectors appended
+    # to a subspace of max_space vectors
+    nrow = max_space + max(nroots, nvec)
+    _incore = max_memory*1e6/x0[0].nbytes > max_space*2+nroots*3
+    lessio = lessio and not _incore
+    log.debug1('max_cycle %d  max_space %d  max_memory %d  incore %s',
+               max_cycle, max_space, max_memory, _incore)
+    xs = ax = heff = None
+    fresh_start = True
+    e = 0
+    v = None
+    conv = [False] * nroots
+
+    for icyc in range(max_cycle):
+        if fresh_start:
+            space = 0
+# Orthogonalize xt space because the basis of subspace xs must be orthogonal
+# but the eigenvectors x0 might not be strictly orthogonal
+            xt = _qr_block(x0, None, 0, dot, lindep)[0]
+            x0 = None
+            max_dx_last = 1e9
+
+        axt = numpy.asarray(aop(xt)).reshape(len(xt),n)
+        if xs is None:  # Lazy initilize the subspace to determine the dtype
+            dtype = numpy.result_type(xt, axt)
+            xs = _block_buffer((nrow,n), dtype, _incore)
+            ax = _block_buffer((nrow,n), dtype, _incore)
+            heff = numpy.empty((nrow,nrow), dtype=dtype)
+        rnow = len(xt)
+        head, space = space, space+rnow
+        xs[head:space] = xt
+        ax[head:space] = axt
+
+        elast = e
+        vlast = v
+        conv_last = conv
+        heff[head:space,:space] = dot(xt.conj(), ax[:space].T)
+        hblk = heff[head:space,head:space]
+        heff[head:space,head:space] = (hblk + hblk.T.conj()) * .5
+        heff[:head,head:space] = heff[head:space,:head].T.conj()
+
+        w, v = scipy.linalg.eigh(heff[:space,:space])
+        e = w[:nroots]
+        v = v[:,:nroots]
+
+        x0 = dot(v.T, xs[:space])
+        if lessio:
+            ax0 = numpy.asarray(aop(x0)).reshape(x0.shape)
+        else:
+            ax0 = dot(v.T, ax[:space])
+
+        elast, conv_last = _sort_elast(elast, conv_last, vlast, v, fresh_start)
+        de = e - numpy.asarray(elast)
+        dx = ax0 - e[:,None] * x0
+        ax0 = None
+        dx_norm = numpy.sqrt(numpy.einsum('ij,ij->i', dx.conj(), dx).real)
+        conv = [abs(de[k]) < tol and dx_norm[k] < toloose
+                for k in range(len(e))]
+        for k, ek in enumerate(e):
+            if conv[k] and not conv_last[k]:
+                log.debug('root %d converged  |r|= %4.3g  e= %s  max|de|= %4.3g',
+                          k, dx_norm[k], ek, de[k])
+        max_dx_norm = max(dx_norm)
+        ide = numpy.argmax(abs(de))
+        if all(conv):
+            log.debug('converge %d %d  |r|= %4.3g  e= %s  max|de|= %4.3g',
+                      icyc, space, max_dx_norm, e, de[ide])
+            break
+        elif (follow_state and max_dx_norm > 1 and
+              max_dx_norm/max_dx_last > 3 and space > nroots*1):
+            log.debug('davidson %d %d  |r|= %4.3g  e= %s  max|de|= %4.3g',
+                      icyc, space, max_dx_norm, e, de[ide])
+            log.debug('Large |r| detected, restore to previous x0')
+            x0 = dot(vlast.T, xs[:len(vlast)])
+            fresh_start = True
+            continue
+
+        # Soft locking: the converged roots stay in the subspace but only the
+        # unconverged roots produce new trial vectors
+        ks = [k for k in range(len(e)) if not conv[k] and dx_norm[k]**2 > lindep]
+        if not ks:
+            ks = [k for k in range(len(e)) if dx_norm[k]**2 > lindep]
+        xt = numpy.asarray([precond(dx[k], e[0], x0[k]) for k in ks]).reshape(-1,n)
+        dx = None
+        if len(xt) > 0:
+            xt /= numpy.sqrt(numpy.einsum('ij,ij->i', xt.conj(), xt).real)[:,None]
+            xt, norm_min = _qr_block(xt, xs, space, dot, lindep)
+        else:
+            norm_min = 0
         log.debug('davidson %d %d  |r|= %4.3g  e= %s  max|de|= %4.3g  lindep= %4.3g',
                   icyc, space, max_dx_norm, e, de[ide], norm_min)
         if len(xt) == 0:
@@ -1217,20 +1388,62 @@ def cho_solve(a, b):
     return scipy.linalg.solve(a, b, sym_pos=True)
 
 
-def _qr(xs, dot):
+def _qr(xs, dot, keep=None):
     norm = numpy.sqrt(dot(xs[0].conj(), xs[0]).real)
     qs = [xs[0]/norm]
+    if keep is not None:
+        qs[0] = keep(qs[0])
     for i in range(1, len(xs)):
         xi = xs[i].copy()
         for j in range(len(qs)):
             xi -= qs[j] * dot(qs[j].conj(), xi)
         norm = numpy.sqrt(dot(xi.conj(), xi).real)
         if norm > 1e-7:
-            qs.append(xi/norm)
+            xi *= 1/norm
+            if keep is not None:
+                xi = keep(xi)
+            qs.append(xi)
     return qs
 
+def _qr_block(xt, xs, space, dot, lindep=1e-14):
+    '''Orthonormalize the rows of xt against the first "space" rows of xs and
+    among themselves.  Block classical Gram-Schmidt (applied twice) followed by
+    canonical orthogonalization of the block.  Directions whose squared norm
+    falls below lindep are discarded.  Returns the orthonormal block and the
+    smallest norm of the kept directions.
+    '''
+    xt = numpy.array(xt, dtype=numpy.result_type(xt, *([xs] if space else [])))
+    norm_min = 1
+    for i in range(2):
+        if space > 0:
+            xsp = xs[:space]
+            xt -= dot(dot(xt, xsp.T.conj()), xsp)
+        s = dot(xt.conj(), xt.T)
+        w, u = scipy.linalg.eigh((s + s.T.conj()) * .5)
+        mask = w > lindep
+        if i == 0:
+            norm_min = numpy.sqrt(w[mask].min()) if mask.any() else 0
+        xt = dot((u[:,mask]/numpy.sqrt(w[mask])).T, xt)
+        if len(xt) == 0:
+            break
+    return xt, norm_min
+
+def _block_buffer(shape, dtype, incore=True):
+    if incore:
+        return numpy.empty(shape, dtype=dtype)
+    else:
+        return numpy.memmap(tempfile.TemporaryFile(dir=parameters.TMPDIR),
+                            dtype=dtype, mode='w+', shape=shape)
+
+def _outcore_copy(x):
+    buf = _block_buffer(x.shape, x.dtype, incore=False)
+    buf[:] = x
+    return buf
+
 def _gen_x0(v, xs):
     space, nroots = v.shape
+    if isinstance(xs, _Xlist):
+        return _gen_x0_outcore(v, xs)
     x0 = []
     for k in range(nroots):
         x0.append(xs[space-1] * v[space-1,k])
@@ -1240,6 +1453,24 @@ def _gen_x0(v, xs):
             x0[k] += v[i,k] * xsi
     return x0
 
+def _gen_x0_outcore(v, xs, blksize=None):
+    '''Linear combinations of the vectors of an _Xlist.  The results are
+    accumulated segment by segment in memory-mapped arrays.
+    '''
+    space, nroots = v.shape
+    xs0 = xs[0]
+    dtype = numpy.result_type(v, xs0)
+    x0 = [_block_buffer(xs0.shape, dtype, incore=False) for k in range(nroots)]
+    if blksize is None:
+# about 16 MB for the segments of xs and x0
+        blksize = max(4096, int(2e6) // (space+nroots))
+    for p0, p1 in misc.prange(0, xs0.size, blksize):
+        xseg = numpy.array([xs[i].reshape(-1)[p0:p1] for i in range(space)])
+        xseg = numpy.dot(v.T, xseg)
+        for k in range(nroots):
+            x0[k].reshape(-1)[p0:p1] = xseg[k]
+    return x0
+
 def _sort_by_similarity(w, v, nroots, conv, vlast, emin=None, heff=None):
     if not any(conv) or vlast is None:
         return w[:nroots], v[:,:nroots]
@@ -1269,36 +1500,89 @@ def _sort_elast(elast, conv_last, vlast, v, fresh_start):
 
 
 class _Xlist(list):
+    '''A list of vectors stored in a memory-mapped scratch file.
+
+    Each vector occupies a fixed-size slot of the file.  Slots released by
+    pop are reused by the following append.  The elements are read-only
+    views of the memory map, which are paged in by the OS on demand.
+    '''
     def __init__(self):
-        self.scr_h5 = misc.H5TmpFile()
+        self.scr = tempfile.TemporaryFile(dir=parameters.TMPDIR)
         self.index = []
+        self._slots = []  # (offset, nbytes) of each slot in the scratch file
+        self._free = []   # ids of released slots
+        self._maps = []   # memmap of each slot
+        self._layout = [] # (offset, shape, dtype) of the vector in each slot
+        self._dirty = False
+
+    def _map(self, slot):
+# The file buffer is flushed only when the vectors are read back
+        if self._dirty:
+            self.scr.flush()
+            self._dirty = False
+        buf = self._maps[slot]
+        if buf is None:
+            offset, shape, dtype = self._layout[slot]
+            buf = self._maps[slot] = numpy.memmap(self.scr, dtype=dtype,
+                                                  mode='r', offset=offset,
+                                                  shape=shape)
+        return buf
 
     def __getitem__(self, n):
-        key = self.index[n]
-        return self.scr_h5[key].value
+        x = numpy.asarray(self._map(self.index[n]))
+        x.flags.writeable = False
+        return x
+
+    def _alloc(self, x):
+        for k, slot in enumerate(self._free):
+            if self._slots[slot][1] >= x.nbytes:
+                return self._free.pop(k)
+        if self._slots:
+            offset = sum(self._slots[-1])
+        else:
+            offset = 0
+        self._slots.append((offset, max(x.nbytes, 1)))
+        self._maps.append(None)
+        self._layout.append(None)
+        return len(self._slots) - 1
+
+    def _store(self, slot, x):
+        x = numpy.ascontiguousarray(x)
+        offset = self._slots[slot][0]
+# Writing through the file is faster than page faults on a new memory map
+        self.scr.seek(offset)
+        self.scr.write(x.data)
+        self._dirty = True
+        if self._layout[slot] != (offset, x.shape, x.dtype):
+            self._layout[slot] = (offset, x.shape, x.dtype)
+            self._maps[slot] = None
 
     def append(self, x):
-        key = str(len(self.index) + 1)
-        if key in self.index:
-            for i in range(len(self.index)+1):
-                if str(i) not in self.index:
-                    key = str(i)
-                    break
-        self.index.append(key)
-        self.scr_h5[key] = x
-        self.scr_h5.flush()
+        x = numpy.asarray(x)
+        slot = self._alloc(x)
+        self._store(slot, x)
+        self.index.append(slot)
 
     def __setitem__(self, n, x):
-        key = self.index[n]
-        self.scr_h5[key][:] = x
-        self.scr_h5.flush()
+        x = numpy.asarray(x)
+        slot = self.index[n]
+        if x.nbytes > self._slots[slot][1]:
+            self._free.append(slot)
+            slot = self.index[n] = self._alloc(x)
+        self._store(slot, x)
 
     def __len__(self):
         return len(self.index)
 
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
     def pop(self, index):
-        key = self.index.pop(index)
-        del(self.scr_h5[key])
+        slot = self.index.pop(index)
+        x = numpy.array(self._map(slot))
+        self._free.append(slot)
+        return x
 
 
 if __name__ == '__main__':
@@ -32,6 +32,11 @@ void FCIcompress_link(_LinkT *clink, int *link_index,
                       int norb, int nstr, int nlink);
 void FCIcompress_link_tril(_LinkTrilT *clink, int *link_index,
                            int nstr, int nlink);
+void FCIgen_linkstr(_LinkT *clink, int norb, int nocc,
+                    int str_start, int count);
+void FCIgen_linkstr_tril(_LinkTrilT *clink, int norb, int nocc,
+                         int str_start, int count);
+int FCInum_strings(int norb, int nelec);
 int FCIcre_des_sign(int p, int q, uint64_t string0);
 int FCIcre_sign(int p, uint64_t string0);
 int FCIdes_sign(int p, uint64_t string0);
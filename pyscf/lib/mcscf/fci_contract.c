@@ -406,6 +406,405 @@ void FCIcontract_2e_spin1(double *eri, double *ci0, double *ci1,
 }
 
 
+/*
+ * Multiple CI vectors version of ctr_rhf2e_kern.  The string links are
+ * traversed once for all nvec vectors.  t1 of the vectors are stored in
+ * t1[nnorb,nvec,bcount] so that the contraction with eri is one dgemm.
+ * taba is the link list of alpha string stra_id.  tabb is the link lists of
+ * the beta strings strb_id, strb_id+1, ...
+ */
+static void prog_a_t1_nvec(double **ci0, double *t1, int nvec,
+                           int bcount, int strb_id, int nstrb, int nlinka,
+                           const _LinkTrilT *taba)
+{
+        const size_t ldt = (size_t)nvec * bcount;
+        int j, k, iv, ia, sign;
+        size_t str1;
+        double *pt1, *pci;
+
+        for (j = 0; j < nlinka; j++) {
+                ia   = EXTRACT_IA  (taba[j]);
+                str1 = EXTRACT_ADDR(taba[j]);
+                sign = EXTRACT_SIGN(taba[j]);
+                if (sign == 0) {
+                        break;
+                }
+                for (iv = 0; iv < nvec; iv++) {
+                        pt1 = t1 + ia*ldt + iv*bcount;
+                        pci = ci0[iv] + strb_id + str1*nstrb;
+                        if (sign > 0) {
+                                for (k = 0; k < bcount; k++) {
+                                        pt1[k] += pci[k];
+                                }
+                        } else {
+                                for (k = 0; k < bcount; k++) {
+                                        pt1[k] -= pci[k];
+                                }
+                        }
+                }
+        }
+}
+
+static void prog_b_t1_nvec(double **ci0, double *t1, int nvec,
+                           int bcount, int stra_id, int nstrb, int nlinkb,
+                           const _LinkTrilT *tabb)
+{
+        const size_t ldt = (size_t)nvec * bcount;
+        const size_t off = stra_id * (size_t)nstrb;
+        int j, iv, ia, str0, str1, sign;
+        double *pt1;
+
+        for (str0 = 0; str0 < bcount; str0++) {
+                for (j = 0; j < nlinkb; j++) {
+                        ia   = EXTRACT_IA  (tabb[j]);
+                        str1 = EXTRACT_ADDR(tabb[j]);
+                        sign = EXTRACT_SIGN(tabb[j]);
+                        if (sign == 0) {
+                                break;
+                        }
+                        pt1 = t1 + ia*ldt + str0;
+                        for (iv = 0; iv < nvec; iv++) {
+                                pt1[iv*bcount] += sign * ci0[iv][off+str1];
+                        }
+                }
+                tabb += nlinkb;
+        }
+}
+
+static void spread_b_t1_nvec(double **ci1, double *t1, int nvec,
+                             int bcount, int stra_id, int nstrb, int nlinkb,
+                             const _LinkTrilT *tabb)
+{
+        const size_t ldt = (size_t)nvec * bcount;
+        const size_t off = stra_id * (size_t)nstrb;
+        int j, iv, ia, str0, str1, sign;
+        double *pt1;
+
+        for (str0 = 0; str0 < bcount; str0++) {
+                for (j = 0; j < nlinkb; j++) {
+                        ia   = EXTRACT_IA  (tabb[j]);
+                        str1 = EXTRACT_ADDR(tabb[j]);
+                        sign = EXTRACT_SIGN(tabb[j]);
+                        if (sign == 0) {
+                                break;
+                        }
+                        pt1 = t1 + ia*ldt + str0;
+                        for (iv = 0; iv < nvec; iv++) {
+                                ci1[iv][off+str1] += sign * pt1[iv*bcount];
+                        }
+                }
+                tabb += nlinkb;
+        }
+}
+
+/*
+ * ci1buf[nvec,na,nstrb].  If rowmap is not NULL, the rows of ci1buf are the
+ * alpha strings of rowmap, ie string str1 is stored in row rowmap[str1].
+ */
+static void spread_bufa_t1_nvec(double *ci1buf, double *t1, int nvec,
+                                int nrow_t1, int bcount, int na, int nstrb,
+                                int nlinka, const _LinkTrilT *taba,
+                                const int *rowmap)
+{
+        const size_t ldt = (size_t)nvec * nrow_t1;
+        int j, k, iv, ia, sign;
+        size_t str1;
+        double *cp0, *cp1;
+
+        for (j = 0; j < nlinka; j++) {
+                ia   = EXTRACT_IA  (taba[j]);
+                str1 = EXTRACT_ADDR(taba[j]);
+                sign = EXTRACT_SIGN(taba[j]);
+                if (sign == 0) {
+                        break;
+                }
+                if (rowmap != NULL) {
+                        str1 = rowmap[str1];
+                }
+                for (iv = 0; iv < nvec; iv++) {
+                        cp0 = t1 + ia*ldt + iv*nrow_t1;
+                        cp1 = ci1buf + (iv*(size_t)na + str1) * nstrb;
+                        if (sign > 0) {
+                                for (k = 0; k < bcount; k++) {
+                                        cp1[k] += cp0[k];
+                                }
+                        } else {
+                                for (k = 0; k < bcount; k++) {
+                                        cp1[k] -= cp0[k];
+                                }
+                        }
+                }
+        }
+}
+
+static void ctr_rhf2e_kern_nvec(double *eri, double **ci0, double **ci1,
+                                double *ci1buf, double *t1buf, int nvec,
+                                int bcount_for_spread_a, int ncol_ci1buf,
+                                int bcount, int stra_id, int strb_id,
+                                int norb, int nrow_ci1buf, int nb,
+                                int nlinka, int nlinkb, const int *rowmap,
+                                const _LinkTrilT *taba, const _LinkTrilT *tabb)
+{
+        const char TRANS_N = 'N';
+        const double D0 = 0;
+        const double D1 = 1;
+        const int nnorb = norb * (norb+1)/2;
+        const int ldt = nvec * bcount;
+        double *t1 = t1buf;
+        double *vt1 = t1buf + (size_t)nnorb*ldt;
+
+        memset(t1, 0, sizeof(double)*nnorb*ldt);
+        prog_a_t1_nvec(ci0, t1, nvec, bcount, strb_id, nb, nlinka, taba);
+        prog_b_t1_nvec(ci0, t1, nvec, bcount, stra_id, nb, nlinkb, tabb);
+
+        dgemm_(&TRANS_N, &TRANS_N, &ldt, &nnorb, &nnorb,
+               &D1, t1, &ldt, eri, &nnorb, &D0, vt1, &ldt);
+        spread_b_t1_nvec(ci1, vt1, nvec, bcount, stra_id, nb, nlinkb, tabb);
+        spread_bufa_t1_nvec(ci1buf, vt1, nvec, bcount, bcount_for_spread_a,
+                            nrow_ci1buf, ncol_ci1buf, nlinka, taba, rowmap);
+}
+
+/*
+ * Loop over the (alpha string, beta string block) pairs.  If link_indexa
+ * (link_indexb) is NULL, the links are generated on the fly for the strings
+ * of each block from the graph based string addresses (FCIgen_linkstr_tril).
+ * spin0 = 1 to compute the lower triangular part of the alpha-beta block
+ * for the singlet, see FCIcontract_2e_spin0.
+ * Only the intermediate alpha strings [stra0:stra1] are included.  If rows
+ * is not NULL, the alpha strings linked to [stra0:stra1] are listed in
+ * rows[:nrow] and rowmap maps them to their position in rows.  Then only
+ * these rows of ci1 are updated, and the buffer ci1buf holds nrow rows
+ * instead of na.
+ */
+static void contract_2e_nvec_drv(double *eri, double **ci0, double **ci1,
+                                 int nvec, int norb, int na, int nb,
+                                 int neleca, int nelecb, int nlinka, int nlinkb,
+                                 int *link_indexa, int *link_indexb,
+                                 int stra0, int stra1, int spin0,
+                                 const int *rows, const int *rowmap, int nrow)
+{
+        _LinkTrilT *clinka = NULL;
+        _LinkTrilT *clinkb = NULL;
+        if (link_indexa != NULL) {
+                clinka = malloc(sizeof(_LinkTrilT) * nlinka * na);
+                FCIcompress_link_tril(clinka, link_indexa, na, nlinka);
+        }
+        if (link_indexb != NULL) {
+                clinkb = malloc(sizeof(_LinkTrilT) * nlinkb * nb);
+                FCIcompress_link_tril(clinkb, link_indexb, nb, nlinkb);
+        }
+
+        if (rows == NULL) {
+                nrow = na;
+                rowmap = NULL;
+        }
+        double *ci1bufs[MAX_THREADS];
+#pragma omp parallel default(none) \
+        shared(eri, ci0, ci1, nvec, norb, na, nb, neleca, nelecb, \
+               nlinka, nlinkb, clinka, clinkb, ci1bufs, stra0, stra1, spin0, \
+               rows, rowmap, nrow)
+{
+        int strk, strk0, ib, i, k;
+        size_t blen;
+        double *t1buf = malloc(sizeof(double) * STRB_BLKSIZE*nvec*norb*(norb+1));
+        double *ci1buf = malloc(sizeof(double) * nrow*STRB_BLKSIZE*nvec);
+        double *pci1, *pbuf;
+        _LinkTrilT *taba = NULL;
+        _LinkTrilT *tabb = NULL;
+        _LinkTrilT *tabbuf = NULL;
+        if (clinka == NULL) {
+                taba = malloc(sizeof(_LinkTrilT) * nlinka);
+        }
+        if (clinkb == NULL) {
+                tabbuf = malloc(sizeof(_LinkTrilT) * nlinkb * STRB_BLKSIZE);
+        }
+        ci1bufs[omp_get_thread_num()] = ci1buf;
+        for (ib = 0; ib < nb; ib += STRB_BLKSIZE) {
+                blen = MIN(STRB_BLKSIZE, nb-ib);
+                memset(ci1buf, 0, sizeof(double) * nrow*blen*nvec);
+                if (clinkb == NULL) {
+                        FCIgen_linkstr_tril(tabbuf, norb, nelecb, ib, blen);
+                        tabb = tabbuf;
+                } else {
+                        tabb = clinkb + ib * nlinkb;
+                }
+/* for spin0, strk starts from ib, because [0:ib,0:ib] have been evaluated */
+                strk0 = spin0 ? MAX(ib, stra0) : stra0;
+#pragma omp for schedule(static)
+                for (strk = strk0; strk < stra1; strk++) {
+                        if (clinka == NULL) {
+                                FCIgen_linkstr_tril(taba, norb, neleca, strk, 1);
+                        } else {
+                                taba = clinka + strk * nlinka;
+                        }
+                        if (spin0) {
+                                ctr_rhf2e_kern_nvec(eri, ci0, ci1, ci1buf, t1buf, nvec,
+                                                    MIN(STRB_BLKSIZE, strk-ib), blen,
+                                                    MIN(STRB_BLKSIZE, strk+1-ib),
+                                                    strk, ib, norb, nrow, nb,
+                                                    nlinka, nlinkb, rowmap,
+                                                    taba, tabb);
+                        } else {
+                                ctr_rhf2e_kern_nvec(eri, ci0, ci1, ci1buf, t1buf, nvec,
+                                                    blen, blen, blen, strk, ib,
+                                                    norb, nrow, nb, nlinka, nlinkb,
+                                                    rowmap, taba, tabb);
+                        }
+                }
+                NPomp_dsum_reduce_inplace(ci1bufs, blen*nrow*nvec);
+#pragma omp master
+                for (i = 0; i < nvec; i++) {
+                        if (rows == NULL) {
+                                FCIaxpy2d(ci1[i]+ib, ci1buf+i*na*blen, na, nb, blen);
+                        } else {
+                                pbuf = ci1buf + i*nrow*blen;
+                                for (k = 0; k < nrow; k++) {
+                                        pci1 = ci1[i] + rows[k]*(size_t)nb + ib;
+                                        FCIaxpy2d(pci1, pbuf+k*blen, 1, nb, blen);
+                                }
+                        }
+                }
+        }
+        if (clinka == NULL) {
+                free(taba);
+        }
+        if (clinkb == NULL) {
+                free(tabbuf);
+        }
+        free(ci1buf);
+        free(t1buf);
+}
+        if (clinka != NULL) {
+                free(clinka);
+        }
+        if (clinkb != NULL) {
+                free(clinkb);
+        }
+}
+
+/*
+ * Apply the 2e Hamiltonian on nvec CI vectors ci0[nvec][na*nb]
+ * simultaneously.  Each ci1[i] is identical to the output of
+ * FCIcontract_2e_spin1 for ci0[i].
+ */
+void FCIcontract_2e_spin1_nvec(double *eri, double **ci0, double **ci1,
+                               int nvec, int norb, int na, int nb,
+                               int nlinka, int nlinkb,
+                               int *link_indexa, int *link_indexb)
+{
+        int iv;
+        for (iv = 0; iv < nvec; iv++) {
+                memset(ci1[iv], 0, sizeof(double)*na*nb);
+        }
+        contract_2e_nvec_drv(eri, ci0, ci1, nvec, norb, na, nb, 0, 0,
+                             nlinka, nlinkb, link_indexa, link_indexb,
+                             0, na, 0, NULL, NULL, 0);
+}
+
+/*
+ * Multiple CI vectors version of FCIcontract_2e_spin0.  As in
+ * FCIcontract_2e_spin0, only half of the contraction is computed for each
+ * vector.  The right contracted ci vector is (ci1[i]+ci1[i].T)
+ */
+void FCIcontract_2e_spin0_nvec(double *eri, double **ci0, double **ci1,
+                               int nvec, int norb, int na, int nlink,
+                               int *link_index)
+{
+        int iv;
+        for (iv = 0; iv < nvec; iv++) {
+                memset(ci1[iv], 0, sizeof(double)*na*na);
+        }
+        contract_2e_nvec_drv(eri, ci0, ci1, nvec, norb, na, na, 0, 0,
+                             nlink, nlink, link_index, link_index,
+                             0, na, 1, NULL, NULL, 0);
+}
+
+/*
+ * FCIcontract_2e_spin1_nvec without the link_index tables.  The single
+ * excitations of each string are generated on the fly.
+ */
+void FCIcontract_2e_spin1_otf(double *eri, double **ci0, double **ci1,
+                              int nvec, int norb, int neleca, int nelecb)
+{
+        int na = FCInum_strings(norb, neleca);
+        int nb = FCInum_strings(norb, nelecb);
+        int nlinka = neleca * (norb - neleca + 1);
+        int nlinkb = nelecb * (norb - nelecb + 1);
+        int iv;
+        for (iv = 0; iv < nvec; iv++) {
+                memset(ci1[iv], 0, sizeof(double)*na*nb);
+        }
+        contract_2e_nvec_drv(eri, ci0, ci1, nvec, norb, na, nb, neleca, nelecb,
+                             nlinka, nlinkb, NULL, NULL, 0, na, 0,
+                             NULL, NULL, 0);
+}
+
+void FCIcontract_2e_spin0_otf(double *eri, double **ci0, double **ci1,
+                              int nvec, int norb, int nelec)
+{
+        int na = FCInum_strings(norb, nelec);
+        int nlink = nelec * (norb - nelec + 1);
+        int iv;
+        for (iv = 0; iv < nvec; iv++) {
+                memset(ci1[iv], 0, sizeof(double)*na*na);
+        }
+        contract_2e_nvec_drv(eri, ci0, ci1, nvec, norb, na, na, nelec, nelec,
+                             nlink, nlink, NULL, NULL, 0, na, 1,
+                             NULL, NULL, 0);
+}
+
+/*
+ * Add to ci1 the contributions of the intermediate alpha strings
+ * [stra0:stra1] to the contraction of FCIcontract_2e_spin1_otf.  ci1 is not
+ * initialized.  Summing over the blocks of alpha strings gives the full
+ * contraction.  The string links of the block are generated on the fly.
+ * Only the rows of ci0 and ci1 of the alpha strings linked to [stra0:stra1]
+ * are accessed.
+ */
+void FCIcontract_2e_spin1_blk(double *eri, double **ci0, double **ci1,
+                              int nvec, int norb, int neleca, int nelecb,
+                              int stra0, int stra1)
+{
+        int na = FCInum_strings(norb, neleca);
+        int nb = FCInum_strings(norb, nelecb);
+        int nlinka = neleca * (norb - neleca + 1);
+        int nlinkb = nelecb * (norb - nelecb + 1);
+        int *rowmap = malloc(sizeof(int) * na);
+        int *rows = malloc(sizeof(int) * na);
+        _LinkTrilT *taba = malloc(sizeof(_LinkTrilT) * nlinka);
+        int i, j, strk, nrow;
+        stra1 = MIN(stra1, na);
+
+        for (i = 0; i < na; i++) {
+                rowmap[i] = -1;
+        }
+        for (strk = stra0; strk < stra1; strk++) {
+                FCIgen_linkstr_tril(taba, norb, neleca, strk, 1);
+                for (j = 0; j < nlinka; j++) {
+                        if (EXTRACT_SIGN(taba[j]) == 0) {
+                                break;
+                        }
+                        rowmap[EXTRACT_ADDR(taba[j])] = 0;
+                }
+        }
+        nrow = 0;
+        for (i = 0; i < na; i++) {
+                if (rowmap[i] == 0) {
+                        rowmap[i] = nrow;
+                        rows[nrow] = i;
+                        nrow++;
+                }
+        }
+
+        contract_2e_nvec_drv(eri, ci0, ci1, nvec, norb, na, nb, neleca, nelecb,
+                             nlinka, nlinkb, NULL, NULL, stra0, stra1, 0,
+                             rows, rowmap, nrow);
+        free(taba);
+        free(rows);
+        free(rowmap);
+}
+
+
 /*
  * eri_ab is mixed integrals (alpha,alpha|beta,beta), |beta,beta) in small strides
  */
@@ -123,6 +123,11 @@ static int binomial(int n, int m)
         }
 }
 
+int FCInum_strings(int norb, int nelec)
+{
+        return binomial(norb, nelec);
+}
+
 int FCIstr2addr(int norb, int nelec, uint64_t string)
 {
         size_t addr = 0;
@@ -279,6 +284,131 @@ void FCIlinkstr_index(int *link_index, int norb, int na, int nocc,
         }
 }
 
+/*
+ * The next string in the lexical order (the same number of bits, the next
+ * larger integer)
+ */
+static uint64_t next_string(uint64_t str0)
+{
+        uint64_t c = str0 & -str0;
+        uint64_t r = str0 + c;
+        return (((r ^ str0) >> 2) / c) | r;
+}
+
+/*
+ * Generate the links of the strings [str_start:str_start+count] on the fly.
+ * The strings are obtained from the graph based addresses (the lexical
+ * order).  clink[count,nlink] is identical to the compressed
+ * (FCIcompress_link_tril) output of FCIlinkstr_index(..., store_trilidx=1)
+ */
+void FCIgen_linkstr_tril(_LinkTrilT *clink, int norb, int nocc,
+                         int str_start, int count)
+{
+        int occ[norb];
+        int vir[norb];
+        int nvir = norb - nocc;
+        int nlink = nocc * nvir + nocc;
+        int n, io, iv, i, a, k;
+        uint64_t str0, str1;
+        uint64_t str1s[nocc*nvir+1];
+        int addrbuf[nocc*nvir+1];
+
+        if (count <= 0 || nocc == 0) {
+                return;
+        }
+        FCIaddrs2str(&str0, &str_start, 1, norb, nocc);
+        for (n = 0; n < count; n++) {
+                for (i = 0, io = 0, iv = 0; i < norb; i++) {
+                        if (str0 & (1ULL<<i)) {
+                                occ[io] = i;
+                                io += 1;
+                        } else {
+                                vir[iv] = i;
+                                iv += 1;
+                        }
+                }
+                for (k = 0; k < nocc; k++) {
+                        clink[k].ia   = occ[k]*(occ[k]+1)/2+occ[k];
+                        clink[k].addr = str_start + n;
+                        clink[k].sign = 1;
+                }
+                for (i = 0; i < nocc; i++) {
+                for (a = 0; a < nvir; a++, k++) {
+                        str1 = (str0^(1ULL<<occ[i])) | (1ULL<<vir[a]);
+                        str1s[k-nocc] = str1;
+                        if (vir[a] > occ[i]) {
+                                clink[k].ia = vir[a]*(vir[a]+1)/2+occ[i];
+                        } else {
+                                clink[k].ia = occ[i]*(occ[i]+1)/2+vir[a];
+                        }
+                        clink[k].sign = FCIcre_des_sign(vir[a], occ[i], str0);
+                } }
+                FCIstrs2addr(addrbuf, str1s, nocc*nvir, norb, nocc);
+                for (k = 0; k < nocc*nvir; k++) {
+                        clink[k+nocc].addr = addrbuf[k];
+                }
+                clink += nlink;
+                if (n+1 < count) {
+                        str0 = next_string(str0);
+                }
+        }
+}
+
+/*
+ * Same to FCIgen_linkstr_tril, for the compressed (FCIcompress_link) output
+ * of FCIlinkstr_index(..., store_trilidx=0)
+ */
+void FCIgen_linkstr(_LinkT *clink, int norb, int nocc,
+                    int str_start, int count)
+{
+        int occ[norb];
+        int vir[norb];
+        int nvir = norb - nocc;
+        int nlink = nocc * nvir + nocc;
+        int n, io, iv, i, a, k;
+        uint64_t str0, str1;
+        uint64_t str1s[nocc*nvir+1];
+        int addrbuf[nocc*nvir+1];
+
+        if (count <= 0 || nocc == 0) {
+                return;
+        }
+        FCIaddrs2str(&str0, &str_start, 1, norb, nocc);
+        for (n = 0; n < count; n++) {
+                for (i = 0, io = 0, iv = 0; i < norb; i++) {
+                        if (str0 & (1ULL<<i)) {
+                                occ[io] = i;
+                                io += 1;
+                        } else {
+                                vir[iv] = i;
+                                iv += 1;
+                        }
+                }
+                for (k = 0; k < nocc; k++) {
+                        clink[k].a    = occ[k];
+                        clink[k].i    = occ[k];
+                        clink[k].addr = str_start + n;
+                        clink[k].sign = 1;
+                }
+                for (i = 0; i < nocc; i++) {
+                for (a = 0; a < nvir; a++, k++) {
+                        str1 = (str0^(1ULL<<occ[i])) | (1ULL<<vir[a]);
+                        str1s[k-nocc] = str1;
+                        clink[k].a    = vir[a];
+                        clink[k].i    = occ[i];
+                        clink[k].sign = FCIcre_des_sign(vir[a], occ[i], str0);
+                } }
+                FCIstrs2addr(addrbuf, str1s, nocc*nvir, norb, nocc);
+                for (k = 0; k < nocc*nvir; k++) {
+                        clink[k+nocc].addr = addrbuf[k];
+                }
+                clink += nlink;
+                if (n+1 < count) {
+                        str0 = next_string(str0);
+                }
+        }
+}
+
 // [cre, des, target_address, parity]
 void FCIcre_str_index(int *link_index, int norb, int na, int nocc,
                       uint64_t *strs)
@@ -342,9 +472,35 @@ void FCIdes_str_index(int *link_index, int norb, int na, int nocc,
  ***********************************************************
  */
 
+/*
+ * nocc is determined by nstr = binomial(norb,nocc) and
+ * nlink = nocc*(norb-nocc+1)
+ */
+static int nocc_of_link(int norb, int nstr, int nlink)
+{
+        int nocc;
+        for (nocc = 0; nocc <= norb; nocc++) {
+                if (nlink == nocc*(norb-nocc+1) && nstr == binomial(norb, nocc)) {
+                        return nocc;
+                }
+        }
+        return -1;
+}
+
+/*
+ * If link_index is NULL, the compressed links are generated from the string
+ * addresses (see FCIgen_linkstr) without the int32 link_index table
+ */
 void FCIcompress_link(_LinkT *clink, int *link_index,
                       int norb, int nstr, int nlink)
 {
+        if (link_index == NULL) {
+                int nocc = nocc_of_link(norb, nstr, nlink);
+                assert(nocc >= 0);
+                FCIgen_linkstr(clink, norb, nocc, 0, nstr);
+                return;
+        }
+
         int j, k;
         for (k = 0; k < nstr; k++) {
                 for (j = 0; j < nlink; j++) {
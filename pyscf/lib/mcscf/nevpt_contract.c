@@ -76,72 +76,6 @@ void NEVPTkern_dfec_dfae(double *gt2, double *eri, double *t2ket,
 }
 }
 
-// (df|ea) E^e_c E^d_f|0> = t_ac
-void NEVPTkern_aedf_ecdf(double *gt2, double *eri, double *t2ket,
-                         int bcount, int norb, int na, int nb)
-{
-        const char TRANS_N = 'N';
-        const char TRANS_T = 'T';
-        const double D0 = 0;
-        const double D1 = 1;
-        const int nnorb = norb * norb;
-        const int n4 = nnorb * nnorb;
-        const int n3 = nnorb * norb;
-        int i, m, n;
-        size_t k;
-        double *cp0, *cp1;
-        double *t2t;
-
-#pragma omp parallel default(none) \
-        shared(gt2, eri, t2ket, bcount, norb, na, nb) \
-        private(cp0, cp1, t2t, m, n, i, k)
-{
-        t2t = malloc(sizeof(double) * n4);
-#pragma omp for schedule(dynamic, 4)
-        for (k = 0; k < bcount; k++) {
-                for (m = 0; m < norb; m++) {
-                        for (n = 0; n < norb; n++) {
-                                cp0 = t2ket + k * n4 + (m*norb+n) * nnorb;
-                                cp1 = t2t + (n*norb+m) * nnorb;
-                                for (i = 0; i < nnorb; i++) {
-                                        cp1[i] = cp0[i];
-                                }
-                        }
-                }
-                dgemm_(&TRANS_T, &TRANS_N, &norb, &norb, &n3,
-                       &D1, t2t, &n3, eri, &n3,
-                       &D0, gt2+nnorb*k, &norb);
-        }
-        free(t2t);
-}
-}
-
-// (df|ce) E^a_e E^d_f|0> = t_ac
-void NEVPTkern_cedf_aedf(double *gt2, double *eri, double *t2ket,
-                         int bcount, int norb, int na, int nb)
-{
-        const char TRANS_N = 'N';
-        const char TRANS_T = 'T';
-        const double D0 = 0;
-        const double D1 = 1;
-        const int nnorb = norb * norb;
-        const int n4 = nnorb * nnorb;
-        const int n3 = nnorb * norb;
-        size_t k;
-        int blen;
-
-#pragma omp parallel default(none) \
-        shared(gt2, eri, t2ket, bcount, norb, na, nb) \
-        private(k, blen)
-#pragma omp for schedule(dynamic, 1)
-        for (k = 0; k < bcount; k+=8) {
-                blen = MIN(bcount-k, 8) * norb;
-                dgemm_(&TRANS_T, &TRANS_N, &norb, &blen, &n3,
-                       &D1, eri, &n3, t2ket+n4*k, &n3,
-                       &D0, gt2+nnorb*k, &norb);
-        }
-}
-
 // (df|ea) E^d_f E^e_c|0> = t_ac
 void NEVPTkern_dfea_dfec(double *gt2, double *eri, double *t2ket,
                          int bcount, int norb, int na, int nb)
@@ -16,6 +16,7 @@ import functools
 import itertools
 import math
 import types
+import traceback
 import ctypes
 import numpy
 import h5py
@@ -479,8 +480,13 @@ def izip(*args):
     else:
         return zip(*args)
 
+import threading
 from threading import Thread
 from multiprocessing import Queue, Process
+if sys.version_info < (3,):
+    import Queue as queue
+else:
+    import queue
 class ProcessWithReturnValue(Process):
     def __init__(self, group=None, target=None, name=None, args=(),
                  kwargs=None):
@@ -517,6 +523,64 @@ def background_process(func, *args, **kwargs):
     thread.start()
     return thread
 
+def fork_imap(fn, tasks, nproc, label='Task'):
+    '''Evaluate fn(*task) for the tasks in nproc forked worker processes,
+    similar to multiprocessing.Pool.imap_unordered.  Each task is processed
+    in one worker and its result is sent back through a queue.  Results
+    which are large arrays should be saved in memory shared with the parent
+    process (e.g. numpy.memmap) instead.
+
+    The OpenMP runtime (libgomp) cannot start a new thread team in a forked
+    process once the parent process has used OpenMP.  The workers run with
+    one OpenMP thread.
+
+    Yields:
+        (i, result) for the i-th task, in the order of completion.  An
+        exception in a worker is raised as RuntimeError in the parent process.
+    '''
+    task_queue = Queue()
+    result_queue = Queue()
+    for i in range(len(tasks)):
+        task_queue.put(i)
+    for i in range(nproc):
+        task_queue.put(None)
+    def worker():
+        with with_omp_threads(1):
+            for i in iter(task_queue.get, None):
+                try:
+                    result_queue.put((i, fn(*tasks[i]), None))
+                except Exception:
+                    result_queue.put((i, None, traceback.format_exc()))
+                    return
+
+    def get_result():
+        while True:
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(p.is_alive() for p in procs):
+                    try:
+                        return result_queue.get(timeout=1)
+                    except queue.Empty:
+                        raise RuntimeError('%s: worker processes exited unexpectedly'
+                                           % label)
+
+    procs = [Process(target=worker) for i in range(nproc)]
+    for p in procs:
+        p.start()
+    try:
+        for k in range(len(tasks)):
+            i, res, err = get_result()
+            if err is not None:
+                raise RuntimeError('%s %s failed in worker process\n%s'
+                                   % (label, tasks[i], err))
+            yield i, res
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+
 bg = background = bg_thread = background_thread
 bp = bg_process = background_process
 
@@ -530,6 +594,81 @@ class H5TmpFile(h5py.File):
     def __del__(self):
         self.close()
 
+# Target size (in bytes) of HDF5 chunks.  A chunk should fit in the default
+# HDF5 chunk cache (1 MB) so that the compressed chunks are decompressed only
+# once when they are read in slices.
+H5_CHUNK_SIZE = 512 * 1024
+
+def h5filter_options(compression=True):
+    '''Keyword arguments of h5py create_dataset for the lossless compression
+    of floating point data.  The byte shuffle filter is combined with a fast
+    compressor.  LZ4 or Zstd filters are used if the package hdf5plugin is
+    available.  Otherwise the built-in gzip filter is used.
+
+    Args:
+        compression : bool or str
+            'lz4', 'zstd', 'gzip', 'lzf', or True for the fastest available
+            compressor.  None or False means no compression.
+
+    Returns:
+        A dict to pass to create_dataset.
+
+    Examples:
+
+    >>> f = lib.H5TmpFile()
+    >>> f.create_dataset('a', (100,100), 'f8', chunks=(10,100),
+    ...                  **lib.h5filter_options('gzip'))
+    '''
+    if not compression:
+        return {}
+    if compression is True:
+        compression = 'lz4'
+    compression = compression.lower()
+    if compression in ('lz4', 'zstd'):
+        try:
+            import hdf5plugin
+            if compression == 'lz4':
+                opts = dict(hdf5plugin.LZ4())
+            else:
+                opts = dict(hdf5plugin.Zstd())
+            opts['shuffle'] = True
+            return opts
+        except (ImportError, AttributeError):
+            compression = 'gzip'
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': 1, 'shuffle': True}
+    elif compression == 'lzf':
+        return {'compression': 'lzf', 'shuffle': True}
+    else:
+        raise ValueError('Unknown compression %s' % compression)
+
+def h5chunks(shape, itemsize=8, chunk_size=H5_CHUNK_SIZE):
+    '''Chunk shape of an HDF5 dataset which is accessed in slices along the
+    leading dimensions (eg a[i0:i1] or a[i,j0:j1]).  The trailing dimensions
+    are kept contiguous in the chunk as long as the chunk is smaller than
+    chunk_size (in bytes).
+    '''
+    shape = [max(1, int(x)) for x in shape]
+    chunks = list(shape)
+    for i in range(len(shape)):
+        rest = itemsize * numpy.prod(shape[i+1:], dtype=float)
+        if rest * shape[i] <= chunk_size:
+            break
+        chunks[i] = max(1, min(shape[i], int(chunk_size // rest)))
+        if rest <= chunk_size:
+            break
+    return tuple(chunks)
+
+def zero_small(a, tol):
+    '''Set the elements of a which are smaller than tol (in absolute value)
+    to 0.  The absolute error of each element is bounded by tol.  The zeros
+    are compressed by the HDF5 filters (see :func:`h5filter_options`) much
+    better than the tiny numbers.
+    '''
+    if tol:
+        a[abs(a) < tol] = 0
+    return a
+
 def finger(a):
     return numpy.dot(numpy.cos(numpy.arange(a.size)), a.ravel())
 
@@ -560,10 +699,30 @@ class call_in_background(object):
             do_something_else()
             afun1(a, b)
             do_something_else()
+
+    Kwargs:
+        depth : int
+            If depth is given, the calls are put in a queue and executed in
+            order by one worker thread.  At most depth calls can be pending.
+            The caller is blocked only when the queue is full.  Each async
+            function returns a handler whose join() method waits for that
+            call.  The caller needs to rotate depth+1 buffers when the
+            arguments of the pending calls are reused.  By default (depth is
+            None), every call waits for the previous call to finish.
+
+        with call_in_background(load, save, depth=2) as (prefetch, async_write):
+            bufs = [numpy.empty(n) for i in range(3)]
+            handler = prefetch(bufs[0])
+            for i in range(nblk):
+                handler.join()
+                handler = prefetch(bufs[(i+1)%3])
+                ...
     '''
-    def __init__(self, *fns):
+    def __init__(self, *fns, **kwargs):
         self.fns = fns
         self.handler = None
+        self.depth = kwargs.get('depth', None)
+        self.queue = None
 
     def __enter__(self):
         if imp.lock_held():
@@ -574,9 +733,18 @@ class call_in_background(object):
 # https://github.com/paramiko/paramiko/issues/104
 # https://docs.python.org/2/library/threading.html#importing-in-threaded-code
 # Disable the asynchoronous mode for safe importing
-            def def_async_fn(fn):
-                return fn
-        else:
+            if self.depth is None:
+                def def_async_fn(fn):
+                    return fn
+            else:
+                def def_async_fn(fn):
+                    def async_fn(*args, **kwargs):
+                        handler = _AsyncCall(fn, args, kwargs)
+                        handler.run()
+                        return handler
+                    return async_fn
+
+        elif self.depth is None:
             def def_async_fn(fn):
                 def async_fn(*args, **kwargs):
                     if self.handler is not None:
@@ -586,6 +754,13 @@ class call_in_background(object):
                     return self.handler
                 return async_fn
 
+        else:
+            self.queue = _AsyncQueue(self.depth)
+            def def_async_fn(fn):
+                def async_fn(*args, **kwargs):
+                    return self.queue.put(fn, args, kwargs)
+                return async_fn
+
         if len(self.fns) == 1:
             return def_async_fn(self.fns[0])
         else:
@@ -594,6 +769,69 @@ class call_in_background(object):
     def __exit__(self, type, value, traceback):
         if self.handler is not None:
             self.handler.join()
+        if self.queue is not None:
+            self.queue.close(raise_error=(type is None))
+            self.queue = None
+
+class _AsyncCall(object):
+    '''A queued call of call_in_background'''
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.fn(*self.args, **self.kwargs)
+        except Exception as err:
+            self.error = err
+        finally:
+            self.args = self.kwargs = None
+            self.done.set()
+
+    def join(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+
+class _AsyncQueue(object):
+    '''One worker thread which executes the queued calls in order'''
+    def __init__(self, depth):
+        self.slots = threading.Semaphore(max(1, depth))
+        self.tasks = queue.Queue()
+        self.error = None
+        self.worker = Thread(target=self._run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            if self.error is None:
+                task.run()
+                self.error = task.error
+            else:  # Skip the remaining calls once an error occurred
+                task.error = self.error
+                task.done.set()
+            self.slots.release()
+
+    def put(self, fn, args, kwargs):
+        if self.error is not None:
+            raise self.error
+        self.slots.acquire()
+        task = _AsyncCall(fn, args, kwargs)
+        self.tasks.put(task)
+        return task
+
+    def close(self, raise_error=True):
+        self.tasks.put(None)
+        self.worker.join()
+        if raise_error and self.error is not None:
+            raise self.error
 
 
 # A tag to label the derived Scanner class
@@ -9,6 +9,7 @@ import tempfile
 from pyscf import gto
 from pyscf import scf
 from pyscf import fci
+from pyscf.lib import linalg_helper
 
 class KnowValues(unittest.TestCase):
     def test_davidson(self):
@@ -25,6 +26,56 @@ class KnowValues(unittest.TestCase):
         e = myfci.kernel()[0]
         self.assertAlmostEqual(e, -11.579978414933732+mol.energy_nuc(), 9)
 
+    def test_davidson_block(self):
+        numpy.random.seed(1)
+        n = 100
+        a = numpy.random.random((n,n)) * .1
+        a = a + a.T + numpy.diag(numpy.arange(n)*.5)
+        e_ref = scipy.linalg.eigh(a)[0]
+        aop = lambda xs: numpy.dot(xs, a)
+        precond = lambda dx, e, x0: dx/(a.diagonal()-e+1e-4)
+        x0 = numpy.eye(n)[:3]
+        conv, e, c = linalg_helper.davidson_block(aop, x0, precond, nroots=3)
+        self.assertTrue(all(conv))
+        self.assertEqual(c.shape, (3,n))
+        self.assertAlmostEqual(abs(e-e_ref[:3]).max(), 0, 9)
+        self.assertAlmostEqual(abs(numpy.dot(c, a) - e[:,None]*c).max(), 0, 5)
+        conv, e1, c1 = linalg_helper.davidson1(lambda xs: [a.dot(x) for x in xs],
+                                               x0, precond, nroots=3)
+        self.assertAlmostEqual(abs(e1-e).max(), 0, 9)
+
+        # one initial guess for 4 roots, subspace held in scratch files
+        conv, e, c = linalg_helper.davidson_block(aop, x0[0], precond, nroots=4,
+                                                  max_memory=1e-4, max_space=4)
+        self.assertTrue(all(conv))
+        self.assertAlmostEqual(abs(e-e_ref[:4]).max(), 0, 9)
+
+        b = a + numpy.random.random((n,n)) * .05j
+        b = b + b.T.conj()
+        e_ref = scipy.linalg.eigh(b)[0]
+        precond = lambda dx, e, x0: dx/(b.diagonal().real-e+1e-4)
+        conv, e, c = linalg_helper.davidson_block(lambda xs: numpy.dot(xs, b.T),
+                                                  x0, precond, nroots=2)
+        self.assertTrue(all(conv))
+        self.assertAlmostEqual(abs(e-e_ref[:2]).max(), 0, 9)
+
+    def test_xlist(self):
+        xs = linalg_helper._Xlist()
+        vs = [numpy.random.random(50) for i in range(4)]
+        for v in vs:
+            xs.append(v)
+        self.assertEqual(len(xs), 4)
+        self.assertAlmostEqual(abs(xs[2]-vs[2]).max(), 0, 14)
+        self.assertFalse(xs[2].flags.writeable)
+        self.assertAlmostEqual(abs(xs.pop(1)-vs[1]).max(), 0, 14)
+        # the released slot is reused
+        xs.append(vs[1])
+        self.assertEqual(len(xs._slots), 4)
+        self.assertAlmostEqual(abs(xs[3]-vs[1]).max(), 0, 14)
+        xs[0] = vs[0] + 1j
+        self.assertAlmostEqual(abs(xs[0]-vs[0]-1j).max(), 0, 14)
+        self.assertAlmostEqual(abs(xs[1]-vs[2]).max(), 0, 14)
+
 if __name__ == "__main__":
     print("Full Tests for linalg_helper")
     unittest.main()
@@ -0,0 +1,55 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import unittest
+import time
+import numpy
+from pyscf import lib
+
+class KnowValues(unittest.TestCase):
+    def test_call_in_background_queue(self):
+        out = []
+        def load(i, buf):
+            time.sleep(.01)
+            buf[:] = i
+        def save(i, buf):
+            out.append((i, buf.copy()))
+
+        bufs = [numpy.zeros(4) for i in range(4)]
+        with lib.call_in_background(load, save, depth=3) as (prefetch, async_write):
+            handlers = [prefetch(i, bufs[i]) for i in range(3)]
+            for i in range(10):
+                if i + 3 < 10:
+                    handlers.append(prefetch(i+3, bufs[(i+3)%4]))
+                handlers[i].join()
+                self.assertTrue(numpy.all(bufs[i%4] == i))
+                async_write(i, bufs[i%4] * 2)
+        self.assertEqual([x[0] for x in out], list(range(10)))
+        self.assertTrue(all(numpy.all(x[1] == x[0]*2) for x in out))
+
+    def test_call_in_background_error(self):
+        def fail(i):
+            raise ValueError(i)
+        def run():
+            with lib.call_in_background(fail, depth=2) as async_fail:
+                async_fail(1).join()
+        self.assertRaises(ValueError, run)
+
+    def test_fork_imap(self):
+        tasks = [(i, i+1) for i in range(7)]
+        out = dict(lib.fork_imap(lambda a, b: a * b, tasks, 3))
+        self.assertEqual(out, dict((i, i*(i+1)) for i in range(7)))
+
+        def fail(i):
+            if i == 3:
+                raise ValueError(i)
+            return i
+        def run():
+            for x in lib.fork_imap(fail, [(i,) for i in range(5)], 2):
+                pass
+        self.assertRaises(RuntimeError, run)
+
+if __name__ == "__main__":
+    print("Full Tests for misc")
+    unittest.main()
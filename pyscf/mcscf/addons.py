@@ -5,6 +5,8 @@
 
 import os
 import sys
+import threading
+import traceback
 from functools import reduce
 import numpy
 from pyscf import lib
@@ -12,6 +14,10 @@ from pyscf.lib import logger
 from pyscf import fci
 from pyscf import scf
 from pyscf import symm
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
 
 def sort_mo(casscf, mo_coeff, caslst, base=1):
@@ -658,6 +664,11 @@ state_specific = state_specific_
 
 def state_average_mix_(casscf, fcisolvers, weights=(0.5,0.5)):
     '''State-average CASSCF over multiple FCI solvers.
+
+    If the attribute concurrent of the returned casscf.fcisolver is set to
+    True, the kernels and RDMs of different solvers are computed in
+    concurrent threads.  The OpenMP threads are partitioned among the
+    solvers.
     '''
     fcibase_class = fcisolvers[0].__class__
 #    if fcibase_class.__name__ == 'FakeCISolver':
@@ -697,14 +708,18 @@ def state_average_mix_(casscf, fcisolvers, weights=(0.5,0.5)):
         return nelec
 
     class FakeCISolver(fcibase_class, StateAverageFCISolver):
+        concurrent = False
         def kernel(self, h1, h2, norb, nelec, ci0=None, verbose=0, **kwargs):
 # Note self.orbsym is initialized lazily in mc1step_symm.kernel function
             log = logger.new_logger(sys, verbose)
             es = []
             cs = []
-            for solver, c0 in loop_solver(fcisolvers, ci0):
-                e, c = solver.kernel(h1, h2, norb, get_nelec(solver, nelec), c0,
+            def solve(solver, c0):
+                return solver.kernel(h1, h2, norb, get_nelec(solver, nelec), c0,
                                      orbsym=self.orbsym, verbose=log, **kwargs)
+            results = _map_solvers(solve, loop_solver(fcisolvers, ci0),
+                                   self.concurrent)
+            for solver, (e, c) in zip(fcisolvers, results):
                 if solver.nroots == 1:
                     es.append(e)
                     cs.append(c)
@@ -725,9 +740,12 @@ def state_average_mix_(casscf, fcisolvers, weights=(0.5,0.5)):
         def approx_kernel(self, h1, h2, norb, nelec, ci0=None, **kwargs):
             es = []
             cs = []
-            for solver, c0 in loop_solver(fcisolvers, ci0):
-                e, c = solver.kernel(h1, h2, norb, get_nelec(solver, nelec), c0,
+            def solve(solver, c0):
+                return solver.kernel(h1, h2, norb, get_nelec(solver, nelec), c0,
                                      orbsym=self.orbsym, **kwargs)
+            results = _map_solvers(solve, loop_solver(fcisolvers, ci0),
+                                   self.concurrent)
+            for solver, (e, c) in zip(fcisolvers, results):
                 if solver.nroots == 1:
                     es.append(e)
                     cs.append(c)
@@ -737,14 +755,21 @@ def state_average_mix_(casscf, fcisolvers, weights=(0.5,0.5)):
             return numpy.einsum('i,i->', es, weights), cs
         def make_rdm1(self, ci0, norb, nelec, **kwargs):
             dm1 = 0
-            for i, (solver, c) in enumerate(loop_civecs(fcisolvers, ci0)):
-                dm1 += weights[i]*solver.make_rdm1(c, norb, get_nelec(solver, nelec), **kwargs)
+            def rdm1(solver, c):
+                return solver.make_rdm1(c, norb, get_nelec(solver, nelec), **kwargs)
+            results = _map_solvers(rdm1, loop_civecs(fcisolvers, ci0),
+                                   self.concurrent)
+            for i, dm in enumerate(results):
+                dm1 += weights[i] * dm
             return dm1
         def make_rdm12(self, ci0, norb, nelec, **kwargs):
             rdm1 = 0
             rdm2 = 0
-            for i, (solver, c) in enumerate(loop_civecs(fcisolvers, ci0)):
-                dm1, dm2 = solver.make_rdm12(c, norb, get_nelec(solver, nelec), **kwargs)
+            def rdm12(solver, c):
+                return solver.make_rdm12(c, norb, get_nelec(solver, nelec), **kwargs)
+            results = _map_solvers(rdm12, loop_civecs(fcisolvers, ci0),
+                                   self.concurrent)
+            for i, (dm1, dm2) in enumerate(results):
                 rdm1 += weights[i] * dm1
                 rdm2 += weights[i] * dm2
             return rdm1, rdm2
@@ -766,6 +791,58 @@ def state_average_mix_(casscf, fcisolvers, weights=(0.5,0.5)):
     return casscf
 state_average_mix = state_average_mix_
 
+def _map_solvers(fn, tasks, concurrent=False):
+    '''Call fn(solver, *args) for each (solver, *args) in tasks and return
+    the results in the order of tasks.  If concurrent is True, the calls are
+    made in a pool of threads.  The OpenMP threads of the caller are
+    partitioned among the threads of the pool.  Calls of the same solver
+    object are made one after another in one thread.
+    '''
+    tasks = list(tasks)
+    groups = []
+    solver_ids = {}
+    for i, args in enumerate(tasks):
+        key = id(args[0])
+        if key not in solver_ids:
+            solver_ids[key] = len(groups)
+            groups.append([])
+        groups[solver_ids[key]].append(i)
+
+    nthreads = lib.num_threads()
+    nworker = min(len(groups), nthreads)
+    if not concurrent or nworker < 2:
+        return [fn(*args) for args in tasks]
+
+    pending = queue.Queue()
+    for group in groups:
+        pending.put(group)
+    results = [None] * len(tasks)
+    errors = []
+    def worker(omp_threads):
+        with lib.with_omp_threads(omp_threads):
+            while not errors:
+                try:
+                    group = pending.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    for i in group:
+                        results[i] = fn(*tasks[i])
+                except Exception:
+                    errors.append(traceback.format_exc())
+
+    workers = []
+    for k in range(nworker):
+        omp_threads = nthreads // nworker + (k < nthreads % nworker)
+        t = threading.Thread(target=worker, args=(omp_threads,))
+        t.start()
+        workers.append(t)
+    for t in workers:
+        t.join()
+    if errors:
+        raise RuntimeError('FCI solver failed in a worker thread\n%s' % errors[0])
+    return results
+
 def hot_tuning_(casscf, configfile=None):
     '''Allow you to tune CASSCF parameters at the runtime
     '''
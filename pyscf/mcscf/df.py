@@ -62,14 +62,28 @@ def density_fit(casscf, auxbasis=None, with_df=None):
             self.__dict__.update(casscf.__dict__)
             #self.grad_update_dep = 0
             self.with_df = with_df
-            self._keys = self._keys.union(['with_df'])
+# Number of macro-iterations in which the MO integrals are obtained by
+# rotating the cached MO-basis 3-index integrals of an earlier iteration.
+# The integrals are transformed from AO integrals at the next iteration.
+            self.eris_update_cycle = getattr(casscf, 'eris_update_cycle', 0)
+            self._keys = self._keys.union(['with_df', 'eris_update_cycle'])
 
         def dump_flags(self):
             casscf_class.dump_flags(self)
             logger.info(self, 'DFCASCI/DFCASSCF: density fitting for JK matrix and 2e integral transformation')
+            if self.eris_update_cycle > 0:
+                logger.info(self, 'eris_update_cycle = %d', self.eris_update_cycle)
 
         def ao2mo(self, mo_coeff):
             if self.with_df:
+                if self.eris_update_cycle > 0:
+                    nmo = mo_coeff.shape[1]
+                    mem = self.with_df.get_naoaux()*nmo**2*8/1e6
+                    if mem < (self.max_memory - lib.current_memory()[0]) * .5:
+                        return _ERIS_update(self, mo_coeff, self.with_df)
+                    logger.debug(self, 'Not enough memory to cache (L|pq) '
+                                 'integrals (%d MB)', mem)
+                self._eris_cache = None
                 return _ERIS(self, mo_coeff, self.with_df)
             else:
                 return casscf_class.ao2mo(self, mo_coeff)
@@ -319,6 +333,110 @@ class _ERIS(object):
         self.vhf_c = reduce(numpy.dot, (mo.T, vj*2-vk, mo))
         t0 = log.timer('density fitting ao2mo', *t0)
 
+class _ERIS_update(object):
+    '''The same integrals as :class:`_ERIS`, computed from the MO-basis 3-index
+    integrals (L|pq) of a reference orbital set.  The 3-index integrals are
+    cached in casscf._eris_cache.  For the orbitals mo = mo_ref * u of the
+    following macro-iterations, the integrals are rotated with u instead of
+    being transformed from the AO integrals again.  The AO to MO
+    transformation is redone every casscf.eris_update_cycle updates to
+    control the accumulated round-off error.
+    '''
+    def __init__(self, casscf, mo, with_df):
+        log = logger.Logger(casscf.stdout, casscf.verbose)
+        t0 = (time.clock(), time.time())
+        nao, nmo = mo.shape
+        ncore = casscf.ncore
+        ncas = casscf.ncas
+        nocc = ncore + ncas
+
+        u = None
+        cache = getattr(casscf, '_eris_cache', None)
+        if cache is not None:
+            mo_ref, ppL, count = cache
+            if mo_ref.shape == mo.shape and count < casscf.eris_update_cycle:
+                s = casscf._scf.get_ovlp()
+                u = reduce(numpy.dot, (mo_ref.T, s, mo))
+                # mo is not spanned by mo_ref if the basis or geometry changed
+                if abs(numpy.dot(u.T, u) - numpy.eye(nmo)).max() > 1e-8:
+                    u = None
+        if u is None:
+            mo_ref = numpy.array(mo)
+            ppL = _ao2mo_ppL(casscf, mo, with_df)
+            count = 0
+            t0 = log.timer('density fitting ao2mo (L|pq)', *t0)
+        else:
+            count += 1
+            log.debug('Rotate DF (L|pq) integrals, update %d', count)
+        casscf._eris_cache = (mo_ref, ppL, count)
+        naoaux = ppL.shape[0]
+
+        # (L|po) for the occupied orbitals o of the current MOs
+        if u is None:
+            poL = numpy.asarray(ppL[:,:,:nocc], order='C')
+        else:
+            poL = numpy.empty((naoaux,nmo,nocc))
+            blksize = max(4, int(1e8/8/(nmo*nmo)))
+            for b0, b1 in prange(0, naoaux, blksize):
+                tmp = numpy.tensordot(ppL[b0:b1], u[:,:nocc], axes=(2,0))
+                poL[b0:b1] = numpy.tensordot(tmp, u, axes=(1,0)).transpose(0,2,1)
+            tmp = None
+
+        pcL = poL[:,:,:ncore]
+        self.k_pc = numpy.einsum('Lpc,Lpc->pc', pcL, pcL)
+        pcL = pcL.transpose(1,0,2).reshape(nmo,-1)
+        vk = lib.dot(pcL, pcL.T)
+        pcL = None
+        paL = numpy.asarray(poL[:,:,ncore:nocc]).reshape(naoaux,-1)
+        self.papa = lib.dot(paL.T, paL).reshape(nmo,ncas,nmo,ncas)
+        paL = None
+
+        # sum_L (L|pq) D_L for the active pairs (ab), the core diagonals (cc)
+        # and the core density
+        aa_idx = numpy.tril_indices(ncas)
+        dL = numpy.empty((naoaux,len(aa_idx[0])+ncore+1))
+        npair = len(aa_idx[0])
+        dL[:,:npair] = poL[:,ncore:nocc,ncore:nocc][:,aa_idx[0],aa_idx[1]]
+        dL[:,npair:npair+ncore] = numpy.einsum('Lcc->Lc', poL[:,:ncore,:ncore])
+        dL[:,-1] = dL[:,npair:npair+ncore].sum(axis=1)
+        poL = None
+        x = lib.dot(ppL.reshape(naoaux,-1).T, dL).reshape(nmo,nmo,-1)
+        dL = None
+        if u is not None:
+            x = numpy.tensordot(u, x, axes=(0,0))
+            x = numpy.tensordot(x, u, axes=(1,0)).transpose(0,2,1)
+
+        idx = numpy.empty((ncas,ncas), dtype=int)
+        idx[aa_idx] = numpy.arange(npair)
+        idx[aa_idx[1],aa_idx[0]] = numpy.arange(npair)
+        self.ppaa = numpy.asarray(x[:,:,idx], order='C')
+        self.j_pc = numpy.einsum('ppc->pc', x[:,:,npair:npair+ncore])
+        self.vhf_c = x[:,:,-1] * 2 - vk
+        x = None
+        log.timer('density fitting ao2mo', *t0)
+
+def _ao2mo_ppL(casscf, mo, with_df):
+    '''MO-basis 3-index DF integrals (L|pq)'''
+    nao, nmo = mo.shape
+    naoaux = with_df.get_naoaux()
+    mo = numpy.asarray(mo, order='F')
+    ppL = numpy.empty((naoaux,nmo,nmo))
+    fmmm = _ao2mo.libao2mo.AO2MOmmm_nr_s2_iltj
+    fdrv = _ao2mo.libao2mo.AO2MOnr_e2_drv
+    ftrans = _ao2mo.libao2mo.AO2MOtranse2_nr_s2
+    b0 = 0
+    for eri1 in with_df.loop():
+        naux = eri1.shape[0]
+        fdrv(ftrans, fmmm,
+             ppL[b0:b0+naux].ctypes.data_as(ctypes.c_void_p),
+             eri1.ctypes.data_as(ctypes.c_void_p),
+             mo.ctypes.data_as(ctypes.c_void_p),
+             ctypes.c_int(naux), ctypes.c_int(nao),
+             (ctypes.c_int*4)(0, nmo, 0, nmo),
+             ctypes.c_void_p(0), ctypes.c_int(0))
+        b0 += naux
+    return ppL
+
 def _mem_usage(ncore, ncas, nmo):
     nvir = nmo - ncore
     outcore = basic = ncas**2*nmo**2*2 * 8/1e6
@@ -64,7 +64,8 @@ def trans_e1_incore(eri_ao, mo, ncore, ncas):
 # level = 1: ppaa, papa and jpc, kpc
 # level = 2 or 3: ppaa, papa
 def trans_e1_outcore(mol, mo, ncore, ncas, erifile,
-                     max_memory=None, level=1, verbose=logger.WARN):
+                     max_memory=None, level=1, verbose=logger.WARN,
+                     io_depth=outcore.IO_QUEUE_DEPTH):
     time0 = (time.clock(), time.time())
     if isinstance(verbose, logger.Logger):
         log = verbose
@@ -111,28 +112,85 @@ def trans_e1_outcore(mol, mo, ncore, ncas, erifile,
     fmmm = libmcscf.AO2MOmmm_ket_nr_s2
     ftrans = libmcscf.AO2MOtranse1_nr_s4
     fdrv = libmcscf.AO2MOnr_e2_drv
-    for istep,sh_range in enumerate(shranges):
-        log.debug('[%d/%d], AO [%d:%d], len(buf) = %d',
-                  istep+1, nstep, *sh_range)
-        buf = bufs1[:sh_range[2]]
-        _ao2mo.nr_e1fill(intor, sh_range,
-                         mol._atm, mol._bas, mol._env, 's4', 1, ao2mopt, buf)
-        if log.verbose >= logger.DEBUG1:
-            ti1 = log.timer('AO integrals buffer', *ti0)
-        bufpa = bufs2[:sh_range[2]]
-        _ao2mo.nr_e1(buf, mo, pashape, 's4', 's1', out=bufpa)
+    def save(key, dat):
+        faapp_buf[key] = dat
+# bufs2 is overwritten in the next step.  The aapp blocks are copied out of
+# bufs2 so that each pending writing request holds its own block.
+    io_depth = outcore.guess_io_depth(max_memory-lib.current_memory()[0],
+                                      maxbuflen*ncas**2*8/1e6, io_depth)
+    log.debug1('io_depth %d', io_depth)
+    with lib.call_in_background(save, depth=io_depth) as async_write:
+        for istep,sh_range in enumerate(shranges):
+            log.debug('[%d/%d], AO [%d:%d], len(buf) = %d',
+                      istep+1, nstep, *sh_range)
+            buf = bufs1[:sh_range[2]]
+            _ao2mo.nr_e1fill(intor, sh_range,
+                             mol._atm, mol._bas, mol._env, 's4', 1, ao2mopt, buf)
+            if log.verbose >= logger.DEBUG1:
+                ti1 = log.timer('AO integrals buffer', *ti0)
+            bufpa = bufs2[:sh_range[2]]
+            _ao2mo.nr_e1(buf, mo, pashape, 's4', 's1', out=bufpa)
 # jc_pp, kc_pp
-        if level == 1: # ppaa, papa and vhf, jcp, kcp
+            if level == 1: # ppaa, papa and vhf, jcp, kcp
+                if log.verbose >= logger.DEBUG1:
+                    ti1 = log.timer('buffer-pa', *ti1)
+                buf1 = bufs3[:sh_range[2]]
+                fdrv(ftrans, fmmm,
+                     buf1.ctypes.data_as(ctypes.c_void_p),
+                     buf.ctypes.data_as(ctypes.c_void_p),
+                     mo.ctypes.data_as(ctypes.c_void_p),
+                     ctypes.c_int(sh_range[2]), ctypes.c_int(nao),
+                     (ctypes.c_int*4)(0, nao, 0, ncore),
+                     ctypes.POINTER(ctypes.c_void_p)(), ctypes.c_int(0))
+                p0 = 0
+                for ij in range(sh_range[0], sh_range[1]):
+                    i,j = _ao2mo._extract_pair(ij)
+                    i0 = ao_loc[i]
+                    j0 = ao_loc[j]
+                    i1 = ao_loc[i+1]
+                    j1 = ao_loc[j+1]
+                    di = i1 - i0
+                    dj = j1 - j0
+                    if i == j:
+                        dij = di * (di+1) // 2
+                        buf = numpy.empty((di,di,nao*ncore))
+                        idx = numpy.tril_indices(di)
+                        buf[idx] = buf1[p0:p0+dij]
+                        buf[idx[1],idx[0]] = buf1[p0:p0+dij]
+                        buf = buf.reshape(di,di,nao,ncore)
+                        mo1 = mo_c[i0:i1]
+                        tmp = numpy.einsum('uvpc,pc->uvc', buf, mo[:,:ncore])
+                        tmp = lib.dot(mo1.T, tmp.reshape(di,-1))
+                        j_pc += numpy.einsum('vp,pvc->pc', mo1, tmp.reshape(nmo,di,ncore))
+                        tmp = numpy.einsum('uvpc,uc->vcp', buf, mo1[:,:ncore])
+                        tmp = lib.dot(tmp.reshape(-1,nmo), mo).reshape(di,ncore,nmo)
+                        k_pc += numpy.einsum('vp,vcp->pc', mo1, tmp)
+                    else:
+                        dij = di * dj
+                        buf = buf1[p0:p0+dij].reshape(di,dj,nao,ncore)
+                        mo1 = mo_c[i0:i1]
+                        mo2 = mo_c[j0:j1]
+                        tmp = numpy.einsum('uvpc,pc->uvc', buf, mo[:,:ncore])
+                        tmp = lib.dot(mo1.T, tmp.reshape(di,-1))
+                        j_pc += numpy.einsum('vp,pvc->pc',
+                                             mo2, tmp.reshape(nmo,dj,ncore)) * 2
+                        tmp = numpy.einsum('uvpc,uc->vcp', buf, mo1[:,:ncore])
+                        tmp = lib.dot(tmp.reshape(-1,nmo), mo).reshape(dj,ncore,nmo)
+                        k_pc += numpy.einsum('vp,vcp->pc', mo2, tmp)
+                        tmp = numpy.einsum('uvpc,vc->ucp', buf, mo2[:,:ncore])
+                        tmp = lib.dot(tmp.reshape(-1,nmo), mo).reshape(di,ncore,nmo)
+                        k_pc += numpy.einsum('up,ucp->pc', mo1, tmp)
+                    p0 += dij
+                if log.verbose >= logger.DEBUG1:
+                    ti1 = log.timer('j_cp and k_cp', *ti1)
+
             if log.verbose >= logger.DEBUG1:
-                ti1 = log.timer('buffer-pa', *ti1)
-            buf1 = bufs3[:sh_range[2]]
-            fdrv(ftrans, fmmm,
-                 buf1.ctypes.data_as(ctypes.c_void_p),
-                 buf.ctypes.data_as(ctypes.c_void_p),
-                 mo.ctypes.data_as(ctypes.c_void_p),
-                 ctypes.c_int(sh_range[2]), ctypes.c_int(nao),
-                 (ctypes.c_int*4)(0, nao, 0, ncore),
-                 ctypes.POINTER(ctypes.c_void_p)(), ctypes.c_int(0))
+                ti1 = log.timer('half transformation of the buffer', *ti1)
+
+# ppaa, papa
+            aapp = bufpa.reshape(sh_range[2],nmo,ncas)[:,ncore:nocc]
+            aapp = numpy.asarray(aapp.reshape(-1,ncas**2).T, order='C')
+            async_write(str(istep), aapp)
             p0 = 0
             for ij in range(sh_range[0], sh_range[1]):
                 i,j = _ao2mo._extract_pair(ij)
@@ -144,72 +202,24 @@ def trans_e1_outcore(mol, mo, ncore, ncas, erifile,
                 dj = j1 - j0
                 if i == j:
                     dij = di * (di+1) // 2
-                    buf = numpy.empty((di,di,nao*ncore))
+                    buf1 = numpy.empty((di,di,nmo*ncas))
                     idx = numpy.tril_indices(di)
-                    buf[idx] = buf1[p0:p0+dij]
-                    buf[idx[1],idx[0]] = buf1[p0:p0+dij]
-                    buf = buf.reshape(di,di,nao,ncore)
-                    mo1 = mo_c[i0:i1]
-                    tmp = numpy.einsum('uvpc,pc->uvc', buf, mo[:,:ncore])
-                    tmp = lib.dot(mo1.T, tmp.reshape(di,-1))
-                    j_pc += numpy.einsum('vp,pvc->pc', mo1, tmp.reshape(nmo,di,ncore))
-                    tmp = numpy.einsum('uvpc,uc->vcp', buf, mo1[:,:ncore])
-                    tmp = lib.dot(tmp.reshape(-1,nmo), mo).reshape(di,ncore,nmo)
-                    k_pc += numpy.einsum('vp,vcp->pc', mo1, tmp)
+                    buf1[idx] = bufpa[p0:p0+dij]
+                    buf1[idx[1],idx[0]] = bufpa[p0:p0+dij]
                 else:
                     dij = di * dj
-                    buf = buf1[p0:p0+dij].reshape(di,dj,nao,ncore)
-                    mo1 = mo_c[i0:i1]
-                    mo2 = mo_c[j0:j1]
-                    tmp = numpy.einsum('uvpc,pc->uvc', buf, mo[:,:ncore])
-                    tmp = lib.dot(mo1.T, tmp.reshape(di,-1))
-                    j_pc += numpy.einsum('vp,pvc->pc',
-                                         mo2, tmp.reshape(nmo,dj,ncore)) * 2
-                    tmp = numpy.einsum('uvpc,uc->vcp', buf, mo1[:,:ncore])
-                    tmp = lib.dot(tmp.reshape(-1,nmo), mo).reshape(dj,ncore,nmo)
-                    k_pc += numpy.einsum('vp,vcp->pc', mo2, tmp)
-                    tmp = numpy.einsum('uvpc,vc->ucp', buf, mo2[:,:ncore])
-                    tmp = lib.dot(tmp.reshape(-1,nmo), mo).reshape(di,ncore,nmo)
-                    k_pc += numpy.einsum('up,ucp->pc', mo1, tmp)
+                    buf1 = bufpa[p0:p0+dij].reshape(di,dj,-1)
+                    mo1 = mo[j0:j1,ncore:nocc].copy()
+                    for i in range(di):
+                         lib.dot(mo1.T, buf1[i], 1, papa_buf[i0+i], 1)
+                mo1 = mo[i0:i1,ncore:nocc].copy()
+                buf1 = lib.dot(mo1.T, buf1.reshape(di,-1))
+                papa_buf[j0:j1] += buf1.reshape(ncas,dj,-1).transpose(1,0,2)
                 p0 += dij
             if log.verbose >= logger.DEBUG1:
-                ti1 = log.timer('j_cp and k_cp', *ti1)
+                ti1 = log.timer('ppaa and papa buffer', *ti1)
 
-        if log.verbose >= logger.DEBUG1:
-            ti1 = log.timer('half transformation of the buffer', *ti1)
-
-# ppaa, papa
-        faapp_buf[str(istep)] = \
-                bufpa.reshape(sh_range[2],nmo,ncas)[:,ncore:nocc].reshape(-1,ncas**2).T
-        p0 = 0
-        for ij in range(sh_range[0], sh_range[1]):
-            i,j = _ao2mo._extract_pair(ij)
-            i0 = ao_loc[i]
-            j0 = ao_loc[j]
-            i1 = ao_loc[i+1]
-            j1 = ao_loc[j+1]
-            di = i1 - i0
-            dj = j1 - j0
-            if i == j:
-                dij = di * (di+1) // 2
-                buf1 = numpy.empty((di,di,nmo*ncas))
-                idx = numpy.tril_indices(di)
-                buf1[idx] = bufpa[p0:p0+dij]
-                buf1[idx[1],idx[0]] = bufpa[p0:p0+dij]
-            else:
-                dij = di * dj
-                buf1 = bufpa[p0:p0+dij].reshape(di,dj,-1)
-                mo1 = mo[j0:j1,ncore:nocc].copy()
-                for i in range(di):
-                     lib.dot(mo1.T, buf1[i], 1, papa_buf[i0+i], 1)
-            mo1 = mo[i0:i1,ncore:nocc].copy()
-            buf1 = lib.dot(mo1.T, buf1.reshape(di,-1))
-            papa_buf[j0:j1] += buf1.reshape(ncas,dj,-1).transpose(1,0,2)
-            p0 += dij
-        if log.verbose >= logger.DEBUG1:
-            ti1 = log.timer('ppaa and papa buffer', *ti1)
-
-        ti0 = log.timer('gen AO/transform MO [%d/%d]'%(istep+1,nstep), *ti0)
+            ti0 = log.timer('gen AO/transform MO [%d/%d]'%(istep+1,nstep), *ti0)
     buf = buf1 = bufpa = None
     bufs1 = bufs2 = bufs3 = None
     time1 = log.timer('mc_ao2mo pass 1', *time0)
@@ -220,9 +230,12 @@ def trans_e1_outcore(mol, mo, ncore, ncas, erifile,
     nblk = int(max(8, min(nmo, (max_memory*1e6/8-papa_buf.size)/(ncas**2*nmo))))
     log.debug1('nblk for papa = %d', nblk)
     dset = feri.create_dataset('papa', (nmo,ncas,nmo,ncas), 'f8')
-    for i0, i1 in prange(0, nmo, nblk):
-        tmp = lib.dot(mo[:,i0:i1].T, papa_buf.reshape(nao,-1))
-        dset[i0:i1] = tmp.reshape(i1-i0,ncas,nmo,ncas)
+    def save(i0, i1, dat):
+        dset[i0:i1] = dat
+    with lib.call_in_background(save, depth=1) as async_write:
+        for i0, i1 in prange(0, nmo, nblk):
+            tmp = lib.dot(mo[:,i0:i1].T, papa_buf.reshape(nao,-1))
+            async_write(i0, i1, tmp.reshape(i1-i0,ncas,nmo,ncas))
     papa_buf = tmp = None
     time1 = log.timer('papa pass 2', *time1)
 
@@ -3,6 +3,7 @@
 import unittest
 from functools import reduce
 import numpy
+from pyscf import lib
 from pyscf import gto
 from pyscf import scf
 from pyscf import mcscf
@@ -146,6 +147,28 @@ class KnowValues(unittest.TestCase):
         mc.state_average_((.64,.36))
         e = mc.kernel()[0]
         self.assertAlmostEqual(e, -108.83342083775061, 7)
+        dm1, dm2 = mc.fcisolver.make_rdm12(mc.ci, 4, 4)
+        dm1a, dm2a = fci.direct_spin1.make_rdm12(mc.ci[0], 4, 4)
+        dm1b, dm2b = fci.direct_spin1.make_rdm12(mc.ci[1], 4, 4)
+        self.assertTrue(numpy.allclose(dm1, dm1a*.64+dm1b*.36))
+        self.assertTrue(numpy.allclose(dm2, dm2a*.64+dm2b*.36))
+
+    def test_state_average_mix(self):
+        solver1 = fci.direct_spin1_symm.FCI(mol)
+        solver1.nroots = 2
+        solver2 = fci.direct_spin1_symm.FCI(mol)
+        solver2.spin = 2
+        mc = mcscf.CASSCF(mfr, 4, 4)
+        mc = mcscf.addons.state_average_mix_(mc, [solver1, solver2], (.25,.25,.5))
+        mc.fcisolver.concurrent = True
+        with lib.with_omp_threads(2):
+            e = mc.kernel()[0]
+            dm1, dm2 = mc.fcisolver.make_rdm12(mc.ci, 4, 4)
+        self.assertAlmostEqual(e, -108.75137870125288, 7)
+        mc.fcisolver.concurrent = False
+        dm1ref, dm2ref = mc.fcisolver.make_rdm12(mc.ci, 4, 4)
+        self.assertAlmostEqual(abs(dm1-dm1ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(dm2-dm2ref).max(), 0, 12)
 
     def test_state_specific(self):
         mc = mcscf.CASSCF(mfr, 4, 4)
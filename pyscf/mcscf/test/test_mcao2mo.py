@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 
 import unittest
+import tempfile
 import numpy
+import h5py
+from pyscf import lib
 from pyscf import gto
 from pyscf import scf
 from pyscf import ao2mo
@@ -66,6 +69,64 @@ class KnowValues(unittest.TestCase):
         self.assertTrue(numpy.allclose(ppaa , eris0.ppaa ))
         self.assertTrue(numpy.allclose(papa , eris0.papa ))
 
+    def test_outcore_io_depth(self):
+        mol.atom = [
+            ['O', ( 0., 0.    , 0.   )],
+            ['H', ( 0., -0.757, 0.587)],
+            ['H', ( 0., 0.757 , 0.587)],]
+        mol.basis = 'cc-pvdz'
+        mol.charge = 0
+        mol.spin = 0
+        mol.build()
+        m = scf.RHF(mol).run()
+        mo = m.mo_coeff
+
+        # Small AO buffers to split the AO shell pairs into many ranges
+        guess_shell_ranges = ao2mo.outcore.guess_shell_ranges
+        def small_ranges(mol, aosym, max_iobuf, *args, **kwargs):
+            return guess_shell_ranges(mol, aosym, 40, *args, **kwargs)
+        # Writing requests are executed at the end, as if the disk is slow.
+        # The pending blocks must not be overwritten by the next step.
+        call_in_background = lib.call_in_background
+        class slow_writer(object):
+            def __init__(self, *fns, **kwargs):
+                self.fns = fns
+                self.calls = []
+            def __enter__(self):
+                def pending(fn):
+                    return lambda *args: self.calls.append((fn, args))
+                if len(self.fns) == 1:
+                    return pending(self.fns[0])
+                return [pending(fn) for fn in self.fns]
+            def __exit__(self, *args):
+                for fn, args in self.calls:
+                    fn(*args)
+
+        ftmp = tempfile.NamedTemporaryFile()
+        ao2mo.outcore.guess_shell_ranges = small_ranges
+        try:
+            j_pc0, k_pc0 = mcscf.mc_ao2mo.trans_e1_outcore(
+                    mol, mo, 2, 4, ftmp.name, max_memory=2000, io_depth=1)
+            with h5py.File(ftmp.name, 'r') as f:
+                ppaa0 = f['ppaa'].value
+                papa0 = f['papa'].value
+            lib.call_in_background = slow_writer
+            j_pc, k_pc = mcscf.mc_ao2mo.trans_e1_outcore(
+                    mol, mo, 2, 4, ftmp.name, max_memory=2000, io_depth=3)
+        finally:
+            ao2mo.outcore.guess_shell_ranges = guess_shell_ranges
+            lib.call_in_background = call_in_background
+        with h5py.File(ftmp.name, 'r') as f:
+            self.assertTrue(numpy.allclose(f['ppaa'].value, ppaa0))
+            self.assertTrue(numpy.allclose(f['papa'].value, papa0))
+        self.assertTrue(numpy.allclose(j_pc, j_pc0))
+        self.assertTrue(numpy.allclose(k_pc, k_pc0))
+
+        nmo = mo.shape[1]
+        eri = ao2mo.incore.full(m._eri, mo, compact=False).reshape((nmo,)*4)
+        self.assertTrue(numpy.allclose(ppaa0, eri[:,:,2:6,2:6]))
+        self.assertTrue(numpy.allclose(papa0, eri[:,2:6,:,2:6]))
+
     def test_uhf(self):
         mol.atom = [
             ['O', ( 0., 0.    , 0.   )],
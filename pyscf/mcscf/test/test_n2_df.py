@@ -63,6 +63,16 @@ class KnowValues(unittest.TestCase):
         emc = mc.mc2step()[0]
         self.assertAlmostEqual(emc, -108.91052310869014, 7)
 
+    def test_mc1step_4o4e_df_update_eris(self):
+        mc = mcscf.density_fit(mcscf.CASSCF(m, 4, 4), auxbasis='weigend')
+        mc.max_memory = 1000
+        mc.eris_update_cycle = 3
+        emc = mc.mc1step()[0]
+        self.assertAlmostEqual(emc, -108.9105231091045, 7)
+        self.assertEqual(mc._eris_cache[1].shape, (mc.with_df.get_naoaux(),28,28))
+        emc = mc.mc2step()[0]
+        self.assertAlmostEqual(emc, -108.91052310869014, 7)
+
     def test_mc1step_6o6e(self):
         mc = mcscf.approx_hessian(mcscf.CASSCF(m, 6, 6), auxbasis='weigend')
         emc = mc.mc1step()[0]
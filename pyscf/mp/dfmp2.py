@@ -12,7 +12,7 @@ from pyscf import lib
 from pyscf.lib import logger
 from pyscf.ao2mo import _ao2mo
 from pyscf import df
-#from pyscf.mp.mp2 import make_rdm1, make_rdm2, make_rdm1_ao
+from pyscf.mp import mp2
 
 
 # the MO integral for MP2 is (ov|ov). The most efficient integral
@@ -27,48 +27,140 @@ def kernel(mp, mo_energy, mo_coeff, nocc, ioblk=256, verbose=None):
     eia = lib.direct_sum('i-a->ia', mo_energy[:nocc], mo_energy[nocc:])
     t2 = None
     emp2 = 0
-    for istep, qov in enumerate(mp.loop_ao2mo(mo_coeff, nocc)):
-        logger.debug(mp, 'Load cderi step %d', istep)
-        for i in range(nocc):
-            buf = numpy.dot(qov[:,i*nvir:(i+1)*nvir].T,
-                            qov).reshape(nvir,nocc,nvir)
-            gi = numpy.array(buf, copy=False)
-            gi = gi.reshape(nvir,nocc,nvir).transpose(1,2,0)
-            t2i = gi/lib.direct_sum('jb+a->jba', eia, eia[i])
+    for i0, i1, gi in _loop_ovov(mp, mo_coeff, nocc):
+        for i in range(i0, i1):
+            g = gi[i-i0].transpose(1,0,2)
+            t2i = g/lib.direct_sum('jb+a->jba', eia, eia[i])
             # 2*ijab-ijba
-            theta = gi*2 - gi.transpose(0,2,1)
+            theta = g*2 - g.transpose(0,2,1)
             emp2 += numpy.einsum('jab,jab', t2i, theta)
 
     return emp2, t2
 
+def make_rdm1(mp, t2=None, verbose=logger.NOTE):
+    '''1-particle density matrix in MO basis.  Without t2, the amplitudes are
+    generated for a block of occupied orbitals at a time from the 3-index
+    tensor.  See also :func:`mp2.make_rdm1`.
+    '''
+    if t2 is not None:
+        return mp2.make_rdm1(mp, t2, verbose=verbose)
 
-class MP2(lib.StreamObject):
-    def __init__(self, mf):
-        self.mol = mf.mol
-        self.verbose = self.mol.verbose
-        self.stdout = self.mol.stdout
-        self.max_memory = mf.max_memory
-        self._scf = mf
+    nmo = mp.nmo
+    nocc = mp.nocc
+    nvir = nmo - nocc
+    mo_coeff = mp2._mo_without_core(mp, mp.mo_coeff)
+    mo_energy = mp2._mo_energy_without_core(mp, mp.mo_energy)
+    eia = mo_energy[:nocc,None] - mo_energy[None,nocc:]
+    dm1occ = numpy.zeros((nocc,nocc))
+    dm1vir = numpy.zeros((nvir,nvir))
+    for i0, i1, gi in _loop_ovov(mp, mo_coeff, nocc):
+        for i in range(i0, i1):
+            g = gi[i-i0].transpose(1,0,2)
+            t2i = g/lib.direct_sum('jb+a->jba', eia, eia[i])
+            dm1vir += numpy.einsum('jca,jcb->ab', t2i, t2i) * 2 \
+                    - numpy.einsum('jca,jbc->ab', t2i, t2i)
+            dm1occ += numpy.einsum('iab,jab->ij', t2i, t2i) * 2 \
+                    - numpy.einsum('iab,jba->ij', t2i, t2i)
+    rdm1 = numpy.zeros((nmo,nmo))
+# *2 for beta electron
+    rdm1[:nocc,:nocc] =-dm1occ * 2
+    rdm1[nocc:,nocc:] = dm1vir * 2
+    for i in range(nocc):
+        rdm1[i,i] += 2
+    return rdm1
+
+def make_rdm2(mp, t2=None, verbose=logger.NOTE):
+    '''2-RDM in MO basis.  Without t2, the amplitudes are generated for a
+    block of occupied orbitals at a time from the 3-index tensor.  See also
+    :func:`mp2.make_rdm2`.
+    '''
+    if t2 is not None:
+        return mp2.make_rdm2(mp, t2, verbose=verbose)
+
+    nmo = mp.nmo
+    nocc = mp.nocc
+    mo_coeff = mp2._mo_without_core(mp, mp.mo_coeff)
+    mo_energy = mp2._mo_energy_without_core(mp, mp.mo_energy)
+    eia = mo_energy[:nocc,None] - mo_energy[None,nocc:]
+    dm2 = numpy.zeros((nmo,nmo,nmo,nmo)) # Chemist notation
+    for i0, i1, gi in _loop_ovov(mp, mo_coeff, nocc):
+        for i in range(i0, i1):
+            g = gi[i-i0].transpose(1,0,2)
+            t2i = g/lib.direct_sum('jb+a->jba', eia, eia[i])
+            dm2[i,nocc:,:nocc,nocc:] = t2i.transpose(1,0,2)*2 - t2i.transpose(2,0,1)
+            dm2[nocc:,i,nocc:,:nocc] = dm2[i,nocc:,:nocc,nocc:].transpose(0,2,1)
+
+    for i in range(nocc):
+        for j in range(nocc):
+            dm2[i,i,j,j] += 4
+            dm2[i,j,j,i] -= 2
+    return dm2
+
+def _loop_ovov(mp, mo_coeff, nocc):
+    '''Generate (ia|jb) for blocks of i.  The (L|ov) tensor is held in memory
+    if it takes less than half of the available memory.  Otherwise it is
+    written to a temporary file and is read back in blocks of L, so that
+    only one block of (L|ov) and one block of (ia|jb) are held in memory.'''
+    nvir = mo_coeff.shape[1] - nocc
+    nov = nocc * nvir
+    if mp.with_df is None:
+        naux = mp._scf.with_df.get_naoaux()
+    else:
+        naux = mp.with_df.get_naoaux()
+
+    max_memory = max(0, mp.max_memory - lib.current_memory()[0])
+    mem_Lov = naux * nov * 8/1e6
+    if mem_Lov < max_memory * .5:
+        feri = None
+        Lov = numpy.empty((naux,nov))
+        max_memory -= mem_Lov
+    else:
+        feri = lib.H5TmpFile()
+        Lov = feri.create_dataset('Lov', (naux,nov), 'f8')
+    p1 = 0
+    for qov in mp.loop_ao2mo(mo_coeff, nocc):
+        p0, p1 = p1, p1 + qov.shape[0]
+        Lov[p0:p1] = qov
+
+    blki = max(1, min(nocc, int(max_memory*.5e6/8/(nvir*nov))))
+    if feri is None:
+        blkL = naux
+    else:
+        blkL = max(1, min(naux, int(max_memory*.3e6/8/nov)))
+    logger.debug1(mp, 'DF-MP2 (L|ov) %s, block sizes: occ %d, aux %d',
+                  'incore' if feri is None else 'outcore', blki, blkL)
+    for i0, i1 in lib.prange(0, nocc, blki):
+        gi = numpy.zeros(((i1-i0)*nvir,nov))
+        for p0, p1 in lib.prange(0, naux, blkL):
+            qov = numpy.asarray(Lov[p0:p1])
+            lib.ddot(qov[:,i0*nvir:i1*nvir].T, qov, 1, gi, 1)
+        yield i0, i1, gi.reshape(i1-i0,nvir,nocc,nvir)
+    if feri is not None:
+        feri.close()
+
+
+class MP2(mp2.MP2):
+    def __init__(self, mf, frozen=0, mo_coeff=None, mo_occ=None):
+        mp2.MP2.__init__(self, mf, frozen, mo_coeff, mo_occ)
         if hasattr(mf, 'with_df') and mf.with_df:
             self.with_df = None
         else:
-            self.with_df = df.DF(mol)
-            self.with_df.auxbasis = df.make_auxbasis(mol, mp2fit=True)
-
-        self.emp2 = None
-        self.t2 = None
+            self.with_df = df.DF(mf.mol)
+            self.with_df.auxbasis = df.make_auxbasis(mf.mol, mp2fit=True)
+        self._keys.update(['with_df'])
 
     def kernel(self, mo_energy=None, mo_coeff=None, nocc=None):
         if mo_coeff is None:
-            mo_coeff = self._scf.mo_coeff
+            mo_coeff = mp2._mo_without_core(self, self.mo_coeff)
         if mo_energy is None:
-            mo_energy = self._scf.mo_energy
+            mo_energy = mp2._mo_energy_without_core(self, self.mo_energy)
         if nocc is None:
-            nocc = self.mol.nelectron // 2
+            nocc = self.nocc
 
         self.emp2, self.t2 = \
                 kernel(self, mo_energy, mo_coeff, nocc, verbose=self.verbose)
         logger.log(self, 'DF-RMP2 energy = %.15g', self.emp2)
+        self.e_corr = self.emp2
         return self.emp2, self.t2
 
     def loop_ao2mo(self, mo_coeff, nocc):
@@ -81,16 +173,19 @@ class MP2(lib.StreamObject):
         else:
             with_df = self.with_df
         for eri1 in with_df.loop():
+# The first block may be the short tail block of the aux basis
+            if Lov is not None and Lov.shape[0] < eri1.shape[0]:
+                Lov = None
             Lov = _ao2mo.nr_e2(eri1, mo, ijslice, aosym='s2', out=Lov)
             yield Lov
 
-#    def make_rdm1(self, t2=None):
-#        if t2 is None: t2 = self.t2
-#        return make_rdm1(self, t2, self.verbose)
-#
-#    def make_rdm2(self, t2=None):
-#        if t2 is None: t2 = self.t2
-#        return make_rdm2(self, t2, self.verbose)
+    def make_rdm1(self, t2=None):
+        if t2 is None: t2 = self.t2
+        return make_rdm1(self, t2, self.verbose)
+
+    def make_rdm2(self, t2=None):
+        if t2 is None: t2 = self.t2
+        return make_rdm2(self, t2, self.verbose)
 
 
 if __name__ == '__main__':
@@ -97,6 +97,62 @@ Given t2 amplitude, current function returns 1-RDM in MO basis''')
     return rdm1
 
 
+def make_fno(mp, thresh=1e-6, pct_occ=None, nvir_act=None, t2=None):
+    '''Frozen natural orbitals.  The virtual orbitals are transformed to
+    the MP2 natural orbitals.  Natural orbitals with small occupation numbers
+    are frozen.
+
+    Kwargs:
+        thresh : float
+            Threshold on the natural orbital occupation numbers.  Default is
+            1e-6.
+        pct_occ : float
+            If given, the natural orbitals are kept until their cumulative
+            occupation reaches pct_occ (0 < pct_occ <= 1) of the total
+            virtual occupation.  It overrides thresh.
+        nvir_act : int
+            If given, the number of virtual natural orbitals to keep.  It
+            overrides thresh and pct_occ.
+
+    Returns:
+        frozen : list
+            The frozen orbitals of mp and the discarded virtual natural
+            orbitals
+        no_coeff : ndarray
+            Orbital coefficients in which the active virtual orbitals are
+            replaced by the natural orbitals.  The kept natural orbitals are
+            semi-canonicalized.
+    '''
+    nocc = mp.nocc
+    dm = mp.make_rdm1(t2)
+    n, v = numpy.linalg.eigh(dm[nocc:,nocc:])
+    idx = numpy.argsort(n)[::-1]
+    n, v = n[idx], v[:,idx]
+    nvir = n.size
+
+    if nvir_act is None:
+        if pct_occ is None:
+            nvir_act = numpy.count_nonzero(n > thresh)
+        else:
+            cumsum = numpy.cumsum(n / n.sum())
+            nvir_act = numpy.count_nonzero(cumsum < pct_occ) + 1
+    nvir_act = min(nvir_act, nvir)
+    logger.info(mp, 'FNO: %d of %d virtual orbitals are kept',
+                nvir_act, nvir)
+
+    moidx = _active_idx(mp)
+    vidx = numpy.where(moidx)[0][nocc:]
+    mo_v = mp.mo_coeff[:,vidx]
+    mo_e = mp.mo_energy[vidx]
+    v1 = v[:,:nvir_act]
+    e, u = numpy.linalg.eigh(numpy.dot(v1.T*mo_e, v1))
+    no_coeff = mp.mo_coeff.copy()
+    no_coeff[:,vidx[:nvir_act]] = reduce(numpy.dot, (mo_v, v1, u))
+    no_coeff[:,vidx[nvir_act:]] = numpy.dot(mo_v, v[:,nvir_act:])
+    frozen = numpy.where(~moidx)[0].tolist() + vidx[nvir_act:].tolist()
+    return frozen, no_coeff
+
+
 def make_rdm2(mp, t2, eris=None, verbose=logger.NOTE):
     '''2-RDM in MO basis'''
     nmo = mp.nmo
@@ -213,6 +269,10 @@ class MP2(lib.StreamObject):
         if t2 is None: t2 = self.t2
         return make_rdm2(self, t2, eris, verbose=self.verbose)
 
+    def make_fno(self, thresh=1e-6, pct_occ=None, nvir_act=None, t2=None):
+        if t2 is None: t2 = self.t2
+        return make_fno(self, thresh, pct_occ, nvir_act, t2)
+
 def _mo_energy_without_core(mp, mo_energy):
     return mo_energy[_active_idx(mp)]
 
@@ -104,6 +104,49 @@ class KnowValues(unittest.TestCase):
         e = pt.kernel()[0]
         self.assertAlmostEqual(e, -0.20425449198401671, 9)
 
+    def test_make_fno(self):
+        pt = mp.mp2.MP2(mf, frozen=1)
+        pt.kernel()
+        frozen, no_coeff = pt.make_fno(1e-4)
+        self.assertEqual(len(frozen), 3)
+        self.assertEqual(frozen[0], 0)
+        # occupied orbitals unchanged, natural orbitals orthonormal
+        self.assertTrue(numpy.allclose(no_coeff[:,:5], mf.mo_coeff[:,:5]))
+        s = reduce(numpy.dot, (no_coeff.T, mf.get_ovlp(), no_coeff))
+        self.assertTrue(numpy.allclose(s, numpy.eye(s.shape[0])))
+        self.assertEqual(len(pt.make_fno(nvir_act=10)[0]), 10)
+        self.assertEqual(len(pt.make_fno(pct_occ=1)[0]), 1)
+
+        pt = mp.dfmp2.MP2(mf, frozen=1)
+        frozen1, no_coeff1 = pt.make_fno(1e-4)
+        self.assertEqual(frozen1, frozen)
+
+    def test_dfmp2_blocks(self):
+        pt = mp.dfmp2.MP2(mf, frozen=1)
+        e0 = pt.kernel()[0]
+        self.assertTrue(pt.t2 is None)
+        dm0 = pt.make_rdm1()
+        pt.with_df.blockdim = 17
+        self.assertAlmostEqual(pt.kernel()[0], e0, 12)
+        self.assertTrue(numpy.allclose(pt.make_rdm1(), dm0))
+        nocc = pt.nocc
+        self.assertAlmostEqual(numpy.einsum('ii', dm0[:nocc,:nocc]) +
+                               numpy.einsum('ii', dm0[nocc:,nocc:]), 8, 9)
+        pt.max_memory = 1
+        self.assertAlmostEqual(pt.kernel()[0], e0, 12)
+        self.assertTrue(numpy.allclose(pt.make_rdm1(), dm0))
+
+    def test_dfmp2_rdm2(self):
+        mf1 = mf.density_fit('weigend')
+        pt = mp.mp2.MP2(mf1, frozen=1)
+        pt.kernel()
+        dm2ref = pt.make_rdm2()
+        pt = mp.dfmp2.MP2(mf1, frozen=1)
+        pt.kernel()
+        self.assertTrue(numpy.allclose(pt.make_rdm2(), dm2ref))
+        pt.max_memory = 1
+        self.assertTrue(numpy.allclose(pt.make_rdm2(), dm2ref))
+
     def test_mp2_frozen(self):
         pt = mp.mp2.MP2(mf)
         pt.frozen = [1]
@@ -4,7 +4,6 @@
 #         Qiming Sun <osirpt.sun@gmail.com>
 #
 
-import ctypes
 import time
 import tempfile
 from functools import reduce
@@ -17,8 +16,6 @@ from pyscf.mcscf import mc_ao2mo
 from pyscf import ao2mo
 from pyscf.ao2mo import _ao2mo
 
-libmc = lib.load_library('libmcscf')
-
 NUMERICAL_ZERO = 1e-14
 # Ref JCP, 117, 9138
 
@@ -26,112 +23,6 @@ NUMERICAL_ZERO = 1e-14
 # h2e is the CAS space 2e integrals in  notation # a' -> p # b' -> q # c' -> r
 # d' -> s
 
-def make_a16(h1e, h2e, dms, civec, norb, nelec, link_index=None):
-    dm3 = dms['3']
-    #dm4 = dms['4']
-    if 'f3ca' in dms and 'f3ac' in dms:
-        f3ca = dms['f3ca']
-        f3ac = dms['f3ac']
-    else:
-        if isinstance(nelec, (int, numpy.integer)):
-            neleca = nelecb = nelec//2
-        else:
-            neleca, nelecb = nelec
-        if link_index is None:
-            link_indexa = fci.cistring.gen_linkstr_index(range(norb), neleca)
-            link_indexb = fci.cistring.gen_linkstr_index(range(norb), nelecb)
-        else:
-            link_indexa, link_indexb = link_index
-        eri = h2e.transpose(0,2,1,3)
-        f3ca = _contract4pdm('NEVPTkern_cedf_aedf', eri, civec, norb, nelec,
-                             (link_indexa,link_indexb))
-        f3ac = _contract4pdm('NEVPTkern_aedf_ecdf', eri, civec, norb, nelec,
-                             (link_indexa,link_indexb))
-
-    a16 = -numpy.einsum('ib,rpqiac->pqrabc', h1e, dm3)
-    a16 += numpy.einsum('ia,rpqbic->pqrabc', h1e, dm3)
-    a16 -= numpy.einsum('ci,rpqbai->pqrabc', h1e, dm3)
-
-# qjkiac = acqjki + delta(ja)qcki + delta(ia)qjkc - delta(qc)ajki - delta(kc)qjai
-    #:a16 -= numpy.einsum('kbij,rpqjkiac->pqrabc', h2e, dm4)
-    a16 -= f3ca.transpose(1,4,0,2,5,3) # c'a'acb'b -> a'b'c'abc
-    a16 -= numpy.einsum('kbia,rpqcki->pqrabc', h2e, dm3)
-    a16 -= numpy.einsum('kbaj,rpqjkc->pqrabc', h2e, dm3)
-    a16 += numpy.einsum('cbij,rpqjai->pqrabc', h2e, dm3)
-    fdm2 = numpy.einsum('kbij,rpajki->prab'  , h2e, dm3)
-    for i in range(norb):
-        a16[:,i,:,:,:,i] += fdm2
-
-    #:a16 += numpy.einsum('ijka,rpqbjcik->pqrabc', h2e, dm4)
-    a16 += f3ac.transpose(1,2,0,4,3,5) # c'a'b'bac -> a'b'c'abc
-
-    #:a16 -= numpy.einsum('kcij,rpqbajki->pqrabc', h2e, dm4)
-    a16 -= f3ca.transpose(1,2,0,4,3,5) # c'a'b'bac -> a'b'c'abc
-
-    a16 += numpy.einsum('jbij,rpqiac->pqrabc', h2e, dm3)
-    a16 -= numpy.einsum('cjka,rpqbjk->pqrabc', h2e, dm3)
-    a16 += numpy.einsum('jcij,rpqbai->pqrabc', h2e, dm3)
-    return a16
-
-def make_a22(h1e, h2e, dms, civec, norb, nelec, link_index=None):
-    dm2 = dms['2']
-    dm3 = dms['3']
-    #dm4 = dms['4']
-    if 'f3ca' in dms and 'f3ac' in dms:
-        f3ca = dms['f3ca']
-        f3ac = dms['f3ac']
-    else:
-        if isinstance(nelec, (int, numpy.integer)):
-            neleca = nelecb = nelec//2
-        else:
-            neleca, nelecb = nelec
-        if link_index is None:
-            link_indexa = fci.cistring.gen_linkstr_index(range(norb), neleca)
-            link_indexb = fci.cistring.gen_linkstr_index(range(norb), nelecb)
-        else:
-            link_indexa, link_indexb = link_index
-        eri = h2e.transpose(0,2,1,3)
-        f3ca = _contract4pdm('NEVPTkern_cedf_aedf', eri, civec, norb, nelec,
-                             (link_indexa,link_indexb))
-        f3ac = _contract4pdm('NEVPTkern_aedf_ecdf', eri, civec, norb, nelec,
-                             (link_indexa,link_indexb))
-
-    a22 = -numpy.einsum('pb,kipjac->ijkabc', h1e, dm3)
-    a22 -= numpy.einsum('pa,kibjpc->ijkabc', h1e, dm3)
-    a22 += numpy.einsum('cp,kibjap->ijkabc', h1e, dm3)
-    a22 += numpy.einsum('cqra,kibjqr->ijkabc', h2e, dm3)
-    a22 -= numpy.einsum('qcpq,kibjap->ijkabc', h2e, dm3)
-
-# qjprac = acqjpr + delta(ja)qcpr + delta(ra)qjpc - delta(qc)ajpr - delta(pc)qjar
-    #a22 -= numpy.einsum('pqrb,kiqjprac->ijkabc', h2e, dm4)
-    a22 -= f3ac.transpose(1,5,0,2,4,3) # c'a'acbb'
-    fdm2 = numpy.einsum('pqrb,kiqcpr->ikbc', h2e, dm3)
-    for i in range(norb):
-        a22[:,i,:,i,:,:] -= fdm2
-    a22 -= numpy.einsum('pqab,kiqjpc->ijkabc', h2e, dm3)
-    a22 += numpy.einsum('pcrb,kiajpr->ijkabc', h2e, dm3)
-    a22 += numpy.einsum('cqrb,kiqjar->ijkabc', h2e, dm3)
-
-    #a22 -= numpy.einsum('pqra,kibjqcpr->ijkabc', h2e, dm4)
-    a22 -= f3ac.transpose(1,3,0,4,2,5) # c'a'bb'ac -> a'b'c'abc
-
-    #a22 += numpy.einsum('rcpq,kibjaqrp->ijkabc', h2e, dm4)
-    a22 += f3ca.transpose(1,3,0,4,2,5) # c'a'bb'ac -> a'b'c'abc
-
-    a22 += 2.0*numpy.einsum('jb,kiac->ijkabc', h1e, dm2)
-    a22 += 2.0*numpy.einsum('pjrb,kiprac->ijkabc', h2e, dm3)
-    fdm2  = numpy.einsum('pa,kipc->ikac', h1e, dm2)
-    fdm2 -= numpy.einsum('cp,kiap->ikac', h1e, dm2)
-    fdm2 -= numpy.einsum('cqra,kiqr->ikac', h2e, dm2)
-    fdm2 += numpy.einsum('qcpq,kiap->ikac', h2e, dm2)
-    fdm2 += numpy.einsum('pqra,kiqcpr->ikac', h2e, dm3)
-    fdm2 -= numpy.einsum('rcpq,kiaqrp->ikac', h2e, dm3)
-    for i in range(norb):
-        a22[:,i,:,:,i,:] += fdm2 * 2
-
-    return a22
-
-
 def make_a17(h1e,h2e,dm2,dm3):
     h1e = h1e - numpy.einsum('mjjn->mn',h2e)
 
@@ -210,23 +101,27 @@ def make_k27(h1e,h2e,dm1,dm2):
 
 
 
-def make_a7(h1e,h2e,dm1,dm2,dm3):
+def make_a7(h1e,h2e,dm1,dm2,dm3,f3=None):
     #This dm2 and dm3 need to be in the form of norm order
     delta = numpy.eye(dm2.shape[0])
     # a^+_ia^+_ja_ka^l =  E^i_lE^j_k -\delta_{j,l} E^i_k
     rm2 = numpy.einsum('iljk->ijkl',dm2) - numpy.einsum('ik,jl->ijkl',dm1,delta)
     # E^{i,j,k}_{l,m,n} = E^{i,j}_{m,n}E^k_l -\delta_{k,m}E^{i,j}_{l,n}- \delta_{k,n}E^{i,j}_{m,l}
     # = E^i_nE^j_mE^k_l -\delta_{j,n}E^i_mE^k_l -\delta_{k,m}E^{i,j}_{l,n} -\delta_{k,n}E^{i,j}_{m,l}
-    rm3 = numpy.einsum('injmkl->ijklmn',dm3)\
-        - numpy.einsum('jn,imkl->ijklmn',delta,dm2)\
-        - numpy.einsum('km,ijln->ijklmn',delta,rm2)\
-        - numpy.einsum('kn,ijml->ijklmn',delta,rm2)
-
+    # The terms -einsum('kbij,pqkija->pqab',h2e,rm3)-einsum('kaij,pqkibj->pqab',h2e,rm3)
+    # are expanded.  f3 is the part of dm3 (see DM3_TERMS), the delta terms
+    # of rm3 are contracted below.
+    if f3 is None:
+        f3 = contract_dm3(h2e, _dm3_blocks(dm3),
+                          {'a7': DM3_TERMS['a7']})['a7']
     a7 = -numpy.einsum('bi,pqia->pqab',h1e,rm2)\
          -numpy.einsum('ai,pqbi->pqab',h1e,rm2)\
-         -numpy.einsum('kbij,pqkija->pqab',h2e,rm3) \
-         -numpy.einsum('kaij,pqkibj->pqab',h2e,rm3) \
-         -numpy.einsum('baij,pqij->pqab',h2e,rm2)
+         +numpy.einsum('jbij,pqia->pqab',h2e,rm2)\
+         +numpy.einsum('abij,pqji->pqab',h2e,rm2)\
+         +numpy.einsum('jaij,pqbi->pqab',h2e,rm2)\
+         +numpy.einsum('kaiq,pbki->pqab',h2e,dm2)\
+         +numpy.einsum('qa,pb->pqab',delta,numpy.einsum('kbij,pjki->pb',h2e,dm2))\
+         +f3
     return rm2, a7
 
 def make_a9(h1e,h2e,hdm1,hdm2,hdm3):
@@ -241,31 +136,151 @@ def make_a9(h1e,h2e,hdm1,hdm2,hdm3):
     a9 -= numpy.einsum('ijka,pqkjbi->pqab',h2e,hdm3)
     return a9
 
-def make_a12(h1e,h2e,dm1,dm2,dm3):
+def _make_a9_f3(h1e,h2e,dm1,dm2,hdm2,f3):
+    '''make_a9 with the hdm3 terms expanded.  f3 is the part of dm3 (see
+    DM3_TERMS), the other terms of hdm3 are contracted here.'''
+    delta = numpy.eye(dm2.shape[0])
+    x = numpy.einsum('ijkb,ikjq->qb',h2e,dm2)
+    y = numpy.einsum('iqkb,ik->qb',h2e,dm1)
+    z = numpy.einsum('ijka,qkji->qa',h2e,hdm2)
+    a9 =  numpy.einsum('ib,pqai->pqab',h1e,hdm2)
+    a9 -= numpy.einsum('ijjb,pqai->pqab',h2e,hdm2)
+    a9 += numpy.einsum('ia,pqib->pqab',h1e,hdm2)
+    a9 -= numpy.einsum('ijja,pqib->pqab',h2e,hdm2)
+    a9 += numpy.einsum('ijia,pqjb->pqab',h2e,hdm2)*2.0
+    # -einsum('ijkb,pkqaij->pqab',h2e,hdm3)
+    a9 += numpy.einsum('pjkb,kqaj->pqab',h2e,hdm2)
+    a9 += numpy.einsum('qjkb,pkaj->pqab',h2e,hdm2)
+    a9 -= numpy.einsum('iqkb,ikap->pqab',h2e,dm2)*2.0
+    a9 += numpy.einsum('ap,qb->pqab',delta,y*4.0-x*2.0)
+    a9 += numpy.einsum('aq,pb->pqab',delta,x-y*2.0)
+    # -einsum('ijka,pqkjbi->pqab',h2e,hdm3)
+    a9 += numpy.einsum('pb,qa->pqab',delta,z)
+    a9 -= numpy.einsum('bq,pa->pqab',delta,z)*2.0
+    a9 -= numpy.einsum('ipka,bqik->pqab',h2e,dm2)*2.0
+    a9 -= numpy.einsum('ijia,bqjp->pqab',h2e,dm2)*2.0
+    a9 += numpy.einsum('ijja,bqip->pqab',h2e,dm2)
+    a9 += numpy.einsum('pa,bq->pqab',numpy.einsum('ipia->pa',h2e)*4.0
+                       -numpy.einsum('pjja->pa',h2e)*2.0,dm1)
+    a9 += f3
+    return a9
+
+def make_a12(h1e,h2e,dm1,dm2,dm3,f3=None):
+    # f3 is the contraction of h2e and dm3 (see DM3_TERMS)
+    if f3 is None:
+        f3 = contract_dm3(h2e, _dm3_blocks(dm3),
+                          {'a12': DM3_TERMS['a12']})['a12']
     a12 = numpy.einsum('ia,qpib->pqab',h1e,dm2)\
         - numpy.einsum('bi,qpai->pqab',h1e,dm2)\
-        + numpy.einsum('ijka,qpjbik->pqab',h2e,dm3)\
-        - numpy.einsum('kbij,qpajki->pqab',h2e,dm3)\
         - numpy.einsum('bjka,qpjk->pqab',h2e,dm2)\
-        + numpy.einsum('jbij,qpai->pqab',h2e,dm2)
+        + numpy.einsum('jbij,qpai->pqab',h2e,dm2)\
+        + f3
     return a12
 
-def make_a13(h1e,h2e,dm1,dm2,dm3):
-    delta = numpy.eye(dm3.shape[0])
+def make_a13(h1e,h2e,dm1,dm2,dm3,f3=None):
+    # f3 is the contraction of h2e and dm3 (see DM3_TERMS)
+    if f3 is None:
+        f3 = contract_dm3(h2e, _dm3_blocks(dm3),
+                          {'a13': DM3_TERMS['a13']})['a13']
+    delta = numpy.eye(dm2.shape[0])
     a13 = -numpy.einsum('ia,qbip->pqab',h1e,dm2)
     a13 += numpy.einsum('pa,qb->pqab',h1e,dm1)*2.0
     a13 += numpy.einsum('bi,qiap->pqab',h1e,dm2)
     a13 -= numpy.einsum('pa,bi,qi->pqab',delta,h1e,dm1)*2.0
-    a13 -= numpy.einsum('ijka,qbjpik->pqab',h2e,dm3)
-    a13 += numpy.einsum('kbij,qjapki->pqab',h2e,dm3)
     a13 += numpy.einsum('blma,qmlp->pqab',h2e,dm2)
     a13 += numpy.einsum('kpma,qbkm->pqab',h2e,dm2)*2.0
     a13 -= numpy.einsum('bpma,qm->pqab',h2e,dm1)*2.0
     a13 -= numpy.einsum('lbkl,qkap->pqab',h2e,dm2)
     a13 -= numpy.einsum('ap,mbkl,qlmk->pqab',delta,h2e,dm2)*2.0
     a13 += numpy.einsum('ap,lbkl,qk->pqab',delta,h2e,dm1)*2.0
+    a13 += f3
     return a13
 
+# The contractions of h2e[i,j,k,l] and the 3-particle density matrix
+# dm3[p,q,r,s,t,u] = <E_pq E_rs E_tu> needed by a7 (Srs), a9 (Sij), a12 and
+# a13 (Sir).  The subscripts of dm3 are in its storage order.
+DM3_TERMS = {
+    'a7' : ((-1, 'kbij,paqjki->pqab'), (-1, 'kaij,pjqbki->pqab')),
+    'a9' : (( 1, 'ijkb,ikapjq->pqab'), ( 1, 'ijka,bqjpik->pqab')),
+    'a12': (( 1, 'ijka,qpjbik->pqab'), (-1, 'kbij,qpajki->pqab')),
+    'a13': ((-1, 'ijka,qbjpik->pqab'), ( 1, 'kbij,qjapki->pqab')),
+}
+
+def contract_dm3(h2e, dm3_blocks, terms=DM3_TERMS):
+    '''Sum the contractions fac*einsum(subscripts, h2e, dm3) of terms over
+    the blocks of dm3.  dm3_blocks yields ((p0,p1), (q0,q1), blk) where blk
+    is dm3[p0:p1,q0:q1].
+
+    Returns:
+        A dict with the same keys as terms.
+    '''
+    norb = h2e.shape[0]
+    out = dict((key, numpy.zeros((norb,)*4)) for key in terms)
+    for (p0, p1), (q0, q1), blk in dm3_blocks:
+        for key, subterms in terms.items():
+            for fac, subscripts in subterms:
+                idx_h, idx_dm3, idx_out = subscripts.replace('->', ',').split(',')
+                def sub(idx):
+                    return tuple(slice(p0,p1) if x == idx_dm3[0] else
+                                 slice(q0,q1) if x == idx_dm3[1] else
+                                 slice(None) for x in idx)
+                out[key][sub(idx_out)] += fac * lib.einsum(subscripts,
+                                                           h2e[sub(idx_h)], blk)
+    return out
+
+def _dm3_blocks(dm3):
+    '''dm3 as one block for contract_dm3'''
+    return [((0,dm3.shape[0]), (0,dm3.shape[1]), dm3)]
+
+def _fci_dm3_blocks(ci, norb, nelec, dm2, max_memory):
+    '''Generate the blocks of the 3-particle density matrix
+    dm3[p,q,r,s,t,u] = <E_pq E_rs E_tu> of the FCI wavefunction ci.  For
+    p >= q, dm3[p,q] is the transition density matrix <E_qp 0|E_rs E_tu|0>.
+    dm3[q,p] is obtained from dm3[p,q] and dm2 = <E_pq E_rs> with
+
+        <E_qp E_rs E_tu> = <E_pq E_ut E_sr> + [E_ut E_sr, E_pq]
+
+    Only the blocks dm3[p,q0:q1] and dm3[q0:q1,p] are held at a time.
+    '''
+    neleca, nelecb = nelec
+    link_index = (fci.cistring.gen_linkstr_index(range(norb), neleca),
+                  fci.cistring.gen_linkstr_index(range(norb), nelecb))
+    max_memory = max_memory - lib.current_memory()[0]
+    qblk = int(max_memory*.2e6/8/norb**4)
+    qblk = max(1, min(norb, qblk))
+    for p in range(norb):
+        # a_p|0> for the alpha and beta electrons
+        xa = xb = None
+        if neleca > 0:
+            xa = fci.addons.des_a(ci, norb, (neleca,nelecb), p)
+        if nelecb > 0:
+            xb = fci.addons.des_b(ci, norb, (neleca,nelecb), p)
+        for q0, q1 in lib.prange(0, p+1, qblk):
+            blk = numpy.empty((1,q1-q0)+(norb,)*4)
+            for q in range(q0, q1):
+                bra = numpy.zeros_like(ci)
+                if xa is not None:
+                    bra += fci.addons.cre_a(xa, norb, (neleca-1,nelecb), q)
+                if xb is not None:
+                    bra += fci.addons.cre_b(xb, norb, (neleca,nelecb-1), q)
+                blk[0,q-q0] = fci.rdm.make_rdm12_spin1('FCItdm12kern_sf', bra,
+                                                       ci, norb, nelec,
+                                                       link_index)[1]
+            yield (p,p+1), (q0,q1), blk
+
+            q1 = min(q1, p)
+            if q1 > q0:
+                blkT = numpy.empty((q1-q0,1)+(norb,)*4)
+                for q in range(q0, q1):
+                    t = blkT[q-q0,0]
+                    t[:] = blk[0,q-q0].transpose(3,2,1,0)
+                    t[p,:,:,:] += dm2[:,:,:,q].transpose(2,1,0)
+                    t[:,q,:,:] -= dm2[:,:,p,:].transpose(2,1,0)
+                    t[:,:,p,:] += dm2[:,q,:,:].transpose(2,1,0)
+                    t[:,:,:,q] -= dm2[p].transpose(2,1,0)
+                yield (q0,q1), (p,p+1), blkT
+            blk = blkT = None
+
 
 def Sr(mc,ci,dms, eris=None, verbose=None):
     #The subspace S_r^{(-1)}
@@ -293,10 +308,15 @@ def Sr(mc,ci,dms, eris=None, verbose=None):
         h1e_v = eris['h1eff'][nocc:,ncore:nocc] - numpy.einsum('mbbn->mn',h2e_v)
 
 
-    if hasattr(mc.fcisolver, 'nevpt_intermediate'):
-        a16 = mc.fcisolver.nevpt_intermediate('A16',mc.ncas,mc.nelecas,ci)
-    else:
-        a16 = make_a16(h1e,h2e, dms, ci, mc.ncas, mc.nelecas)
+    if not hasattr(mc.fcisolver, 'nevpt_intermediate'):
+        # For FCI wavefunction, the perturbers
+        #   sum_q h1e_v[i,q] a_q|0> + sum_{pqr} h2e_v[i,p,q,r] a_p^+ a_r a_q|0>
+        # are constructed explicitly in the CI space
+        h1 = h1e_v + numpy.einsum('mbbn->mn',h2e_v)
+        norm, ener = _sc_perturbers(mc, ci, h1, h2e_v, h1e, h2e, 'des')
+        return _norm_to_energy(norm, ener, mc.mo_energy[mc.ncore+mc.ncas:])
+
+    a16 = mc.fcisolver.nevpt_intermediate('A16',mc.ncas,mc.nelecas,ci)
     a17 = make_a17(h1e,h2e,dm2,dm3)
     a19 = make_a19(h1e,h2e,dm1,dm2)
 
@@ -334,11 +354,17 @@ def Si(mc, ci, dms, eris=None, verbose=None):
         h2e_v = eris['ppaa'][ncore:nocc,:ncore].transpose(0,2,1,3)
         h1e_v = eris['h1eff'][ncore:nocc,:ncore]
 
-    if hasattr(mc.fcisolver, 'nevpt_intermediate'):
-        #mc.fcisolver.make_a22(mc.ncas, state)
-        a22 = mc.fcisolver.nevpt_intermediate('A22',mc.ncas,mc.nelecas,ci)
-    else:
-        a22 = make_a22(h1e,h2e, dms, ci, mc.ncas, mc.nelecas)
+    if not hasattr(mc.fcisolver, 'nevpt_intermediate'):
+        # For FCI wavefunction, the perturbers
+        #   sum_q a_q^+ (h1e_v[q,i] + sum_{pr} h2e_v[q,p,i,r] a_p^+ a_r)|0>
+        # are constructed explicitly in the CI space
+        h1 = h1e_v.T - numpy.einsum('rqir->iq',h2e_v)
+        h2 = h2e_v.transpose(2,1,0,3)
+        norm, ener = _sc_perturbers(mc, ci, h1, h2, h1e, h2e, 'cre')
+        return _norm_to_energy(norm, ener, -mc.mo_energy[:mc.ncore])
+
+    #mc.fcisolver.make_a22(mc.ncas, state)
+    a22 = mc.fcisolver.nevpt_intermediate('A22',mc.ncas,mc.nelecas,ci)
     a23 = make_a23(h1e,h2e,dm1,dm2,dm3)
     a25 = make_a25(h1e,h2e,dm1,dm2)
     delta = numpy.eye(mc.ncas)
@@ -448,6 +474,7 @@ def Srs(mc, dms, eris=None, verbose=None):
     dm1 = dms['1']
     dm2 = dms['2']
     dm3 = dms['3']
+    f3 = dms.get('f3', {})
     if mo_virt.shape[1] ==0:
         return 0, 0
     if eris is None:
@@ -463,7 +490,7 @@ def Srs(mc, dms, eris=None, verbose=None):
         h2e_v = eris['papa'][nocc:,:,nocc:].transpose(0,2,1,3)
 
 # a7 is very sensitive to the accuracy of HF orbital and CI wfn
-    rm2, a7 = make_a7(h1e,h2e,dm1,dm2,dm3)
+    rm2, a7 = make_a7(h1e,h2e,dm1,dm2,dm3,f3.get('a7'))
     norm = 0.5*numpy.einsum('rsqp,rsba,pqba->rs',h2e_v,h2e_v,rm2)
     h = 0.5*numpy.einsum('rsqp,rsba,pqab->rs',h2e_v,h2e_v,a7)
     diff = mc.mo_energy[mc.ncore+mc.ncas:,None] + mc.mo_energy[None,mc.ncore+mc.ncas:]
@@ -497,13 +524,16 @@ def Sij(mc, dms, eris, verbose=None):
         hdm2 = dms['h2']
     else:
         hdm2 = make_hdm2(dm1,dm2)
-    if 'h3' in dms:
-        hdm3 = dms['h3']
-    else:
-        hdm3 = make_hdm3(dm1,dm2,dm3,hdm1,hdm2)
 
 # a9 is very sensitive to the accuracy of HF orbital and CI wfn
-    a9 = make_a9(h1e,h2e,hdm1,hdm2,hdm3)
+    if 'h3' in dms:
+        a9 = make_a9(h1e,h2e,hdm1,hdm2,dms['h3'])
+    else:
+        if 'f3' in dms:
+            f3 = dms['f3']['a9']
+        else:
+            f3 = contract_dm3(h2e, _dm3_blocks(dm3), {'a9': DM3_TERMS['a9']})['a9']
+        a9 = _make_a9_f3(h1e,h2e,dm1,dm2,hdm2,f3)
     norm = 0.5*numpy.einsum('qpij,baij,pqab->ij',h2e_v,h2e_v,hdm2)
     h = 0.5*numpy.einsum('qpij,baij,pqab->ij',h2e_v,h2e_v,a9)
     diff = mc.mo_energy[:mc.ncore,None] + mc.mo_energy[None,:mc.ncore]
@@ -543,8 +573,9 @@ def Sir(mc, dms, eris, verbose=None):
          - numpy.einsum('rpqi,ri,qp->ir',h2e_v2,h1e_v,dm1)*2.0\
          + numpy.einsum('ri,ri->ir',h1e_v,h1e_v)*2.0
 
-    a12 = make_a12(h1e,h2e,dm1,dm2,dm3)
-    a13 = make_a13(h1e,h2e,dm1,dm2,dm3)
+    f3 = dms.get('f3', {})
+    a12 = make_a12(h1e,h2e,dm1,dm2,dm3,f3.get('a12'))
+    a13 = make_a13(h1e,h2e,dm1,dm2,dm3,f3.get('a13'))
 
     h = numpy.einsum('rpiq,raib,pqab->ir',h2e_v1,h2e_v1,a12)*2.0\
          - numpy.einsum('rpiq,rabi,pqab->ir',h2e_v1,h2e_v2,a12)\
@@ -670,30 +701,30 @@ class NEVPT(lib.StreamObject):
             logger.info(self, 'DMRG-NEVPT')
             dm1, dm2, dm3 = self.fcisolver._make_dm123(self.load_ci(),self.ncas,self.nelecas,None)
         else:
-            dm1, dm2, dm3 = fci.rdm.make_dm123('FCI3pdm_kern_sf',
-                                               self.load_ci(), self.load_ci(), self.ncas, self.nelecas)
+            dm1, dm2 = fci.rdm.make_rdm12_spin1('FCIrdm12kern_sf', self.load_ci(),
+                                                self.load_ci(), self.ncas, self.nelecas)
+            dm3 = None
         dm4 = None
 
         dms = {'1': dm1, '2': dm2, '3': dm3, '4': dm4,
                #'h1': hdm1, 'h2': hdm2, 'h3': hdm3
               }
-        time1 = log.timer('3pdm, 4pdm', *time0)
+        time1 = log.timer('1pdm, 2pdm, 3pdm', *time0)
 
         eris = _ERIS(self, self.mo_coeff)
         time1 = log.timer('integral transformation', *time1)
-        nocc = self.ncore + self.ncas
-
-        if not hasattr(self.fcisolver, 'nevpt_intermediate'):  # regular FCI solver
-            link_indexa = fci.cistring.gen_linkstr_index(range(self.ncas), self.nelecas[0])
-            link_indexb = fci.cistring.gen_linkstr_index(range(self.ncas), self.nelecas[1])
-            aaaa = eris['ppaa'][self.ncore:nocc,self.ncore:nocc].copy()
-            f3ca = _contract4pdm('NEVPTkern_cedf_aedf', aaaa, self.load_ci(), self.ncas,
-                                 self.nelecas, (link_indexa,link_indexb))
-            f3ac = _contract4pdm('NEVPTkern_aedf_ecdf', aaaa, self.load_ci(), self.ncas,
-                                 self.nelecas, (link_indexa,link_indexb))
-            dms['f3ca'] = f3ca
-            dms['f3ac'] = f3ac
-        time1 = log.timer('eri-4pdm contraction', *time1)
+
+        if dm3 is None:
+# For FCI wavefunctions, Sr and Si do not need dm3.  The dm3 contractions of
+# Srs, Sij and Sir are accumulated over the blocks dm3[p,q0:q1] without
+# storing the full dm3.
+            ncore = self.ncore
+            nocc = ncore + self.ncas
+            h2e = eris['ppaa'][ncore:nocc,ncore:nocc].transpose(0,2,1,3)
+            dm3_blocks = _fci_dm3_blocks(self.load_ci(), self.ncas, self.nelecas,
+                                         dm2, self.max_memory)
+            dms['f3'] = contract_dm3(h2e, dm3_blocks)
+            time1 = log.timer('3pdm contractions', *time1)
 
         if self.compressed_mps:
             fh5 = h5py.File('Perturbation_%d'%self.root,'r')
@@ -766,38 +797,98 @@ def sc_nevpt(mc, ci=None, verbose=None):
 
 
 
-def _contract4pdm(kern, eri, civec, norb, nelec, link_index=None):
-    if isinstance(nelec, (int, numpy.integer)):
-        neleca = nelecb = nelec//2
-    else:
-        neleca, nelecb = nelec
-    if link_index is None:
-        link_indexa = fci.cistring.gen_linkstr_index(range(norb), neleca)
-        link_indexb = fci.cistring.gen_linkstr_index(range(norb), nelecb)
+def _excitations(civec, a0, a1, norb, link_index):
+    '''E_pr|civec> for the alpha strings a0:a1 of the output vector.  The
+    result is saved as t[p*norb+r,I,J]'''
+    link_indexa, link_indexb = link_index
+    nb = civec.shape[1]
+    t = numpy.zeros((norb*norb,a1-a0,nb))
+    link = link_indexa[a0:a1]
+    pr = link[:,:,1] * norb + link[:,:,0]
+    t[pr,numpy.arange(a1-a0)[:,None]] = link[:,:,3,None] * civec[link[:,:,2]]
+    pr = link_indexb[:,:,1] * norb + link_indexb[:,:,0]
+    t[pr,:,numpy.arange(nb)[:,None]] += link_indexb[:,:,3,None] * \
+            civec[a0:a1,link_indexb[:,:,2]].transpose(1,2,0)
+    return t
+
+def _perturber_norm_ener(h1, h2, xop, h1e, eri, e0, norb, nelec, max_memory):
+    '''Norm and energy of the strongly contracted perturbers
+
+        |P_i> = sum_q h1[i,q] |X_q> + sum_{pqr} h2[i,p,q,r] E_pr |X_q>
+
+    norm[i] = <P_i|P_i>, ener[i] = <P_i|H-e0|P_i> where H is the CAS space
+    Hamiltonian (h1e, eri) for nelec electrons.  xop(q) returns |X_q> in the
+    CI space of nelec electrons.  The perturbers are generated for batches of
+    external orbitals i and alpha strings, and |X_q> is regenerated for each
+    batch, so that only one of them is held at a time.
+    '''
+    link_indexa = fci.cistring.gen_linkstr_index(range(norb), nelec[0])
+    link_indexb = fci.cistring.gen_linkstr_index(range(norb), nelec[1])
+    link_index = (link_indexa, link_indexb)
+    na = link_indexa.shape[0]
+    nb = link_indexb.shape[0]
+    nx = h1.shape[0]
+    h2eff = fci.direct_spin1.absorb_h1e(h1e, eri, norb, nelec, .5)
+    link_tril = (fci.cistring.gen_linkstr_index_trilidx(range(norb), nelec[0]),
+                 fci.cistring.gen_linkstr_index_trilidx(range(norb), nelec[1]))
+
+    max_memory = max_memory - lib.current_memory()[0]
+    # Four CI vectors for contract_2e and X_q, plus the excitation buffer
+    blksize = int(max_memory*.3e6/8/(na*nb))
+    blksize = max(1, min(nx, blksize-5))
+    ablksize = int(max_memory*.3e6/8/(norb**2*nb))
+    ablksize = max(1, min(na, ablksize))
+
+    norm = numpy.zeros(nx)
+    ener = numpy.zeros(nx)
+    for i0, i1 in lib.prange(0, nx, blksize):
+        # pert[I,J,i] so that both terms are accumulated in place
+        pert = numpy.zeros((na,nb,i1-i0))
+        for q in range(norb):
+            x = xop(q).reshape(-1,1)
+            lib.dot(x, h1[i0:i1,q].reshape(1,-1), 1, pert.reshape(-1,i1-i0), 1)
+            x = x.reshape(na,nb)
+            g = h2[i0:i1,:,q,:].reshape(i1-i0,-1)
+            for a0, a1 in lib.prange(0, na, ablksize):
+                t = _excitations(x, a0, a1, norb, link_index)
+                lib.dot(t.reshape(norb**2,-1).T, g.T, 1,
+                        pert[a0:a1].reshape(-1,i1-i0), 1)
+                t = None
+            x = None
+        for k in range(i1-i0):
+            p = numpy.asarray(pert[:,:,k], order='C')
+            hp = fci.direct_spin1.contract_2e(h2eff, p, norb, nelec, link_tril)
+            norm[i0+k] = numpy.dot(p.ravel(), p.ravel())
+            ener[i0+k] = numpy.dot(p.ravel(), hp.ravel()) - e0 * norm[i0+k]
+            hp = None
+    return norm, ener
+
+def _sc_perturbers(mc, ci, h1, h2, h1e, h2e, excitation):
+    '''Sum the norm and energy of the spin-adapted perturbers over the alpha
+    and beta electron attached (excitation='cre') or removed
+    (excitation='des') from the active space'''
+    norb = mc.ncas
+    neleca, nelecb = mc.nelecas
+    eri = numpy.asarray(h2e.transpose(0,2,1,3), order='C')
+    e0 = fci.direct_spin1.energy(h1e, eri, ci, norb, (neleca,nelecb))
+    if excitation == 'des':
+        ops = ((fci.addons.des_a, (neleca-1,nelecb)),
+               (fci.addons.des_b, (neleca,nelecb-1)))
     else:
-        link_indexa, link_indexb = link_index
-    na,nlinka = link_indexa.shape[:2]
-    nb,nlinkb = link_indexb.shape[:2]
-    fdm2 = numpy.empty((norb,norb,norb,norb))
-    fdm3 = numpy.empty((norb,norb,norb,norb,norb,norb))
-    eri = numpy.ascontiguousarray(eri)
-
-    libmc.NEVPTcontract(getattr(libmc, kern),
-                        fdm2.ctypes.data_as(ctypes.c_void_p),
-                        fdm3.ctypes.data_as(ctypes.c_void_p),
-                        eri.ctypes.data_as(ctypes.c_void_p),
-                        civec.ctypes.data_as(ctypes.c_void_p),
-                        ctypes.c_int(norb),
-                        ctypes.c_int(na), ctypes.c_int(nb),
-                        ctypes.c_int(nlinka), ctypes.c_int(nlinkb),
-                        link_indexa.ctypes.data_as(ctypes.c_void_p),
-                        link_indexb.ctypes.data_as(ctypes.c_void_p))
-    for i in range(norb):
-        for j in range(i):
-            fdm3[j,:,i] = fdm3[i,:,j].transpose(1,0,2,3)
-            fdm3[j,i,i,:] += fdm2[j,:]
-            fdm3[j,:,i,j] -= fdm2[i,:]
-    return fdm3
+        ops = ((fci.addons.cre_a, (neleca+1,nelecb)),
+               (fci.addons.cre_b, (neleca,nelecb+1)))
+
+    norm = numpy.zeros(h1.shape[0])
+    ener = numpy.zeros(h1.shape[0])
+    for op, nelec1 in ops:
+        if min(nelec1) < 0 or max(nelec1) > norb:
+            continue
+        xop = lambda q: op(ci, norb, (neleca,nelecb), q)
+        n1, e1 = _perturber_norm_ener(h1, h2, xop, h1e, eri, e0, norb, nelec1,
+                                      mc.max_memory)
+        norm += n1
+        ener += e1
+    return norm, ener
 
 def _extract_orbs(mc, mo_coeff):
     ncore = mc.ncore
@@ -872,6 +963,8 @@ def trans_e1_outcore(mc, mo, max_memory=None, ioblk_size=256, tmpdir=None,
     nvir = nmo - nocc
     nav = nmo - ncore
 
+    if max_memory is None:
+        max_memory = mc.max_memory
     if tmpdir is None:
         tmpdir = lib.param.TMPDIR
     swapfile = tempfile.NamedTemporaryFile(dir=tmpdir)
@@ -881,11 +974,10 @@ def trans_e1_outcore(mc, mo, max_memory=None, ioblk_size=256, tmpdir=None,
 
     fswap = h5py.File(swapfile.name, 'r')
     klaoblks = len(fswap['0'])
-    def load_buf(r0,r1):
+    def load_buf(r0, r1, buf):
         if mol.verbose >= logger.DEBUG1:
             time1[:] = logger.timer(mol, 'between load_buf',
                                               *tuple(time1))
-        buf = numpy.empty(((r1-r0)*nav,nao_pair))
         col0 = 0
         for ic in range(klaoblks):
             dat = fswap['0/%d'%ic]
@@ -899,9 +991,25 @@ def trans_e1_outcore(mc, mo, max_memory=None, ioblk_size=256, tmpdir=None,
     time1 = [time.clock(), time.time()]
     ao_loc = numpy.array(mol.ao_loc_nr(), dtype=numpy.int32)
     cvcvfile = tempfile.NamedTemporaryFile(dir=tmpdir)
-    with h5py.File(cvcvfile.name) as f5:
-        cvcv = f5.create_dataset('eri_mo', (ncore*nvir,ncore*nvir), 'f8')
-        ppaa, papa, pacv = _trans(mo, ncore, ncas, load_buf, cvcv, ao_loc)[:3]
+
+# _trans requests the half-transformed integrals row by row (one occupied
+# orbital each time) in order.  The next io_depth rows are read in background.
+    io_depth = ao2mo.outcore.guess_io_depth(max_memory-lib.current_memory()[0],
+                                            nav*nao_pair*8/1e6)
+    nbuf = io_depth + 1
+    bufs = [numpy.empty((nav,nao_pair)) for i in range(nbuf)]
+    with lib.call_in_background(load_buf, depth=io_depth) as prefetch:
+        loading = [prefetch(i, i+1, bufs[i]) for i in range(min(io_depth, nocc))]
+        def fload(r0, r1):
+            i = r0 + io_depth
+            if i < nocc:
+                loading.append(prefetch(i, i+1, bufs[i%nbuf]))
+            loading[r0].join()
+            return bufs[r0%nbuf]
+
+        with h5py.File(cvcvfile.name) as f5:
+            cvcv = f5.create_dataset('eri_mo', (ncore*nvir,ncore*nvir), 'f8')
+            ppaa, papa, pacv = _trans(mo, ncore, ncas, fload, cvcv, ao_loc)[:3]
     time0 = logger.timer(mol, 'trans_cvcv', *time0)
     fswap.close()
     return ppaa, papa, pacv, cvcvfile
@@ -61,6 +61,17 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(e, -0.0021281408063186956, 7)
         self.assertAlmostEqual(norm, 0.0037402334190064367, 7)
 
+    def test_Sr_Si_small_memory(self):
+        mc1 = mcscf.CASCI(mf, norb, nelec)
+        mc1.__dict__.update(mc.__dict__)
+        mc1.max_memory = 1
+        norm, e = nevpt2.Sr(mc1, mc.ci, dms, eris)
+        self.assertAlmostEqual(e, -0.020245617857870119, 7)
+        self.assertAlmostEqual(norm, 0.039479583324952064, 7)
+        norm, e = nevpt2.Si(mc1, mc.ci, dms, eris)
+        self.assertAlmostEqual(e, -0.0021281408063186956, 7)
+        self.assertAlmostEqual(norm, 0.0037402334190064367, 7)
+
     def test_Sijrs(self):
         norm, e = nevpt2.Sijrs(mc, eris)
         self.assertAlmostEqual(e, -0.0071504286486605891, 7)
@@ -86,6 +97,26 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(e, -0.033866295344083322, 7)
         self.assertAlmostEqual(norm, 0.074269050656629421, 7)
 
+    def test_dm3_blocks(self):
+        f3ref = nevpt2.contract_dm3(h2e, nevpt2._dm3_blocks(dm3))
+        # One (p,q) pair per block
+        dm3_blocks = nevpt2._fci_dm3_blocks(mc.ci, norb, (nelec//2,nelec//2),
+                                            dm2, 1)
+        f3 = nevpt2.contract_dm3(h2e, dm3_blocks)
+        for key in f3ref:
+            self.assertAlmostEqual(abs(f3[key] - f3ref[key]).max(), 0, 9)
+
+        dms1 = {'1': dm1, '2': dm2, '3': None, 'f3': f3}
+        norm, e = nevpt2.Srs(mc, dms1, eris)
+        self.assertAlmostEqual(e, -0.017531645975808627, 7)
+        self.assertAlmostEqual(norm, 0.056323606234166601, 7)
+        norm, e = nevpt2.Sij(mc, dms1, eris)
+        self.assertAlmostEqual(e, -0.0035003054453081922, 7)
+        self.assertAlmostEqual(norm, 0.00852113595280264, 7)
+        norm, e = nevpt2.Sir(mc, dms1, eris)
+        self.assertAlmostEqual(e, -0.033866295344083322, 7)
+        self.assertAlmostEqual(norm, 0.074269050656629421, 7)
+
     def test_energy(self):
         e = nevpt2.NEVPT(mc).kernel()
         self.assertAlmostEqual(e, -0.10315217594326213, 7)
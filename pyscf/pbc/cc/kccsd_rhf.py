@@ -6,8 +6,11 @@
 
 import time
 import tempfile
+import copy
+from functools import reduce
 import numpy
 import numpy as np
+import scipy.linalg
 import kpoint_helper
 import h5py
 
@@ -17,8 +20,10 @@ import pyscf.ao2mo
 from pyscf.lib import logger
 import pyscf.cc
 import pyscf.cc.ccsd
+from pyscf.cc import ccsd_t
 from pyscf.pbc.cc.kccsd import get_moidx
 from pyscf.pbc.cc import kintermediates_rhf as imdk
+from pyscf.pbc.mpitools import mpi_load_balancer
 from pyscf.lib import linalg_helper
 
 #einsum = np.einsum
@@ -75,19 +80,262 @@ def kernel(cc, eris, t1=None, t2=None, max_cycle=50, tol=1e-8, tolnormt=1e-6,
 
 
 def update_amps(cc, t1, t2, eris):
+    '''CCSD amplitudes of the next iteration.  The contractions of the T2
+    equation are batched over the momentum conserving k-point blocks (see
+    _update_t2).  update_amps_loop is the equivalent implementation with
+    explicit loops over k-points.
+
+    If the integrals satisfy time-reversal symmetry (eris.minus_k is set),
+    only the blocks of the irreducible k-points ki are computed.  The other
+    blocks are generated by t[-ki,-kj,-ka] = t[ki,kj,ka]^*.
+    '''
     time0 = time.clock(), time.time()
     log = logger.Logger(cc.stdout, cc.verbose)
     nkpts, nocc, nvir = t1.shape
     fock = eris.fock
+    mo_e_o = numpy.array([fock[k].diagonal()[:nocc] for k in range(nkpts)])
+    mo_e_v = numpy.array([fock[k].diagonal()[nocc:] for k in range(nkpts)])
+
+    Foo, Fvv, Fov, Loo, Lvv, Woooo, Wvvvv, Wvoov, Wvovo = \
+            _make_imds(cc, t1, t2, eris)
+    t1new = _update_t1(cc, t1, t2, eris, Foo, Fvv, Fov)
+    time1 = log.timer_debug1('t1 and intermediates', *time0)
+    t2new = _update_t2(cc, t1, t2, eris, Loo, Lvv, Woooo, Wvvvv, Wvoov, Wvovo,
+                       cc.nproc)
+    log.timer_debug1('t2', *time1)
+
+    eia = mo_e_o[:,:,None] - mo_e_v[:,None,:]
+    t1new /= eia
+    kb = _kb_index(cc.kconserv)
+    eijab = (mo_e_o[:,None,None,:,None,None,None] +
+             mo_e_o[None,:,None,None,:,None,None] -
+             mo_e_v[None,None,:,None,None,:,None] -
+             mo_e_v[kb][:,:,:,None,None,None,:])
+    t2new /= eijab
+
+    log.timer_debug1('update t1 t2', *time0)
+    return t1new, t2new
+
+def _tr_irreducible(eris, nkpts):
+    '''The irreducible k-points under time reversal (k <= index of -k) and
+    the index array of -k.  Without time-reversal symmetry, all k-points and
+    None.'''
+    minus_k = getattr(eris, 'minus_k', None)
+    if minus_k is None:
+        return numpy.arange(nkpts), None
+    else:
+        return numpy.where(numpy.arange(nkpts) <= minus_k)[0], minus_k
+
+def _tr_fill(t, minus_k, kirr):
+    '''Generate the blocks t[ki] of the k-points ki not in kirr from the
+    time-reversal partners.  t is t1-like (nkpts,...) if t.ndim == 3,
+    otherwise t2-like (nkpts,nkpts,nkpts,...).'''
+    if minus_k is None:
+        return t
+    for ki in range(len(minus_k)):
+        if ki not in kirr:
+            if t.ndim == 3:
+                t[ki] = t[minus_k[ki]].conj()
+            else:
+                t[ki] = t[minus_k[ki]][minus_k[:,None],minus_k].conj()
+    return t
+
+def _kb_index(kconserv):
+    '''kb[ki,kj,ka] = kconserv[ki,ka,kj], the k-point of the fourth index of
+    the momentum conserving block t2[ki,kj,ka]'''
+    k = numpy.arange(kconserv.shape[0])
+    return kconserv[k[:,None,None],k[None,None,:],k[None,:,None]]
+
+def make_tau(t2, t1, fac=1):
+    '''tau[ki,kj,ka] = t2[ki,kj,ka] + fac * t1[ki] t1[kj]  (ka == ki)'''
+    nkpts = t1.shape[0]
+    tau = t2.copy()
+    for ki in range(nkpts):
+        tau[ki,:,ki] += numpy.einsum('ia,xjb->xijab', t1[ki]*fac, t1)
+    return tau
+
+def _update_t2(cc, t1, t2, eris, Loo, Lvv, Woooo, Wvvvv, Wvoov, Wvovo,
+               nproc=1):
+    '''T2 equation.  For each ki, the integrals and amplitudes of all
+    momentum conserving (kj,ka) blocks are gathered (with the index arrays
+    derived from kconserv) into batched tensors.  Each term is then one
+    batched GEMM (numpy.matmul) instead of nkpts**2 (or nkpts**3) small
+    einsum calls.  The P(ij)P(ab) partner terms are obtained at the end by
+    permuting the k-point blocks of the first half.
+
+    If nproc > 1, the k-point blocks (ki for the Woooo term and the
+    P(ij)P(ab) terms, ka for the Wvvvv term) are distributed over nproc
+    forked worker processes.  The results are accumulated in shared memory
+    maps.
+    '''
+    log = logger.Logger(cc.stdout, cc.verbose)
+    nkpts, nocc, nvir = t1.shape
+    kconserv = cc.kconserv
+    kb = _kb_index(kconserv)
+    kirr, minus_k = _tr_irreducible(eris, nkpts)
+    kpts = numpy.arange(nkpts)
+    kx = kpts[:,None,None]  # first index of the (kj,ka,kk) batches
+    ky = kpts[None,:,None]  # second index
+    kz = kpts[None,None,:]  # third index (summed k-point kk)
+    t1T = t1.transpose(0,2,1)
+    dtype = numpy.result_type(t1, t2, eris.oovv[0,0,0])
+
+    tau = make_tau(t2, t1)
+
+    if nproc > 1:
+        t2new = ccsd_t._memmap_tmp(t2.shape, dtype)
+        half = ccsd_t._memmap_tmp(t2.shape, dtype)
+        for ki in range(nkpts):
+            t2new[ki] = numpy.asarray(eris.oovv[ki]).conj()
+    else:
+        t2new = numpy.array(eris.oovv).conj().astype(dtype)
+        half = numpy.zeros(t2.shape, dtype)
+
+    def contract_ki(ki, ovov, vovv, voov, ooov):
+        #: Woooo term
+        #: t2new[ki,kj,ka] += einsum('klij,klab->ijab', Woooo[kk,kl,ki], tau[kk,kl,ka])
+        #: where kk = kconserv[kj,kl,ki]
+        kk = kconserv[kpts[:,None],kpts,ki]  # kk[kj,kl]
+        w = Woooo[kk,kpts[None,:],ki]
+        w = w.transpose(0,4,5,1,2,3).reshape(nkpts,nocc**2,nkpts*nocc**2)
+        t = tau[kk[:,:,None],kpts[None,:,None],kpts[None,None,:]]
+        t = t.transpose(0,2,1,3,4,5,6).reshape(nkpts,nkpts,nkpts*nocc**2,nvir**2)
+        t2new[ki] += numpy.matmul(w[:,None], t).reshape(nkpts,nkpts,nocc,nocc,nvir,nvir)
+        w = t = None
+
+        #: The first half of the P(ij)P(ab) symmetrized terms
+        #: half[ki,kj,ka] += einsum('ac,ijcb->ijab', Lvv[ka], t2[ki,kj,ka])
+        half[ki] = numpy.matmul(Lvv[None,:,None,None], t2[ki])
+        kbi = kb[ki]  # kb[kj,ka]
+        #: half[ki,kj,ka] -= einsum('ki,kjab->ijab', Loo[ki], t2[ki,kj,ka])
+        half[ki] -= lib.einsum('ki,xykjab->xyijab', Loo[ki], t2[ki])
+
+        #: tmp2 = vovv[kj,ki,kb].transpose(3,2,1,0).conj() - einsum('kbic,ka->abic', ovov[ka,kb,ki], t1[ka])
+        #: half[ki,kj,ka] += einsum('abic,jc->ijab', tmp2, t1[kj])
+        ovov = numpy.asarray(ovov[:,:,ki])[kpts[None,:],kbi]
+        ovov = ovov.reshape(nkpts,nkpts,nocc,-1)
+        tmp2 = numpy.matmul(t1T[None], ovov).reshape(nkpts,nkpts,nvir,nvir,nocc,nvir)
+        vovv = numpy.asarray(vovv[:,ki])[kpts[:,None],kbi]
+        tmp2 = vovv.transpose(0,1,5,4,3,2).conj() - tmp2
+        tmp = numpy.matmul(tmp2.reshape(nkpts,nkpts,-1,nvir), t1T[:,None])
+        half[ki] += tmp.reshape(nkpts,nkpts,nvir,nvir,nocc,nocc).transpose(0,1,4,5,2,3)
+        ovov = vovv = tmp2 = tmp = None
+
+        #: tmp2 = ooov[kj,ki,kb].transpose(3,2,1,0).conj() + einsum('akic,jc->akij', voov[ka,kb,ki], t1[kj])
+        #: half[ki,kj,ka] -= einsum('akij,kb->ijab', tmp2, t1[kb])
+        voov = numpy.asarray(voov[:,:,ki])[kpts[None,:],kbi]
+        tmp2 = numpy.matmul(voov.reshape(nkpts,nkpts,-1,nvir), t1T[:,None])
+        tmp2 = tmp2.reshape(nkpts,nkpts,nvir,nocc,nocc,nocc)
+        ooov = numpy.asarray(ooov[:,ki])[kpts[:,None],kbi]
+        tmp2 += ooov.transpose(0,1,5,4,3,2).conj()
+        tmp2 = tmp2.transpose(0,1,4,5,2,3).reshape(nkpts,nkpts,-1,nocc)
+        half[ki] -= numpy.matmul(tmp2, t1[kbi]).reshape(nkpts,nkpts,nocc,nocc,nvir,nvir)
+        voov = ooov = tmp2 = None
+
+        #: kc = kconserv[ka,ki,kk]
+        #: half[ki,kj,ka] += einsum('akic,kjcb->ijab', 2*Wvoov[ka,kk,ki]-Wvovo[ka,kk,kc].transpose(0,1,3,2), t2[kk,kj,kc])
+        #: half[ki,kj,ka] -= einsum('akic,kjbc->ijab', Wvoov[ka,kk,ki], t2[kk,kj,kb])
+        kc = kconserv[kpts[:,None],ki,kpts]  # kc[ka,kk]
+        wvoov = Wvoov[kpts[:,None],kpts,ki]
+        w = wvoov*2 - Wvovo[kpts[:,None],kpts,kc].transpose(0,1,2,3,5,4)
+        w = w.transpose(0,2,4,1,3,5).reshape(nkpts,nvir*nocc,-1)
+        t = t2[kz,kx,kc[None,:,:]].transpose(0,1,2,3,5,4,6)
+        t = t.reshape(nkpts,nkpts,nkpts*nocc*nvir,nocc*nvir)
+        tmp = numpy.matmul(w[None], t)
+        w = wvoov.transpose(0,2,4,1,3,5).reshape(nkpts,nvir*nocc,-1)
+        t = t2[kz,kx,kbi[:,:,None]].transpose(0,1,2,3,6,4,5)
+        t = t.reshape(nkpts,nkpts,nkpts*nocc*nvir,nocc*nvir)
+        tmp -= numpy.matmul(w[None], t)
+        tmp = tmp.reshape(nkpts,nkpts,nvir,nocc,nocc,nvir)
+        half[ki] += tmp.transpose(0,1,3,4,2,5)
+        wvoov = w = t = tmp = None
+
+        #: kc = kconserv[kk,ka,kj]
+        #: half[ki,kj,ka] -= einsum('bkci,kjac->ijab', Wvovo[kb,kk,kc], t2[kk,kj,ka])
+        kc = kconserv[kz,ky,kx]  # kc[kj,ka,kk]
+        w = Wvovo[kbi[:,:,None],kz,kc].transpose(0,1,3,6,2,4,5)
+        w = w.reshape(nkpts,nkpts,nvir*nocc,-1)
+        t = t2[kz,kx,ky].transpose(0,1,2,3,6,4,5)
+        t = t.reshape(nkpts,nkpts,nkpts*nocc*nvir,nocc*nvir)
+        tmp = numpy.matmul(w, t).reshape(nkpts,nkpts,nvir,nocc,nocc,nvir)
+        half[ki] -= tmp.transpose(0,1,3,4,5,2)
+        w = t = tmp = None
+
+    #: Wvvvv term, blocked by the virtual index a of Wvvvv
+    #: t2new[ki,kj,ka] += einsum('abcd,ijcd->ijab', Wvvvv[ka,kb,kc], tau[ki,kj,kc])
+    max_memory = max(0, cc.max_memory - lib.current_memory()[0]) / max(1, nproc)
+    blksize = int(max_memory*1e6/16/(nkpts*nvir**3*2))
+    blksize = max(1, min(nvir, blksize))
+    taut = tau.transpose(0,1,3,4,2,5,6).reshape(nkpts,nkpts,nocc**2,nkpts*nvir**2)
+    def contract_ka(ka, Wvvvv):
+        for kbi in range(nkpts):
+            kj = kconserv[ka,kirr,kbi]
+            tauab = taut[kirr,kj].reshape(len(kirr)*nocc**2,-1)
+            for a0, a1 in lib.prange(0, nvir, blksize):
+                w = numpy.asarray(Wvvvv[ka,kbi,:,a0:a1])
+                w = w.transpose(1,2,0,3,4).reshape((a1-a0)*nvir,-1)
+                tmp = lib.dot(tauab, w.T).reshape(len(kirr),nocc,nocc,a1-a0,nvir)
+                t2new[kirr,kj,ka,:,:,a0:a1] += tmp
+
+    _run_kpt_blocks('t2 ki', contract_ki, kirr, nproc, log,
+                    (eris.ovov, eris.vovv, eris.voov, eris.ooov))
+    _run_kpt_blocks('t2 Wvvvv ka', contract_ka, kpts, nproc, log, (Wvvvv,))
+    taut = tau = None
+    _tr_fill(t2new, minus_k, kirr)
+    _tr_fill(half, minus_k, kirr)
+
+    #: P(ij)P(ab): t2new[ki,kj,ka] += half[kj,ki,kb].transpose(1,0,3,2)
+    t2out = half + half[ky,kx,kb].transpose(0,1,2,4,3,6,5)
+    t2out += t2new
+    return t2out
+
+def _run_kpt_blocks(label, fn, klist, nproc, log, h5dat=(), blksize=1):
+    '''Call fn(k, *h5dat) for the k-points k in klist.  The k-points are split
+    into blocks with the block decomposition of the MPI load balancer
+    (pbc.mpitools.mpi_load_balancer).  If nproc > 1, the blocks are dispatched
+    dynamically to nproc forked worker processes (see lib.fork_imap).  fn must
+    save its results in memory shared with the parent process.
+
+    The HDF5 library state inherited by the forked processes does not allow
+    concurrent reads.  The arrays in h5dat should be held in memory or in
+    memory maps if nproc > 1 (see _ERIS and imdk.cc_Wvvvv).  HDF5 datasets
+    are copied to temporary memory maps.
+    '''
+    blocks = mpi_load_balancer.make_blocks((range(len(klist)),), (blksize,))
+    tasks = [[klist[k] for k in blocks[0][i]]
+             for i, in mpi_load_balancer.block_tasks(blocks)]
+    if nproc <= 1 or len(tasks) <= 1:
+        for ks in tasks:
+            for k in ks:
+                fn(k, *h5dat)
+            log.debug1('%s block %s', label, ks)
+        return
+
+    h5dat = [_h5_to_memmap(x) for x in h5dat]
+    def fn_block(*ks):
+        for k in ks:
+            fn(k, *h5dat)
+    for i, res in lib.fork_imap(fn_block, tasks, nproc, label + ' block'):
+        log.debug1('%s block %s', label, tasks[i])
+
+def _h5_to_memmap(dat):
+    if isinstance(dat, kpoint_helper.TimeReversalArray):
+        dat = copy.copy(dat)
+        dat.data = _h5_to_memmap(dat.data)
+        return dat
+    elif isinstance(dat, h5py.Dataset):
+        buf = ccsd_t._memmap_tmp(dat.shape, dat.dtype)
+        for i in range(dat.shape[0]):
+            buf[i] = dat[i]
+        return buf
+    else:
+        return dat
 
-    fov = fock[:,:nocc,nocc:]
+def _make_imds(cc, t1, t2, eris):
+    nkpts, nocc, nvir = t1.shape
+    fock = eris.fock
     foo = fock[:,:nocc,:nocc]
     fvv = fock[:,nocc:,nocc:]
-
-    #mo_e = eris.fock.diagonal()
-    #eia = mo_e[:nocc,None] - mo_e[None,nocc:]
-    #eijab = lib.direct_sum('ia,jb->ijab',eia,eia)
-
     kconserv = cc.kconserv
 
     Foo = imdk.cc_Foo(t1,t2,eris,kconserv)
@@ -96,7 +344,7 @@ def update_amps(cc, t1, t2, eris):
     Loo = imdk.Loo(t1,t2,eris,kconserv)
     Lvv = imdk.Lvv(t1,t2,eris,kconserv)
     Woooo = imdk.cc_Woooo(t1,t2,eris,kconserv)
-    Wvvvv = imdk.cc_Wvvvv(t1,t2,eris,kconserv)
+    Wvvvv = imdk.cc_Wvvvv(t1,t2,eris,kconserv,memmap=(cc.nproc > 1))
     Wvoov = imdk.cc_Wvoov(t1,t2,eris,kconserv)
     Wvovo = imdk.cc_Wvovo(t1,t2,eris,kconserv)
 
@@ -106,10 +354,18 @@ def update_amps(cc, t1, t2, eris):
         Fvv[k] -= np.diag(np.diag(fvv[k]))
         Loo[k] -= np.diag(np.diag(foo[k]))
         Lvv[k] -= np.diag(np.diag(fvv[k]))
+    return Foo, Fvv, Fov, Loo, Lvv, Woooo, Wvvvv, Wvoov, Wvovo
+
+def _update_t1(cc, t1, t2, eris, Foo, Fvv, Fov):
+    nkpts, nocc, nvir = t1.shape
+    fov = eris.fock[:,:nocc,nocc:]
+    kconserv = cc.kconserv
+
+    kirr, minus_k = _tr_irreducible(eris, nkpts)
 
     # T1 equation
     t1new = np.array(fov).astype(t1.dtype).conj()
-    for ka in range(nkpts):
+    for ka in kirr:
         ki = ka
         # kc == ki; kk == ka
         t1new[ka] += -2.*einsum('kc,ka,ic->ia',fov[ki],t1[ka],t1[ki])
@@ -145,6 +401,22 @@ def update_amps(cc, t1, t2, eris):
                 if kk == ka and kl == kc:
                     tau_term_1 += einsum('ka,lc->klac',t1[ka],t1[kc])
                 t1new[ka] += -einsum('klic,klac->ia',Sooov,tau_term_1)
+    return _tr_fill(t1new, minus_k, kirr)
+
+def update_amps_loop(cc, t1, t2, eris):
+    '''Reference implementation of update_amps with explicit loops over the
+    k-point blocks'''
+    time0 = time.clock(), time.time()
+    log = logger.Logger(cc.stdout, cc.verbose)
+    nkpts, nocc, nvir = t1.shape
+    fock = eris.fock
+    foo = fock[:,:nocc,:nocc]
+    fvv = fock[:,nocc:,nocc:]
+    kconserv = cc.kconserv
+
+    Foo, Fvv, Fov, Loo, Lvv, Woooo, Wvvvv, Wvoov, Wvovo = \
+            _make_imds(cc, t1, t2, eris)
+    t1new = _update_t1(cc, t1, t2, eris, Foo, Fvv, Fov)
 
     # T2 equation
     t2new = np.array(eris.oovv).conj()
@@ -258,6 +530,22 @@ def update_amps(cc, t1, t2, eris):
 
 
 def energy(cc, t1, t2, eris):
+    nkpts, nocc, nvir = t1.shape
+    fock = eris.fock
+    kpts = numpy.arange(nkpts)
+    kb = _kb_index(cc.kconserv)
+    e = 2*numpy.einsum('kia,kia', fock[:,:nocc,nocc:], t1)
+    tau = make_tau(t2, t1)
+    for ki in range(nkpts):
+        oovv = numpy.asarray(eris.oovv[ki])
+        e += 2*numpy.einsum('xyijab,xyijab', tau[ki], oovv)
+        e -= numpy.einsum('xyijab,xyijba', tau[ki], oovv[kpts[:,None],kb[ki]])
+    e /= nkpts
+    return e.real
+
+def energy_loop(cc, t1, t2, eris):
+    '''Reference implementation of energy with explicit loops over the
+    k-point blocks'''
     nkpts, nocc, nvir = t1.shape
     kconserv = cc.kconserv
     fock = eris.fock
@@ -313,7 +601,15 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
     def __init__(self, mf, frozen=0, mo_coeff=None, mo_occ=None):
         pyscf.cc.ccsd.CCSD.__init__(self, mf, frozen, mo_coeff, mo_occ)
         self.max_space = 20
-        self._keys = self._keys.union(['max_space'])
+# Number of local worker processes for the T2 equation.  The k-point blocks
+# are distributed over nproc forked processes.  It does not require MPI.
+        self.nproc = 1
+# Time-reversal symmetry t[-ki,-kj,-ka] = t[ki,kj,ka]^*.  The orbitals of -k
+# are chosen to be the complex conjugate of the orbitals of k.  Only the
+# irreducible k-point blocks of the integrals, the T1/T2 equations and the
+# Wvvvv intermediate are computed.
+        self.time_reversal = False
+        self._keys = self._keys.union(['max_space', 'nproc', 'time_reversal'])
         self.kpts = mf.kpts
         self.mo_energy = mf.mo_energy
         self.nkpts = len(self.kpts)
@@ -338,6 +634,10 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
 
     def dump_flags(self):
         pyscf.cc.ccsd.CCSD.dump_flags(self)
+        if self.nproc > 1:
+            logger.info(self, 'nproc = %d', self.nproc)
+        if self.time_reversal:
+            logger.info(self, 'time_reversal = %s', self.time_reversal)
 
     def init_amps(self, eris):
         time0 = time.clock(), time.time()
@@ -933,16 +1233,28 @@ class _ERIS:
         dtype = cc.mo_coeff[0].dtype
         self.mo_coeff = numpy.zeros((nkpts,nao,nmo), dtype=dtype)
         self.fock = numpy.zeros((nkpts,nmo,nmo), dtype=dtype)
+        log = logger.Logger(cc.stdout, cc.verbose)
         if mo_coeff is None:
             for kp in range(nkpts):
                 self.mo_coeff[kp] = cc.mo_coeff[kp][:,moidx[kp]]
             mo_coeff = self.mo_coeff
+            mo_energy = [cc.mo_energy[kp][moidx[kp]] for kp in range(nkpts)]
+            self.minus_k = None
+            if cc.time_reversal:
+                self.minus_k, mo_tr, mo_energy = \
+                        _time_reversal_gauge(cc, mo_coeff, mo_energy, log)
+                mo_coeff[:] = mo_tr
             for kp in range(nkpts):
-                self.fock[kp] = numpy.diag(cc.mo_energy[kp][moidx[kp]]).astype(dtype)
+                self.fock[kp] = numpy.diag(mo_energy[kp]).astype(dtype)
         else:  # If mo_coeff is not canonical orbital
             for kp in range(nkpts):
                 self.mo_coeff[kp] = mo_coeff[kp][:,moidx[kp]]
             mo_coeff = self.mo_coeff
+            self.minus_k = None
+            if cc.time_reversal:
+                self.minus_k, mo_tr = \
+                        _time_reversal_gauge(cc, mo_coeff, None, log)[:2]
+                mo_coeff[:] = mo_tr
             dm = cc._scf.make_rdm1(cc.mo_coeff, cc.mo_occ)
             # Don't use get_veff(), because cc._scf might be DFT,
             # but veff should be Fock, not Kohn-Sham.
@@ -961,11 +1273,16 @@ class _ERIS:
         fao2mo = cc._scf.with_df.ao2mo
 
         kconserv = cc.kconserv
-        khelper = cc.khelper
+        minus_k = self.minus_k
+        if minus_k is None:
+            khelper = cc.khelper
+        else:
+            khelper = kpoint_helper.unique_pqr_list(cc._scf.cell, cc.kpts,
+                                                    time_reversal=True)
         unique_klist = khelper.get_uniqueList()
         nUnique_klist = khelper.nUnique
+        log.debug('%d unique k-point blocks of the integrals', nUnique_klist)
 
-        log = logger.Logger(cc.stdout, cc.verbose)
         if (method == 'incore' and (mem_incore+mem_now < cc.max_memory)
             or cc.mol.incore_anyway):
             log.info('using incore ERI storage')
@@ -999,25 +1316,56 @@ class _ERIS:
             self.ovov = eri[:,:,:,:nocc,nocc:,:nocc,nocc:].copy() / nkpts
             self.voov = eri[:,:,:,nocc:,:nocc,:nocc,nocc:].copy() / nkpts
             self.vovv = eri[:,:,:,nocc:,:nocc,nocc:,nocc:].copy() / nkpts
-            self.vvvv = eri[:,:,:,nocc:,nocc:,nocc:,nocc:].copy() / nkpts
+            if minus_k is None:
+                self.vvvv = eri[:,:,:,nocc:,nocc:,nocc:,nocc:].copy() / nkpts
+            else:
+                # Only the time-reversal irreducible blocks of vvvv are kept
+                self.vvvv = kpoint_helper.TimeReversalArray(minus_k, (nvir,)*4, dtype)
+                kirr = self.vvvv.irreducible()
+                self.vvvv.data[:] = eri[kirr][:,nocc:,nocc:,nocc:,nocc:] / nkpts
         else:
             log.info('using HDF5 ERI storage')
             _tmpfile1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
             self.feri1 = h5py.File(_tmpfile1.name)
 
             self.oooo = self.feri1.create_dataset('oooo', (nkpts,nkpts,nkpts,nocc,nocc,nocc,nocc), dtype.char)
-            self.ooov = self.feri1.create_dataset('ooov', (nkpts,nkpts,nkpts,nocc,nocc,nocc,nvir), dtype.char)
             self.oovv = self.feri1.create_dataset('oovv', (nkpts,nkpts,nkpts,nocc,nocc,nvir,nvir), dtype.char)
-            self.ovov = self.feri1.create_dataset('ovov', (nkpts,nkpts,nkpts,nocc,nvir,nocc,nvir), dtype.char)
-            self.voov = self.feri1.create_dataset('voov', (nkpts,nkpts,nkpts,nvir,nocc,nocc,nvir), dtype.char)
-            self.vovv = self.feri1.create_dataset('vovv', (nkpts,nkpts,nkpts,nvir,nocc,nvir,nvir), dtype.char)
-            self.vvvv = self.feri1.create_dataset('vvvv', (nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), dtype.char)
+            if cc.nproc > 1:
+                # The blocks read by the forked worker processes in update_amps
+                # are stored in memory maps.  HDF5 does not allow concurrent
+                # reads in the forked processes.
+                self.ooov = ccsd_t._memmap_tmp((nkpts,nkpts,nkpts,nocc,nocc,nocc,nvir), dtype)
+                self.ovov = ccsd_t._memmap_tmp((nkpts,nkpts,nkpts,nocc,nvir,nocc,nvir), dtype)
+                self.voov = ccsd_t._memmap_tmp((nkpts,nkpts,nkpts,nvir,nocc,nocc,nvir), dtype)
+                self.vovv = ccsd_t._memmap_tmp((nkpts,nkpts,nkpts,nvir,nocc,nvir,nvir), dtype)
+            else:
+                self.ooov = self.feri1.create_dataset('ooov', (nkpts,nkpts,nkpts,nocc,nocc,nocc,nvir), dtype.char)
+                self.ovov = self.feri1.create_dataset('ovov', (nkpts,nkpts,nkpts,nocc,nvir,nocc,nvir), dtype.char)
+                self.voov = self.feri1.create_dataset('voov', (nkpts,nkpts,nkpts,nvir,nocc,nocc,nvir), dtype.char)
+                self.vovv = self.feri1.create_dataset('vovv', (nkpts,nkpts,nkpts,nvir,nocc,nvir,nvir), dtype.char)
+            if minus_k is None:
+                self.vvvv = self.feri1.create_dataset('vvvv', (nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), dtype.char)
+            else:
+                # Only the time-reversal irreducible blocks of vvvv are stored
+                self.vvvv = kpoint_helper.TimeReversalArray(minus_k, (nvir,)*4, dtype,
+                                                            self.feri1, 'vvvv')
+
+            # The blocks (kp,kq,kr) whose time-reversal partner
+            # (-kp,-kq,-kr) comes first are copied from the partner
+            def tr_partner(kp, kq, kr):
+                if minus_k is not None:
+                    mk = tuple(minus_k[[kp,kq,kr]])
+                    if mk != (kp, kq, kr):
+                        return mk
 
             # <ij|pq>  = (ip|jq)
             cput1 = time.clock(), time.time()
             for kp in range(nkpts):
                 for kq in range(nkpts):
                     for kr in range(nkpts):
+                        mk = tr_partner(kp, kq, kr)
+                        if mk is not None and mk < (kp, kq, kr):
+                            continue
                         ks = kconserv[kp,kq,kr]
                         orbo_p = mo_coeff[kp,:,:nocc]
                         orbo_r = mo_coeff[kr,:,:nocc]
@@ -1029,6 +1377,12 @@ class _ERIS:
                         self.oooo[kp,kr,kq,:,:,:,:] = buf_kpt[:,:,:nocc,:nocc]
                         self.ooov[kp,kr,kq,:,:,:,:] = buf_kpt[:,:,:nocc,nocc:]
                         self.oovv[kp,kr,kq,:,:,:,:] = buf_kpt[:,:,nocc:,nocc:]
+                        if mk is not None:
+                            mkp, mkq, mkr = mk
+                            buf_kpt = buf_kpt.conj()
+                            self.oooo[mkp,mkr,mkq,:,:,:,:] = buf_kpt[:,:,:nocc,:nocc]
+                            self.ooov[mkp,mkr,mkq,:,:,:,:] = buf_kpt[:,:,:nocc,nocc:]
+                            self.oovv[mkp,mkr,mkq,:,:,:,:] = buf_kpt[:,:,nocc:,nocc:]
             cput1 = log.timer_debug1('transforming oopq', *cput1)
 
             # <ia|pq> = (ip|aq)
@@ -1036,6 +1390,9 @@ class _ERIS:
             for kp in range(nkpts):
                 for kq in range(nkpts):
                     for kr in range(nkpts):
+                        mk = tr_partner(kp, kq, kr)
+                        if mk is not None and mk < (kp, kq, kr):
+                            continue
                         ks = kconserv[kp,kq,kr]
                         orbo_p = mo_coeff[kp,:,:nocc]
                         orbv_r = mo_coeff[kr,:,nocc:]
@@ -1046,6 +1403,13 @@ class _ERIS:
                         self.ovov[kp,kr,kq,:,:,:,:] = buf_kpt[:,:,:nocc,nocc:]
                         self.vovv[kr,kp,ks,:,:,:,:] = buf_kpt[:,:,nocc:,nocc:].transpose(1,0,3,2)
                         self.voov[kr,kp,ks,:,:,:,:] = buf_kpt[:,:,nocc:,:nocc].transpose(1,0,3,2)
+                        if mk is not None:
+                            mkp, mkq, mkr = mk
+                            mks = minus_k[ks]
+                            buf_kpt = buf_kpt.conj()
+                            self.ovov[mkp,mkr,mkq,:,:,:,:] = buf_kpt[:,:,:nocc,nocc:]
+                            self.vovv[mkr,mkp,mks,:,:,:,:] = buf_kpt[:,:,nocc:,nocc:].transpose(1,0,3,2)
+                            self.voov[mkr,mkp,mks,:,:,:,:] = buf_kpt[:,:,nocc:,:nocc].transpose(1,0,3,2)
             cput1 = log.timer_debug1('transforming ovpq', *cput1)
 
 #            # Without k-point symmetry
@@ -1087,10 +1451,78 @@ class _ERIS:
                     self.vvvv[kr,kp,ks,:,a,:,:] = buf_kpt.transpose(1,0,3,2)[:,0,:,:]
                     self.vvvv[kq,ks,kp,:,:,a,:] = buf_kpt.transpose(2,3,0,1).conj()[:,:,0,:]
                     self.vvvv[ks,kq,kr,:,:,:,a] = buf_kpt.transpose(3,2,1,0).conj()[:,:,:,0]
+                    # The time-reversal partners share the storage of these
+                    # blocks in the TimeReversalArray
             cput1 = log.timer_debug1('transforming vvvv', *cput1)
 
         log.timer('CCSD integral transformation', *cput0)
 
+def _time_reversal_gauge(cc, mo_coeff, mo_energy, log):
+    '''Choose the orbitals of -k to be the complex conjugate of the orbitals
+    of k, and real orbitals at the k-points with k = -k (mod G).  Then the
+    integrals and amplitudes satisfy the time-reversal symmetry
+    X[-k1,-k2,-k3] = X[k1,k2,k3]^*.  The input mo_coeff and mo_energy are not
+    modified.
+
+    Returns:
+        minus_k, mo_coeff, mo_energy.  minus_k is the index array of -k, or
+        None if the time-reversal symmetry cannot be used (-k not in kpts or
+        the orbitals cannot be made real).  In that case, the input
+        mo_coeff and mo_energy are returned.
+    '''
+    minus_k = kpoint_helper.get_minus_k(cc._scf.cell, cc.kpts)
+    if (minus_k < 0).any():
+        log.warn('-k not in kpts.  Time-reversal symmetry is not used.')
+        return None, mo_coeff, mo_energy
+
+    mo_coeff_in, mo_energy_in = mo_coeff, mo_energy
+    mo_coeff = numpy.array(mo_coeff, copy=True)
+    if mo_energy is not None:
+        mo_energy = [numpy.array(e, copy=True) for e in mo_energy]
+    nkpts = len(mo_coeff)
+    nocc = cc.nocc
+    nmo = mo_coeff.shape[2]
+    if numpy.iscomplexobj(mo_coeff):
+        s = cc._scf.get_ovlp()
+    for k in range(nkpts):
+        if minus_k[k] > k:
+            mo_coeff[minus_k[k]] = mo_coeff[k].conj()
+            if mo_energy is not None:
+                mo_energy[minus_k[k]] = mo_energy[k]
+        elif minus_k[k] == k and numpy.iscomplexobj(mo_coeff):
+            # Groups of (nearly) degenerate orbitals are transformed together
+            if mo_energy is None:
+                groups = [numpy.arange(nocc), numpy.arange(nocc,nmo)]
+            else:
+                groups = []
+                for p0, p1 in ((0, nocc), (nocc, nmo)):
+                    e = mo_energy[k][p0:p1]
+                    bounds = numpy.where(abs(numpy.diff(e)) > 1e-4)[0] + 1
+                    groups.extend([g+p0 for g in
+                                   numpy.split(numpy.arange(p1-p0), bounds)])
+            c = mo_coeff[k]
+            sk = s[k].real
+            for idx in groups:
+                n = len(idx)
+                if n == 0:
+                    continue
+                # The real and imaginary parts span the real subspace
+                x = numpy.hstack((c[:,idx].real, c[:,idx].imag))
+                w, u = scipy.linalg.eigh(reduce(numpy.dot, (x.T, sk, x)))
+                if w[-n-1] > 1e-6:
+                    log.warn('Orbitals at k-point %d cannot be made real.  '
+                             'Time-reversal symmetry is not used.', k)
+                    return None, mo_coeff_in, mo_energy_in
+                x = numpy.dot(x, u[:,-n:] / numpy.sqrt(w[-n:]))
+                if mo_energy is not None and n > 1:
+                    # Canonicalize within the group
+                    cx = reduce(numpy.dot, (c[:,idx].T.conj(), s[k], x))
+                    fx = reduce(numpy.dot, (cx.T.conj() * mo_energy[k][idx], cx))
+                    x = numpy.dot(x, scipy.linalg.eigh(fx.real)[1])
+                c[:,idx] = x
+    log.debug('Time-reversal symmetry: -k = %s', minus_k)
+    return minus_k, mo_coeff, mo_energy
+
 def verify_eri_symmetry(nmo, nkpts, kconserv, eri):
     # Check ERI symmetry
     maxdiff = 0.0
@@ -8,6 +8,8 @@ import tempfile
 import numpy as np
 import h5py
 from pyscf import lib
+from pyscf.cc import ccsd_t
+from pyscf.pbc.cc import kpoint_helper
 
 #einsum = np.einsum
 einsum = lib.einsum
@@ -121,7 +123,9 @@ def cc_Woooo(t1,t2,eris,kconserv):
                 Wklij[kl,kk,kj] = Wklij[kk,kl,ki].transpose(1,0,3,2)
     return Wklij
 
-def cc_Wvvvv(t1,t2,eris,kconserv):
+def cc_Wvvvv(t1,t2,eris,kconserv,memmap=False):
+    '''If memmap is set, W is stored in a temporary memory map instead of an
+    HDF5 file, to be read by forked processes (kccsd_rhf._update_t2).'''
     # Incore:
     #nkpts, nocc, nvir = t1.shape
     #Wabcd = np.array(eris.vvvv, copy=True)
@@ -140,13 +144,38 @@ def cc_Wvvvv(t1,t2,eris,kconserv):
     ## HDF5
     if t1.dtype == np.complex: ds_type = 'c16'
     else: ds_type = 'f8'
-    _tmpfile1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
-    fimd = h5py.File(_tmpfile1.name)
+    if not memmap:
+        _tmpfile1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        fimd = h5py.File(_tmpfile1.name)
     nkpts, nocc, nvir = t1.shape
-    Wabcd = fimd.create_dataset('vvvv', (nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), ds_type) 
+
+    # With time-reversal symmetry (eris.minus_k), W[-ka,-kb,-kc] = W[ka,kb,kc]^*.
+    # Only one block of each time-reversal pair is stored.  The blocks whose
+    # time-reversal partner is computed earlier are skipped.
+    minus_k = getattr(eris, 'minus_k', None)
+    if minus_k is None and memmap:
+        Wabcd = ccsd_t._memmap_tmp((nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), ds_type)
+    elif minus_k is None:
+        Wabcd = fimd.create_dataset('vvvv', (nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), ds_type) 
+    elif memmap:
+        Wabcd = kpoint_helper.TimeReversalArray(minus_k, (nvir,)*4, ds_type,
+                                                memmap=True)
+    else:
+        Wabcd = kpoint_helper.TimeReversalArray(minus_k, (nvir,)*4, ds_type,
+                                                fimd, 'vvvv')
+    def tr_skip(ka, kb, kc):
+        if minus_k is None:
+            return False
+        mka, mkb, mkc = minus_k[[ka,kb,kc]]
+        if mkb > mka:  # stored as the permutation partner
+            mka, mkb, mkc = mkb, mka, kconserv[mka,mkc,mkb]
+        return (mka, mkb, mkc) < (ka, kb, kc)
+
     for ka in range(nkpts):
         for kb in range(ka+1):
             for kc in range(nkpts):
+                if tr_skip(ka, kb, kc):
+                    continue
                 kd = kconserv[ka,kc,kb]
                 # avoid transpose in loop
                 ovvv = np.array(eris.vovv[kb,ka,kd]).transpose(1,0,3,2)
@@ -159,10 +188,11 @@ def cc_Wvvvv(t1,t2,eris,kconserv):
             # Be careful about making this term only after all the others are created
             for kb in range(ka+1):
                 for kc in range(nkpts):
+                    if tr_skip(ka, kb, kc):
+                        continue
                     kd = kconserv[ka,kc,kb]
                     for a in range(nvir):
                         Wabcd[kb,ka,kd,a,:] = Wabcd[ka,kb,kc,:,a].transpose(0,2,1)
-
     return Wabcd
 
 def cc_Wvoov(t1,t2,eris,kconserv):
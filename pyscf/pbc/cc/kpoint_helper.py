@@ -11,14 +11,137 @@ import numpy
 
 DEBUG = 0
 
+def get_minus_k(cell, kpts):
+    '''Index of the k-point -k (mod G) for each k in kpts.  The index is -1
+    if -k is not in the list of k-points.'''
+    scaled_kpts = cell.get_scaled_kpts(kpts)
+    ksum = scaled_kpts[:,None,:] + scaled_kpts[None,:,:]
+    is_G = (abs(ksum - numpy.round(ksum)) < 1e-9).all(axis=2)
+    minus_k = numpy.empty(len(kpts), dtype=int)
+    for k in range(len(kpts)):
+        idx = numpy.where(is_G[k])[0]
+        if len(idx) > 0:
+            minus_k[k] = idx[0]
+        else:
+            minus_k[k] = -1
+    return minus_k
+
+class TimeReversalArray(object):
+    '''Array X[k1,k2,k3,...] with the time-reversal symmetry
+    X[-k1,-k2,-k3] = X[k1,k2,k3]^*.  Only one block of each pair (k1,k2,k3),
+    (-k1,-k2,-k3) is stored in self.data.  The other block is generated on
+    demand.  The first three indices can be integers or slices.  Blocks are
+    written with integer k-point indices.
+
+    Args:
+        minus_k : 1D array
+            The index of -k for each k-point (see get_minus_k).
+        blk_shape : tuple
+            The shape of a (k1,k2,k3) block.
+
+    Kwargs:
+        h5grp : h5py File or Group
+            If given, the blocks are saved in the dataset h5grp[dataname].
+            Otherwise they are held in memory.
+        memmap : bool
+            If h5grp is not given, whether to hold the blocks in a temporary
+            memory map which can be shared with forked processes.
+    '''
+    def __init__(self, minus_k, blk_shape, dtype, h5grp=None, dataname='data',
+                 memmap=False):
+        nkpts = len(minus_k)
+        self.minus_k = minus_k
+        self.index = numpy.empty((nkpts,nkpts,nkpts), dtype=int)
+        self.conj = numpy.zeros((nkpts,nkpts,nkpts), dtype=bool)
+        n = 0
+        for k1 in range(nkpts):
+            for k2 in range(nkpts):
+                for k3 in range(nkpts):
+                    mk = (minus_k[k1], minus_k[k2], minus_k[k3])
+                    if mk < (k1, k2, k3):
+                        self.index[k1,k2,k3] = self.index[mk]
+                        self.conj[k1,k2,k3] = True
+                    else:
+                        self.index[k1,k2,k3] = n
+                        n += 1
+        self.dtype = numpy.dtype(dtype)
+        self.shape = (nkpts,nkpts,nkpts) + tuple(blk_shape)
+        self.ndim = len(self.shape)
+        if h5grp is None and memmap:
+            from pyscf.cc import ccsd_t
+            self.data = ccsd_t._memmap_tmp((n,)+tuple(blk_shape), self.dtype)
+        elif h5grp is None:
+            self.data = numpy.zeros((n,)+tuple(blk_shape), dtype=self.dtype)
+        else:
+            self.data = h5grp.create_dataset(dataname, (n,)+tuple(blk_shape),
+                                             self.dtype.char)
+
+    def irreducible(self):
+        '''The (k1,k2,k3) indices of the blocks in self.data'''
+        idx = numpy.where(~self.conj)
+        order = numpy.argsort(self.index[idx])
+        return tuple(x[order] for x in idx)
+
+    def _get_block(self, k1, k2, k3, rest):
+        blk = numpy.asarray(self.data[(self.index[k1,k2,k3],) + rest])
+        if self.conj[k1,k2,k3]:
+            blk = blk.conj()
+        return blk
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        kpts = numpy.arange(self.shape[0])
+        kidx = [kpts[k] for k in key[:3]]
+        rest = tuple(key[3:])
+        if all(numpy.ndim(k) == 0 for k in kidx):
+            return self._get_block(kidx[0], kidx[1], kidx[2], rest)
+
+        k1s, k2s, k3s = [numpy.atleast_1d(k) for k in kidx]
+        out = numpy.array([[[self._get_block(k1, k2, k3, rest) for k3 in k3s]
+                            for k2 in k2s] for k1 in k1s])
+        # drop the axes of the integer indices
+        return out[tuple(0 if numpy.ndim(k) == 0 else slice(None)
+                         for k in kidx)]
+
+    def __setitem__(self, key, value):
+        k1, k2, k3 = key[:3]
+        value = numpy.asarray(value)
+        if self.conj[k1,k2,k3]:
+            value = value.conj()
+        self.data[(self.index[k1,k2,k3],) + tuple(key[3:])] = value
+
+    def __array__(self, dtype=None):
+        out = numpy.empty(self.shape, dtype=self.dtype)
+        nkpts = self.shape[0]
+        for k1 in range(nkpts):
+            for k2 in range(nkpts):
+                for k3 in range(nkpts):
+                    out[k1,k2,k3] = self._get_block(k1, k2, k3, ())
+        if dtype is not None:
+            out = out.astype(dtype)
+        return out
+
 class unique_pqr_list:
     #####################################################################################
     # The following only computes the integrals not related by permutational symmetries.
     # Wasn't sure how to do this 'cleanly', but it's fairly straightforward
+    #
+    # With time_reversal=True, the blocks related by time-reversal symmetry
+    #       (pq|rs)[-kp,-kq,-kr] = (pq|rs)[kp,kq,kr]^*
+    # are also removed from the unique list (operations 4-7).  It requires the
+    # orbitals of -k to be the complex conjugate of the orbitals of k, and
+    # real orbitals at the k-points with k = -k (mod G).
     #####################################################################################
-    def __init__(self,cell,kpts):
+    def __init__(self,cell,kpts,time_reversal=False):
         kconserv = tools.get_kconserv(cell,kpts)
         nkpts = len(kpts)
+        if time_reversal:
+            minus_k = get_minus_k(cell,kpts)
+            if (minus_k < 0).any():
+                raise ValueError('Time-reversal symmetry requires -k for all '
+                                 'k-points in kpts')
         temp = range(0,nkpts)
         klist = pyscf.lib.cartesian_prod((temp,temp,temp))
         completed = numpy.zeros((nkpts,nkpts,nkpts),dtype=int)
@@ -60,6 +183,15 @@ class unique_pqr_list:
                 self.operations[ks,kr,kq] = 3 #numpy.conj(.transpose(3,2,1,0))
                 self.equivalentList[ks,kr,kq] = current_kvec.copy()
 
+                if time_reversal:
+                    mkp, mkq, mkr, mks = minus_k[[kp,kq,kr,ks]]
+                    for op, kvec in ((4, (mkp,mkq,mkr)), (5, (mkr,mks,mkp)),
+                                     (6, (mkq,mkp,mks)), (7, (mks,mkr,mkq))):
+                        if completed[kvec] == 0:
+                            completed[kvec] = 1
+                            self.operations[kvec] = op
+                            self.equivalentList[kvec] = current_kvec.copy()
+
             ivec += 1
             if ivec == len(klist):
                 not_done = False
@@ -104,3 +236,11 @@ class unique_pqr_list:
             return numpy.conj(invec.transpose(1,0,3,2))
         if operation == 3:
             return numpy.conj(invec.transpose(3,2,1,0))
+        if operation == 4:
+            return numpy.conj(invec)
+        if operation == 5:
+            return numpy.conj(invec.transpose(2,3,0,1))
+        if operation == 6:
+            return invec.transpose(1,0,3,2)
+        if operation == 7:
+            return invec.transpose(3,2,1,0)
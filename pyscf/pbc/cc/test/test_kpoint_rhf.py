@@ -104,6 +104,63 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(escf,hf_311, 9)
         self.assertAlmostEqual(ecc, cc_311, 6)
 
+    def test_311_n1_time_reversal(self):
+        cell = make_test_cell.test_cell_n1(7.0, 4)
+        kmf = pbchf.KRHF(cell, cell.make_kpts((3,1,1), wrap_around=True), exxdiv=None)
+        kmf.conv_tol = 1e-14
+        kmf.scf()
+        cc = pyscf.pbc.cc.kccsd_rhf.RCCSD(kmf)
+        cc.conv_tol = 1e-8
+        cc.time_reversal = True
+        mo_coeff = [c.copy() for c in cc.mo_coeff]
+        eris = cc.ao2mo()
+        self.assertEqual(list(eris.minus_k), [0, 2, 1])
+        self.assertTrue(all(abs(c0-c1).max() == 0
+                            for c0, c1 in zip(mo_coeff, cc.mo_coeff)))
+        # 14 of the 27 vvvv blocks are stored
+        self.assertEqual(eris.vvvv.data.shape[0], 14)
+        ecc, t1, t2 = cc.kernel(eris=eris)
+        self.assertAlmostEqual(ecc, -0.042702177586414237, 6)
+        self.assertAlmostEqual(abs(t2[1,2,1] - t2[2,1,2].conj()).max(), 0, 12)
+
+        cc.max_memory = 1  # HDF5 ERI storage
+        eris1 = cc.ao2mo()
+        for key in ('oooo', 'ooov', 'oovv', 'ovov', 'voov', 'vovv', 'vvvv'):
+            self.assertAlmostEqual(abs(np.asarray(getattr(eris1, key)) -
+                                       np.asarray(getattr(eris, key))).max(), 0, 9)
+        self.assertAlmostEqual(abs(eris1.vvvv[1,2,:,1:3] -
+                                   np.asarray(eris.vvvv)[1,2,:,1:3]).max(), 0, 9)
+
+    def test_update_amps_batched(self):
+        cell = make_test_cell.test_cell_n1(7.0, 4)
+        kmf = pbchf.KRHF(cell, cell.make_kpts((3,1,1)), exxdiv=None).run()
+        cc = pyscf.pbc.cc.kccsd_rhf.RCCSD(kmf)
+        eris = cc.ao2mo()
+        nkpts, nocc, nvir = cc.nkpts, cc.nocc, cc.nmo - cc.nocc
+        np.random.seed(2)
+        t1 = (np.random.random((nkpts,nocc,nvir)) +
+              np.random.random((nkpts,nocc,nvir))*1j) * .1
+        t2 = (np.random.random((nkpts,)*3+(nocc,nocc,nvir,nvir)) +
+              np.random.random((nkpts,)*3+(nocc,nocc,nvir,nvir))*1j) * .1
+        t1ref, t2ref = pyscf.pbc.cc.kccsd_rhf.update_amps_loop(cc, t1, t2, eris)
+        t1new, t2new = pyscf.pbc.cc.kccsd_rhf.update_amps(cc, t1, t2, eris)
+        self.assertAlmostEqual(abs(t1new-t1ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(t2new-t2ref).max(), 0, 12)
+        self.assertAlmostEqual(pyscf.pbc.cc.kccsd_rhf.energy(cc, t1, t2, eris),
+                               pyscf.pbc.cc.kccsd_rhf.energy_loop(cc, t1, t2, eris), 12)
+
+        cc.nproc = 2
+        t1new, t2new = cc.update_amps(t1, t2, eris)
+        self.assertAlmostEqual(abs(t1new-t1ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(t2new-t2ref).max(), 0, 12)
+
+        cc.max_memory = 1  # HDF5 ERI storage
+        eris = cc.ao2mo()
+        self.assertTrue(isinstance(eris.vovv, np.memmap))
+        t1new, t2new = cc.update_amps(t1, t2, eris)
+        self.assertAlmostEqual(abs(t1new-t1ref).max(), 0, 9)
+        self.assertAlmostEqual(abs(t2new-t2ref).max(), 0, 9)
+
 if __name__ == '__main__':
     print("Full kpoint test")
     unittest.main()
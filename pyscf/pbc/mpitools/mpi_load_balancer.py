@@ -1,4 +1,9 @@
-from mpi4py import MPI
+try:
+    from mpi4py import MPI
+except ImportError:
+    # The block decomposition (make_blocks) is also used by the
+    # multiprocessing backend of pyscf.pbc.cc.kccsd_rhf, without MPI
+    MPI = None
 import pyscf.lib
 import numpy as np
 import time
@@ -10,6 +15,31 @@ def enum(**enums):
 
 tags = enum(WORK=1, WORK_DONE=2, KILL=3)
 
+def make_blocks(inindices, BLKSIZE):
+    '''Split each index range inindices[i] into blocks of size BLKSIZE[i].
+    The work items of the load balancer are the cartesian products of the
+    block indices (see block_tasks).'''
+    outblocks = []
+    for i in range(len(inindices)):
+        max_range = max(inindices[i])
+        min_range = min(inindices[i])
+        ranges_size = len(inindices[i])
+        nblocks = int(np.ceil(ranges_size/(1.*BLKSIZE[i])))
+        ##print "nblocks for range (%3d-%3d) = %3d" % (min_range, max_range, nblocks)
+        segment_blocks = []
+        for j in range(nblocks):
+            block_j_min = min_range + BLKSIZE[i]*j
+            block_j_max = min(max_range+1,min_range+BLKSIZE[i]*(j+1))
+            segment_blocks.append(range(block_j_min,block_j_max))
+        outblocks.append(segment_blocks)
+    return outblocks
+
+def block_tasks(outblocks):
+    '''The block indices of all work items, in the order the master sends
+    them out'''
+    work = [range(len(blocks)) for blocks in outblocks]
+    return pyscf.lib.cartesian_prod(work)
+
 class load_balancer:
     def __init__(self,BLKSIZE):
         self.rank = MPI.COMM_WORLD.Get_rank()
@@ -32,28 +62,7 @@ class load_balancer:
             print self.rank, BLKSIZE, inindices
             sys.exit()
         self.nindices = len(inindices)
-        ##print "nindices = ", self.nindices
-        ##print "inindices = ", inindices
-        ##print "BLKSIZE = ", BLKSIZE
-        outblocks = []
-        for i in range(self.nindices):
-
-            max_range = max(inindices[i])
-            min_range = min(inindices[i])
-            ranges_size = len(inindices[i])
-            nblocks = int(np.ceil(ranges_size/(1.*BLKSIZE[i])))
-            ##print "nblocks for range (%3d-%3d) = %3d" % (min_range, max_range, nblocks)
-            segment_blocks = []
-            for j in range(nblocks):
-                block_j_min = min_range + BLKSIZE[i]*j
-                block_j_max = min(max_range+1,min_range+BLKSIZE[i]*(j+1))
-                segment_blocks.append(range(block_j_min,block_j_max))
-#            if rank == 0:
-#                print "segment blocks [segment %3d]: " % i
-#                print segment_blocks
-            outblocks.append(segment_blocks)
-        ###print "index 0 block 1"
-        ###print outblocks[0][1]
+        outblocks = make_blocks(inindices, BLKSIZE)
         self.outblocks = np.asarray(outblocks)
         #if rank == 0:
         #    ##print "final block structure"
@@ -63,10 +72,7 @@ class load_balancer:
 
     def master(self):
         status = MPI.Status()
-        work = []
-        for index in range(0,self.nindices):
-            work.append(range(len(self.outblocks[index])))
-        block_indices = pyscf.lib.cartesian_prod(work)
+        block_indices = block_tasks(self.outblocks)
         nwork = len(block_indices)
         iwork = 0
         iwork_recieved = 0